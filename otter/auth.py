@@ -37,6 +37,8 @@ a token.)
 """
 
 import json
+import random
+from collections import OrderedDict
 from itertools import groupby
 from functools import partial
 
@@ -160,18 +162,38 @@ class CachingAuthenticator(object):
     An authenticator which cases the result of the provided auth_function
     based on the tenant_id.
 
+    A cached token that is used within ``refresh_ahead`` seconds of its
+    expiry is re-authenticated in the background while the cached token is
+    returned, so that tenants in use do not wait on identity when their token
+    expires. Each entry's TTL is reduced by a random fraction of up to
+    ``jitter`` so that entries cached together, for example after a restart,
+    do not expire together. At most ``max_size`` least recently used entries
+    are kept.
+
     :param IReactorTime reactor: An IReactorTime provider used for enforcing
         the cache TTL.
     :param IAuthenticator authenticator:
     :param int ttl: An integer indicating the TTL of a cache entry in seconds.
-    """
-    def __init__(self, reactor, authenticator, ttl):
+    :param int max_size: Maximum number of tenants cached
+    :param refresh_ahead: Seconds before expiry in which use of a token
+        refreshes it. 0 disables refreshing ahead.
+    :param float jitter: Maximum fraction of ``ttl`` to reduce TTL of an entry
+        by.
+    """
+    def __init__(self, reactor, authenticator, ttl, max_size=10000,
+                 refresh_ahead=0, jitter=0, rand=random.random):
         self._reactor = reactor
         self._authenticator = authenticator
         self._ttl = ttl
+        self._max_size = max_size
+        self._refresh_ahead = refresh_ahead
+        self._jitter = jitter
+        self._random = rand
 
         self._waiters = {}
-        self._cache = {}
+        self._cache = OrderedDict()
+        self._refreshing = set()
+        self.evictions = 0
         self._log = self._bind_log(default_log)
         self._auth_func = wait(ignore_kwargs=['log'])(self._authenticator.authenticate_tenant)
 
@@ -184,6 +206,39 @@ class CachingAuthenticator(object):
                         cache_ttl=self._ttl,
                         **kwargs)
 
+    def _populate(self, result, tenant_id, log):
+        """
+        Cache authentication result of a tenant, evicting least recently used
+        tenants if cache is full
+        """
+        log.msg('otter.auth.cache.populate')
+        now = self._reactor.seconds()
+        ttl = self._ttl * (1 - self._jitter * self._random())
+        self._cache.pop(tenant_id, None)
+        self._cache[tenant_id] = (now, now + ttl, result)
+        while len(self._cache) > self._max_size:
+            evicted, _ = self._cache.popitem(last=False)
+            self.evictions += 1
+            self._log.msg('otter.auth.cache.evict', evicted_tenant_id=evicted,
+                          evictions=self.evictions,
+                          cache_size=len(self._cache))
+        return result
+
+    def _refresh(self, tenant_id, log):
+        """
+        Re-authenticate tenant in the background
+        """
+        def refreshed(result):
+            self._refreshing.discard(tenant_id)
+            return result
+
+        log.msg('otter.auth.cache.refresh')
+        self._refreshing.add(tenant_id)
+        d = self._auth_func(tenant_id, log=log)
+        d.addCallback(self._populate, tenant_id, log)
+        d.addBoth(refreshed)
+        d.addErrback(log.err, 'otter.auth.cache.refresh-failed')
+
     def authenticate_tenant(self, tenant_id, log=None):
         """
         see :meth:`IAuthenticator.authenticate_tenant`
@@ -194,23 +249,22 @@ class CachingAuthenticator(object):
             log = self._bind_log(log, tenant_id=tenant_id)
 
         if tenant_id in self._cache:
-            (created, data) = self._cache[tenant_id]
+            (created, expires, data) = self._cache.pop(tenant_id)
             now = self._reactor.seconds()
 
-            if now - created <= self._ttl:
+            if now <= expires:
+                self._cache[tenant_id] = (created, expires, data)
                 log.msg('otter.auth.cache.hit', age=now - created)
+                if (now >= expires - self._refresh_ahead and
+                        tenant_id not in self._refreshing):
+                    self._refresh(tenant_id, log)
                 return succeed(data)
 
             log.msg('otter.auth.cache.expired', age=now - created)
 
-        def when_authenticated(result):
-            log.msg('otter.auth.cache.populate')
-            self._cache[tenant_id] = (self._reactor.seconds(), result)
-            return result
-
         log.msg('otter.auth.cache.miss')
         d = self._auth_func(tenant_id, log=log)
-        d.addCallback(when_authenticated)
+        d.addCallback(self._populate, tenant_id, log)
 
         return d
 
@@ -584,6 +638,9 @@ def generate_authenticator(reactor, config):
     """
     # FIXME: Pick an arbitrary cache ttl value based on absolutely no science.
     cache_ttl = config.get('cache_ttl', 300)
+    cache_max_size = config.get('cache_max_size', 10000)
+    cache_refresh_ahead = config.get('cache_refresh_ahead', cache_ttl / 10)
+    cache_jitter = config.get('cache_jitter', 0.1)
     if config.get('strategy', 'impersonation') == 'single_tenant':
         auth = SingleTenantAuthenticator(
             config['username'],
@@ -606,4 +663,7 @@ def generate_authenticator(reactor, config):
                 max_retries=config['max_retries'],
                 retry_interval=config['retry_interval']),
             config.get('wait', 5)),
-        cache_ttl)
+        cache_ttl,
+        max_size=cache_max_size,
+        refresh_ahead=cache_refresh_ahead,
+        jitter=cache_jitter)
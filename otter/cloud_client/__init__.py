@@ -16,13 +16,13 @@ from effect import (
     perform,
     sync_performer)
 
+from pyrsistent import pvector
+
 import six
 
 from toolz.dicttoolz import get_in
 from toolz.functoolz import identity
 
-from twisted.internet.task import deferLater
-
 from txeffect import deferred_performer, perform as twisted_perform
 
 from otter.auth import Authenticate, InvalidateToken, public_endpoint_url
@@ -41,7 +41,7 @@ from otter.util.pure_http import (
     has_code,
     request,
 )
-from otter.util.weaklocks import WeakLocks
+from otter.util.tokenbucket import TokenBucket
 
 
 def add_bind_service(catalog, service_name, region, log, request_func):
@@ -243,8 +243,8 @@ class _Throttle(object):
 @deferred_performer
 def _perform_throttle(dispatcher, throttle):
     """
-    Perform :obj:`_Throttle` by performing the effect after acquiring a lock
-    and delaying but some period of time.
+    Perform :obj:`_Throttle` by performing the effect inside the bracket,
+    which waits for its turn to make the request.
     """
     lock = throttle.bracket
     eff = throttle.effect
@@ -268,24 +268,107 @@ _CFG_NAMES_PER_TENANT = {
 }
 
 
-def _default_throttler(locks, clock, stype, method, tenant_id):
+def _is_rate_limited(failure):
+    """
+    Is the failure of a request caused by upstream service rate limiting it?
     """
-    Get a throttler function with throttling policies based on configuration.
+    return (failure.check(APIError) is not None and
+            failure.value.code in (413, 429))
+
+
+def _throttling_config(cfg_name):
     """
-    cfg_name = _CFG_NAMES.get((stype, method))
-    if cfg_name is not None:
-        delay = config_value('cloud_client.throttling.' + cfg_name)
-        if delay is not None:
-            lock = locks.get_lock((stype, method))
-            return partial(lock.run, deferLater, clock, delay)
+    Get token bucket configuration of given throttling config name as dict
+    of :obj:`TokenBucket` arguments or None if it is not configured.
 
-    # Could be a per-tenant lock
-    cfg_name = _CFG_NAMES_PER_TENANT.get((stype, method))
-    if cfg_name is not None:
-        delay = config_value('cloud_client.throttling.' + cfg_name)
-        if delay is not None:
-            lock = locks.get_lock((stype, method, tenant_id))
-            return partial(lock.run, deferLater, clock, delay)
+    ``<name>_rate`` and ``<name>_burst`` give the rate and burst. Older
+    ``<name>_delay`` config is treated as a rate of one request every
+    ``delay`` seconds.
+    """
+    def throttling_value(name):
+        return config_value('cloud_client.throttling.' + name)
+
+    base = cfg_name[:-len('_delay')]
+    rate = throttling_value(base + '_rate')
+    if rate is None:
+        delay = throttling_value(cfg_name)
+        if delay is None:
+            return None
+        rate = 1.0 / delay
+    cfg = {'rate': rate, 'burst': throttling_value(base + '_burst') or 1}
+    factor = throttling_value('backoff_factor')
+    if factor is not None:
+        cfg['backoff_factor'] = factor
+    recovery = throttling_value('recovery_ratio')
+    if recovery is not None:
+        cfg['recovery_step'] = rate * recovery
+    return cfg
+
+
+class _TokenBucketThrottler(object):
+    """
+    Throttler returning the ``run`` method of a :obj:`TokenBucket` per
+    (service type, method) or (service type, method, tenant) based on
+    configuration. Statistics of buckets are logged every ``stats_interval``
+    seconds while they are in use and buckets that are idle are forgotten.
+    """
+
+    def __init__(self, clock, log, stats_interval=60):
+        self.clock = clock
+        self.log = log
+        self.stats_interval = stats_interval
+        self.buckets = {}
+        self._stats_call = None
+
+    def _bucket(self, key, cfg_name):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            cfg = _throttling_config(cfg_name)
+            if cfg is None:
+                return None
+            bucket = self.buckets[key] = TokenBucket(
+                self.clock, is_throttled=_is_rate_limited, **cfg)
+            if self._stats_call is None:
+                self._stats_call = self.clock.callLater(
+                    self.stats_interval, self.log_stats)
+        return bucket.run
+
+    def __call__(self, stype, method, tenant_id):
+        """
+        Get a throttler function with throttling policies based on
+        configuration.
+        """
+        cfg_name = _CFG_NAMES.get((stype, method))
+        if cfg_name is not None:
+            return self._bucket((stype, method), cfg_name)
+
+        # Could be a per-tenant bucket
+        cfg_name = _CFG_NAMES_PER_TENANT.get((stype, method))
+        if cfg_name is not None:
+            return self._bucket((stype, method, tenant_id), cfg_name)
+
+    def log_stats(self):
+        """
+        Log statistics of buckets since last time and forget idle buckets
+        """
+        self._stats_call = None
+        for key, bucket in sorted(self.buckets.items()):
+            idle = bucket.idle
+            if bucket.calls or bucket.throttled:
+                self.log.msg(
+                    "throttle-stats",
+                    service_type=key[0].name, method=key[1],
+                    tenant_id=key[2] if len(key) > 2 else None,
+                    requests=bucket.calls, waits=bucket.waits,
+                    avg_wait_time=bucket.wait_time / max(bucket.waits, 1),
+                    throttled_responses=bucket.throttled,
+                    rate=bucket.rate, tokens=bucket.tokens)
+            bucket.reset_stats()
+            if idle:
+                del self.buckets[key]
+        if self.buckets:
+            self._stats_call = self.clock.callLater(
+                self.stats_interval, self.log_stats)
 
 
 def perform_tenant_scope(
@@ -320,7 +403,9 @@ def get_cloud_client_dispatcher(reactor, authenticator, log, service_configs):
     """
     # this throttler could be parameterized but for now it's basically a hack
     # that we want to keep private to this module
-    throttler = partial(_default_throttler, WeakLocks(), reactor)
+    throttler = _TokenBucketThrottler(
+        reactor, log,
+        config_value('cloud_client.throttling.stats_interval') or 60)
     return TypeDispatcher({
         TenantScope: partial(perform_tenant_scope, authenticator, log,
                              service_configs, throttler),
@@ -662,47 +747,68 @@ def list_servers_details_page(parameters=None):
     )
 
 
-def list_servers_details_all(parameters=None):
+def fold_servers_details(f, initial, parameters=None):
     """
-    List all pages of servers details, starting at the page specified by the
-    given filtering and pagination parameters.
+    Fold all pages of servers details with ``f`` as the pages are listed,
+    starting at the page specified by the given filtering and pagination
+    parameters. Servers of a page are not kept after ``f`` is called unless
+    ``f`` keeps them.
 
+    :param f: Function of (accumulated value, ``list`` of server details
+        `dict`s of a page) -> new accumulated value. It should not mutate
+        the accumulated value since the returned effect can be performed
+        more than once.
+    :param initial: Initial accumulated value
     :ivar dict parameters: A dictionary with pagination information,
         changes-since filters, and name filters.
 
     Succeed on 200.
 
-    :return: a `list` of server details `dict`s
+    :return: Effect of the accumulated value after the last page
     :raise: :class:`NovaRateLimitError`, :class:`NovaComputeFaultError`,
         :class:`APIError`
     """
-    last_link = []
-
-    def continue_(result, servers_so_far=None):
-        if servers_so_far is None:
-            servers_so_far = []
-
+    def continue_(acc, last_link, result):
         _response, body = result
-        servers = servers_so_far + body['servers']
+        acc = f(acc, body['servers'])
 
         # Only continue if pagination is supported and there is another page
         continuation = [link['href'] for link in body.get('servers_links', [])
                         if link['rel'] == 'next']
         if continuation:
             # blow up if we try to fetch the same link twice
-            if last_link and last_link[-1] == continuation[0]:
+            if last_link == continuation[0]:
                 raise NovaComputeFaultError(
                     "When gathering server details, got the same 'next' link "
-                    "twice from Nova: {0}".format(last_link[-1]))
+                    "twice from Nova: {0}".format(last_link))
 
-            last_link[:] = [continuation[0]]
             parsed_query = parse_qs(urlparse(continuation[0]).query)
             return list_servers_details_page(parsed_query).on(
-                partial(continue_, servers_so_far=servers))
+                partial(continue_, acc, continuation[0]))
+
+        return acc
 
-        return servers
+    return list_servers_details_page(parameters).on(
+        partial(continue_, initial, None))
 
-    return list_servers_details_page(parameters).on(continue_)
+
+def list_servers_details_all(parameters=None):
+    """
+    List all pages of servers details, starting at the page specified by the
+    given filtering and pagination parameters.
+
+    :ivar dict parameters: A dictionary with pagination information,
+        changes-since filters, and name filters.
+
+    Succeed on 200.
+
+    :return: a `list` of server details `dict`s
+    :raise: :class:`NovaRateLimitError`, :class:`NovaComputeFaultError`,
+        :class:`APIError`
+    """
+    return fold_servers_details(
+        lambda servers, page: servers.extend(page), pvector(),
+        parameters).on(list)
 
 
 _nova_standard_errors = [
@@ -21,6 +21,7 @@ Storage model for state information:
  * last touched information for policy
 """
 import json
+from copy import deepcopy
 from datetime import datetime
 from decimal import Decimal, ROUND_UP
 from functools import partial
@@ -39,6 +40,7 @@ from six import reraise
 from toolz.dicttoolz import get_in
 
 from twisted.internet import defer
+from twisted.python.failure import Failure
 
 from txeffect import perform
 
@@ -64,8 +66,8 @@ from otter.supervisor import (
     execute_launch_config)
 from otter.supervisor import (
     remove_server_from_group as worker_remove_server_from_group)
+from otter.util.combiner import Combiner
 from otter.util.config import config_value
-from otter.util.deferredutils import unwrap_first_error
 from otter.util.fp import assoc_obj
 from otter.util.retry import (
     exponential_backoff_interval,
@@ -348,6 +350,168 @@ def modify_and_trigger(dispatcher, group, logargs, modifier, *args, **kwargs):
         raise cannot_exec_pol_err
 
 
+def modify_and_trigger_combined(dispatcher, group, logargs, modifier, *args,
+                                **kwargs):
+    """
+    Same as :func:`modify_and_trigger` except that for convergence tenants
+    calls on a group made while a previous call on that group is waiting for
+    or holding the group's lock are combined: their modifiers are applied
+    in order within one ``modify_state`` and convergence is triggered once
+    for all of them. This is meant for policy executions which can arrive
+    many at a time from webhooks and the scheduler. Calls are not combined
+    until :func:`set_combiner_clock` is called.
+
+    :return: Deferred with None if modification and convergence succeeded
+    """
+    if (_combined_modifications is None or
+            not tenant_is_enabled(group.tenant_id, config_value)):
+        return modify_and_trigger(dispatcher, group, logargs, modifier,
+                                  *args, **kwargs)
+    reason = kwargs.pop('modify_state_reason', None)
+    return _combined_modifications.add(
+        (group.tenant_id, group.uuid),
+        (dispatcher, group, logargs, reason, modifier, args, kwargs))
+
+
+def _triggers_convergence(result):
+    """
+    Does the modifier result require triggering convergence like
+    :func:`modify_and_trigger` does?
+    """
+    return (not isinstance(result, Failure) or
+            result.check(CannotExecutePolicyError) is not None)
+
+
+class _NothingModified(Exception):
+    """
+    Raised by the batch's modifier when none of the modifiers in the batch
+    succeeded and there is nothing to write
+    """
+
+
+@defer.inlineCallbacks
+def _modify_batch(batch, results, group, state):
+    """
+    Apply the modifiers of a batch in order, each on its own copy of the
+    state, appending each modifier's result to ``results``.
+
+    :return: Deferred with the modified state. Fails with
+        :obj:`_NothingModified` if all modifiers failed.
+    """
+    if state.suspended:
+        raise TenantSuspendedError(group.tenant_id)
+    for _, _, _, _, modifier, args, kwargs in batch:
+        try:
+            state = yield modifier(group, deepcopy(state), *args, **kwargs)
+            results.append(None)
+        except Exception:
+            results.append(Failure())
+    if not any(r is None for r in results):
+        raise _NothingModified()
+    defer.returnValue(state)
+
+
+def _fail_unwritten(results, failure, batch_size):
+    """
+    Fail the results of a batch whose state could not be written.
+
+    :param list results: Results of the modifiers that were called
+    :param failure: :class:`Failure` of ``modify_state``
+    :param int batch_size: Number of calls in the batch
+
+    :return: List of results where each call that did not already fail with
+        its own error fails with ``failure``
+    """
+    results = [r if isinstance(r, Failure) else failure for r in results]
+    return results + [failure] * (batch_size - len(results))
+
+
+@defer.inlineCallbacks
+def _trigger_batch(dispatcher, group, logargs, results):
+    """
+    Trigger convergence once for a batch if any of its results require it.
+    If triggering fails, the calls that required it fail with that error.
+
+    :return: Deferred with list of results of each call
+    """
+    if any(_triggers_convergence(r) for r in results):
+        try:
+            yield perform(
+                dispatcher,
+                Effect(BoundFields(
+                    trigger_convergence(group.tenant_id, group.uuid),
+                    logargs)))
+        except Exception:
+            failure = Failure()
+            results = [failure if _triggers_convergence(r) else r
+                       for r in results]
+    defer.returnValue(results)
+
+
+@defer.inlineCallbacks
+def modify_and_trigger_batch(clock, key, batch):
+    """
+    Process a batch of :func:`modify_and_trigger_combined` calls on the same
+    group. Each modifier gets its own copy of the state so that a failing
+    modifier does not leave its changes in the state written. The batch's
+    size, the time taken to get the lock and state and each call's bound log
+    fields are logged. If the state cannot be written, every call that did
+    not fail with its own error fails with that error and convergence is not
+    triggered.
+
+    :param clock: ``IReactorTime`` provider
+    :param key: (tenant ID, group ID) tuple
+    :param list batch: List of tuples of arguments given to
+        :func:`modify_and_trigger_combined`
+
+    :return: Deferred with list of results of each call
+    """
+    dispatcher, group, logargs, reason = batch[0][:4]
+    start = clock.seconds()
+    waited = []
+    results = []
+
+    def modify_all(_group, state):
+        waited.append(clock.seconds() - start)
+        return _modify_batch(batch, results, _group, state)
+
+    written = True
+    try:
+        yield group.modify_state(modify_all, modify_state_reason=reason)
+    except _NothingModified:
+        pass
+    except Exception:
+        written = False
+        results = _fail_unwritten(results, Failure(), len(batch))
+    callers = [item[2] for item in batch]
+    yield perform(
+        dispatcher,
+        Effect(BoundFields(
+            msg("modify-state-batch", batch_size=len(batch),
+                lock_wait_time=waited[0] if waited else None,
+                transaction_ids=[c.get('transaction_id') for c in callers],
+                callers=callers),
+            logargs)))
+    if written:
+        results = yield _trigger_batch(dispatcher, group, logargs, results)
+    defer.returnValue(results)
+
+
+_combined_modifications = None
+
+
+def set_combiner_clock(clock):
+    """
+    Set up combining of :func:`modify_and_trigger_combined` calls.
+
+    :param clock: ``IReactorTime`` provider used to time waiting for the
+        group's lock
+    """
+    global _combined_modifications
+    _combined_modifications = Combiner(
+        partial(modify_and_trigger_batch, clock))
+
+
 def converge(log, transaction_id, config, scaling_group, state, launch_config,
              policy, config_value=config_value):
     """
@@ -442,17 +606,9 @@ def maybe_execute_scaling_policy(
                                "execute policy {}".format(policy_id))
 
     # make sure that the policy (and the group) exists before doing
-    # anything else
-    deferred = scaling_group.get_policy(policy_id, version)
-
-    def _do_get_configs(policy):
-        deferred = defer.gatherResults([
-            scaling_group.view_config(),
-            scaling_group.view_launch_config()
-        ])
-        return deferred.addCallback(lambda results: results + [policy])
-
-    deferred.addCallbacks(_do_get_configs, unwrap_first_error)
+    # anything else. Configs and policy are read together to keep the time
+    # spent holding the group's lock short
+    deferred = scaling_group.view_policy_manifest(policy_id, version)
 
     def _do_maybe_execute(config_launch_policy):
         """
@@ -1,19 +1,29 @@
 """Code related to gathering data to inform convergence."""
 import re
+from collections import OrderedDict
+from datetime import timedelta
 from functools import partial
+from hashlib import sha1
 
-from effect import catch, parallel
+import attr
+
+from effect import Effect, TypeDispatcher, catch, parallel, sync_performer
 from effect.do import do, do_return
 
-from pyrsistent import pmap
+from pyrsistent import pmap, pvector
 
-from toolz.curried import filter, groupby, keyfilter, map
+from toolz.curried import filter, keyfilter, map
 from toolz.dicttoolz import assoc, get_in, merge
 from toolz.functoolz import compose, curry, identity
 from toolz.itertoolz import concat
 
+from twisted.internet.defer import Deferred, succeed
+
+from txeffect import deferred_performer, perform
+
 from otter.auth import NoSuchEndpoint
 from otter.cloud_client import (
+    fold_servers_details,
     list_servers_details_all,
     list_stacks_all,
     service_request
@@ -26,8 +36,10 @@ from otter.cloud_client.clb import (
     get_clbs
 )
 from otter.constants import ServiceType
+from otter.convergence.composition import json_to_LBConfigs
 from otter.convergence.model import (
     CLB,
+    CLBDescription,
     CLBNode,
     CLBNodeCondition,
     HeatStack,
@@ -38,11 +50,12 @@ from otter.convergence.model import (
     group_id_from_metadata
 )
 from otter.indexer import atom
-from otter.models.cass import CassScalingGroupServersCache
+from otter.log.intents import msg
+from otter.models.cass import get_servers_cache
 from otter.util.http import append_segments
 from otter.util.retry import (
     exponential_backoff_interval, retry_effect, retry_times)
-from otter.util.timestamp import timestamp_to_epoch
+from otter.util.timestamp import datetime_to_epoch, timestamp_to_epoch
 
 
 def _retry(eff):
@@ -51,6 +64,248 @@ def _retry(eff):
         eff, retry_times(5), exponential_backoff_interval(2))
 
 
+@attr.s
+class SharedGather(object):
+    """
+    Intent to perform a gather effect whose result can be shared with other
+    performances of the intent with the same key. See :obj:`GatherCache`.
+
+    The result is a tuple of (status, result of ``effect``) where status is
+    one of "hit", "shared" or "miss".
+
+    :ivar group: (tenant ID, group ID) of the group gathering. Results fetched
+        before this group last changed the gathered resources are not used.
+    """
+    key = attr.ib()
+    effect = attr.ib()
+    group = attr.ib(default=None)
+
+
+@attr.s
+class InvalidateSharedGather(object):
+    """
+    Intent to stop sharing results fetched so far with ``group`` because it
+    has changed the gathered resources, for example by adding or removing
+    load balancer nodes. Other groups keep sharing them.
+
+    :ivar group: (tenant ID, group ID) of the group
+    """
+    group = attr.ib()
+
+
+class GatherCache(object):
+    """
+    Short-lived, single-flight cache of gathered resources. When groups of
+    the same tenant are converged at the same time, only one of them fetches
+    a tenant-wide resource and the others share its result. Successful
+    results are kept for ``ttl`` seconds after their fetch started. Errors
+    are not cached. A group that has invalidated its results does not get
+    results whose fetch started before that, so its next iteration sees its
+    own changes.
+    """
+
+    def __init__(self, clock, ttl):
+        self.clock = clock
+        self.ttl = ttl
+        self._results = {}
+        self._waiting = {}
+        self._invalidated = {}
+
+    def get(self, key, fetch, group=None):
+        """
+        Get result for ``key``, calling ``fetch`` only if it is not cached
+        and is not already being fetched.
+
+        :param key: Hashable key of the resource
+        :param callable fetch: No-arg function returning Deferred of resource
+        :param group: Hashable ID of group getting the result, if any
+
+        :return: Deferred of (status, result) tuple where status is "hit" if
+            the result was cached, "shared" if it was already being fetched
+            and "miss" if it was fetched by this call
+        """
+        self._expire()
+        usable = partial(self._usable, self._invalidated.get(group))
+        if key in self._results and usable(self._results[key][0]):
+            return succeed(("hit", self._results[key][1]))
+        if key in self._waiting and usable(self._waiting[key][0]):
+            d = Deferred()
+            self._waiting[key][1].append(d)
+            return d.addCallback(lambda r: ("shared", r))
+        started = self.clock.seconds()
+        if key in self._waiting:
+            # Fetch in progress started before the group changed the
+            # resource. Fetch it again without disturbing its waiters
+            d = fetch().addCallback(self._store, key, started)
+        else:
+            self._waiting[key] = (started, [])
+            d = fetch()
+            d.addCallbacks(self._fetched, self._fetch_failed,
+                           callbackArgs=(key, started), errbackArgs=(key,))
+        return d.addCallback(lambda r: ("miss", r))
+
+    def invalidate(self, group):
+        """
+        Do not give ``group`` results whose fetch started before now
+        """
+        self._invalidated[group] = self.clock.seconds()
+
+    def _usable(self, invalidated_at, started):
+        return (self.clock.seconds() - started < self.ttl and
+                (invalidated_at is None or started > invalidated_at))
+
+    def _expire(self):
+        now = self.clock.seconds()
+        for key, (started, _) in self._results.items():
+            if now - started >= self.ttl:
+                del self._results[key]
+        # Results fetched before an invalidation older than ttl have expired
+        for group, invalidated_at in self._invalidated.items():
+            if now - invalidated_at >= self.ttl:
+                del self._invalidated[group]
+
+    def _store(self, result, key, started):
+        if key not in self._results or self._results[key][0] <= started:
+            self._results[key] = (started, result)
+        return result
+
+    def _fetched(self, result, key, started):
+        self._store(result, key, started)
+        for d in self._waiting.pop(key)[1]:
+            d.callback(result)
+        return result
+
+    def _fetch_failed(self, failure, key):
+        for d in self._waiting.pop(key)[1]:
+            d.errback(failure)
+        return failure
+
+
+@attr.s
+class GetCachedDrainedAt(object):
+    """
+    Intent to get drained-at times of CLB nodes found in an earlier
+    convergence iteration. Result is a ``dict`` of (lb_id, node_id) -> drained
+    at time in seconds since EPOCH containing only the nodes that are cached.
+    """
+    keys = attr.ib()
+
+
+@attr.s
+class UpdateCachedDrainedAt(object):
+    """
+    Intent to cache drained-at times of CLB nodes.
+
+    :ivar dict found: (lb_id, node_id) -> drained at time of DRAINING nodes
+    :ivar list undrained: (lb_id, node_id) of nodes that are not DRAINING
+        anymore. Their drained-at times are forgotten so that they are read
+        again if the nodes are put in DRAINING again.
+    """
+    found = attr.ib()
+    undrained = attr.ib()
+
+
+class DrainedAtCache(object):
+    """
+    LRU cache of CLB node drained-at times. The time at which a node was
+    put in DRAINING does not change while it remains in DRAINING, so its
+    atom feed needs to be read only once. Keeps at most ``size`` nodes.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._times = OrderedDict()
+
+    def get(self, keys):
+        """
+        Get cached drained-at times of given (lb_id, node_id) keys
+
+        :return: ``dict`` of key -> drained-at for keys that are cached
+        """
+        found = {}
+        for key in keys:
+            if key in self._times:
+                found[key] = self._times.pop(key)
+                self._times[key] = found[key]
+        return found
+
+    def update(self, found, undrained):
+        """
+        Cache drained-at times in ``found`` dict and forget times of keys in
+        ``undrained``
+        """
+        for key in undrained:
+            self._times.pop(key, None)
+        for key, drained_at in found.items():
+            self._times.pop(key, None)
+            self._times[key] = drained_at
+        while len(self._times) > self.size:
+            self._times.popitem(last=False)
+
+
+@deferred_performer
+def perform_shared_gather(cache, dispatcher, intent):
+    """
+    Perform :obj:`SharedGather` using :obj:`GatherCache`. Must be partialed
+    with ``cache``.
+    """
+    return cache.get(intent.key,
+                     lambda: perform(dispatcher, intent.effect),
+                     intent.group)
+
+
+def get_gather_cache_dispatcher(clock, ttl, drained_at_cache_size=10000):
+    """
+    Get dispatcher with performers of :obj:`SharedGather` and
+    :obj:`InvalidateSharedGather` that use a new :obj:`GatherCache` and
+    performers of :obj:`GetCachedDrainedAt` and :obj:`UpdateCachedDrainedAt`
+    that use a new :obj:`DrainedAtCache`
+    """
+    gather_cache = GatherCache(clock, ttl)
+    drained_at_cache = DrainedAtCache(drained_at_cache_size)
+    return TypeDispatcher({
+        SharedGather: partial(perform_shared_gather, gather_cache),
+        InvalidateSharedGather: sync_performer(
+            lambda d, i: gather_cache.invalidate(i.group)),
+        GetCachedDrainedAt: sync_performer(
+            lambda d, i: drained_at_cache.get(i.keys)),
+        UpdateCachedDrainedAt: sync_performer(
+            lambda d, i: drained_at_cache.update(i.found, i.undrained))
+    })
+
+
+def shared_gather(tenant_id, resource, eff, key=(), group_id=None):
+    """
+    Share the result of tenant-wide gather effect with other convergence
+    iterations of the same tenant. Logs if the result came from the cache.
+
+    :param str tenant_id: Tenant ID
+    :param str resource: Name of the gathered resource
+    :param Effect eff: Effect gathering the resource
+    :param tuple key: Hashable values further identifying the resource, if
+        ``eff`` does not gather all of it
+    :param str group_id: ID of the group gathering, if any. See
+        :obj:`InvalidateSharedGather`.
+
+    :return: Effect of result of ``eff``
+    """
+    def log_status((status, result)):
+        return msg('gather-cache', resource=resource,
+                   cache_status=status).on(lambda _: result)
+
+    group = None if group_id is None else (tenant_id, group_id)
+    return Effect(
+        SharedGather((tenant_id, resource) + tuple(key), eff, group)).on(
+            log_status)
+
+
+def _server_details_query(changes_since, batch_size):
+    query = {'limit': [str(batch_size)]}
+    if changes_since is not None:
+        query['changes-since'] = ['{0}Z'.format(changes_since.isoformat())]
+    return query
+
+
 def get_all_server_details(changes_since=None, batch_size=100):
     """
     Return all servers of a tenant.
@@ -61,37 +316,44 @@ def get_all_server_details(changes_since=None, batch_size=100):
 
     NOTE: This really screams to be a independent fxcloud-type API
     """
-    query = {'limit': [str(batch_size)]}
-    if changes_since is not None:
-        query['changes-since'] = ['{0}Z'.format(changes_since.isoformat())]
-
-    return list_servers_details_all(query)
+    return list_servers_details_all(
+        _server_details_query(changes_since, batch_size))
 
 
 def get_all_scaling_group_servers(changes_since=None,
-                                  server_predicate=identity):
+                                  server_predicate=identity,
+                                  batch_size=100):
     """
     Return tenant's servers that belong to any scaling group as
     {group_id: [server1, server2]} ``dict``. No specific ordering is guaranteed
 
+    Servers are filtered and grouped as each page is listed so that servers
+    not belonging to any group are not kept around until the last page.
+
     :param datetime changes_since: Get server since this time. Must be UTC
     :param server_predicate: function of server -> bool that determines whether
         the server should be included in the result.
+    :param int batch_size: number of servers to fetch *per batch*.
     :return: dict mapping group IDs to lists of Nova servers.
     """
 
     def has_group_id(s):
         return 'metadata' in s and isinstance(s['metadata'], dict)
 
-    def group_id(s):
-        return group_id_from_metadata(s['metadata'])
-
-    servers_apply = compose(keyfilter(lambda k: k is not None),
-                            groupby(group_id),
-                            filter(server_predicate),
-                            filter(has_group_id))
+    def add_page(groups, servers):
+        for server in servers:
+            if has_group_id(server) and server_predicate(server):
+                group_id = group_id_from_metadata(server['metadata'])
+                if group_id is not None:
+                    servers_of_group = groups.get(group_id, pvector())
+                    groups = groups.set(
+                        group_id, servers_of_group.append(server))
+        return groups
 
-    return get_all_server_details(changes_since).on(servers_apply)
+    return fold_servers_details(
+        add_page, pmap(), _server_details_query(changes_since, batch_size)
+    ).on(lambda groups: {group_id: list(servers)
+                         for group_id, servers in groups.items()})
 
 
 def mark_deleted_servers(old, new):
@@ -123,30 +385,93 @@ def server_of_group(group_id, server):
     return group_id_from_metadata(server.get('metadata', {})) == group_id
 
 
+def merge_changed_servers(old, changed):
+    """
+    Given cached servers and servers changed since the cache was last updated,
+    return a list of all servers. The changed servers replace the cached ones
+    with the same ID. Nova returns deleted servers in a changes-since listing
+    with a status of DELETED but possibly without their metadata, so a
+    deleted server replaces its cached entry as that entry marked DELETED.
+
+    :param list old: List of cached servers
+    :param list changed: List of servers changed since the cache was updated
+    :return: List of updated servers
+    """
+    old = {s['id']: s for s in old}
+    new = {}
+    for server in changed:
+        sid = server['id']
+        if server.get('status') == 'DELETED' and sid in old:
+            server = assoc(old[sid], "status", "DELETED")
+        new[sid] = server
+    return merge(old, new).values()
+
+
+def _full_resync_due(group_id, last_update, now, interval):
+    """
+    Is a full listing of servers due for the given group? This is the case
+    when the period of ``interval`` seconds in which the cache was last updated
+    has ended. The periods are offset by a stable hash of the group ID so that
+    groups of the same tenant don't all resync in the same iteration.
+    """
+    offset = int(sha1(group_id).hexdigest(), 16) % interval
+
+    def period(dt):
+        return (datetime_to_epoch(dt) + offset) // interval
+
+    return period(now) != period(last_update)
+
+
 @do
 def get_scaling_group_servers(tenant_id, group_id, now,
                               all_as_servers=get_all_scaling_group_servers,
                               all_servers=get_all_server_details,
-                              cache_class=CassScalingGroupServersCache):
+                              cache_class=get_servers_cache,
+                              full_resync_interval=600,
+                              changes_since_margin=300):
     """
     Get a group's servers taken from cache if it exists. Updates cache
     if it is empty from newly fetched servers
+
+    If the cache exists, only the servers that changed since it was last
+    updated are fetched from Nova and merged into the cached servers. A full
+    listing is done instead every ``full_resync_interval`` seconds to catch up
+    on anything that a ``changes-since`` listing can miss.
+
     # NOTE: This function takes tenant_id even though the whole effect is
     # scoped on the tenant because cache calls require tenant_id. Should
     # they also not take tenant_id and work on the scope?
 
-    :return: Servers as list of dicts
+    :param int full_resync_interval: Number of seconds between full listings
+        of the tenant's servers when the cache exists
+    :param int changes_since_margin: Number of seconds before cache's last
+        update time to get changes since. This accounts for clock skew with
+        Nova and for the cache being updated after the servers were fetched
+
+    :return: Effect of (servers as list of dicts, ``bool`` of whether all
+        the tenant's servers were listed instead of only the changed ones)
     :rtype: Effect
     """
     cache = cache_class(tenant_id, group_id)
     cached_servers, last_update = yield cache.get_servers(False)
     if last_update is None:
+        yield msg('gather-servers', fetch='initial')
         servers = (yield all_as_servers()).get(group_id, [])
-    else:
+        listed_all = True
+    elif _full_resync_due(group_id, last_update, now, full_resync_interval):
+        yield msg('gather-servers', fetch='full')
         current = yield all_servers()
         servers = mark_deleted_servers(cached_servers, current)
         servers = list(filter(server_of_group(group_id), servers))
-    yield do_return(servers)
+        listed_all = True
+    else:
+        yield msg('gather-servers', fetch='delta')
+        changed = yield all_servers(
+            last_update - timedelta(seconds=changes_since_margin))
+        servers = merge_changed_servers(cached_servers, changed)
+        servers = list(filter(server_of_group(group_id), servers))
+        listed_all = False
+    yield do_return((servers, listed_all))
 
 
 def get_all_stacks(stack_tag=None):
@@ -163,12 +488,16 @@ def get_scaling_group_stacks(group_id, get_all_stacks=get_all_stacks):
 
 
 @do
-def get_clb_contents():
+def get_clb_contents(lb_ids=None):
     """
     Get Rackspace Cloud Load Balancer contents as list of `CLBNode`. CLB
     health monitor information is also returned as a pmap of :obj:`CLB` objects
     mapped on LB ID.
 
+    :param lb_ids: Sequence of IDs of load balancers to get contents of. All
+        the load balancers of the tenant are listed and fetched if this is
+        None.
+
     :return: Effect of (``list`` of :obj:`CLBNode`, `pmap` of :obj:`CLB`)
     :rtype: :obj:`Effect`
     """
@@ -182,7 +511,8 @@ def get_clb_contents():
     def gone(r):
         return catch(CLBNotFoundError, lambda exc: r)
 
-    lb_ids = [lb['id'] for lb in (yield _retry(get_clbs()))]
+    if lb_ids is None:
+        lb_ids = [lb['id'] for lb in (yield _retry(get_clbs()))]
     node_reqs = [_retry(get_clb_nodes(lb_id).on(error=gone([])))
                  for lb_id in lb_ids]
     healthmon_reqs = [
@@ -199,30 +529,50 @@ def get_clb_contents():
         for lb_id, health_mon in zip(lb_ids, hms) if health_mon is not None}
     draining = [n for n in concat(lb_nodes.values())
                 if n.description.condition == CLBNodeCondition.DRAINING]
+    # Feeds of nodes whose drained-at time was found earlier are not read
+    cached = yield Effect(
+        GetCachedDrainedAt([_node_key(n) for n in draining]))
+    to_fetch = [n for n in draining if _node_key(n) not in cached]
     feeds = yield parallel(
         [_retry(get_clb_node_feed(n.description.lb_id, n.node_id).on(
             error=gone(None)))
-         for n in draining]
+         for n in to_fetch]
     )
-    nodes_to_feeds = dict(zip(draining, feeds))
+    nodes_to_feeds = dict(zip(to_fetch, feeds))
     deleted_lbs = set([
         node.description.lb_id
         for (node, feed) in nodes_to_feeds.items() if feed is None])
 
+    # Drained-at times extracted from the feeds read
+    found = {}
+
     def update_drained_at(node):
         feed = nodes_to_feeds.get(node)
         if node.description.lb_id in deleted_lbs:
             return None
         if feed is not None:
-            node.drained_at = extract_clb_drained_at(feed)
+            node.drained_at = drained_at = extract_clb_drained_at(feed)
+            if drained_at is not None:
+                found[_node_key(node)] = drained_at
+        elif _node_key(node) in cached:
+            node.drained_at = cached[_node_key(node)]
         return node
 
-    nodes = map(update_drained_at, concat(lb_nodes.values()))
+    nodes = list(filter(bool, map(update_drained_at,
+                                  concat(lb_nodes.values()))))
+    yield Effect(UpdateCachedDrainedAt(
+        found=found,
+        undrained=[_node_key(n) for n in nodes
+                   if n.description.condition != CLBNodeCondition.DRAINING]))
     yield do_return((
-        list(filter(bool, nodes)),
+        nodes,
         pmap(keyfilter(lambda k: k not in deleted_lbs, clbs))))
 
 
+def _node_key(node):
+    return (node.description.lb_id, node.node_id)
+
+
 _DRAINING_CREATED_RE = (
     "^Node successfully created with address: '.+', port: '\d+', "
     "condition: 'DRAINING', weight: '\d+'$")
@@ -281,29 +631,61 @@ def get_rcv3_contents():
         error=catch(NoSuchEndpoint, lambda _: []))
 
 
+def servers_clb_ids(servers, launch_config):
+    """
+    Get IDs of CLBs that servers are supposed to be in as per their metadata
+    and the CLBs in group's launch config. Since the metadata of a server is
+    set from group's launch config when creating it, these are the CLBs that
+    convergence of the group will add servers to or remove them from.
+
+    :param servers: Sequence of :obj:`NovaServer`
+    :param dict launch_config: Group's launch config
+    :return: sorted ``list`` of LB IDs
+    """
+    descs = concat(
+        [json_to_LBConfigs(launch_config['args'].get('loadBalancers', []))] +
+        [server.desired_lbs for server in servers])
+    return sorted(set(
+        desc.lb_id for desc in descs if isinstance(desc, CLBDescription)))
+
+
+@do
 def get_all_launch_server_data(
         tenant_id,
         group_id,
         now,
+        launch_config,
         get_scaling_group_servers=get_scaling_group_servers,
         get_clb_contents=get_clb_contents,
         get_rcv3_contents=get_rcv3_contents):
     """
-    Gather all launch_server data relevant for convergence w.r.t given time,
-    in parallel where possible.
+    Gather all launch_server data relevant for convergence w.r.t given time.
+    Servers are gathered first and then only the CLBs they or the launch
+    config reference are fetched along with RCv3 contents. All the CLBs are
+    fetched instead whenever all the tenant's servers are listed, so that
+    nodes left on CLBs no longer referenced are eventually cleaned up. Load
+    balancer contents are shared with other groups of the tenant via
+    :func:`shared_gather`.
 
     Returns an Effect of {'servers': [NovaServer], 'lb_nodes': [LBNode],
                           'lbs': pmap(LB_ID -> CLB)}.
     """
-    return parallel(
-        [get_scaling_group_servers(tenant_id, group_id, now)
-         .on(map(NovaServer.from_server_details_json)).on(list),
-         get_clb_contents(),
-         get_rcv3_contents()]
-    ).on(lambda (servers, clb_nodes_and_clbs, rcv3_nodes): {
+    servers, listed_all = yield get_scaling_group_servers(
+        tenant_id, group_id, now)
+    servers = list(map(NovaServer.from_server_details_json, servers))
+    if listed_all:
+        lb_ids, key = None, ('all',)
+    else:
+        lb_ids = key = servers_clb_ids(servers, launch_config)
+    (clb_nodes, clbs), rcv3_nodes = yield parallel(
+        [shared_gather(tenant_id, 'clb', get_clb_contents(lb_ids),
+                       key=key, group_id=group_id),
+         shared_gather(tenant_id, 'rcv3', get_rcv3_contents(),
+                       group_id=group_id)])
+    yield do_return({
         'servers': servers,
-        'lb_nodes': clb_nodes_and_clbs[0] + rcv3_nodes,
-        'lbs': clb_nodes_and_clbs[1]
+        'lb_nodes': clb_nodes + rcv3_nodes,
+        'lbs': clbs
     })
 
 
@@ -311,9 +693,11 @@ def get_all_launch_stack_data(
         tenant_id,
         group_id,
         now,
+        launch_config,
         get_scaling_group_stacks=get_scaling_group_stacks):
     """
-    Gather all launch_stack data relevant for convergence w.r.t given time
+    Gather all launch_stack data relevant for convergence w.r.t given time.
+    ``launch_config`` is not needed to gather stacks.
 
     Returns an Effect of {'stacks': [HeatStack]}.
     """
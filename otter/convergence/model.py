@@ -721,3 +721,41 @@ class RCv3Node(object):
         """
         return (isinstance(server, NovaServer) and
                 server.id == self.cloud_server_id)
+
+
+class LBNodeIndex(object):
+    """
+    Index of :obj:`ILBNode` providers to find the nodes matching a server
+    without scanning every node on the tenant. :obj:`CLBNode` instances are
+    indexed on their address and :obj:`RCv3Node` instances on their cloud
+    server ID. Nodes of any other type are checked against every server.
+
+    :param lb_nodes: sequence of :obj:`ILBNode` providers
+    """
+    def __init__(self, lb_nodes):
+        self._by_address = {}
+        self._by_server_id = {}
+        self._others = []
+        for i, node in enumerate(lb_nodes):
+            if isinstance(node, CLBNode):
+                self._by_address.setdefault(node.address, []).append((i, node))
+            elif isinstance(node, RCv3Node):
+                self._by_server_id.setdefault(
+                    node.cloud_server_id, []).append((i, node))
+            else:
+                self._others.append((i, node))
+
+    def matching(self, server):
+        """
+        Return nodes matching given server, in the order in which they were
+        given to the index.
+
+        :param server: :obj:`NovaServer` to match
+        :return: ``list`` of :obj:`ILBNode` providers
+        """
+        candidates = (
+            self._by_address.get(server.servicenet_address, []) +
+            self._by_server_id.get(server.id, []) +
+            self._others)
+        return [node for _, node in sorted(candidates, key=lambda c: c[0])
+                if node.matches(server)]
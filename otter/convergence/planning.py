@@ -79,6 +79,7 @@ from otter.convergence.model import (
     DrainingUnavailable,
     ErrorReason,
     IDrainable,
+    LBNodeIndex,
     RCv3Description,
     RCv3Node,
     ServerState,
@@ -396,12 +397,17 @@ def converge_launch_server(desired_state, servers_with_cheese,
         servers[Destiny.WAIT] +
         waiting_for_build)
     servers_to_delete = servers_in_preferred_order[desired_state.capacity:]
+    ids_to_delete = set(server.id for server in servers_to_delete)
+
+    # Built once per plan so that finding nodes of a server does not require
+    # scanning all the nodes on the tenant
+    lb_nodes_index = LBNodeIndex(load_balancer_nodes)
 
     def drain_and_delete_a_server(server):
         return _drain_and_delete(
             server,
             desired_state.draining_timeout,
-            [node for node in load_balancer_nodes if node.matches(server)],
+            lb_nodes_index.matching(server),
             now)
 
     try:
@@ -421,10 +427,10 @@ def converge_launch_server(desired_state, servers_with_cheese,
     cleanup_errored_and_deleted_steps = [
         remove_node_from_lb(lb_node)
         for server in servers[Destiny.DELETE] + servers[Destiny.CLEANUP]
-        for lb_node in load_balancer_nodes if lb_node.matches(server)]
+        for lb_node in lb_nodes_index.matching(server)]
 
     # converge all the servers that remain to their desired load balancer state
-    still_active_servers = filter(lambda s: s not in servers_to_delete,
+    still_active_servers = filter(lambda s: s.id not in ids_to_delete,
                                   servers_in_active)
     try:
         lb_converge_steps = [
@@ -432,7 +438,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
             for server in still_active_servers
             for step in _converge_lb_state(
                 server,
-                [node for node in load_balancer_nodes if node.matches(server)],
+                lb_nodes_index.matching(server),
                 load_balancers,
                 now,
                 # Temporarily using build timeout as node offline timeout.
@@ -444,7 +450,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
 
     # Converge again if we expect state transitions on any servers
     converge_later = []
-    if any((s not in servers_to_delete
+    if any((s.id not in ids_to_delete
             for s in waiting_for_build)):
         converge_later = [
             ConvergeLater(reasons=[ErrorReason.String('waiting for servers')])]
@@ -453,7 +459,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
                    'from {status}')
     reasons = [ErrorReason.UserMessage(unavail_fmt.format(server_id=s.id,
                                                           status=s.state.name))
-               for s in servers[Destiny.WAIT] if s not in servers_to_delete]
+               for s in servers[Destiny.WAIT] if s.id not in ids_to_delete]
     if reasons:
         converge_later.append(ConvergeLater(limited=True, reasons=reasons))
 
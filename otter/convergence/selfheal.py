@@ -2,6 +2,11 @@
 Self heal service. It continously triggers convergence on all groups by equally
 distributing the triggering over a period of time in effect "heal"ing the
 groups.
+
+By default all groups are fetched at once and a call is scheduled for each of
+them. In paced mode groups are instead streamed page by page and a single loop
+triggers them one after another at a pace that spreads them over most of the
+period.
 """
 
 import attr
@@ -11,8 +16,9 @@ from effect.do import do
 
 from toolz.curried import filter
 
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, succeed
 from twisted.internet.interfaces import IReactorTime
+from twisted.internet.task import deferLater
 
 from txeffect import perform
 
@@ -20,10 +26,16 @@ from otter.convergence.composition import tenant_is_enabled
 from otter.convergence.service import trigger_convergence
 from otter.log import BoundLog
 from otter.log.intents import msg, with_log
-from otter.models.intents import GetAllValidGroups, GetScalingGroupInfo
+from otter.models.intents import (
+    GetAllValidGroups, GetScalingGroupInfo, GetValidGroupsPage)
 from otter.models.interface import NoSuchScalingGroupError, ScalingGroupStatus
 
 
+# Fraction of time range over which a paced cycle spreads the groups it
+# expects to trigger, leaving room for more groups than expected
+PACE_FRACTION = 0.9
+
+
 @attr.s
 class SelfHeal(object):
     """
@@ -40,8 +52,19 @@ class SelfHeal(object):
     :ivar float time_range: Seconds over which convergence triggerring will be
         spread evenly
     :ivar log: :obj:`BoundLog` object used to log messages
+    :ivar bool paced: Stream groups and trigger them from a single paced loop
+        instead of scheduling a call for every group
+    :ivar int page_size: Number of groups fetched at a time when paced
+    :ivar float max_row_age: Maximum seconds a fetched group's row is used to
+        decide whether to trigger it when paced. Pages are made small enough
+        to be triggered within this time
     :ivar list _calls: List of :obj:`IDelayedCall` objects. Each object
         represents scheduled call to trigger convergence on a group
+    :ivar int _estimate: Number of groups triggered in last paced cycle used
+        to pace the next one. None if no cycle has finished yet.
+    :ivar bool _cycling: Is a paced cycle running?
+    :ivar bool _next_cycle: Should a paced cycle be started as soon as the
+        running one finishes?
     """
 
     clock = attr.ib(validator=attr.validators.provides(IReactorTime))
@@ -55,15 +78,114 @@ class SelfHeal(object):
         validator=attr.validators.instance_of(BoundLog),
         convert=lambda l: l.bind(otter_service="selfheal"),
         cmp=False)
+    paced = attr.ib(default=False)
+    page_size = attr.ib(default=100)
+    max_row_age = attr.ib(default=30.0)
     _calls = attr.ib(default=attr.Factory(list))
+    _estimate = attr.ib(default=None)
+    _cycling = attr.ib(default=False)
+    _next_cycle = attr.ib(default=False)
 
     def setup(self):
         """
         Setup convergencence triggerring and capture any error occurred
         """
+        if self.paced:
+            self._start_cycle()
+            return succeed(None)
         d = self._setup_convergences()
         return d.addErrback(self.log.err, "selfheal-setup-err")
 
+    def _start_cycle(self):
+        """
+        Start paced cycle. If the previous one is still running, the cycle is
+        started as soon as it finishes instead. The returned Deferred is not
+        waited on to not delay stopping the service by a whole cycle.
+        """
+        if self._cycling:
+            self.log.msg("selfheal-cycle-running")
+            self._next_cycle = True
+            return
+        self._cycling = True
+        d = self._heal_cycle()
+        d.addErrback(self.log.err, "selfheal-setup-err")
+        d.addBoth(self._cycle_done)
+
+    def _cycle_done(self, _):
+        """
+        Called when paced cycle has finished. Starts the next cycle if it was
+        due while this one was running.
+        """
+        self._cycling = False
+        if self._next_cycle:
+            self._next_cycle = False
+            self._start_cycle()
+
+    def _pacing(self):
+        """
+        Get seconds between triggering groups and page size of a paced cycle.
+        Groups are spread over :obj:`PACE_FRACTION` of time_range based on
+        number of groups triggered in previous cycle and pages are made small
+        enough to be triggered within max_row_age. The first cycle is not
+        paced since number of groups is not known yet.
+
+        :return: (spacing, page size) tuple
+        """
+        if self._estimate is None:
+            return 0, self.page_size
+        spacing = PACE_FRACTION * self.time_range / max(self._estimate, 1)
+        return spacing, int(max(1, min(self.page_size,
+                                       self.max_row_age / spacing)))
+
+    @inlineCallbacks
+    def _heal_cycle(self):
+        """
+        Stream groups and trigger convergence on the ones that can be
+        converged one after another at the pace given by :meth:`_pacing`.
+        Groups that cannot be converged are skipped without reading them
+        again.
+        """
+        start = last_report = self.clock.seconds()
+        spacing, page_size = self._pacing()
+        after, triggered, skipped = None, 0, 0
+        while True:
+            groups, after = yield perform(
+                self.dispatcher,
+                get_groups_page(self.config_func, after, page_size))
+            for group in groups:
+                if not can_converge(group):
+                    skipped += 1
+                    continue
+                delay = start + triggered * spacing - self.clock.seconds()
+                if delay > 0:
+                    yield deferLater(self.clock, delay, lambda: None)
+                yield self._trigger(group)
+                triggered += 1
+            now = self.clock.seconds()
+            if after is None:
+                break
+            if now - last_report >= self.time_range / 10:
+                last_report = now
+                self.log.msg("selfheal-progress", triggered=triggered,
+                             skipped=skipped, estimate=self._estimate,
+                             elapsed=now - start)
+        self.log.msg("selfheal-cycle-done", triggered=triggered,
+                     skipped=skipped, estimate=self._estimate,
+                     elapsed=now - start)
+        self._estimate = triggered
+
+    def _trigger(self, group):
+        """
+        Trigger convergence on group logging any error
+        """
+        tenant_id, group_id = group["tenantId"], group["groupId"]
+        d = perform(
+            self.dispatcher,
+            with_log(trigger_convergence(tenant_id, group_id, selfheal=True),
+                     tenant_id=tenant_id, scaling_group_id=group_id))
+        return d.addErrback(self.log.err, "selfheal-trigger-err",
+                            tenant_id=tenant_id, scaling_group_id=group_id)
+
     def _cancel_scheduled_calls(self):
         """
         Cancel any remaining scheduled calls.
@@ -106,12 +228,39 @@ def get_groups_to_converge(config_func):
     """
     Get all tenant's all groups that needs convergence triggering
     """
-    eff = Effect(GetAllValidGroups())
+    eff = Effect(GetAllValidGroups(props=["tenantId", "groupId"]))
     eff = eff.on(
         filter(lambda g: tenant_is_enabled(g["tenantId"], config_func)))
     return eff.on(list)
 
 
+def get_groups_page(config_func, after, limit):
+    """
+    Get page of valid groups of convergence enabled tenants with columns
+    needed by :func:`can_converge`
+
+    :return: (``list`` of group ``dict``, ``after`` of next page or None)
+        tuple
+    """
+    eff = Effect(GetValidGroupsPage(
+        props=["status", "paused", "suspended"], after=after, limit=limit))
+    return eff.on(
+        lambda (groups, after): (
+            [g for g in groups if tenant_is_enabled(g["tenantId"],
+                                                    config_func)],
+            after))
+
+
+def can_converge(group):
+    """
+    Can group whose scaling_group row is given be converged? Like
+    :func:`check_and_trigger`, only ACTIVE groups that are not paused or
+    suspended are converged. A row without status is an ACTIVE group.
+    """
+    return (group.get("status") in (None, "ACTIVE") and
+            not (group.get("paused") or group.get("suspended")))
+
+
 @do
 def check_and_trigger(tenant_id, group_id):
     """
@@ -129,5 +278,5 @@ def check_and_trigger(tenant_id, group_id):
         if (state.status == ScalingGroupStatus.ACTIVE and
                 not (state.paused or state.suspended)):
             yield with_log(
-                trigger_convergence(tenant_id, group_id),
+                trigger_convergence(tenant_id, group_id, selfheal=True),
                 tenant_id=tenant_id, scaling_group_id=group_id)
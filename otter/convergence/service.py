@@ -70,8 +70,9 @@ The top-level entry-points into this module are :func:`trigger_convergence` and
 # So instead of just a boolean flag, we'll take advantage of ZK node
 # versioning. When we mark a group as dirty, we'll create a node for it if it
 # doesn't exist, and if it does exist, we'll write to it with `set`. The
-# content doesn't matter - the only thing that does matter is the version,
-# which will be incremented on every `set` operation. On the converger side,
+# content only decides the priority of convergence (see `SELFHEAL_DIRTY`) -
+# the thing that matters is the version, which will be incremented on every
+# `set` operation. On the converger side,
 # when it searches for dirty groups to converge, it will remember the version
 # of the node. When convergence completes, it will delete the node ONLY if the
 # version hasn't changed, with a `delete(path, version)` call.
@@ -94,20 +95,24 @@ The top-level entry-points into this module are :func:`trigger_convergence` and
 # respective LBs. The cache stores multiple versions based on timestamp. See
 # `IScalingGroupServersCache`. Hence, each call to cache update is expected to
 # have higher timestamp which it mostly will since it is always called from
-# same node. The cache interface can be better.
+# same node. With "servers_cache.mode" config set to "delta", only the servers
+# that changed are written instead of a new version of all of them. The cache
+# interface can be better.
 # See https://github.com/rackerlabs/otter/issues/1966
 
 
 import operator
 import time
 import uuid
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime
 from functools import partial
 from hashlib import sha1
 
 import attr
 
-from effect import Constant, Effect, FirstError, Func, parallel
+from effect import (
+    Constant, Effect, FirstError, Func, TypeDispatcher, parallel)
 from effect.do import do, do_return
 from effect.ref import Reference
 
@@ -124,8 +129,9 @@ from sumtypes import match
 from toolz.functoolz import curry
 
 from twisted.application.service import MultiService
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
 
-from txeffect import exc_info_to_failure, perform
+from txeffect import deferred_performer, exc_info_to_failure, perform
 
 from otter.auth import NoSuchEndpoint
 from otter.cloud_client import TenantScope
@@ -134,15 +140,23 @@ from otter.convergence.composition import (get_desired_server_group_state,
                                            get_desired_stack_group_state)
 from otter.convergence.effecting import steps_to_effect
 from otter.convergence.errors import present_reasons, structure_reason
-from otter.convergence.gathering import (get_all_launch_server_data,
+from otter.convergence.gathering import (InvalidateSharedGather,
+                                         get_all_launch_server_data,
                                          get_all_launch_stack_data)
 from otter.convergence.logging import log_steps
 from otter.convergence.model import (
     ConvergenceIterationStatus,
     ErrorReason,
+    LBNodeIndex,
     ServerState,
     StepResult)
 from otter.convergence.planning import plan_launch_server, plan_launch_stack
+from otter.convergence.steps import (
+    AddNodesToCLB,
+    BulkAddToRCv3,
+    BulkRemoveFromRCv3,
+    ChangeCLBNode,
+    RemoveNodesFromCLB)
 from otter.convergence.transforming import get_step_limits_from_conf
 from otter.log.cloudfeeds import cf_err, cf_msg
 from otter.log.intents import err, msg, msg_with_time, with_log
@@ -151,7 +165,7 @@ from otter.models.intents import (
     UpdateGroupErrorReasons, UpdateGroupStatus, UpdateServersCache)
 from otter.models.interface import NoSuchScalingGroupError, ScalingGroupStatus
 from otter.util.timestamp import datetime_to_epoch
-from otter.util.zk import CreateOrSet, DeleteNode, GetChildren, GetStat
+from otter.util.zk import CreateOrSet, DeleteNode, GetChildren, GetData
 
 
 def get_executor(launch_config):
@@ -213,9 +227,10 @@ def update_servers_cache(group, now, servers, lb_nodes, lbs,
     :param include_deleted: Include deleted servers in cache. Defaults to True.
     """
     server_dicts = []
+    lb_nodes_index = LBNodeIndex(lb_nodes)
     for server in servers:
         sd = thaw(server.json)
-        if is_autoscale_active(server, lb_nodes):
+        if is_autoscale_active(server, lb_nodes_index.matching(server)):
             sd["_is_as_active"] = True
         if server.state != ServerState.DELETED or include_deleted:
             server_dicts.append(sd)
@@ -224,6 +239,11 @@ def update_servers_cache(group, now, servers, lb_nodes, lbs,
         UpdateServersCache(group.tenant_id, group.uuid, now, server_dicts))
 
 
+# Steps changing load balancer contents shared by :func:`shared_gather`
+_LB_STEPS = (AddNodesToCLB, RemoveNodesFromCLB, ChangeCLBNode, BulkAddToRCv3,
+             BulkRemoveFromRCv3)
+
+
 @do
 def _execute_steps(steps):
     """
@@ -275,7 +295,7 @@ def convergence_exec_data(tenant_id, group_id, now, get_executor):
 
     executor = get_executor(launch_config)
 
-    resources = yield executor.gather(tenant_id, group_id, now)
+    resources = yield executor.gather(tenant_id, group_id, now, launch_config)
 
     if group_state.status == ScalingGroupStatus.DELETING:
         desired_capacity = 0
@@ -355,6 +375,9 @@ def execute_convergence(tenant_id, group_id, build_timeout, waiting,
               steps=steps, now=now_dt, desired=desired_group_state,
               **resources)
     worst_status, reasons = yield _execute_steps(steps)
+    if any(isinstance(step, _LB_STEPS) for step in steps):
+        # Next iteration should see the changed LB nodes
+        yield Effect(InvalidateSharedGather((tenant_id, group_id)))
 
     if worst_status != StepResult.LIMITED_RETRY:
         # If we're not waiting any more, there's no point in keeping track of
@@ -453,7 +476,17 @@ def parse_dirty_flag(flag):
     return flag.split('_', 1)
 
 
-def mark_divergent(tenant_id, group_id):
+DIRTY = 'dirty'
+"""Content of divergent flag set when convergence is requested by user"""
+
+SELFHEAL_DIRTY = 'selfheal'
+"""
+Content of divergent flag set by selfheal. Groups marked divergent by selfheal
+are converged after the ones marked divergent by users.
+"""
+
+
+def mark_divergent(tenant_id, group_id, content=DIRTY):
     """
     Indicate that a group should be converged.
 
@@ -462,6 +495,8 @@ def mark_divergent(tenant_id, group_id):
 
     :param tenant_id: tenant ID that owns the group.
     :param group_id: ID of the group to converge.
+    :param str content: Content of the divergent flag. One of :obj:`DIRTY`
+        or :obj:`SELFHEAL_DIRTY`
 
     :return: an Effect which succeeds when the information has been
         recorded.
@@ -469,7 +504,7 @@ def mark_divergent(tenant_id, group_id):
     # See note [Divergent flags]
     flag = format_dirty_flag(tenant_id, group_id)
     path = CONVERGENCE_DIRTY_DIR + '/' + flag
-    eff = Effect(CreateOrSet(path=path, content='dirty'))
+    eff = Effect(CreateOrSet(path=path, content=content))
     return eff
 
 
@@ -508,11 +543,15 @@ def log_and_raise(msg, exc_info):
     return eff.on(lambda _: six.reraise(*exc_info))
 
 
-def trigger_convergence(tenant_id, group_id):
+def trigger_convergence(tenant_id, group_id, selfheal=False):
     """
     Trigger convergence on a scaling group
+
+    :param bool selfheal: Is this triggered by selfheal? Such convergences
+        are given lower priority.
     """
-    eff = mark_divergent(tenant_id, group_id)
+    eff = mark_divergent(tenant_id, group_id,
+                         SELFHEAL_DIRTY if selfheal else DIRTY)
     return eff.on(success=lambda _: msg("mark-dirty-success"),
                   error=log_and_raise("mark-dirty-failure"))
 
@@ -546,6 +585,159 @@ def non_concurrently(locks, key, eff):
     yield do_return(result)
 
 
+@attr.s
+class LimitedConvergence(object):
+    """
+    Intent to perform a group's convergence when allowed by
+    :obj:`ConvergenceLimiter`.
+
+    :ivar bool low_priority: Should the convergence be started only after
+        all other waiting convergences of normal priority?
+    :ivar effect: Effect converging the group
+    """
+    tenant_id = attr.ib()
+    group_id = attr.ib()
+    low_priority = attr.ib()
+    effect = attr.ib()
+
+
+class ConvergenceLimiter(object):
+    """
+    Limits number of group convergences running at a time, both overall and
+    per tenant. Waiting convergences are started in order of priority and,
+    within a priority, round-robin across tenants (the tenant served least
+    recently goes first) so that a tenant with many divergent groups does not
+    hold up other tenants.
+
+    A group waits at most once; another request to converge it while it
+    is waiting is dropped.
+    """
+
+    def __init__(self, clock, limit, tenant_limit):
+        """
+        :param clock: :obj:`IReactorTime` provider
+        :param int limit: Maximum number of convergences running at a time
+        :param int tenant_limit: Maximum number of convergences of a tenant
+            running at a time
+        """
+        self.clock = clock
+        self.limit = limit
+        self.tenant_limit = tenant_limit
+        # [normal, low] priority queues, each an ordered mapping of
+        # tenant ID -> deque of waiting convergences of that tenant
+        self._queues = [OrderedDict(), OrderedDict()]
+        self._waiting = set()
+        self._running = defaultdict(int)
+        self._num_running = 0
+        self._last_served = {}
+        self._num_served = 0
+        self._starting = False
+
+    @property
+    def queue_depth(self):
+        """Number of convergences waiting to be started"""
+        return len(self._waiting)
+
+    def run(self, tenant_id, group_id, low_priority, f):
+        """
+        Call ``f`` when allowed.
+
+        :param callable f: Function of (seconds waited, queue depth) that
+            returns a Deferred
+
+        :return: Deferred fired with result of ``f`` or None if group is
+            already waiting
+        """
+        if group_id in self._waiting:
+            return succeed(None)
+        d = Deferred()
+        queue = self._queues[1 if low_priority else 0]
+        queue.setdefault(tenant_id, deque()).append(
+            (group_id, self.clock.seconds(), f, d))
+        self._waiting.add(group_id)
+        self._start_waiting()
+        return d
+
+    def _next(self):
+        for queue in self._queues:
+            tenants = [tenant_id for tenant_id in queue
+                       if self._running.get(tenant_id, 0) < self.tenant_limit]
+            if tenants:
+                # Tenant served least recently goes first
+                tenant_id = min(tenants,
+                                key=lambda t: self._last_served.get(t, -1))
+                convergences = queue[tenant_id]
+                convergence = convergences.popleft()
+                if not convergences:
+                    del queue[tenant_id]
+                self._num_served += 1
+                self._last_served[tenant_id] = self._num_served
+                return tenant_id, convergence
+        return None
+
+    def _start_waiting(self):
+        # Convergences finishing synchronously call this again while we are
+        # starting them. The loop below will pick up from where they left.
+        if self._starting:
+            return
+        self._starting = True
+        try:
+            while self._num_running < self.limit:
+                next_ = self._next()
+                if next_ is None:
+                    return
+                tenant_id, (group_id, queued_at, f, d) = next_
+                self._waiting.remove(group_id)
+                self._running[tenant_id] += 1
+                self._num_running += 1
+                waited = self.clock.seconds() - queued_at
+                fd = maybeDeferred(f, waited, self.queue_depth)
+                fd.addBoth(self._finished, tenant_id)
+                fd.chainDeferred(d)
+        finally:
+            self._starting = False
+
+    def _finished(self, result, tenant_id):
+        self._num_running -= 1
+        self._running[tenant_id] -= 1
+        if self._running[tenant_id] == 0:
+            del self._running[tenant_id]
+            if not any(tenant_id in queue for queue in self._queues):
+                # Forget idle tenant so that this does not grow forever.
+                # It will be served before others when it converges again
+                # like any new tenant.
+                self._last_served.pop(tenant_id, None)
+        self._start_waiting()
+        return result
+
+
+@deferred_performer
+def perform_limited_convergence(limiter, dispatcher, intent):
+    """
+    Perform :obj:`LimitedConvergence` using :obj:`ConvergenceLimiter`.
+    Must be partialed with ``limiter``.
+    """
+    def start(waited, queue_depth):
+        eff = msg('converge-queue-wait', wait_time=waited,
+                  queue_depth=queue_depth)
+        return perform(dispatcher, eff.on(lambda _: intent.effect))
+
+    return limiter.run(intent.tenant_id, intent.group_id,
+                       intent.low_priority, start)
+
+
+def get_convergence_limiter_dispatcher(clock, limit, tenant_limit):
+    """
+    Get dispatcher with performer of :obj:`LimitedConvergence` that uses a
+    new :obj:`ConvergenceLimiter`
+    """
+    return TypeDispatcher({
+        LimitedConvergence: partial(
+            perform_limited_convergence,
+            ConvergenceLimiter(clock, limit, tenant_limit))
+    })
+
+
 def get_my_divergent_groups(my_buckets, all_buckets, divergent_flags):
     """
     Given a list of dirty-flags, filter out the ones that aren't associated
@@ -687,22 +879,25 @@ def converge_all_groups(
 
     @do
     def converge(tenant_id, group_id, dirty_flag):
-        stat = yield Effect(GetStat(dirty_flag))
-        # If the node disappeared, ignore it. `stat` will be None here if the
+        flag = yield Effect(GetData(dirty_flag))
+        # If the node disappeared, ignore it. `flag` will be None here if the
         # divergent flag was discovered only after the group is removed from
         # currently_converging, but before the divergent flag is deleted, and
-        # then the deletion happens, and then our GetStat happens. This
+        # then the deletion happens, and then our GetData happens. This
         # basically means it happens when one convergence is starting as
         # another one for the same group is ending.
-        if stat is None:
+        if flag is None:
             yield msg('converge-divergent-flag-disappeared', znode=dirty_flag)
         else:
+            content, stat = flag
             eff = converge_one_group(currently_converging, recently_converged,
                                      waiting,
                                      tenant_id, group_id,
                                      stat.version, build_timeout,
                                      limited_retry_iterations, step_limits)
-            result = yield Effect(TenantScope(eff, tenant_id))
+            result = yield Effect(LimitedConvergence(
+                tenant_id, group_id, content == SELFHEAL_DIRTY,
+                Effect(TenantScope(eff, tenant_id))))
             yield do_return(result)
 
     recent_groups = yield get_recently_converged_groups(recently_converged,
@@ -54,7 +54,7 @@ def get_full_dispatcher(reactor, authenticator, log, service_configs,
     """
     return ComposedDispatcher([
         get_legacy_dispatcher(reactor, authenticator, log, service_configs),
-        get_zk_dispatcher(kz_client),
+        get_zk_dispatcher(kz_client, reactor),
         get_model_dispatcher(log, store),
         get_eviction_dispatcher(supervisor),
         get_msg_time_dispatcher(reactor),
@@ -2,7 +2,8 @@
 Package for all otter specific logging functionality.
 """
 
-from otter.log.setup import observer_factory, observer_factory_debug
+from otter.log.setup import (
+    observer_factory, observer_factory_debug, observer_factory_queued)
 from otter.log.bound import BoundLog
 from twisted.python.log import msg, err
 
@@ -21,4 +22,5 @@ def audit(log):
     return log.bind(audit_log=True)
 
 
-__all__ = ['observer_factory', 'observer_factory_debug', 'log']
+__all__ = ['observer_factory', 'observer_factory_debug',
+           'observer_factory_queued', 'log']
@@ -1,7 +1,9 @@
 """
 Publishing events to Cloud feeds
 """
+from collections import deque
 from copy import deepcopy
+from functools import partial
 
 from characteristic import attributes
 
@@ -9,6 +11,8 @@ from effect import Effect
 
 from toolz.dicttoolz import keyfilter
 
+from twisted.internet.defer import Deferred, succeed
+
 from txeffect import perform
 
 from otter.cloud_client import TenantScope
@@ -17,6 +21,7 @@ from otter.effect_dispatcher import get_legacy_dispatcher
 from otter.log import log as otter_log
 from otter.log.formatters import LogLevel
 from otter.log.intents import err as err_effect, msg as msg_effect
+from otter.util.deferredutils import TimedOutError, timeout_deferred
 from otter.util.http import APIError
 from otter.util.retry import (
     compose_retries,
@@ -172,17 +177,38 @@ def add_event(event, admin_tenant_id, region, log):
 
 
 @attributes(['reactor', 'authenticator', 'tenant_id', 'region',
-             'service_configs', 'log', 'get_disp', 'add_event'],
+             'service_configs', 'log', 'get_disp', 'add_event', 'max_queue',
+             'concurrency'],
             defaults={'log': otter_log, 'get_disp': get_legacy_dispatcher,
-                      'add_event': add_event})
+                      'add_event': add_event, 'max_queue': 1000,
+                      'concurrency': 10})
 class CloudFeedsObserver(object):
     """
-    Log observer that pushes events to cloud feeds
+    Log observer that pushes events to cloud feeds.
+
+    Events are queued and published by at most ``concurrency`` publishers
+    sharing one dispatcher, and hence its connection pool and throttling.
+    When ``max_queue`` events are already waiting, new events are dropped
+    and counted in ``dropped``. ``published`` and ``failed`` count the
+    events that were published or could not be published.
     """
 
+    def __init__(self):
+        self._queue = deque()
+        self._publishing = 0
+        self._draining = False
+        self._dispatcher = None
+        self._flushes = []
+        self._dropped_while_full = 0
+        self.published = self.failed = self.dropped = 0
+
     def __call__(self, event_dict):
         """
-        Process event and push it to Cloud feeds
+        Process event and queue it to be pushed to Cloud feeds
+
+        :return: Deferred fired when the event is published or fails to be
+            published, or None if event is not a cloud feed event or cannot
+            be pushed
         """
         if not event_dict.get('cloud_feed', False):
             return
@@ -198,8 +224,87 @@ class CloudFeedsObserver(object):
         except UnsuitableMessage as me:
             log.err(None, 'cf-unsuitable-message',
                     unsuitable_message=me.unsuitable_message)
-        else:
-            return perform(
-                self.get_disp(self.reactor, self.authenticator, log,
-                              self.service_configs),
-                eff).addErrback(log.err, 'cf-add-failure')
+            return
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            if not self._dropped_while_full:
+                log.msg('cf-queue-full', max_queue=self.max_queue)
+            self._dropped_while_full += 1
+            return succeed(None)
+        d = Deferred()
+        self._queue.append((eff, log, d))
+        self._drain()
+        return d
+
+    def _get_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = self.get_disp(
+                self.reactor, self.authenticator,
+                self.log.bind(system='otter.cloud_feed'),
+                self.service_configs)
+        return self._dispatcher
+
+    def _drain(self):
+        """
+        Start publishing queued events while there are free publishers
+        """
+        if self._draining:
+            # Called when an event is published synchronously inside the
+            # loop below which will pick up next event
+            return
+        self._draining = True
+        try:
+            while self._queue and self._publishing < self.concurrency:
+                eff, log, d = self._queue.popleft()
+                self._publishing += 1
+                pd = perform(self._get_dispatcher(), eff)
+                pd.addCallbacks(self._published, partial(self._failed, log))
+                pd.addBoth(self._publish_done, log)
+                pd.chainDeferred(d)
+        finally:
+            self._draining = False
+
+    def _published(self, result):
+        self.published += 1
+        return result
+
+    def _failed(self, log, failure):
+        self.failed += 1
+        log.err(failure, 'cf-add-failure')
+
+    def _publish_done(self, result, log):
+        self._publishing -= 1
+        self._drain()
+        if not self._queue and not self._publishing:
+            if self._dropped_while_full:
+                log.msg('cf-events-dropped', dropped=self._dropped_while_full)
+                self._dropped_while_full = 0
+            flushes, self._flushes = self._flushes, []
+            for d in flushes:
+                d.callback(None)
+        return result
+
+    def flush(self, timeout=None):
+        """
+        Wait for queued events to be published. This is meant to be called
+        on shutdown.
+
+        :param float timeout: Seconds after which to stop waiting and log
+            number of events not published yet
+        :return: Deferred fired with None
+        """
+        if not self._queue and not self._publishing:
+            return succeed(None)
+        d = Deferred()
+        self._flushes.append(d)
+        if timeout is not None:
+            timeout_deferred(d, timeout, self.reactor)
+
+            def timed_out(f):
+                f.trap(TimedOutError)
+                self._flushes.remove(d)
+                self.log.msg('cf-flush-timeout', system='otter.cloud_feed',
+                             pending=len(self._queue) + self._publishing)
+
+            d.addErrback(timed_out)
+        return d
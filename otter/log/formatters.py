@@ -2,7 +2,9 @@
 Composable log observers for use with Twisted's log module.
 """
 import json
+import threading
 import time
+from Queue import Full, Queue
 from datetime import datetime
 from uuid import uuid4
 
@@ -24,6 +26,20 @@ THROTTLED_MESSAGES = [
             'SELECT "tenantId", "groupId", "policyId", "trigger", '
             'cron, version FROM scaling_schedule_v2 '
             'WHERE bucket = :bucket AND trigger <= :now LIMIT :size;')}),
+    pmap({
+        'system': 'otter.silverberg',
+        'message': ('CQL query executed successfully',),
+        'query': (
+            'SELECT slice FROM scaling_schedule_slices '
+            'WHERE bucket = :bucket AND slice <= :now;')}),
+    pmap({
+        'system': 'otter.silverberg',
+        'message': ('CQL query executed successfully',),
+        'query': (
+            'SELECT "tenantId", "groupId", "policyId", "trigger", '
+            'cron, version FROM scaling_schedule_v3 '
+            'WHERE bucket = :bucket AND slice = :slice AND trigger <= :now '
+            'LIMIT :size;')}),
 ]
 
 THROTTLE_COUNT = 50
@@ -153,6 +169,101 @@ def StreamObserverWrapper(stream, delimiter='\n', buffered=False):
     return StreamObserver
 
 
+_STOP = object()
+
+
+class QueuedObserver(object):
+    """
+    An observer that puts events in a bounded queue and delegates them to
+    `observer` from a worker thread. This keeps expensive observers like
+    JSON serialization and stream writes off the reactor thread. Events are
+    dropped when the queue is full and the number dropped is added as
+    ``num_dropped_events`` to the next event that gets delegated. Similarly,
+    the number of errors raised by `observer` or `on_idle` since the last
+    successfully delegated event is added as ``num_observer_errors``.
+
+    Events should not be mutated after they are logged since they are
+    delegated later from another thread.
+    """
+    def __init__(self, observer, max_queue=10000, on_idle=None):
+        """
+        :param ILogObserver observer: The log observer to delegate to from the
+            worker thread.
+        :param int max_queue: Maximum number of events waiting to be delegated
+        :param callable on_idle: 0-argument callable called from the worker
+            thread whenever it has delegated all the queued events. Typically
+            flushes a buffered stream.
+        """
+        self.observer = observer
+        self.on_idle = on_idle
+        self.dropped = 0
+        self.errors = 0
+        self._queue = Queue(max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __call__(self, event_dict):
+        """
+        Queue the event or drop it if the queue is full
+        """
+        try:
+            self._queue.put_nowait(event_dict)
+        except Full:
+            with self._lock:
+                self.dropped += 1
+
+    def start(self):
+        """
+        Start the worker thread
+        """
+        self._thread = threading.Thread(
+            target=self._run, name='otter-log-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker thread after it delegates the events queued so far
+
+        :param float timeout: Seconds to wait for the queue to drain
+        """
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is _STOP:
+                self._idle()
+                return
+            with self._lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                event['num_dropped_events'] = dropped
+            if self.errors:
+                event['num_observer_errors'] = self.errors
+            try:
+                self.observer(event)
+                self.errors = 0
+            except Exception:
+                self.errors += 1
+            if self._queue.empty():
+                self._idle()
+
+    def _idle(self):
+        if self.on_idle is not None:
+            try:
+                self.on_idle()
+            except Exception:
+                self.errors += 1
+
+
 def SystemFilterWrapper(observer):
     """
     Normalize the system key in the eventDict to not leak strange
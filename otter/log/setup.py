@@ -1,6 +1,7 @@
 """
 Observer factories which will be used to configure twistd logging.
 """
+import atexit
 import socket
 import sys
 
@@ -9,6 +10,7 @@ from otter.log.formatters import (
     JSONObserverWrapper,
     ObserverWrapper,
     PEP3101FormattingWrapper,
+    QueuedObserver,
     StreamObserverWrapper,
     SystemFilterWrapper,
     add_to_fanout,
@@ -19,17 +21,30 @@ from otter.log.formatters import (
 from otter.log.spec import SpecificationObserverWrapper
 
 
-def make_observer_chain(ultimate_observer, indent):
+QUEUE_SIZE = 10000
+
+STOP_TIMEOUT = 5
+
+
+def make_observer_chain(ultimate_observer, indent, queued=False, flush=None):
     """
     Return our feature observers wrapped our the ultimate_observer
+
+    :param bool queued: Serialize and deliver events to `ultimate_observer`
+        from a worker thread instead of the calling thread
+    :param callable flush: Called from the worker thread when there are no
+        more queued events. Only used if `queued` is True.
     """
-    add_to_fanout(
-        ObserverWrapper(
-            JSONObserverWrapper(
-                ultimate_observer,
-                sort_keys=True,
-                indent=indent or None),
-            hostname=socket.gethostname()))
+    serializer = JSONObserverWrapper(
+        ultimate_observer,
+        sort_keys=True,
+        indent=indent or None)
+    if queued:
+        serializer = QueuedObserver(serializer, QUEUE_SIZE, on_idle=flush)
+        serializer.start()
+        atexit.register(serializer.stop, STOP_TIMEOUT)
+
+    add_to_fanout(ObserverWrapper(serializer, hostname=socket.gethostname()))
 
     return throttling_wrapper(
         SpecificationObserverWrapper(
@@ -52,3 +67,13 @@ def observer_factory_debug():
     Log pretty JSON formatted structures to sys.stdout.
     """
     return make_observer_chain(StreamObserverWrapper(sys.stdout), 2)
+
+
+def observer_factory_queued():
+    """
+    Log non-pretty JSON formatted structures to sys.stdout. The events are
+    serialized and written with buffering by a worker thread.
+    """
+    return make_observer_chain(
+        StreamObserverWrapper(sys.stdout, buffered=True), False,
+        queued=True, flush=sys.stdout.flush)
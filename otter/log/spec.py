@@ -3,14 +3,17 @@ Format logs based on specification
 """
 import json
 import math
+from collections import OrderedDict
 
 from toolz.curried import assoc
 from toolz.dicttoolz import keyfilter
 from toolz.functoolz import compose, curry
+from toolz.recipes import countby
 
 from twisted.python.failure import Failure
 
 from otter.log.formatters import LoggingEncoder
+from otter.util.config import config_value
 
 
 _json_len = compose(len, curry(json.dumps, cls=LoggingEncoder))
@@ -64,6 +67,98 @@ def split_execute_convergence(event, max_length=event_max_length):
     return events
 
 
+def _name(value):
+    return getattr(value, 'name', value)
+
+
+def _states_by_id(items):
+    """
+    Return mapping of ID to state name of items that have ``id`` and
+    ``state``
+    """
+    return {item.id: _name(item.state) for item in items
+            if hasattr(item, 'id') and hasattr(item, 'state')}
+
+
+def _ids_by_state(states):
+    by_state = {}
+    for _id, state in states.iteritems():
+        by_state.setdefault(state, []).append(_id)
+    return {state: sorted(ids) for state, ids in by_state.iteritems()}
+
+
+def _lb_id(node):
+    return getattr(getattr(node, 'description', None), 'lb_id', None)
+
+
+class ConvergenceSummarizer(object):
+    """
+    Format execute-convergence events compactly. Servers, LB nodes and steps
+    are replaced with counts, server IDs grouped by state and changes in
+    servers since the previous event of the same group. The full event is
+    logged (and split by :func:`split_execute_convergence`) only every
+    ``converger.full_log_every`` iterations of a group. Setting it to 1 always
+    logs the full event.
+
+    Previous servers are remembered for at most ``max_groups`` groups.
+    """
+
+    message = "Executing convergence"
+
+    def __init__(self, max_groups=10000, full_every=None):
+        """
+        :param int max_groups: Maximum number of groups to remember
+        :param callable full_every: 0-argument callable returning how often
+            full event is logged. Defaults to reading config.
+        """
+        self.max_groups = max_groups
+        self.full_every = full_every or (
+            lambda: config_value('converger.full_log_every'))
+        self._groups = OrderedDict()
+
+    def _remember(self, group_id, states):
+        iteration, previous = self._groups.pop(group_id, (0, None))
+        self._groups[group_id] = (iteration + 1, states)
+        if len(self._groups) > self.max_groups:
+            self._groups.popitem(last=False)
+        return iteration, previous
+
+    def __call__(self, event):
+        """
+        Return compact or full execute-convergence event
+
+        :return: `list` of (`dict`, `str`) like
+            :func:`split_execute_convergence`
+        """
+        servers = event.get('servers') or []
+        states = _states_by_id(servers)
+        iteration, previous = self._remember(
+            event.get('scaling_group_id'), states)
+        full_every = self.full_every()
+        if full_every and iteration % full_every == 0:
+            return split_execute_convergence(event)
+
+        lb_nodes = event.pop('lb_nodes', None) or []
+        steps = event.pop('steps', None) or []
+        event.pop('servers', None)
+        event.update(
+            num_servers=len(servers),
+            servers_by_state=_ids_by_state(states),
+            num_lb_nodes=len(lb_nodes),
+            lb_nodes_by_lb=countby(_lb_id, lb_nodes),
+            num_steps=len(steps),
+            steps_by_type=countby(lambda s: type(s).__name__, steps))
+        if previous is not None:
+            event['server_changes'] = {
+                'added': sorted(set(states) - set(previous)),
+                'removed': sorted(set(previous) - set(states)),
+                'changed': {
+                    _id: [previous[_id], state]
+                    for _id, state in states.iteritems()
+                    if _id in previous and previous[_id] != state}}
+        return [(event, self.message)]
+
+
 def split_list_servers(event, maxlength=event_max_length):
     """
     Split response_body in listing servers detail log such that each
@@ -146,7 +241,7 @@ msg_types = {
     "converge-non-fatal-error": (
         "Non-fatal error while converging group {scaling_group_id}"),
     "delete-server": "Deleting {server_id} server",
-    "execute-convergence": split_execute_convergence,
+    "execute-convergence": ConvergenceSummarizer(),
     "execute-convergence-results": (
         "Got result of {worst_status} after executing convergence"),
     "gather-convergence-data": (
@@ -183,6 +278,13 @@ msg_types = {
     "cf-unsuitable-message": (
         "Tried to add unsuitable message in cloud feeds: "
         "{unsuitable_message}"),
+    "cf-queue-full": (
+        "Cloud feeds queue has {max_queue} events. Dropping new events"),
+    "cf-events-dropped": (
+        "Dropped {dropped} cloud feeds events while queue was full"),
+    "cf-flush-timeout": (
+        "Timed out publishing cloud feeds events with {pending} events "
+        "not published"),
 
     # CF-published log messages
     "convergence-create-servers":
@@ -217,7 +319,16 @@ msg_types = {
         "SelfHeal service errored occurred when scheduling convergence"),
     "selfheal-calls-err": "SelfHeal service has {active} scheduled calls",
     "selfheal-lock-acquired": "SelfHeal service acquired lock",
-    "selfheal-group-deleted": "Group deleted when selfhealing"
+    "selfheal-group-deleted": "Group deleted when selfhealing",
+    "selfheal-cycle-running": (
+        "SelfHeal cycle still running when next one is due"),
+    "selfheal-progress": (
+        "SelfHeal triggered {triggered} of about {estimate} groups and "
+        "skipped {skipped} groups in {elapsed} seconds"),
+    "selfheal-cycle-done": (
+        "SelfHeal cycle triggered {triggered} groups and skipped {skipped} "
+        "groups in {elapsed} seconds"),
+    "selfheal-trigger-err": "SelfHeal failed to trigger convergence"
 }
 
 
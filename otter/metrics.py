@@ -268,7 +268,10 @@ def collect_metrics(reactor, config, log, client=None, authenticator=None,
                                 get_service_configs(config), store)
 
     # calculate metrics on launch_server and non-paused groups
-    groups = yield perform(dispatcher, Effect(GetAllValidGroups()))
+    groups = yield perform(
+        dispatcher,
+        Effect(GetAllValidGroups(
+            props=["launch_config", "paused", "status", "desired"])))
     groups = [
         g for g in groups
         if json.loads(g["launch_config"]).get("type") == "launch_server" and
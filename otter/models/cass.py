@@ -2,11 +2,15 @@
 Cassandra implementation of the store for the front-end scaling groups engine
 """
 
+import calendar
 import functools
 import json
 import time
 import uuid
-from datetime import datetime
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import datetime, timedelta
+from hashlib import sha1
 from itertools import cycle, takewhile
 
 from characteristic import attributes
@@ -18,7 +22,7 @@ from jsonschema import ValidationError
 
 from kazoo.protocol.states import KazooState
 
-from pyrsistent import freeze
+from pyrsistent import freeze, pvector
 
 from silverberg.client import ConsistencyLevel
 
@@ -53,7 +57,7 @@ from otter.models.interface import (
 from otter.util import timestamp, zk
 from otter.util.config import config_value
 from otter.util.cqlbatch import Batch, batch
-from otter.util.deferredutils import with_lock
+from otter.util.deferredutils import unwrap_first_error, with_lock
 from otter.util.hashkey import generate_capability, generate_key_str
 from otter.util.retry import repeating_interval, retry, retry_times
 from otter.util.weaklocks import WeakLocks
@@ -159,6 +163,15 @@ _cql_view_manifest = (
     '"policyTouched", paused, desired, created_at, status, error_reasons, '
     'deleting, suspended FROM {cf} '
     'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
+_cql_view_state_versions = (
+    'SELECT "tenantId", "groupId", active, pending, "groupTouched", '
+    '"policyTouched", paused, desired, created_at, status, error_reasons, '
+    'deleting, suspended, writetime(group_config), writetime(launch_config) '
+    'FROM {cf} WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
+_cql_view_versioned_configs = (
+    'SELECT group_config, launch_config, writetime(group_config), '
+    'writetime(launch_config) FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
 _cql_insert_policy = (
     'INSERT INTO {cf}("tenantId", "groupId", "policyId", data, version) '
     'VALUES (:tenantId, :groupId, :{name}policyId, :{name}data, '
@@ -195,6 +208,44 @@ _cql_delete_bucket_event = (
     'AND trigger = :{name}trigger AND "policyId" = :{name}policyId;')
 _cql_oldest_event = 'SELECT * from {cf} WHERE bucket=:bucket LIMIT 1;'
 
+# Events are stored in SLICED_EVENT_TABLE partitioned by bucket and time slice
+# when "scheduler.time_slice" config is set. EVENT_SLICES_TABLE keeps the
+# slices of each bucket that have events
+SLICED_EVENT_TABLE = "scaling_schedule_v3"
+EVENT_SLICES_TABLE = "scaling_schedule_slices"
+_cql_insert_sliced_group_event = (
+    'INSERT INTO {cf}(bucket, slice, "tenantId", "groupId", "policyId", '
+    'trigger, version) '
+    'VALUES (:{name}bucket, :{name}slice, :tenantId, :groupId, '
+    ':{name}policyId, :{name}trigger, :{name}version)')
+_cql_insert_sliced_group_event_with_cron = (
+    'INSERT INTO {cf}(bucket, slice, "tenantId", "groupId", "policyId", '
+    'trigger, cron, version) '
+    'VALUES (:{name}bucket, :{name}slice, :tenantId, :groupId, '
+    ':{name}policyId, :{name}trigger, :{name}cron, :{name}version)')
+_cql_insert_sliced_cron_event = (
+    'INSERT INTO {cf}(bucket, slice, "tenantId", "groupId", "policyId", '
+    'trigger, cron, version) '
+    'VALUES (:{name}bucket, :{name}slice, :{name}tenantId, :{name}groupId, '
+    ':{name}policyId, :{name}trigger, :{name}cron, :{name}version);')
+_cql_insert_event_slice = (
+    'INSERT INTO {cf}(bucket, slice) VALUES (:{name}bucket, :{name}slice);')
+_cql_fetch_event_slices = 'SELECT slice FROM {cf} WHERE bucket = :bucket;'
+_cql_fetch_due_event_slices = (
+    'SELECT slice FROM {cf} WHERE bucket = :bucket AND slice <= :now;')
+_cql_fetch_batch_of_sliced_events = (
+    'SELECT "tenantId", "groupId", "policyId", "trigger", cron, version '
+    'FROM {cf} '
+    'WHERE bucket = :bucket AND slice = :slice AND trigger <= :now '
+    'LIMIT :size;')
+_cql_delete_sliced_event = (
+    'DELETE FROM {cf} WHERE bucket = :bucket AND slice = :{name}slice '
+    'AND trigger = :{name}trigger AND "policyId" = :{name}policyId;')
+_cql_delete_event_slice = (
+    'DELETE FROM {cf} WHERE bucket = :bucket AND slice = :{name}slice;')
+_cql_oldest_sliced_event = (
+    'SELECT * FROM {cf} WHERE bucket = :bucket AND slice = :slice LIMIT 1;')
+
 _cql_insert_webhook = (
     'INSERT INTO {cf}("tenantId", "groupId", "policyId", "webhookId", data, '
     'capability, '
@@ -369,6 +420,63 @@ def _build_policies(policies, policies_table, event_table, queries, data,
     return outpolicies
 
 
+class ScheduleBuckets(object):
+    """
+    Round-robin iterator of buckets used to store scheduled events that also
+    tells observers about events added to the buckets.
+
+    :param buckets: Buckets to cycle through
+    :param list observers: Callables of (bucket, trigger) called by
+        :meth:`event_added`
+    """
+
+    def __init__(self, buckets, observers=None):
+        self._buckets = cycle(buckets)
+        self.observers = [] if observers is None else observers
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """
+        Return next bucket
+        """
+        return next(self._buckets)
+
+    def event_added(self, bucket, trigger):
+        """
+        Tell observers that event with given trigger time is added to bucket
+        """
+        for observer in self.observers:
+            observer(bucket, trigger)
+
+
+def _event_slice(trigger, time_slice):
+    """
+    Return start of the ``time_slice`` seconds long slice that ``trigger``
+    falls in as naive UTC datetime
+    """
+    seconds = calendar.timegm(trigger.utctimetuple())
+    return datetime.utcfromtimestamp(seconds - seconds % time_slice)
+
+
+def _add_event_query(query, sliced_query, event_table, queries, data, name):
+    """
+    Add query inserting event ``name`` whose values are in ``data`` to
+    ``queries``. If "scheduler.time_slice" config is set, the event is
+    inserted with ``sliced_query`` into its time slice partition and the slice
+    is recorded in the bucket's slices.
+    """
+    time_slice = config_value('scheduler.time_slice')
+    if time_slice:
+        data[name + 'slice'] = _event_slice(data[name + 'trigger'], time_slice)
+        queries.append(sliced_query.format(cf=SLICED_EVENT_TABLE, name=name))
+        queries.append(
+            _cql_insert_event_slice.format(cf=EVENT_SLICES_TABLE, name=name))
+    else:
+        queries.append(query.format(cf=event_table, name=name))
+
+
 def _build_schedule_policy(policy, event_table, queries, data, polname,
                            buckets):
     """
@@ -376,16 +484,19 @@ def _build_schedule_policy(policy, event_table, queries, data, polname,
     """
     data[polname + 'bucket'] = buckets.next()
     if 'at' in policy["args"]:
-        queries.append(_cql_insert_group_event
-                       .format(cf=event_table, name=polname))
         at_time = timestamp.from_timestamp(policy["args"]["at"])
         data[polname + "trigger"] = at_time
+        _add_event_query(_cql_insert_group_event,
+                         _cql_insert_sliced_group_event,
+                         event_table, queries, data, polname)
     elif 'cron' in policy["args"]:
-        queries.append(_cql_insert_group_event_with_cron
-                       .format(cf=event_table, name=polname))
         cron = policy["args"]["cron"]
         data[polname + "trigger"] = next_cron_occurrence(cron)
         data[polname + 'cron'] = cron
+        _add_event_query(_cql_insert_group_event_with_cron,
+                         _cql_insert_sliced_group_event_with_cron,
+                         event_table, queries, data, polname)
+    buckets.event_added(data[polname + 'bucket'], data[polname + 'trigger'])
 
 
 def _build_webhooks(bare_webhooks, webhooks_table, webhooks_keys_table,
@@ -477,6 +588,20 @@ def _jsonloads_data(raw_data):
     return data
 
 
+_valid_group_props = {'tenantId', 'groupId', 'created_at', 'desired',
+                      'deleting'}
+
+
+def _valid_group_row(row):
+    """
+    Is given scaling_group row a *valid* group, i.e. completely created and
+    not being deleted?
+    """
+    return (row.get('created_at') is not None and
+            row.get('desired') is not None and
+            not row.get('deleting', False))
+
+
 def _group_status(status, deleting):
     if deleting:
         return ScalingGroupStatus.DELETING
@@ -490,7 +615,9 @@ def _group_status(status, deleting):
             return ScalingGroupStatus.lookupByName(status)
 
 
-def _unmarshal_state(state_dict):
+def _unmarshal_state(state_dict, config=None):
+    if config is None:
+        config = _jsonloads_data(state_dict["group_config"])
     desired_capacity = state_dict['desired']
     if desired_capacity is None:
         desired_capacity = 0
@@ -500,7 +627,7 @@ def _unmarshal_state(state_dict):
 
     return GroupState(
         state_dict["tenantId"], state_dict["groupId"],
-        _jsonloads_data(state_dict["group_config"])["name"],
+        config["name"],
         _jsonloads_data(state_dict["active"]),
         _jsonloads_data(state_dict["pending"]),
         state_dict["groupTouched"],
@@ -646,9 +773,15 @@ class CassScalingGroup(object):
 
     """
     def __init__(self, log, tenant_id, uuid, connection, buckets, kz_client,
-                 reactor, local_locks, dispatcher):
+                 reactor, local_locks, dispatcher, webhook_cache=None,
+                 manifest_cache=None):
         """
         Creates a CassScalingGroup object.
+
+        :param webhook_cache: :obj:`WebhookInfoCache` to invalidate when
+            webhooks of this group are deleted
+        :param manifest_cache: :obj:`ManifestCache` of parsed group and launch
+            configs. If given, configs are read only when they have changed.
         """
         self.log = log.bind(system=self.__class__.__name__,
                             tenant_id=tenant_id,
@@ -661,6 +794,8 @@ class CassScalingGroup(object):
         self.reactor = reactor
         self.local_locks = local_locks
         self.dispatcher = dispatcher
+        self.webhook_cache = webhook_cache
+        self.manifest_cache = manifest_cache
 
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
@@ -670,6 +805,16 @@ class CassScalingGroup(object):
         self.webhooks_keys_table = "webhook_keys"
         self.event_table = "scaling_schedule_v2"
         self.servers_cache_table = "servers_cache"
+        self.servers_delta_cache_table = "group_servers_cache"
+
+    def _invalidate_webhooks(self, result, policy_id=None):
+        """
+        Invalidate cached info of this group's webhooks (only of given
+        policy if given) and return ``result``
+        """
+        if self.webhook_cache is not None:
+            self.webhook_cache.invalidate(self.tenant_id, self.uuid, policy_id)
+        return result
 
     def with_timestamp(self, func):
         """
@@ -712,26 +857,16 @@ class CassScalingGroup(object):
                 assemble_webhooks_in_policies(policies, webhooks),
                 group)
 
-        def _generate_manifest_group_part(group):
+        def _generate_manifest_group_part((group, config, launch_config)):
             m = {
-                'groupConfiguration': _jsonloads_data(group['group_config']),
-                'launchConfiguration': _jsonloads_data(group['launch_config']),
+                'groupConfiguration': config,
+                'launchConfiguration': launch_config,
                 'id': self.uuid,
-                'state': _unmarshal_state(group),
+                'state': _unmarshal_state(group, config),
             }
             return m
 
-        view_query = _cql_view_manifest.format(
-            cf=self.group_table)
-        del_query = _cql_delete_all_in_group.format(
-            cf=self.group_table, name='')
-        d = verified_view(self.connection, view_query, del_query,
-                          {"tenantId": self.tenant_id,
-                           "groupId": self.uuid},
-                          DEFAULT_CONSISTENCY,
-                          NoSuchScalingGroupError(self.tenant_id, self.uuid),
-                          self.log)
-        d.addCallback(_check_deleting, get_deleting)
+        d = self._view_group(DEFAULT_CONSISTENCY, get_deleting)
         d.addCallback(_generate_manifest_group_part)
 
         if with_policies:
@@ -786,18 +921,63 @@ class CassScalingGroup(object):
         if consistency is None:
             consistency = DEFAULT_CONSISTENCY
 
-        view_query = _cql_view_manifest.format(cf=self.group_table)
+        d = self._view_group(consistency, get_deleting)
+        return d.addCallback(
+            lambda (group, config, _): _unmarshal_state(group, config))
+
+    def _view_group(self, consistency, get_deleting):
+        """
+        Read the group's row and parse its configs. If there is a
+        ``manifest_cache``, the configs are read only when their write
+        timestamps differ from the ones cached.
+
+        :return: Deferred that fires with (row, group config, launch config)
+        """
+        data = {"tenantId": self.tenant_id, "groupId": self.uuid}
         del_query = _cql_delete_all_in_group.format(
             cf=self.group_table, name='')
-        d = verified_view(self.connection, view_query, del_query,
-                          {"tenantId": self.tenant_id,
-                           "groupId": self.uuid},
-                          consistency,
-                          NoSuchScalingGroupError(self.tenant_id, self.uuid),
-                          self.log)
+        not_found = NoSuchScalingGroupError(self.tenant_id, self.uuid)
+
+        def parse(group):
+            return (group, _jsonloads_data(group['group_config']),
+                    _jsonloads_data(group['launch_config']))
+
+        if self.manifest_cache is None:
+            d = verified_view(
+                self.connection,
+                _cql_view_manifest.format(cf=self.group_table), del_query,
+                data, consistency, not_found, self.log)
+            d.addCallback(_check_deleting, get_deleting)
+            return d.addCallback(parse)
+
+        def versions(row):
+            return (row['writetime(group_config)'],
+                    row['writetime(launch_config)'])
+
+        def read_configs(group):
+            configs = self.manifest_cache.get(
+                self.tenant_id, self.uuid, versions(group))
+            if configs is not None:
+                return (group,) + configs
+            d = self.connection.execute(
+                _cql_view_versioned_configs.format(cf=self.group_table),
+                data, consistency)
+            return d.addCallback(cache_configs, group)
 
+        def cache_configs(rows, group):
+            if len(rows) == 0:
+                raise not_found
+            _, config, launch_config = parse(rows[0])
+            self.manifest_cache.put(self.tenant_id, self.uuid,
+                                    versions(rows[0]), config, launch_config)
+            return group, config, launch_config
+
+        d = verified_view(
+            self.connection,
+            _cql_view_state_versions.format(cf=self.group_table), del_query,
+            data, consistency, not_found, self.log)
         d.addCallback(_check_deleting, get_deleting)
-        return d.addCallback(_unmarshal_state)
+        return d.addCallback(read_configs)
 
     def modify_state(self, modifier_callable, *args, **kwargs):
         """
@@ -836,7 +1016,7 @@ class CassScalingGroup(object):
                 self, state, *args, **kwargs))
             return d.addCallback(_write_state)
 
-        lock = zk.PollingLock(self.dispatcher, LOCK_PATH + '/' + self.uuid)
+        lock = zk.WatchingLock(self.dispatcher, LOCK_PATH + '/' + self.uuid)
         lock.acquire = functools.partial(lock.acquire, timeout=ACQUIRE_TIMEOUT)
         local_lock = self.local_locks.get_lock(self.uuid)
         return local_lock.run(
@@ -1006,6 +1186,36 @@ class CassScalingGroup(object):
         d = self.view_config()  # Ensure group exists
         return d.addCallback(fetch_policy)
 
+    def view_policy_manifest(self, policy_id, version=None):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.view_policy_manifest`
+
+        The group's configurations and the policy are read concurrently so
+        that it takes one round trip.
+        """
+        data = {"tenantId": self.tenant_id, "groupId": self.uuid}
+        view_query = _cql_view.format(
+            cf=self.group_table, column='group_config, launch_config')
+        del_query = _cql_delete_all_in_group.format(
+            cf=self.group_table, name='')
+        group_d = verified_view(
+            self.connection, view_query, del_query, data, DEFAULT_CONSISTENCY,
+            NoSuchScalingGroupError(self.tenant_id, self.uuid), self.log)
+        policy_d = self.connection.execute(
+            _cql_view_policy.format(cf=self.policies_table),
+            assoc(data, "policyId", policy_id), DEFAULT_CONSISTENCY)
+
+        def _assemble((group, rows)):
+            if len(rows) == 0 or version and rows[0]['version'] != version:
+                raise NoSuchPolicyError(self.tenant_id, self.uuid, policy_id)
+            return (_jsonloads_data(group['group_config']),
+                    _jsonloads_data(group['launch_config']),
+                    _jsonloads_data(rows[0]['data']))
+
+        d = defer.gatherResults([group_d, policy_d], consumeErrors=True)
+        d.addErrback(unwrap_first_error)
+        return d.addCallback(_assemble)
+
     def create_policies(self, data):
         """
         see :meth:`otter.models.interface.IScalingGroup.create_policies`
@@ -1109,6 +1319,7 @@ class CassScalingGroup(object):
         d.addCallback(
             lambda _: self._naive_list_webhooks(policy_id, QUERY_LIMIT, None))
         d.addCallback(_do_delete)
+        d.addCallback(self._invalidate_webhooks, policy_id)
         return d
 
     def _naive_list_all_webhooks(self):
@@ -1276,7 +1487,8 @@ class CassScalingGroup(object):
                 DEFAULT_CONSISTENCY)
             return d
 
-        return self.get_webhook(policy_id, webhook_id).addCallback(_do_delete)
+        d = self.get_webhook(policy_id, webhook_id).addCallback(_do_delete)
+        return d.addCallback(self._invalidate_webhooks, policy_id)
 
     def delete_group(self):
         """
@@ -1290,10 +1502,13 @@ class CassScalingGroup(object):
             queries, params = _del_webhook_queries(
                 self.webhooks_keys_table, webhooks)
 
+            tables = [self.policies_table, self.webhooks_table,
+                      self.servers_cache_table]
+            if config_value('servers_cache.mode') == 'delta':
+                tables.append(self.servers_delta_cache_table)
             queries.extend([
-                _cql_delete_all_in_group.format(cf=table, name='') for table in
-                (self.policies_table, self.webhooks_table,
-                 self.servers_cache_table)])
+                _cql_delete_all_in_group.format(cf=table, name='')
+                for table in tables])
             queries.append(_cql_delete_group.format(cf=self.group_table))
             params.update({'tenantId': self.tenant_id,
                            'groupId': self.uuid,
@@ -1311,8 +1526,15 @@ class CassScalingGroup(object):
 
             d = self._naive_list_all_webhooks()
             d.addCallback(_delete_everything)
+            d.addCallback(self._invalidate_webhooks)
+            d.addCallback(_invalidate_manifest)
             return d
 
+        def _invalidate_manifest(result):
+            if self.manifest_cache is not None:
+                self.manifest_cache.invalidate(self.tenant_id, self.uuid)
+            return result
+
         def _delete_group():
             d = self.view_state(get_deleting=True)
             d.addCallback(_maybe_delete)
@@ -1332,7 +1554,7 @@ class CassScalingGroup(object):
                     exc=f.value,
                     otter_msg_type="ignore-delete-lock-error"))
 
-        lock = zk.PollingLock(self.dispatcher, LOCK_PATH + '/' + self.uuid)
+        lock = zk.WatchingLock(self.dispatcher, LOCK_PATH + '/' + self.uuid)
         lock.acquire = functools.partial(lock.acquire, timeout=ACQUIRE_TIMEOUT)
         d = with_lock(self.reactor, lock, _delete_group,
                       log.bind(category='locking', lock_reason='delete_group'),
@@ -1344,6 +1566,113 @@ class CassScalingGroup(object):
         return d
 
 
+class WebhookInfoCache(object):
+    """
+    Bounded LRU cache of webhook info, i.e. (tenant ID, group ID, policy ID)
+    tuple, keyed on capability hash. Unrecognized hashes are cached as None.
+    Entries expire after their TTL. Invalidation only happens in this process
+    and hence the TTL bounds how long other processes can execute a deleted
+    webhook's policy.
+
+    :param clock: ``IReactorTime`` provider
+    :param int size: Maximum number of entries
+    :param ttl: Seconds for which recognized hashes are cached
+    :param negative_ttl: Seconds for which unrecognized hashes are cached
+    """
+
+    def __init__(self, clock, size=10000, ttl=60, negative_ttl=60):
+        self.clock = clock
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+
+    def get(self, capability_hash):
+        """
+        Get cached info of a hash
+
+        :return: (found, info) tuple where info is None for unrecognized hash
+        """
+        entry = self._entries.pop(capability_hash, None)
+        if entry is None or entry[0] <= self.clock.seconds():
+            return False, None
+        self._entries[capability_hash] = entry
+        return True, entry[1]
+
+    def put(self, capability_hash, info, generation):
+        """
+        Cache info of hash got by lookup started at ``generation``. It is not
+        cached if anything got invalidated since then.
+        """
+        if generation != self.generation:
+            return
+        ttl = self.negative_ttl if info is None else self.ttl
+        self._entries.pop(capability_hash, None)
+        self._entries[capability_hash] = (self.clock.seconds() + ttl, info)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, tenant_id, group_id, policy_id=None):
+        """
+        Remove entries of group's webhooks, only of given policy if given
+        """
+        self.generation += 1
+        for capability_hash, (_, info) in self._entries.items():
+            if (info is not None and info[:2] == (tenant_id, group_id) and
+                    policy_id in (None, info[2])):
+                del self._entries[capability_hash]
+
+
+class ManifestCache(object):
+    """
+    Bounded LRU cache of parsed group and launch configs keyed on
+    (tenant ID, group ID). Each entry is tagged with the write timestamps of
+    the configs it was parsed from and is used only if the timestamps read
+    along with the group's state are the same. Hence it does not need to be
+    invalidated when configs are updated by any process. Configs are copied
+    when put and got so that callers changing them do not change the cache.
+
+    :param int size: Maximum number of entries
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, tenant_id, group_id, versions):
+        """
+        Get cached configs of group if they were cached with ``versions``
+
+        :return: (group config, launch config) tuple or None
+        """
+        entry = self._entries.pop((tenant_id, group_id), None)
+        if entry is None or entry[0] != versions:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries[(tenant_id, group_id)] = entry
+        return deepcopy(entry[1])
+
+    def put(self, tenant_id, group_id, versions, config, launch_config):
+        """
+        Cache configs of group with the write timestamps they were read with
+        """
+        self._entries.pop((tenant_id, group_id), None)
+        self._entries[(tenant_id, group_id)] = (
+            versions, deepcopy((config, launch_config)))
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, tenant_id, group_id):
+        """
+        Remove group's entry
+        """
+        self._entries.pop((tenant_id, group_id), None)
+
+
 @implementer(IScalingGroupCollection, IScalingScheduleCollection)
 class CassScalingGroupCollection:
     """
@@ -1392,6 +1721,10 @@ class CassScalingGroupCollection:
         self.reactor = reactor
         self.max_groups = max_groups
         self.local_locks = WeakLocks()
+        self.webhook_cache = WebhookInfoCache(
+            reactor, **(config_value('webhook_cache') or {}))
+        self.manifest_cache = ManifestCache(
+            **(config_value('manifest_cache') or {}))
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
         self.policies_table = "scaling_policies"
@@ -1400,6 +1733,7 @@ class CassScalingGroupCollection:
         self.state_table = "group_state"
         self.event_table = "scaling_schedule_v2"
         self.buckets = None
+        self.event_observers = []
         self.kz_client = None
         self.dispatcher = None
 
@@ -1408,7 +1742,13 @@ class CassScalingGroupCollection:
         Set round-robin list of buckets that will be used to store scheduled
         events.
         """
-        self.buckets = cycle(buckets)
+        self.buckets = ScheduleBuckets(buckets, self.event_observers)
+
+    def add_event_observer(self, observer):
+        """
+        see :meth:`IScalingScheduleCollection.add_event_observer`
+        """
+        self.event_observers.append(observer)
 
     def create_scaling_group(self, log, tenant_id, config, launch,
                              policies=None):
@@ -1534,13 +1874,19 @@ class CassScalingGroupCollection:
         return CassScalingGroup(log, tenant_id, scaling_group_id,
                                 self.connection, self.buckets, self.kz_client,
                                 self.reactor, self.local_locks,
-                                self.dispatcher)
+                                self.dispatcher, self.webhook_cache,
+                                self.manifest_cache)
 
     def fetch_and_delete(self, bucket, now, size=100):
         """
         Fetch events to be occurring now or before in a bucket
         and delete them after fetching
         """
+        time_slice = config_value('scheduler.time_slice')
+        if time_slice:
+            return self._fetch_and_delete_sliced(bucket, now, size,
+                                                 time_slice)
+
         def delete_events(events):
             if not events:
                 return events
@@ -1561,6 +1907,67 @@ class CassScalingGroupCollection:
             {"size": size, "now": now, "bucket": bucket}, DEFAULT_CONSISTENCY)
         return d.addCallback(delete_events)
 
+    def _fetch_and_delete_sliced(self, bucket, now, size, time_slice):
+        """
+        Fetch up to ``size`` events to be occurring now or before from the
+        oldest time slices of a bucket and delete them. A slice that ended
+        more than ``time_slice`` seconds ago gets no new events, so once it
+        is drained its whole partition is deleted with one partition
+        tombstone instead of a tombstone per event.
+        """
+        fetched, drained = [], []
+
+        def fetch_slices(slices):
+            remaining = size - len(fetched)
+            if not slices or remaining <= 0:
+                return
+            slice_ = slices[0]['slice']
+
+            def got_events(events):
+                fetched.extend((slice_, event) for event in events)
+                if (len(events) < remaining and
+                        slice_ + timedelta(seconds=2 * time_slice) <= now):
+                    drained.append(slice_)
+                return fetch_slices(slices[1:])
+
+            d = self.connection.execute(
+                _cql_fetch_batch_of_sliced_events.format(
+                    cf=SLICED_EVENT_TABLE),
+                {"bucket": bucket, "slice": slice_, "now": now,
+                 "size": remaining},
+                DEFAULT_CONSISTENCY)
+            return d.addCallback(got_events)
+
+        def delete_events(_):
+            events = [event for slice_, event in fetched]
+            if not fetched and not drained:
+                return events
+            data = {'bucket': bucket}
+            queries = []
+            for i, (slice_, event) in enumerate(fetched):
+                if slice_ in drained:
+                    continue
+                event_name = 'event{}'.format(i)
+                queries.append(
+                    _cql_delete_sliced_event.format(cf=SLICED_EVENT_TABLE,
+                                                    name=event_name))
+                data[event_name + 'slice'] = slice_
+                data[event_name + 'policyId'] = event['policyId']
+                data[event_name + 'trigger'] = event['trigger']
+            for i, slice_ in enumerate(drained):
+                slice_name = 'slice{}'.format(i)
+                queries.extend(
+                    _cql_delete_event_slice.format(cf=table, name=slice_name)
+                    for table in [SLICED_EVENT_TABLE, EVENT_SLICES_TABLE])
+                data[slice_name + 'slice'] = slice_
+            b = Batch(queries, data, DEFAULT_CONSISTENCY)
+            return b.execute(self.connection).addCallback(lambda _: events)
+
+        d = self.connection.execute(
+            _cql_fetch_due_event_slices.format(cf=EVENT_SLICES_TABLE),
+            {"bucket": bucket, "now": now}, DEFAULT_CONSISTENCY)
+        return d.addCallback(fetch_slices).addCallback(delete_events)
+
     def add_cron_events(self, cron_events):
         """
         Add cron events to event table
@@ -1568,10 +1975,13 @@ class CassScalingGroupCollection:
         queries, data = list(), dict()
         for i, event in enumerate(cron_events):
             event_name = 'event{}'.format(i)
-            queries.append(_cql_insert_cron_event.format(cf=self.event_table,
-                                                         name=event_name))
             data[event_name + 'bucket'] = self.buckets.next()
             data.update({event_name + key: event[key] for key in event})
+            _add_event_query(_cql_insert_cron_event,
+                             _cql_insert_sliced_cron_event, self.event_table,
+                             queries, data, event_name)
+            self.buckets.event_added(data[event_name + 'bucket'],
+                                     event['trigger'])
         b = Batch(queries, data, ConsistencyLevel.ONE)
         return b.execute(self.connection)
 
@@ -1579,26 +1989,62 @@ class CassScalingGroupCollection:
         """
         see :meth:`IScalingScheduleCollection.get_oldest_event`
         """
+        if config_value('scheduler.time_slice'):
+            return self._get_oldest_sliced_event(bucket)
         d = self.connection.execute(
             _cql_oldest_event.format(cf=self.event_table),
             {'bucket': bucket}, ConsistencyLevel.ONE)
         d.addCallback(lambda r: r[0] if len(r) > 0 else None)
         return d
 
+    def _get_oldest_sliced_event(self, bucket):
+        """
+        Return oldest event in the first of the bucket's time slices that has
+        any event
+        """
+        def first_event(slices):
+            if not slices:
+                return None
+            d = self.connection.execute(
+                _cql_oldest_sliced_event.format(cf=SLICED_EVENT_TABLE),
+                {'bucket': bucket, 'slice': slices[0]['slice']},
+                ConsistencyLevel.ONE)
+            return d.addCallback(
+                lambda r: r[0] if len(r) > 0 else first_event(slices[1:]))
+
+        d = self.connection.execute(
+            _cql_fetch_event_slices.format(cf=EVENT_SLICES_TABLE),
+            {'bucket': bucket}, ConsistencyLevel.ONE)
+        return d.addCallback(first_event)
+
     def webhook_info_by_hash(self, log, capability_hash):
         """
         see :meth:`IScalingGroupCollection.webhook_info_by_hash`
+
+        Both recognized and unrecognized hashes are cached in
+        ``self.webhook_cache``.
         """
+        def extract_info(info):
+            if info is None:
+                raise UnrecognizedCapabilityError(capability_hash, 1)
+            return info
+
+        found, info = self.webhook_cache.get(capability_hash)
+        if found:
+            return defer.maybeDeferred(extract_info, info)
+
+        def cache_info(rows):
+            info = ((rows[0]['tenantId'], rows[0]['groupId'],
+                     rows[0]['policyId'])
+                    if len(rows) > 0 else None)
+            self.webhook_cache.put(capability_hash, info, generation)
+            return info
+
+        generation = self.webhook_cache.generation
         d = self.connection.execute(
             _cql_find_webhook_token.format(cf=self.webhook_keys_table),
             {"webhookKey": capability_hash}, ConsistencyLevel.ONE)
-
-        def extract_info(rows):
-            if len(rows) == 0:
-                raise UnrecognizedCapabilityError(capability_hash, 1)
-            r = rows[0]
-            return (r['tenantId'], r['groupId'], r['policyId'])
-
+        d.addCallback(cache_info)
         d.addCallback(extract_info)
         return d
 
@@ -1726,33 +2172,170 @@ class CassScalingGroupCollection:
                               self.reactor.seconds() - start_time}))
         return d
 
-    def get_all_valid_groups(self):
+    def get_all_valid_groups(self, props=None):
         """
-        Get all *valid* scaling groups
+        Get all *valid* scaling groups. Invalid groups are dropped as pages
+        of groups are fetched.
 
+        :param ``list`` props: Columns to fetch. All columns are fetched if
+            None. Columns needed to check validity are always fetched.
         :return: `Deferred` fired with ``list`` of group ``dict``
         """
-        def _valid_group_row(row):
-            return (row.get('created_at') is not None and
-                    row.get('desired') is not None and
-                    not row.get('deleting', False))
+        if props is not None:
+            props = set(props) | _valid_group_props
+        d = self.fold_scaling_group_rows(
+            lambda groups, rows: groups.extend(filter(_valid_group_row, rows)),
+            pvector(), props)
+        return d.addCallback(list)
 
-        d = self.get_scaling_group_rows()
-        return d.addCallback(lambda gs: list(filter(_valid_group_row, gs)))
+    def get_valid_groups_page(self, props=None, after=None, limit=100):
+        """
+        Get page of *valid* scaling groups. See
+        :meth:`get_scaling_group_rows_page` for arguments. Columns needed to
+        check validity are always fetched.
 
-    @defer.inlineCallbacks
-    def get_scaling_group_rows(self, props=None, batch_size=100):
+        :return: `Deferred` fired with (``list`` of group ``dict``, ``after``
+            of next page or None if this is the last page) tuple
+        """
+        if props is not None:
+            props = set(props) | _valid_group_props
+        d = self.get_scaling_group_rows_page(props, after, limit)
+        return d.addCallback(
+            lambda (rows, after): (list(filter(_valid_group_row, rows)),
+                                   after))
+
+    def get_scaling_group_rows(self, props=None, batch_size=None):
         """
         Return scaling group rows from Cassandra as a list of ``dict`` where
         each dict has all columns in table if `props` is None. Otherwise
         only columns given in `props` are retreived
 
         :param ``list`` props: List of extra properties to extract
-        :param int batch_size: Number of groups to fetch at a time
+        :param int batch_size: Number of groups to fetch at a time. Defaults
+            to "cassandra.group_page_size" config or 100
         :return: `Deferred` fired with ``list`` of ``dict``
         """
-        # TODO: Currently returning all groups as one giant list for now.
-        # Will try to use Twisted tubes to do streaming later
+        d = self.fold_scaling_group_rows(
+            lambda groups, rows: groups.extend(rows), pvector(), props,
+            batch_size)
+        return d.addCallback(list)
+
+    @defer.inlineCallbacks
+    def copy_events_to_slices(self, bucket, time_slice, page_size=100):
+        """
+        Copy events of ``bucket`` from the unsliced event table to their
+        ``time_slice`` seconds long slice partitions in
+        :obj:`SLICED_EVENT_TABLE` and record the slices in
+        :obj:`EVENT_SLICES_TABLE`. Events are read ``page_size`` at a time
+        and each page is written in one batch.
+
+        :return: `Deferred` fired with number of events copied
+        """
+        copied, after = 0, None
+        while True:
+            events, after = yield self._get_events_page(
+                bucket, after, page_size)
+            queries, params = [], {}
+            for i, event in enumerate(events):
+                name = 'event{}'.format(i)
+                queries.append(_cql_insert_sliced_cron_event.format(
+                    cf=SLICED_EVENT_TABLE, name=name))
+                queries.append(_cql_insert_event_slice.format(
+                    cf=EVENT_SLICES_TABLE, name=name))
+                params.update({name + key: event[key] for key in event})
+                params[name + 'slice'] = _event_slice(event['trigger'],
+                                                      time_slice)
+            if queries:
+                yield self.connection.execute(
+                    batch(queries), params, ConsistencyLevel.QUORUM)
+            copied += len(events)
+            if after is None:
+                defer.returnValue(copied)
+
+    @defer.inlineCallbacks
+    def _get_events_page(self, bucket, after, limit):
+        """
+        Return page of events of ``bucket`` in the unsliced event table in
+        the order they are stored: sorted by trigger and then policy ID.
+
+        :param tuple after: (trigger, policy ID) of last event of previous
+            page or None to get the first page
+        :return: `Deferred` fired with (``list`` of ``dict``, ``after`` of
+            next page or None if this is the last page) tuple
+        """
+        query = ('SELECT * FROM {cf} WHERE bucket = :bucket{where} '
+                 'LIMIT :limit;')
+        params = {'bucket': bucket, 'limit': limit}
+        if after is None:
+            events = last = yield self.connection.execute(
+                query.format(cf=self.event_table, where=''), params,
+                ConsistencyLevel.QUORUM)
+        else:
+            # Get remaining events of last trigger and then events of later
+            # triggers
+            params['trigger'], params['policyId'] = after
+            events = last = yield self.connection.execute(
+                query.format(
+                    cf=self.event_table,
+                    where=(' AND trigger = :trigger'
+                           ' AND "policyId" > :policyId')),
+                params, ConsistencyLevel.QUORUM)
+            if len(events) < limit:
+                del params['policyId']
+                last = yield self.connection.execute(
+                    query.format(cf=self.event_table,
+                                 where=' AND trigger > :trigger'),
+                    params, ConsistencyLevel.QUORUM)
+                events = events + last
+        if len(last) < limit:
+            defer.returnValue((events, None))
+        defer.returnValue(
+            (events, (events[-1]['trigger'], events[-1]['policyId'])))
+
+    @defer.inlineCallbacks
+    def fold_scaling_group_rows(self, f, initial, props=None,
+                                page_size=None):
+        """
+        Fold scaling group rows with ``f`` page by page as they are fetched.
+        The next page is fetched after ``f`` is done with the current one and
+        rows of a page are not kept after that unless ``f`` keeps them.
+
+        :param f: Function of (accumulated value, ``list`` of row ``dict`` of
+            a page) -> new accumulated value or `Deferred` fired with it
+        :param initial: Initial accumulated value
+        :param ``list`` props: Columns to fetch. All columns are fetched if
+            None. They should include "tenantId" and "groupId"
+        :param int page_size: Number of groups to fetch at a time. Defaults
+            to "cassandra.group_page_size" config or 100
+        :return: `Deferred` fired with the accumulated value after last page
+        """
+        if page_size is None:
+            page_size = config_value('cassandra.group_page_size') or 100
+        acc, after = initial, None
+        while True:
+            rows, after = yield self.get_scaling_group_rows_page(
+                props, after, page_size)
+            acc = yield f(acc, rows)
+            if after is None:
+                defer.returnValue(acc)
+
+    @defer.inlineCallbacks
+    def get_scaling_group_rows_page(self, props=None, after=None, limit=100):
+        """
+        Return page of scaling group rows in the order they are stored: sorted
+        first based on hash of tenant ID and then based on group ID.
+
+        :param ``list`` props: Columns to fetch. All columns are fetched if
+            None. They should include "tenantId" and "groupId" to get pages
+            after this one
+        :param tuple after: (tenant ID, group ID) of last row of previous page
+            or None to get the first page
+        :param int limit: Number of groups to fetch at a time. A page that
+            finishes a tenant's groups also has upto ``limit`` groups of
+            following tenants
+        :return: `Deferred` fired with (``list`` of ``dict``, ``after`` of
+            next page or None if this is the last page) tuple
+        """
         if props is None:
             cols = "*"
         else:
@@ -1762,39 +2345,30 @@ class CassScalingGroupCollection:
         where_key = 'WHERE "tenantId"=:tenantId AND "groupId">:groupId'
         where_token = 'WHERE token("tenantId") > token(:tenantId)'
 
-        # We first start by getting all groups limited on batch size
-        # It will return groups sorted first based on hash of tenant id
-        # and then based group id. Note that only tenant id is sorted
-        # based on hash; group id is sorted normally
-        batch = yield self.connection.execute(
-            query.format(where=''),
-            {'limit': batch_size}, ConsistencyLevel.ONE)
-        if len(batch) < batch_size:
-            defer.returnValue(batch)
-
-        # We got batch size response. That means there are probably more groups
-        groups = batch
-        while batch != []:
-            # We start by getting all the groups of last tenant ID we received
-            # except the ones we already got. We do that by asking
-            # groups > last group id since groups are sorted
-            tenant_id = batch[-1]['tenantId']
-            while len(batch) == batch_size:
-                batch = yield self.connection.execute(
-                    query.format(where=where_key),
-                    {'limit': batch_size,
-                     'tenantId': tenant_id,
-                     'groupId': batch[-1]['groupId']},
-                    ConsistencyLevel.ONE)
-                groups.extend(batch)
-            # We then get next tenant's groups by using there hash value. i.e
-            # tenants whose hash > last tenant id we just fetched
-            batch = yield self.connection.execute(
-                query.format(where=where_token),
-                {'limit': batch_size, 'tenantId': tenant_id},
+        if after is None:
+            rows = last = yield self.connection.execute(
+                query.format(where=''), {'limit': limit},
                 ConsistencyLevel.ONE)
-            groups.extend(batch)
-        defer.returnValue(groups)
+        else:
+            # Get remaining groups of last tenant we received except the ones
+            # we already got. We do that by asking groups > last group id
+            # since groups are sorted
+            tenant_id, group_id = after
+            rows = last = yield self.connection.execute(
+                query.format(where=where_key),
+                {'limit': limit, 'tenantId': tenant_id, 'groupId': group_id},
+                ConsistencyLevel.ONE)
+            if len(rows) < limit:
+                # We then get next tenants' groups by using their hash
+                # value. i.e tenants whose hash > last tenant id
+                last = yield self.connection.execute(
+                    query.format(where=where_token),
+                    {'limit': limit, 'tenantId': tenant_id},
+                    ConsistencyLevel.ONE)
+                rows = rows + last
+        if len(last) < limit:
+            defer.returnValue((rows, None))
+        defer.returnValue((rows, (rows[-1]['tenantId'], rows[-1]['groupId'])))
 
 
 @implementer(IScalingGroupServersCache)
@@ -1880,6 +2454,214 @@ class CassScalingGroupServersCache(object):
         params = assoc(self.params, "last_update", time)
         return cql_eff(query.format(cf=self.table), params)
 
+    @classmethod
+    @do
+    def get_groups_active_servers(cls, tenant_id, group_ids):
+        """
+        Get latest cached AS active servers of multiple groups of a tenant in
+        one query.
+
+        :return: Effect of ``dict`` of group ID -> ``list`` of server dicts.
+            Groups without cache are not included.
+        """
+        if not group_ids:
+            yield do_return({})
+        query, params = _groups_in_query(
+            'SELECT "groupId", server_blob, server_as_active, last_update '
+            'FROM servers_cache', tenant_id, group_ids)
+        rows = yield cql_eff(query, params)
+        last_updates = {}
+        for row in rows:
+            last_updates[row['groupId']] = max(
+                row['last_update'],
+                last_updates.get(row['groupId'], row['last_update']))
+        servers = {group_id: [] for group_id in last_updates}
+        for row in rows:
+            if (row['server_as_active'] and
+                    row['last_update'] == last_updates[row['groupId']]):
+                servers[row['groupId']].append(json.loads(row['server_blob']))
+        yield do_return(servers)
+
+
+def _groups_in_query(select, tenant_id, group_ids):
+    """
+    Return (query, params) selecting rows of given groups of a tenant
+    """
+    params = {'groupId{}'.format(i): group_id
+              for i, group_id in enumerate(group_ids)}
+    params['tenantId'] = tenant_id
+    query = '{} WHERE "tenantId"=:tenantId AND "groupId" IN ({});'.format(
+        select, ', '.join(':groupId{}'.format(i)
+                          for i in range(len(group_ids))))
+    return query, params
+
+
+def _server_row(server):
+    """
+    Return (server_id, server_as_active, server_blob, server_links, blob_hash)
+    of a server dict to be stored in servers cache. "_is_as_active" is popped
+    from the dict.
+    """
+    as_active = server.pop('_is_as_active', False)
+    blob = json.dumps(server, sort_keys=True)
+    blob_hash = sha1('{}:{}'.format(int(as_active), blob)).hexdigest()
+    return (server['id'], as_active, blob,
+            json.dumps(server.get('links', [])), blob_hash)
+
+
+@implementer(IScalingGroupServersCache)
+class CassScalingGroupServersDeltaCache(object):
+    """
+    Cache of scaling group servers that keeps one row per server instead of
+    a new generation of all servers on every update. Only the servers that
+    were added, changed or removed since the last update are written, along
+    with the group's last update time which is a static column. Servers are
+    compared using a hash of their stored blob.
+    """
+
+    def __init__(self, tenant_id, group_id):
+        self.tenantId = tenant_id
+        self.groupId = group_id
+        self.table = "group_servers_cache"
+        self.params = {"tenantId": self.tenantId, "groupId": self.groupId}
+
+    @do
+    def get_servers(self, only_as_active):
+        """
+        See :method:`IScalingGroupServersCache.get_servers`
+        """
+        query = ('SELECT server_id, server_blob, server_as_active, '
+                 'last_update FROM {cf} '
+                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+        rows = yield cql_eff(query.format(cf=self.table), self.params)
+        if len(rows) == 0 or rows[0]['last_update'] is None:
+            yield do_return(([], None))
+        # A partition with only the static column set is returned as a row
+        # with null server_id
+        servers = [
+            json.loads(r['server_blob']) for r in rows
+            if r['server_id'] is not None and
+            (r['server_as_active'] or not only_as_active)]
+        yield do_return((servers, rows[0]['last_update']))
+
+    @do
+    def update_servers(self, time, servers):
+        """
+        See :method:`IScalingGroupServersCache.update_servers`
+
+        Like :obj:`CassScalingGroupServersCache`, this is not re-entrant for a
+        given group and `time` must be higher for subsequent calls.
+        """
+        query = ('SELECT server_id, blob_hash, last_update FROM {cf} '
+                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+        rows = yield cql_eff(query.format(cf=self.table), self.params)
+        last_update = rows[0]['last_update'] if rows else None
+        if last_update is not None and time <= last_update:
+            raise ValueError(
+                "Given time arg {} must be greater than time of earlier "
+                "inserted servers {}".format(time, last_update))
+        current = {r['server_id']: r['blob_hash'] for r in rows
+                   if r['server_id'] is not None}
+
+        queries = []
+        params = assoc(self.params, "last_update", time)
+        new_ids = set()
+        insert_query = (
+            'INSERT INTO {cf} ("tenantId", "groupId", server_id, server_blob, '
+            'server_links, server_as_active, blob_hash) VALUES(:tenantId, '
+            ':groupId, :server_id{i}, :server_blob{i}, :server_links{i}, '
+            ':server_as_active{i}, :blob_hash{i});')
+        for i, server in enumerate(servers):
+            server_id, as_active, blob, links, blob_hash = _server_row(server)
+            new_ids.add(server_id)
+            if current.get(server_id) == blob_hash:
+                continue
+            params.update({
+                'server_id{}'.format(i): server_id,
+                'server_as_active{}'.format(i): as_active,
+                'server_blob{}'.format(i): blob,
+                'server_links{}'.format(i): links,
+                'blob_hash{}'.format(i): blob_hash
+            })
+            queries.append(insert_query.format(cf=self.table, i=i))
+        delete_query = (
+            'DELETE FROM {cf} WHERE "tenantId"=:tenantId AND '
+            '"groupId"=:groupId AND server_id=:removed_id{i};')
+        for i, server_id in enumerate(sorted(set(current) - new_ids)):
+            params['removed_id{}'.format(i)] = server_id
+            queries.append(delete_query.format(cf=self.table, i=i))
+        queries.append(
+            ('UPDATE {cf} SET last_update=:last_update WHERE '
+             '"tenantId"=:tenantId AND "groupId"=:groupId;').format(
+                 cf=self.table))
+        yield cql_eff(batch(queries), params)
+
+    def delete_servers(self, time):
+        """
+        See :method:`IScalingGroupServersCache.delete_servers`
+
+        Since only the latest servers are kept, this deletes all of them
+        irrespective of ``time``.
+        """
+        return cql_eff(
+            _cql_delete_all_in_group.format(cf=self.table, name=';'),
+            self.params)
+
+    @classmethod
+    @do
+    def get_groups_active_servers(cls, tenant_id, group_ids):
+        """
+        Get cached AS active servers of multiple groups of a tenant in one
+        query. Only the servers' IDs and links are read without decoding
+        their blobs.
+
+        :return: Effect of ``dict`` of group ID -> ``list`` of
+            {"id": server ID, "links": server links} dicts. Groups without
+            cache are not included.
+        """
+        if not group_ids:
+            yield do_return({})
+        query, params = _groups_in_query(
+            'SELECT "groupId", server_id, server_links, server_as_active '
+            'FROM group_servers_cache', tenant_id, group_ids)
+        rows = yield cql_eff(query, params)
+        servers = {}
+        for row in rows:
+            group_servers = servers.setdefault(row['groupId'], [])
+            if row['server_id'] is not None and row['server_as_active']:
+                group_servers.append(
+                    {'id': row['server_id'],
+                     'links': json.loads(row['server_links'])})
+        yield do_return(servers)
+
+
+def _servers_cache_class():
+    if config_value('servers_cache.mode') == 'delta':
+        return CassScalingGroupServersDeltaCache
+    return CassScalingGroupServersCache
+
+
+def get_servers_cache(tenant_id, group_id):
+    """
+    Return :obj:`IScalingGroupServersCache` provider of the group as per
+    "servers_cache.mode" config. The cache writes only changed servers if
+    it is "delta" and all the servers on every update otherwise.
+    """
+    return _servers_cache_class()(tenant_id, group_id)
+
+
+def get_groups_active_servers(tenant_id, group_ids):
+    """
+    Get cached AS active servers of given groups of a tenant in one query
+    from the cache configured by "servers_cache.mode".
+
+    :return: Effect of ``dict`` of group ID -> ``list`` of server dicts
+        having at least "id" and "links". Groups without cache are not
+        included.
+    """
+    return _servers_cache_class().get_groups_active_servers(
+        tenant_id, group_ids)
+
 
 @implementer(IAdmin)
 class CassAdmin(object):
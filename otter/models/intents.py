@@ -11,18 +11,40 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 from txeffect import deferred_performer
 
 from otter.log.intents import merge_effectful_fields
-from otter.models.cass import CassScalingGroupServersCache
+from otter.models.cass import get_servers_cache
 from otter.util.fp import assoc_obj
 
 
 @attr.s
 class GetAllValidGroups(object):
-    pass
+    """
+    Get all valid groups with only ``props`` columns if given. See
+    :meth:`CassScalingGroupCollection.get_all_valid_groups`
+    """
+    props = attr.ib(default=None)
 
 
 @deferred_performer
 def perform_get_all_valid_groups(store, dispatcher, intent):
-    return store.get_all_valid_groups()
+    return store.get_all_valid_groups(intent.props)
+
+
+@attr.s
+class GetValidGroupsPage(object):
+    """
+    Get page of valid groups in the order they are stored along with the
+    ``after`` of next page. See
+    :meth:`CassScalingGroupCollection.get_valid_groups_page`
+    """
+    props = attr.ib(default=None)
+    after = attr.ib(default=None)
+    limit = attr.ib(default=100)
+
+
+@deferred_performer
+def perform_get_valid_groups_page(store, dispatcher, intent):
+    return store.get_valid_groups_page(intent.props, intent.after,
+                                       intent.limit)
 
 
 @attributes(['tenant_id', 'group_id'])
@@ -110,7 +132,7 @@ class UpdateServersCache(object):
 @sync_performer
 def perform_update_servers_cache(disp, intent):
     """ Perform :obj:`UpdateServersCache` """
-    cache = CassScalingGroupServersCache(intent.tenant_id, intent.group_id)
+    cache = get_servers_cache(intent.tenant_id, intent.group_id)
     return cache.update_servers(intent.time, intent.servers)
 
 
@@ -163,4 +185,5 @@ def get_model_dispatcher(log, store):
             partial(perform_update_error_reasons, log, store),
         ModifyGroupStatePaused: perform_modify_group_state_paused,
         GetAllValidGroups: partial(perform_get_all_valid_groups, store),
+        GetValidGroupsPage: partial(perform_get_valid_groups_page, store),
     })
@@ -488,6 +488,28 @@ class IScalingGroup(Interface):
             :class:`NoSuchPolicyError` can be raised instead
         """
 
+    def view_policy_manifest(policy_id, version=None):
+        """
+        Gets the group's configuration, launch configuration and the specified
+        policy together, as needed to execute the policy.
+
+        :param policy_id: the uuid of the policy
+        :type policy_id: :class:`bytes`
+
+        :param version: version of policy to check as Type-1 UUID
+        :type version: ``UUID``
+
+        :return: a :class:`twisted.internet.defer.Deferred` that fires with
+            a ``tuple`` of (config, launch config, policy) as specified by
+            :data:`otter.json_schema.group_schemas.config`,
+            :data:`otter.json_schema.group_schemas.launch_config` and
+            :data:`otter.json_schema.group_schemas.policy`
+
+        :raises NoSuchPolicyError: if the policy id does not exist
+        :raises NoSuchScalingGroupError: if this scaling group (one
+            with this uuid) does not exist
+        """
+
     def delete_policy(policy_id):
         """
         Delete the specified policy on this particular scaling group, and all
@@ -690,6 +712,17 @@ class IScalingScheduleCollection(Interface):
         :rtype: :class:`dict`
         """
 
+    def add_event_observer(observer):
+        """
+        Add a function to be called whenever this collection or any of its
+        scaling groups add an event. Events added by other processes are not
+        observed.
+
+        :param observer: Callable taking the bucket and trigger time
+            (:class:`datetime`) of the added event.
+        :return: :data:`None`
+        """
+
 
 def next_cron_occurrence(cron):
     """
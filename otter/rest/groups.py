@@ -21,7 +21,7 @@ from otter.json_schema.group_schemas import (
 from otter.json_schema.rest_schemas import create_group_request
 from otter.log import log
 from otter.log.bound import bound_log_kwargs
-from otter.models.cass import CassScalingGroupServersCache
+from otter.models.cass import get_groups_active_servers, get_servers_cache
 from otter.models.interface import ScalingGroupStatus
 from otter.rest.bobby import get_bobby
 from otter.rest.configs import (
@@ -205,12 +205,13 @@ class OtterGroups(object):
         def fetch_active_caches(group_states):
             if not tenant_is_enabled(self.tenant_id, config_value):
                 return group_states, [None] * len(group_states)
-            d = gatherResults(
-                [get_active_cache(
-                    self.store.reactor, self.store.connection, self.tenant_id,
-                    state.group_id)
-                 for state in group_states])
-            return d.addCallback(lambda cache: (group_states, cache))
+            d = get_active_caches(
+                self.store.reactor, self.store.connection, self.tenant_id,
+                [state.group_id for state in group_states])
+            return d.addCallback(
+                lambda caches: (group_states,
+                                [caches.get(state.group_id, {})
+                                 for state in group_states]))
 
         deferred = self.store.list_scaling_group_states(
             self.log, self.tenant_id, **paginate)
@@ -465,12 +466,28 @@ def get_active_cache(reactor, connection, tenant_id, group_id):
     """
     Get active servers from servers cache table
     """
-    eff = CassScalingGroupServersCache(tenant_id, group_id).get_servers(True)
+    eff = get_servers_cache(tenant_id, group_id).get_servers(True)
     disp = get_working_cql_dispatcher(reactor, connection)
     d = perform(disp, eff)
     return d.addCallback(lambda (servers, _): {s['id']: s for s in servers})
 
 
+def get_active_caches(reactor, connection, tenant_id, group_ids):
+    """
+    Get active servers of multiple groups from servers cache table in one
+    query
+
+    :return: Deferred of ``dict`` of group ID -> active servers keyed on ID.
+        Groups without cache are not included.
+    """
+    eff = get_groups_active_servers(tenant_id, group_ids)
+    disp = get_working_cql_dispatcher(reactor, connection)
+    d = perform(disp, eff)
+    return d.addCallback(
+        lambda groups: {group_id: {s['id']: s for s in servers}
+                        for group_id, servers in groups.items()})
+
+
 class OtterGroup(object):
     """
     REST endpoints for managing a specific scaling group.
@@ -380,7 +380,7 @@ class OtterPolicy(object):
         """
         group = self.store.get_scaling_group(self.log, self.tenant_id,
                                              self.scaling_group_id)
-        d = controller.modify_and_trigger(
+        d = controller.modify_and_trigger_combined(
             self.dispatcher,
             group,
             bound_log_kwargs(self.log),
@@ -372,7 +372,7 @@ class OtterExecute(object):
             logl[0] = bound_log
             group = self.store.get_scaling_group(bound_log, tenant_id,
                                                  group_id)
-            return controller.modify_and_trigger(
+            return controller.modify_and_trigger_combined(
                 self.dispatcher,
                 group,
                 bound_log_kwargs(bound_log),
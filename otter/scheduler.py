@@ -8,16 +8,18 @@ from datetime import datetime
 from functools import partial
 
 from twisted.application.service import MultiService
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 
 from otter.controller import (
-    CannotExecutePolicyError, maybe_execute_scaling_policy, modify_and_trigger)
+    CannotExecutePolicyError, maybe_execute_scaling_policy,
+    modify_and_trigger_combined)
 from otter.log import log as otter_log
 from otter.log.bound import bound_log_kwargs
 from otter.models.interface import (
     NoSuchPolicyError, NoSuchScalingGroupError, next_cron_occurrence)
 from otter.util.deferredutils import ignore_and_log
 from otter.util.hashkey import generate_transaction_id
+from otter.util.weaklocks import WeakLocks
 
 
 class SchedulerService(MultiService):
@@ -26,24 +28,58 @@ class SchedulerService(MultiService):
     """
 
     def __init__(self, dispatcher, batchsize, store, partitioner_factory,
-                 threshold=60):
+                 threshold=60, scan_interval=30, clock=None,
+                 max_in_flight=None):
         """
         Initialize the scheduler service
 
+        Events are checked when the earliest known event of the buckets
+        allocated to this node is due. The earliest events are learnt by
+        reading the oldest event of all the buckets when they are allocated
+        and every ``scan_interval`` seconds after that, and from the store
+        whenever it adds an event. Only buckets whose oldest event is due
+        are checked for events.
+
         :param dispatcher: Effect dispatcher
         :param int batchsize: number of events to fetch on each iteration
         :param store: cassandra store
         :param partitioner_factory: Callable of (log, callback) ->
             :obj:`Partitioner`
+        :param scan_interval: Seconds after which buckets are scanned again
+            to learn about events added by other nodes. Such events can be
+            checked up to this late. It should be well above the
+            partitioner's interval as every scan reads all the buckets.
+        :param clock: :obj:`IReactorTime` provider used to wait for events
+        :param int max_in_flight: If given, events in a bucket are checked
+            with :func:`pipelined_check_events_in_bucket` keeping at most
+            these many events in flight
         """
         MultiService.__init__(self)
         self.store = store
         self.threshold = threshold
+        self.batchsize = batchsize
+        self.scan_interval = scan_interval
+        self.max_in_flight = max_in_flight
+        self.clock = reactor if clock is None else clock
         self.log = otter_log.bind(system='otter.scheduler')
-        self.partitioner = partitioner_factory(
-            self.log, partial(self._check_events, batchsize))
+        self.partitioner = partitioner_factory(self.log, self._got_buckets)
         self.partitioner.setServiceParent(self)
         self.dispatcher = dispatcher
+        self.next_triggers = {}
+        self._last_scan = None
+        self._timer = None
+        self._timer_trigger = None
+        self._lock = defer.DeferredLock()
+        store.add_event_observer(self._event_added)
+
+    def stopService(self):
+        """
+        Stop waiting for events and stop the partitioner
+        """
+        self._cancel_timer()
+        self.next_triggers = {}
+        self._last_scan = None
+        return MultiService.stopService(self)
 
     def reset(self, path):
         """
@@ -88,7 +124,51 @@ class SchedulerService(MultiService):
         d = self.partitioner.health_check()
         return d.addCallback(got_partitioner_health_check)
 
-    def _check_events(self, batchsize, buckets):
+    def _got_buckets(self, buckets):
+        """
+        Called by partitioner with buckets allocated to this node. Scan all
+        of them if they have changed or if they were last scanned
+        ``scan_interval`` seconds ago. Otherwise the timer takes care of them.
+        """
+        now = self.clock.seconds()
+        if (self._last_scan is not None and
+                set(buckets) == set(self.next_triggers) and
+                now - self._last_scan < self.scan_interval):
+            return None
+        self._last_scan = now
+        self.next_triggers = {bucket: None for bucket in buckets}
+        return self._lock.run(self._scan_buckets, buckets)
+
+    def _scan_buckets(self, buckets):
+        """
+        Learn the next event of each bucket and check events in the buckets
+        whose next event is due
+        """
+        d = self._update_next_triggers(buckets)
+        d.addCallback(lambda due: self._check_buckets(due) if due else None)
+        return d
+
+    def _due_buckets(self, buckets):
+        """
+        Return the buckets whose next event is due
+        """
+        utcnow = datetime.utcnow()
+        return [bucket for bucket in buckets
+                if self.next_triggers.get(bucket) is not None and
+                self.next_triggers[bucket] <= utcnow]
+
+    def _check_buckets(self, buckets):
+        """
+        Check for events in buckets, learn the next event of each of them and
+        wait for the earliest one
+        """
+        d = self._check_events(buckets)
+        d.addCallback(
+            lambda results: self._update_next_triggers(buckets).addCallback(
+                lambda _: results))
+        return d
+
+    def _check_events(self, buckets):
         """
         Check for events occurring now and earlier
         """
@@ -96,11 +176,114 @@ class SchedulerService(MultiService):
         log = self.log.bind(scheduler_run_id=generate_transaction_id(),
                             utcnow=utcnow)
 
+        if self.max_in_flight is None:
+            check = check_events_in_bucket
+        else:
+            check = partial(pipelined_check_events_in_bucket,
+                            max_in_flight=self.max_in_flight)
+
         return defer.gatherResults(
-            [check_events_in_bucket(
-                log, self.dispatcher, self.store, bucket, utcnow, batchsize)
+            [check(log, self.dispatcher, self.store, bucket, utcnow,
+                   self.batchsize)
              for bucket in buckets])
 
+    def _update_next_triggers(self, buckets):
+        """
+        Get next trigger time of the buckets and wait for the earliest one
+
+        :return: Deferred fired with the buckets whose next event is due.
+            None of them are if the trigger times could not be got.
+        """
+        def got_events(events):
+            for bucket, event in zip(buckets, events):
+                if bucket in self.next_triggers:
+                    self.next_triggers[bucket] = (
+                        None if event is None else event['trigger'])
+            self._schedule()
+            return self._due_buckets(buckets)
+
+        def failed(f):
+            self.log.err(f, "sch-next-trigger-err")
+            # Check the buckets again soon instead of at the next scan
+            utcnow = datetime.utcnow()
+            for bucket in buckets:
+                if bucket in self.next_triggers:
+                    self.next_triggers[bucket] = utcnow
+            self._schedule()
+            return []
+
+        d = defer.gatherResults(
+            [self.store.get_oldest_event(bucket) for bucket in buckets],
+            consumeErrors=True)
+        d.addCallbacks(got_events, failed)
+        return d
+
+    def _event_added(self, bucket, trigger):
+        """
+        Called by store when an event is added. Wait for it if it is earlier
+        than other events in the bucket.
+        """
+        if bucket not in self.next_triggers:
+            return
+        trigger = _naive_utc(trigger)
+        current = self.next_triggers[bucket]
+        if current is None or trigger < current:
+            self.next_triggers[bucket] = trigger
+            self._schedule()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._timer_trigger = None
+
+    def _schedule(self):
+        """
+        Wait for the earliest trigger time of all buckets
+        """
+        triggers = [t for t in self.next_triggers.values() if t is not None]
+        if not triggers:
+            self._cancel_timer()
+            return
+        trigger = min(triggers)
+        if trigger == self._timer_trigger:
+            return
+        self._cancel_timer()
+        # Events that are already due are checked after a second so that
+        # events that keep failing to be fetched are not checked in a loop
+        delay = (trigger - datetime.utcnow()).total_seconds()
+        self._timer_trigger = trigger
+        self._timer = self.clock.callLater(max(delay, 1), self._timer_fired)
+
+    def _timer_fired(self):
+        """
+        Check events in buckets whose next event is due if they are still
+        allocated to this node. If none are checked, wait again for the
+        earliest event.
+        """
+        self._timer = None
+        self._timer_trigger = None
+        due = self._due_buckets(self.next_triggers)
+
+        def got_health((healthy, info)):
+            buckets = [bucket for bucket in due
+                       if healthy and bucket in info['buckets']]
+            if buckets:
+                return self._lock.run(self._check_buckets, buckets)
+            self._schedule()
+
+        return self.partitioner.health_check().addCallback(got_health)
+
+
+def _naive_utc(dt):
+    """
+    Convert timezone aware datetime to naive UTC datetime like the ones
+    returned by :func:`datetime.utcnow`
+    """
+    if dt.tzinfo is None:
+        return dt
+    return dt.replace(tzinfo=None) - dt.utcoffset()
+
 
 def check_events_in_bucket(log, dispatcher, store, bucket, now, batchsize):
     """
@@ -133,7 +316,67 @@ def check_events_in_bucket(log, dispatcher, store, bucket, now, batchsize):
     return _do_check()
 
 
-def process_events(events, dispatcher, store, log):
+def pipelined_check_events_in_bucket(log, dispatcher, store, bucket, now,
+                                     batchsize, max_in_flight):
+    """
+    Like :func:`check_events_in_bucket` but fetches next batch of events
+    while previous batches are being processed as long as there are at most
+    ``max_in_flight`` events fetched and not yet processed. Events of the
+    same group are executed one after another in the order they are fetched.
+
+    :param int max_in_flight: Maximum number of events fetched and not yet
+        processed. It is at least ``batchsize``.
+
+    :return: a deferred that fires with None after all events that occur
+        before or at now are processed
+    """
+    log = log.bind(bucket=bucket)
+    max_in_flight = max(max_in_flight, batchsize)
+    group_locks = WeakLocks()
+    state = {'in_flight': 0, 'fetching': False, 'exhausted': False}
+    done = defer.Deferred()
+
+    def maybe_done():
+        if (state['exhausted'] and not state['fetching'] and
+                state['in_flight'] == 0 and not done.called):
+            done.callback(None)
+
+    def maybe_fetch():
+        if (state['fetching'] or state['exhausted'] or
+                state['in_flight'] + batchsize > max_in_flight):
+            return
+        state['fetching'] = True
+        d = store.fetch_and_delete(bucket, now, batchsize)
+        d.addCallbacks(got_events, fetch_failed)
+
+    def fetch_failed(failure):
+        state['fetching'] = False
+        state['exhausted'] = True
+        log.err(failure)
+        maybe_done()
+
+    def got_events(events):
+        state['fetching'] = False
+        if len(events) < batchsize:
+            state['exhausted'] = True
+        state['in_flight'] += len(events)
+        d = defer.maybeDeferred(
+            process_events, events, dispatcher, store, log, group_locks)
+        d.addErrback(log.err)
+        d.addCallback(processed, len(events))
+        maybe_fetch()
+        maybe_done()
+
+    def processed(_, num_events):
+        state['in_flight'] -= num_events
+        maybe_fetch()
+        maybe_done()
+
+    maybe_fetch()
+    return done
+
+
+def process_events(events, dispatcher, store, log, group_locks=None):
     """
     Executes all the events and adds the next occurrence of each event
     to the buckets
@@ -142,6 +385,8 @@ def process_events(events, dispatcher, store, log):
     :param dispatcher: Effect dispatcher
     :param store: `IScalingGroupCollection` provider
     :param log: A bound log for logging
+    :param group_locks: :obj:`WeakLocks` used to execute events of a group
+        one at a time. Events are executed concurrently if not given.
 
     :return: a `Deferred` that fires with number of events processed
     """
@@ -152,10 +397,15 @@ def process_events(events, dispatcher, store, log):
 
     deleted_policy_ids = set()
 
-    deferreds = [
-        execute_event(dispatcher, store, log, event, deleted_policy_ids)
-        for event in events
-    ]
+    def execute(event):
+        if group_locks is None:
+            return execute_event(
+                dispatcher, store, log, event, deleted_policy_ids)
+        lock = group_locks.get_lock((event['tenantId'], event['groupId']))
+        return lock.run(execute_event, dispatcher, store, log, event,
+                        deleted_policy_ids)
+
+    deferreds = [execute(event) for event in events]
     d = defer.gatherResults(deferreds, consumeErrors=True)
     d.addCallback(lambda _: add_cron_events(store, log, events, deleted_policy_ids))
     return d.addCallback(lambda _: len(events))
@@ -209,7 +459,7 @@ def execute_event(dispatcher, store, log, event, deleted_policy_ids):
                    scheduled_time=event["trigger"].isoformat() + "Z")
     log.msg('sch-exec-pol', cloud_feed=True)
     group = store.get_scaling_group(log, tenant_id, group_id)
-    d = modify_and_trigger(
+    d = modify_and_trigger_combined(
         dispatcher,
         group,
         bound_log_kwargs(log),
@@ -6,6 +6,8 @@ import os
 from copy import deepcopy
 from functools import partial
 
+from effect import ComposedDispatcher
+
 import jsonfig
 
 from kazoo.client import KazooClient
@@ -36,8 +38,11 @@ from otter.constants import (
     CONVERGENCE_DIRTY_DIR,
     CONVERGENCE_PARTITIONER_PATH,
     get_service_configs)
+from otter.controller import set_combiner_clock
+from otter.convergence.gathering import get_gather_cache_dispatcher
 from otter.convergence.selfheal import SelfHeal
-from otter.convergence.service import Converger
+from otter.convergence.service import (
+    Converger, get_convergence_limiter_dispatcher)
 from otter.effect_dispatcher import get_full_dispatcher
 from otter.log import log
 from otter.log.cloudfeeds import CloudFeedsObserver
@@ -48,7 +53,7 @@ from otter.rest.application import Otter
 from otter.rest.bobby import set_bobby
 from otter.scheduler import SchedulerService
 from otter.supervisor import SupervisorService, set_supervisor
-from otter.util import zk
+from otter.util import logging_treq, zk
 from otter.util.config import config_value, set_config_data
 from otter.util.cqlbatch import TimingOutCQLClient
 from otter.util.deferredutils import timeout_deferred
@@ -190,6 +195,10 @@ def makeService(config):
 
     parent = MultiService()
 
+    pool_svc = setup_http_pool(reactor, config, log)
+    if pool_svc is not None:
+        pool_svc.setServiceParent(parent)
+
     region = config_value('region')
 
     seed_endpoints = [
@@ -222,6 +231,7 @@ def makeService(config):
     supervisor.setServiceParent(parent)
 
     set_supervisor(supervisor)
+    set_combiner_clock(reactor)
 
     health_checker = HealthChecker(reactor, {
         'store': getattr(store, 'health_check', None),
@@ -255,12 +265,17 @@ def makeService(config):
     if cf_conf is not None:
         id_conf = deepcopy(config['identity'])
         id_conf['strategy'] = 'single_tenant'
-        add_to_fanout(CloudFeedsObserver(
+        cf_observer = CloudFeedsObserver(
             reactor=reactor,
             authenticator=generate_authenticator(reactor, id_conf),
             tenant_id=cf_conf['tenant_id'],
             region=region,
-            service_configs=service_configs))
+            service_configs=service_configs,
+            max_queue=cf_conf.get('max_queue', 1000),
+            concurrency=cf_conf.get('concurrency', 10))
+        add_to_fanout(cf_observer)
+        parent.addService(FunctionalService(stop=partial(
+            cf_observer.flush, cf_conf.get('flush_timeout', 30))))
 
     # Setup Kazoo client
     if config_value('zookeeper'):
@@ -310,7 +325,10 @@ def makeService(config):
                 config_value('converger.interval') or 10,
                 config_value('converger.build_timeout') or 3600,
                 config_value('converger.limited_retry_iterations') or 10,
-                config_value('converger.step_limits') or {})
+                config_value('converger.step_limits') or {},
+                config_value('converger.gather_cache_ttl') or 5,
+                config_value('converger.max_concurrent') or 100,
+                config_value('converger.max_concurrent_per_tenant') or 10)
 
             # Setup selfheal service
             sh_svc = setup_selfheal_service(
@@ -324,6 +342,36 @@ def makeService(config):
     return parent
 
 
+def setup_http_pool(clock, config, log):
+    """
+    Setup persistent HTTP connection pool shared by all requests to upstream
+    services and return service that periodically logs the pool's statistics
+    and closes its connections when stopped.
+
+    :param clock: :obj:`IReactorTime` provider
+    :param dict config: Configuration dict containing http_pool info
+    :param log: :obj:`BoundLog` logger used to log statistics
+
+    :return: pool service or None if relevant config is not found
+    :rtype: :obj:`IService`
+    """
+    if "http_pool" not in config:
+        return None
+    pool_config = config["http_pool"]
+    pool = logging_treq.MeteredHTTPConnectionPool(
+        clock, pool_config.get("max_persistent_per_host", 10),
+        pool_config.get("idle_timeout", 240))
+    logging_treq.set_pool(pool)
+    svc = MultiService()
+    stats_timer = TimerService(
+        pool_config.get("stats_interval", 60), pool.log_stats,
+        log.bind(system="otter.http_pool"))
+    stats_timer.clock = clock
+    stats_timer.setServiceParent(svc)
+    FunctionalService(stop=pool.closeCachedConnections).setServiceParent(svc)
+    return svc
+
+
 def setup_selfheal_service(clock, config, dispatcher, health_checker, log):
     """
     Setup selfheal timer service and return it.
@@ -341,7 +389,11 @@ def setup_selfheal_service(clock, config, dispatcher, health_checker, log):
     if "selfheal" not in config:
         return None
     interval = get_in(["selfheal", "interval"], config, no_default=True)
-    selfheal = SelfHeal(clock, dispatcher, config_value, interval, log)
+    selfheal = SelfHeal(
+        clock, dispatcher, config_value, interval, log,
+        paced=get_in(["selfheal", "mode"], config) == "paced",
+        page_size=get_in(["selfheal", "page_size"], config, 100),
+        max_row_age=get_in(["selfheal", "max_row_age"], config, 30.0))
     func, lock = zk.locked_logged_func(
         dispatcher, "/selfheallock", log, "selfheal-lock-acquired",
         selfheal.setup)
@@ -352,10 +404,16 @@ def setup_selfheal_service(clock, config, dispatcher, health_checker, log):
 
 
 def setup_converger(parent, kz_client, dispatcher, interval, build_timeout,
-                    limited_retry_iterations, step_limits):
+                    limited_retry_iterations, step_limits, gather_cache_ttl,
+                    max_concurrent, max_concurrent_per_tenant):
     """
     Create a Converger service, which has a Partitioner as a child service, so
     that if the Converger is stopped, the partitioner is also stopped.
+
+    The Converger's dispatcher is extended with a tenant gather cache keeping
+    results for ``gather_cache_ttl`` seconds and a limiter allowing
+    ``max_concurrent`` group convergences at a time, at most
+    ``max_concurrent_per_tenant`` of them from a single tenant.
     """
     partitioner_factory = partial(
         Partitioner,
@@ -364,6 +422,11 @@ def setup_converger(parent, kz_client, dispatcher, interval, build_timeout,
         partitioner_path=CONVERGENCE_PARTITIONER_PATH,
         time_boundary=15,  # time boundary
     )
+    dispatcher = ComposedDispatcher([
+        get_gather_cache_dispatcher(reactor, gather_cache_ttl),
+        get_convergence_limiter_dispatcher(
+            reactor, max_concurrent, max_concurrent_per_tenant),
+        dispatcher])
     cvg = Converger(log, dispatcher, 10, partitioner_factory, build_timeout,
                     interval / 2, limited_retry_iterations, step_limits)
     cvg.setServiceParent(parent)
@@ -383,12 +446,14 @@ def setup_scheduler(parent, dispatcher, store, kz_client):
     partition_path = (config_value('scheduler.partition.path') or
                       '/scheduler_partition')
     time_boundary = config_value('scheduler.partition.time_boundary') or 15
+    interval = int(config_value('scheduler.interval'))
     partitioner_factory = partial(
         Partitioner,
-        kz_client, int(config_value('scheduler.interval')), partition_path,
-        buckets, time_boundary)
+        kz_client, interval, partition_path, buckets, time_boundary)
     scheduler_service = SchedulerService(
         dispatcher, int(config_value('scheduler.batchsize')),
-        store, partitioner_factory)
+        store, partitioner_factory,
+        scan_interval=config_value('scheduler.scan_interval') or 30,
+        max_in_flight=config_value('scheduler.max_in_flight'))
     scheduler_service.setServiceParent(parent)
     return scheduler_service
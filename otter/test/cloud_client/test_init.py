@@ -21,6 +21,7 @@ import six
 from toolz.dicttoolz import assoc
 
 from twisted.internet.task import Clock
+from twisted.python.failure import Failure
 from twisted.trial.unittest import SynchronousTestCase
 
 from txeffect import perform
@@ -36,7 +37,8 @@ from otter.cloud_client import (
     ServiceRequest,
     TenantScope,
     _Throttle,
-    _default_throttler,
+    _TokenBucketThrottler,
+    _is_rate_limited,
     _perform_throttle,
     add_bind_service,
     check_stack,
@@ -44,6 +46,7 @@ from otter.cloud_client import (
     create_server,
     create_stack,
     delete_stack,
+    fold_servers_details,
     get_cloud_client_dispatcher,
     get_server_details,
     list_servers_details_all,
@@ -57,6 +60,7 @@ from otter.constants import ServiceType
 from otter.log.intents import Log
 from otter.test.utils import (
     StubResponse,
+    mock_log,
     nested_sequence,
     resolve_effect,
     stub_pure_response
@@ -65,7 +69,6 @@ from otter.test.worker.test_launch_server_v1 import fake_service_catalog
 from otter.util.config import set_config_data
 from otter.util.http import APIError, headers
 from otter.util.pure_http import Request, has_code
-from otter.util.weaklocks import WeakLocks
 
 
 def make_service_configs():
@@ -368,23 +371,26 @@ class ThrottleTests(SynchronousTestCase):
         self.assertEqual(result, ('bracketed', 'foo'))
 
 
-class DefaultThrottlerTests(SynchronousTestCase):
-    """Tests for :func:`_default_throttler`."""
+class TokenBucketThrottlerTests(SynchronousTestCase):
+    """Tests for :obj:`_TokenBucketThrottler`."""
 
-    def tearDown(self):
-        set_config_data(None)
+    def setUp(self):
+        self.clock = Clock()
+        self.log = mock_log()
+        self.throttler = _TokenBucketThrottler(self.clock, self.log)
+        self.addCleanup(set_config_data, {})
 
     def test_mismatch(self):
         """policy doesn't have a throttler for random junk."""
-        bracket = _default_throttler(
-            WeakLocks(), None, 'foo', 'get', 'any-tenant')
+        bracket = self.throttler('foo', 'get', 'any-tenant')
         self.assertIs(bracket, None)
 
     def test_no_config(self):
         """ No config results in no throttling """
-        bracket = _default_throttler(
-            WeakLocks(), None, ServiceType.CLOUD_SERVERS, 'get', 'any-tenant')
+        bracket = self.throttler(
+            ServiceType.CLOUD_SERVERS, 'get', 'any-tenant')
         self.assertIs(bracket, None)
+        self.assertEqual(self.throttler.buckets, {})
 
     def test_post_and_delete_not_the_same(self):
         """
@@ -393,66 +399,58 @@ class DefaultThrottlerTests(SynchronousTestCase):
         set_config_data(
             {"cloud_client": {"throttling": {"create_server_delay": 1,
                                              "delete_server_delay": 0.4}}})
-        clock = Clock()
-        locks = WeakLocks()
-        deleter = _default_throttler(
-            locks, clock, ServiceType.CLOUD_SERVERS, 'delete', 'any-tenant')
-        poster = _default_throttler(
-            locks, clock, ServiceType.CLOUD_SERVERS, 'post', 'any-tenant')
-        self.assertIsNot(deleter, poster)
+        deleter = self.throttler(
+            ServiceType.CLOUD_SERVERS, 'delete', 'any-tenant')
+        poster = self.throttler(
+            ServiceType.CLOUD_SERVERS, 'post', 'any-tenant')
+        self.assertIsNot(deleter.__self__, poster.__self__)
 
     def _test_throttle(self, cfg_name, stype, method):
-        """Test a specific throttling configuration."""
-        locks = WeakLocks()
+        """
+        Test a specific throttling configuration: ``delay`` config allows a
+        request every ``delay`` seconds and the bucket is shared between
+        different calls to the throttler.
+        """
         set_config_data(
             {'cloud_client': {'throttling': {cfg_name: 500}}})
-        self.addCleanup(set_config_data, {})
-        clock = Clock()
-        bracket = _default_throttler(locks, clock, stype, method, 'tenant1')
+        throttler = _TokenBucketThrottler(self.clock, self.log)
+        bracket = throttler(stype, method, 'tenant1')
         if bracket is None:
             self.fail("No throttler for %s and %s" % (stype, method))
-        d = bracket(lambda: 'foo')
-        clock.advance(499)
-        self.assertNoResult(d)
-        clock.advance(500)
-        self.assertEqual(self.successResultOf(d), 'foo')
-
-        # also make sure that the lock is shared between different calls to the
-        # throttler.
-        bracket1 = _default_throttler(locks, clock, stype, method, 'tenant1')
+        self.assertEqual(self.successResultOf(bracket(lambda: 'foo')), 'foo')
+
+        bracket1 = throttler(stype, method, 'tenant1')
         result1 = bracket1(lambda: 'bar1')
-        bracket2 = _default_throttler(locks, clock, stype, method, 'tenant1')
+        bracket2 = throttler(stype, method, 'tenant1')
         result2 = bracket2(lambda: 'bar2')
-        clock.advance(499)
+        self.clock.advance(499)
         self.assertNoResult(result1)
         self.assertNoResult(result2)
-        clock.advance(1)
+        self.clock.advance(1)
         self.assertEqual(self.successResultOf(result1), 'bar1')
         self.assertNoResult(result2)
-        clock.advance(500)
+        self.clock.advance(500)
         self.assertEqual(self.successResultOf(result2), 'bar2')
 
     def _test_tenant(self, cfg_name, stype, method):
         """
-        Test a specific throttling configuration, and ensure that locks are
+        Test a specific throttling configuration, and ensure that buckets are
         per-tenant.
         """
-        locks = WeakLocks()
         set_config_data(
             {'cloud_client': {'throttling': {cfg_name: 500}}})
-        self.addCleanup(set_config_data, {})
-        clock = Clock()
-        bracket1 = _default_throttler(locks, clock, stype, method, 'tenant1')
+        throttler = _TokenBucketThrottler(self.clock, self.log)
+        bracket1 = throttler(stype, method, 'tenant1')
         if bracket1 is None:
             self.fail("No throttler for %s and %s" % (stype, method))
+        bracket1(lambda: 'bar1')
         result1 = bracket1(lambda: 'bar1')
-        bracket2 = _default_throttler(locks, clock, stype, method, 'tenant2')
+        bracket2 = throttler(stype, method, 'tenant2')
         result2 = bracket2(lambda: 'bar2')
         self.assertNoResult(result1)
-        self.assertNoResult(result2)
-        clock.advance(500)
-        self.assertEqual(self.successResultOf(result1), 'bar1')
         self.assertEqual(self.successResultOf(result2), 'bar2')
+        self.clock.advance(500)
+        self.assertEqual(self.successResultOf(result1), 'bar1')
 
     def test_delay_configurable(self):
         """Delays are configurable."""
@@ -460,10 +458,6 @@ class DefaultThrottlerTests(SynchronousTestCase):
             'create_server_delay', ServiceType.CLOUD_SERVERS, 'post')
         self._test_throttle(
             'delete_server_delay', ServiceType.CLOUD_SERVERS, 'delete')
-        self._test_throttle(
-            'create_server_delay', ServiceType.CLOUD_SERVERS, 'post')
-        self._test_throttle(
-            'delete_server_delay', ServiceType.CLOUD_SERVERS, 'delete')
 
         self._test_throttle(
             'get_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'get')
@@ -481,7 +475,7 @@ class DefaultThrottlerTests(SynchronousTestCase):
         self._test_throttle(
             'delete_rcv3_delay', ServiceType.RACKCONNECT_V3, 'delete')
 
-    def test_tenant_specific_locking(self):
+    def test_tenant_specific_buckets(self):
         self._test_tenant(
             'get_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'get')
         self._test_tenant(
@@ -491,6 +485,80 @@ class DefaultThrottlerTests(SynchronousTestCase):
         self._test_tenant(
             'delete_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'delete')
 
+    def test_rate_and_burst(self):
+        """
+        Rate and burst config takes precedence over delay config. Backoff
+        factor and recovery ratio are configurable.
+        """
+        set_config_data(
+            {'cloud_client': {'throttling': {
+                'create_server_delay': 500, 'create_server_rate': 2,
+                'create_server_burst': 5, 'backoff_factor': 0.25,
+                'recovery_ratio': 0.5}}})
+        bracket = self.throttler(ServiceType.CLOUD_SERVERS, 'post', 't')
+        bucket = bracket.__self__
+        self.assertEqual(
+            (bucket.rate, bucket.burst, bucket.backoff_factor,
+             bucket.recovery_step),
+            (2, 5, 0.25, 1))
+        self.assertIs(bucket.is_throttled, _is_rate_limited)
+
+    def test_is_rate_limited(self):
+        """
+        413 and 429 API errors are rate limited responses
+        """
+        self.assertTrue(_is_rate_limited(Failure(APIError(413, ''))))
+        self.assertTrue(_is_rate_limited(Failure(APIError(429, ''))))
+        self.assertFalse(_is_rate_limited(Failure(APIError(500, ''))))
+        self.assertFalse(_is_rate_limited(Failure(ValueError(413))))
+
+    def test_log_stats(self):
+        """
+        Statistics of buckets used are logged every ``stats_interval``
+        seconds and idle buckets are forgotten
+        """
+        set_config_data(
+            {'cloud_client': {'throttling': {'create_server_delay': 1,
+                                             'get_clb_delay': 1,
+                                             'recovery_ratio': 0.5}}})
+        servers = self.throttler(ServiceType.CLOUD_SERVERS, 'post', 't1')
+        servers(lambda: None)
+        servers(lambda: None)
+        clb = self.throttler(ServiceType.CLOUD_LOAD_BALANCERS, 'get', 't1')
+        self.failureResultOf(clb(lambda: 1 / 0), ZeroDivisionError)
+        self.clock.advance(1)
+        self.failureResultOf(clb(lambda: raise_(APIError(413, ''))),
+                             APIError)
+        self.clock.advance(59)
+        self.log.msg.assert_has_calls([
+            mock.call(
+                "throttle-stats", service_type="CLOUD_SERVERS",
+                method="post", tenant_id=None, requests=2, waits=1,
+                avg_wait_time=1.0, throttled_responses=0, rate=1.0,
+                tokens=1),
+            mock.call(
+                "throttle-stats", service_type="CLOUD_LOAD_BALANCERS",
+                method="get", tenant_id="t1", requests=2, waits=0,
+                avg_wait_time=0, throttled_responses=1, rate=0.5,
+                tokens=1)], any_order=True)
+        self.assertEqual(
+            self.throttler.buckets.keys(),
+            [(ServiceType.CLOUD_LOAD_BALANCERS, 'get', 't1')])
+        # Nothing is logged for bucket not used but it is kept until it
+        # recovers
+        self.log.msg.reset_mock()
+        self.clock.advance(60)
+        self.assertFalse(self.log.msg.called)
+        self.assertEqual(len(self.throttler.buckets), 1)
+        clb(lambda: None)
+        self.clock.advance(60)
+        self.assertEqual(self.throttler.buckets, {})
+        # stats are not logged anymore when there are no buckets
+        self.log.msg.reset_mock()
+        self.clock.advance(60)
+        self.assertFalse(self.log.msg.called)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
 
 class GetCloudClientDispatcherTests(SynchronousTestCase):
     """Tests for :func:`get_cloud_client_dispatcher`."""
@@ -502,15 +570,15 @@ class GetCloudClientDispatcherTests(SynchronousTestCase):
                              effect=Effect(Constant('foo')))
         self.assertIs(dispatcher(throttle), _perform_throttle)
 
-    @mock.patch('twisted.internet.defer.DeferredLock.run')
-    def test_performs_tenant_scope(self, deferred_lock_run):
+    @mock.patch('otter.util.tokenbucket.TokenBucket.run')
+    def test_performs_tenant_scope(self, bucket_run):
         """
         :func:`perform_tenant_scope` performs :obj:`TenantScope`, and uses the
         default throttler
         """
         # We want to ensure
         # 1. the TenantScope can be performed
-        # 2. the ServiceRequest is run within a lock, since it matches the
+        # 2. the ServiceRequest is run within a bucket, since it matches the
         #    default throttling policy
 
         set_config_data(
@@ -530,7 +598,7 @@ class GetCloudClientDispatcherTests(SynchronousTestCase):
             result.addCallback(
                 lambda x: (x[0], assoc(x[1], 'locked', True)))
             return result
-        deferred_lock_run.side_effect = run
+        bucket_run.side_effect = run
 
         response = stub_pure_response({}, 200)
         seq = SequenceDispatcher([
@@ -545,8 +613,6 @@ class GetCloudClientDispatcherTests(SynchronousTestCase):
         disp = ComposedDispatcher([seq, dispatcher])
         with seq.consume():
             result = perform(disp, Effect(tscope))
-            self.assertNoResult(result)
-            clock.advance(1)
             self.assertEqual(self.successResultOf(result),
                              (response[0], {'locked': True}))
 
@@ -1005,6 +1071,47 @@ class NovaClientTests(SynchronousTestCase):
         ]
         self.assertRaises(NovaComputeFaultError, perform_sequence, seq, eff)
 
+    def test_fold_servers_details(self):
+        """
+        :func:`fold_servers_details` calls the given function with servers of
+        each page as soon as the page is listed. The effect can be performed
+        again, folding from the initial value.
+        """
+        bodies = [
+            {'servers': ['1', '2'],
+             'servers_links': [{'href': 'doesnt_matter_url?marker=3',
+                                'rel': 'next'}]},
+            {'servers': ['3'], 'servers_links': []}
+        ]
+        resps = [json.dumps(d) for d in bodies]
+        calls = []
+
+        def f(acc, servers):
+            calls.append(servers)
+            return acc + len(servers)
+
+        eff = fold_servers_details(f, 10, {'marker': ['1']})
+
+        def first_page_listed(i):
+            self.assertEqual(calls, [])
+            return service_request_eqf(stub_pure_response(resps[0], 200))(i)
+
+        def second_page_listed(i):
+            self.assertEqual(calls, [['1', '2']])
+            return service_request_eqf(stub_pure_response(resps[1], 200))(i)
+
+        seq = [
+            (self._list_server_details_intent({'marker': ['1']}),
+             first_page_listed),
+            (self._list_server_details_log_intent(bodies[0]), lambda _: None),
+            (self._list_server_details_intent({'marker': ['3']}),
+             second_page_listed),
+            (self._list_server_details_log_intent(bodies[1]), lambda _: None)
+        ]
+        self.assertEqual(perform_sequence(seq, eff), 13)
+        del calls[:]
+        self.assertEqual(perform_sequence(seq, eff), 13)
+
     def test_list_servers_details_all_propagates_errors(self):
         """
         :func:`list_servers_details_all` propagates exceptions from making
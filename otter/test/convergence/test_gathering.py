@@ -1,8 +1,9 @@
 """Tests for convergence gathering."""
 
 from copy import deepcopy
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import partial
+from hashlib import sha1
 
 import attr
 
@@ -10,22 +11,28 @@ from effect import (
     ComposedDispatcher,
     Constant,
     Effect,
+    Func,
     ParallelEffects,
     TypeDispatcher,
-    sync_perform)
+    base_dispatcher,
+    sync_perform,
+    sync_performer)
 
 from effect.async import perform_parallel_async
 from effect.testing import (
-    EQDispatcher, EQFDispatcher, Stub, intent_func, nested_sequence,
-    parallel_sequence, perform_sequence)
+    EQDispatcher, EQFDispatcher, Stub, const, intent_func, nested_sequence,
+    noop, parallel_sequence, perform_sequence)
 
 import mock
 
-from pyrsistent import freeze
+from pyrsistent import freeze, pset
 
 from toolz.curried import map
+from toolz.dicttoolz import assoc
 from toolz.functoolz import compose
 
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.auth import NoSuchEndpoint
@@ -33,7 +40,14 @@ from otter.cloud_client import service_request
 from otter.cloud_client.clb import CLBNotFoundError
 
 from otter.constants import ServiceType
+from otter.convergence import gathering
 from otter.convergence.gathering import (
+    DrainedAtCache,
+    GatherCache,
+    GetCachedDrainedAt,
+    InvalidateSharedGather,
+    SharedGather,
+    UpdateCachedDrainedAt,
     extract_clb_drained_at,
     get_all_launch_server_data,
     get_all_launch_stack_data,
@@ -41,10 +55,13 @@ from otter.convergence.gathering import (
     get_all_server_details,
     get_all_stacks,
     get_clb_contents,
+    get_gather_cache_dispatcher,
     get_rcv3_contents,
     get_scaling_group_servers,
     get_scaling_group_stacks,
-    mark_deleted_servers)
+    mark_deleted_servers,
+    merge_changed_servers,
+    servers_clb_ids)
 from otter.convergence.model import (
     CLB,
     CLBDescription,
@@ -57,6 +74,7 @@ from otter.convergence.model import (
 from otter.indexer import atom
 from otter.log.intents import Log
 from otter.test.utils import (
+    DummyException,
     EffectServersCache,
     StubResponse,
     patch,
@@ -202,6 +220,31 @@ class GetAllScalingGroupServersTests(SynchronousTestCase):
             result,
             {'a': as_servers[:5] + [as_servers[-1]], 'b': as_servers[5:8]})
 
+    def test_multiple_pages(self):
+        """
+        Servers from all pages are grouped
+        """
+        server_a = {'metadata': {'rax:auto_scaling_group_id': 'a'}, 'id': 1}
+        server_b = {'metadata': {'rax:auto_scaling_group_id': 'b'}, 'id': 2}
+        server_a2 = {'metadata': {'rax:auto_scaling_group_id': 'a'}, 'id': 3}
+        bodies = [
+            {'servers': [server_a, {'id': 4}],
+             'servers_links': [{'href': 'url?marker=4', 'rel': 'next'}]},
+            {'servers': [server_b, server_a2]}]
+        sequence = [
+            (service_request(*self.req).intent,
+             lambda i: (StubResponse(200, None), bodies[0])),
+            (Log(mock.ANY, mock.ANY), lambda i: None),
+            (service_request(
+                ServiceType.CLOUD_SERVERS, 'GET', 'servers/detail', None,
+                None, {'marker': ['4']}).intent,
+             lambda i: (StubResponse(200, None), bodies[1])),
+            (Log(mock.ANY, mock.ANY), lambda i: None)
+        ]
+        result = perform_sequence(sequence, get_all_scaling_group_servers())
+        self.assertEqual(result,
+                         {'a': [server_a, server_a2], 'b': [server_b]})
+
     def test_filters_on_user_criteria(self):
         """
         Considers user provided filter if provided
@@ -235,9 +278,9 @@ class GetScalingGroupServersTests(SynchronousTestCase):
         self.now = datetime(2010, 5, 31)
         self.freeze = compose(set, map(freeze))
 
-    def _invoke(self):
+    def _invoke(self, now=None):
         return get_scaling_group_servers(
-            'tid', 'gid', self.now, cache_class=EffectServersCache,
+            'tid', 'gid', now or self.now, cache_class=EffectServersCache,
             all_as_servers=intent_func("all-as"),
             all_servers=intent_func("alls"))
 
@@ -246,20 +289,24 @@ class GetScalingGroupServersTests(SynchronousTestCase):
                                     {'id': 'b', 'b': 'c'}]
         sequence = [
             (("cachegstidgid", False), lambda i: (object(), None)),
+            (Log('gather-servers', {'fetch': 'initial'}), noop),
             (("all-as",), lambda i: {} if empty else {"gid": current})]
-        self.assertEqual(perform_sequence(sequence, self._invoke()), current)
+        self.assertEqual(perform_sequence(sequence, self._invoke()),
+                         (current, True))
 
     def test_no_cache(self):
         """
-        If cache is empty then current list of servers are returned
+        If cache is empty then current list of servers are returned along
+        with True since all servers were listed
         """
         self._test_no_cache(False)
         self._test_no_cache(True)
 
     def test_from_cache(self):
         """
-        If cache is there then servers returned are updated with servers
-        not found in current list marked as deleted
+        If cache is there and full resync is due then servers returned are
+        updated with servers not found in current list marked as deleted,
+        along with True since all servers were listed
         """
         asmetakey = "rax:autoscale:group:id"
         cache = [
@@ -275,12 +322,92 @@ class GetScalingGroupServersTests(SynchronousTestCase):
         last_update = datetime(2010, 5, 20)
         sequence = [
             (("cachegstidgid", False), lambda i: (cache, last_update)),
+            (Log('gather-servers', {'fetch': 'full'}), noop),
             (("alls",), lambda i: current)]
         del_cache_server = deepcopy(cache[1])
         del_cache_server["status"] = "DELETED"
+        servers, listed_all = perform_sequence(sequence, self._invoke())
         self.assertEqual(
-            self.freeze(perform_sequence(sequence, self._invoke())),
+            self.freeze(servers),
             self.freeze([del_cache_server, cache[-1]] + current[0:2]))
+        self.assertTrue(listed_all)
+
+    def test_from_cache_changes_since(self):
+        """
+        If cache is there and full resync is not due then only servers
+        changed since last update of cache (minus margin) are fetched and
+        merged into cached servers. Servers deleted in Nova are returned by
+        it with DELETED status and possibly without metadata. They replace
+        the cached servers as DELETED before servers are filtered by group.
+        False is returned along with servers since not all servers were
+        listed.
+        """
+        asmetakey = "rax:autoscale:group:id"
+        cache = [
+            {'id': 'a', 'metadata': {asmetakey: "gid"}},  # gets updated
+            {'id': 'b', 'metadata': {asmetakey: "gid"}},  # deleted
+            {'id': 'd', 'metadata': {asmetakey: "gid"}},  # meta removed
+            {'id': 'c', 'metadata': {asmetakey: "gid"}}]  # unchanged
+        changed = [
+            {'id': 'a', 'b': 'c', 'metadata': {asmetakey: "gid"}},
+            {'id': 'b', 'status': 'DELETED'},
+            {'id': 'z', 'z': 'w', 'metadata': {asmetakey: "gid"}},  # new
+            {'id': 'd', 'metadata': {"changed": "yes"}},
+            {'id': 'y', 'metadata': {asmetakey: "other"}},
+            {'id': 'x', 'status': 'DELETED'}]  # not in cache
+        last_update = datetime(2010, 5, 31, 0, 0, 10)
+        now = datetime(2010, 5, 31, 0, 0, 20)
+        self.patch(gathering, "_full_resync_due",
+                   lambda gid, lu, n, i: (gid, lu, n, i) != (
+                       "gid", last_update, now, 600))
+        sequence = [
+            (("cachegstidgid", False), lambda i: (cache, last_update)),
+            (Log('gather-servers', {'fetch': 'delta'}), noop),
+            (("alls", datetime(2010, 5, 31, 0, 0, 10) - timedelta(
+                seconds=300)),
+             lambda i: changed)]
+        servers, listed_all = perform_sequence(sequence, self._invoke(now))
+        self.assertEqual(
+            self.freeze(servers),
+            self.freeze([changed[0], changed[2], cache[-1],
+                         assoc(cache[1], 'status', 'DELETED')]))
+        self.assertFalse(listed_all)
+
+    def test_merge_changed_servers(self):
+        """
+        :func:`merge_changed_servers` replaces old servers with changed
+        servers of the same ID and keeps the rest. Deleted servers replace
+        old servers as the old server marked DELETED.
+        """
+        old = [{'id': 'a', 'a': 1}, {'id': 'b', 'b': 2},
+               {'id': 'c', 'c': 3}]
+        changed = [{'id': 'd', 'd': 3}, {'id': 'b', 'status': 'DELETED'},
+                   {'id': 'c', 'c': 4}, {'id': 'e', 'status': 'DELETED'}]
+        self.assertEqual(
+            self.freeze(merge_changed_servers(old, changed)),
+            self.freeze([old[0], changed[0], changed[2], changed[3],
+                         {'id': 'b', 'b': 2, 'status': 'DELETED'}]))
+
+    def test_full_resync_due(self):
+        """
+        :func:`_full_resync_due` returns True only when the interval period
+        (offset by group) in which cache was last updated has ended
+        """
+        interval = 600
+        offset = int(sha1("gid").hexdigest(), 16) % interval
+        boundary = datetime.utcfromtimestamp(
+            (1275264000 // interval + 1) * interval - offset)
+        due = partial(gathering._full_resync_due, "gid", interval=interval)
+        self.assertFalse(
+            due(boundary - timedelta(seconds=5),
+                now=boundary - timedelta(seconds=1)))
+        self.assertTrue(
+            due(boundary - timedelta(seconds=1), now=boundary))
+        self.assertFalse(
+            due(boundary, now=boundary + timedelta(seconds=interval - 1)))
+        # cache older than interval always resyncs
+        self.assertTrue(
+            due(boundary, now=boundary + timedelta(seconds=interval)))
 
     def test_mark_deleted_servers_precedence(self):
         """
@@ -485,8 +612,14 @@ class GetCLBContentsTests(SynchronousTestCase):
                                [nodes_req(2, [node21, node22])],
                                [lb_hm_req(1, {"type": "CONNECT"})],
                                [lb_hm_req(2, {})]]),
+            (GetCachedDrainedAt([('1', '11'), ('2', '22')]),
+             const({})),
             parallel_sequence([[node_feed_req('1', '11', '11feed')],
                                [node_feed_req('2', '22', '22feed')]]),
+            (UpdateCachedDrainedAt(
+                found={('1', '11'): 1.0, ('2', '22'): 2.0},
+                undrained=[('1', '12'), ('2', '21')]),
+             noop)
         ]
         eff = get_clb_contents()
         self.assertEqual(
@@ -504,7 +637,9 @@ class GetCLBContentsTests(SynchronousTestCase):
         seq = [
             lb_req('loadbalancers', True, {'loadBalancers': []}),
             parallel_sequence([]),  # No LBs to fetch
+            (GetCachedDrainedAt([]), const({})),
             parallel_sequence([]),  # No nodes to fetch
+            (UpdateCachedDrainedAt(found={}, undrained=[]), noop)
         ]
         eff = get_clb_contents()
         self.assertEqual(perform_sequence(seq, eff), ([], {}))
@@ -520,7 +655,9 @@ class GetCLBContentsTests(SynchronousTestCase):
                 [nodes_req(1, [])], [nodes_req(2, [])],
                 [lb_hm_req(1, {})], [lb_hm_req(2, {"type": "a"})]
             ]),
+            (GetCachedDrainedAt([]), const({})),
             parallel_sequence([]),  # No nodes to fetch
+            (UpdateCachedDrainedAt(found={}, undrained=[]), noop)
         ]
         self.assertEqual(
             perform_sequence(seq, get_clb_contents()),
@@ -537,7 +674,11 @@ class GetCLBContentsTests(SynchronousTestCase):
                                [nodes_req(2, [node('21', 'a21')])],
                                [lb_hm_req(1, {})],
                                [lb_hm_req(2, {})]]),
-            parallel_sequence([])  # No nodes to fetch
+            (GetCachedDrainedAt([]), const({})),
+            parallel_sequence([]),  # No nodes to fetch
+            (UpdateCachedDrainedAt(
+                found={}, undrained=[('1', '11'), ('2', '21')]),
+             noop)
         ]
         make_desc = partial(CLBDescription, port=20, weight=2,
                             condition=CLBNodeCondition.ENABLED,
@@ -567,7 +708,9 @@ class GetCLBContentsTests(SynchronousTestCase):
                 [lb_req('loadbalancers/2/healthmonitor', True,
                         CLBNotFoundError(lb_id=u'2'))]
             ]),
-            parallel_sequence([])  # No node feeds to fetch
+            (GetCachedDrainedAt([]), const({})),
+            parallel_sequence([]),  # No node feeds to fetch
+            (UpdateCachedDrainedAt(found={}, undrained=[('1', '11')]), noop)
         ]
         make_desc = partial(CLBDescription, port=20, weight=2,
                             condition=CLBNodeCondition.ENABLED,
@@ -595,9 +738,12 @@ class GetCLBContentsTests(SynchronousTestCase):
                 [lb_hm_req(1, {"type": "CONNECT"})],
                 [lb_hm_req(2, {"type": "CONNECT"})]
             ]),
+            (GetCachedDrainedAt([('1', '11'), ('2', '21')]), const({})),
             parallel_sequence([
                 [node_feed_req('1', '11', CLBNotFoundError(lb_id=u'1'))],
                 [node_feed_req('2', '21', '22feed')]]),
+            (UpdateCachedDrainedAt(found={('2', '21'): 2.0}, undrained=[]),
+             noop)
         ]
         eff = get_clb_contents()
         self.assertEqual(
@@ -605,6 +751,84 @@ class GetCLBContentsTests(SynchronousTestCase):
             ([attr.assoc(CLBNode.from_node_json(2, node21), _drained_at=2.0)],
              {'2': CLB(True)}))
 
+    def test_cached_drained_at(self):
+        """
+        Feeds of DRAINING nodes whose drained-at time is cached are not
+        fetched. Only newly found times are cached.
+        """
+        node11 = node('11', 'a11', condition='DRAINING')
+        node12 = node('12', 'a12', condition='DRAINING')
+        seq = [
+            parallel_sequence([[nodes_req('1', [node11, node12])],
+                               [lb_hm_req('1', {})]]),
+            (GetCachedDrainedAt([('1', '11'), ('1', '12')]),
+             const({('1', '11'): 5.0})),
+            parallel_sequence([[node_feed_req('1', '12', '11feed')]]),
+            (UpdateCachedDrainedAt(found={('1', '12'): 1.0}, undrained=[]),
+             noop)
+        ]
+        self.assertEqual(
+            perform_sequence(seq, get_clb_contents(['1'])),
+            ([attr.assoc(CLBNode.from_node_json('1', node11), _drained_at=5.0),
+              attr.assoc(CLBNode.from_node_json('1', node12),
+                         _drained_at=1.0)],
+             {'1': CLB(False)}))
+
+    def test_given_lb_ids(self):
+        """
+        Only contents of given load balancers are fetched without listing
+        the tenant's load balancers
+        """
+        seq = [
+            parallel_sequence([[nodes_req('1', [node('11', 'a11')])],
+                               [lb_hm_req('1', {})]]),
+            (GetCachedDrainedAt([]), const({})),
+            parallel_sequence([]),  # No nodes to fetch
+            (UpdateCachedDrainedAt(found={}, undrained=[('1', '11')]), noop)
+        ]
+        self.assertEqual(
+            perform_sequence(seq, get_clb_contents(['1'])),
+            ([CLBNode.from_node_json('1', node('11', 'a11'))],
+             {'1': CLB(False)}))
+
+    def test_given_no_lb_ids(self):
+        """
+        Nothing is fetched if empty list of LB IDs is given
+        """
+        seq = [parallel_sequence([]),
+               (GetCachedDrainedAt([]), const({})),
+               parallel_sequence([]),
+               (UpdateCachedDrainedAt(found={}, undrained=[]), noop)]
+        self.assertEqual(perform_sequence(seq, get_clb_contents([])),
+                         ([], {}))
+
+
+class ServersCLBIDsTests(SynchronousTestCase):
+    """
+    Tests for :func:`servers_clb_ids`
+    """
+
+    def test_clb_ids(self):
+        """
+        Returns sorted unique CLB IDs from servers' desired LBs and the
+        launch config ignoring RCv3 LBs
+        """
+        servers = [
+            server('a', ServerState.ACTIVE,
+                   desired_lbs=pset([CLBDescription(lb_id='2', port=80),
+                                     CLBDescription(lb_id='2', port=8080),
+                                     RCv3Description(lb_id='3')])),
+            server('b', ServerState.ACTIVE,
+                   desired_lbs=pset([CLBDescription(lb_id='1', port=80)])),
+            server('c', ServerState.ACTIVE)]
+        launch_config = {'args': {'loadBalancers': [
+            {'loadBalancerId': 4, 'port': 80},
+            {'loadBalancerId': '1', 'port': 443},
+            {'loadBalancerId': '5', 'type': 'RackConnectV3'}]}}
+        self.assertEqual(servers_clb_ids(servers, launch_config),
+                         ['1', '2', '4'])
+        self.assertEqual(servers_clb_ids([], {'args': {}}), [])
+
 
 class GetRCv3ContentsTests(SynchronousTestCase):
     """
@@ -737,13 +961,25 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
              'created': '1970-01-01T00:00:01Z',
              'addresses': {'private': [{'addr': u'10.0.0.2',
                                         'version': 4}]},
-             'links': [{'href': 'link2', 'rel': 'self'}]}
+             'links': [{'href': 'link2', 'rel': 'self'}],
+             'metadata': {
+                 'rax:autoscale:lb:CloudLoadBalancer:lb1': '[{"port": 80}]',
+                 'rax:autoscale:lb:RackConnectV3:lb2': ''}}
         ]
         self.now = datetime(2010, 10, 20, 03, 30, 00)
+        self.disp = ComposedDispatcher([
+            get_gather_cache_dispatcher(Clock(), 10),
+            TypeDispatcher({
+                Log: sync_performer(lambda d, i: None),
+                ParallelEffects: perform_parallel_async,
+                Stub: sync_performer(
+                    lambda d, i: sync_perform(d, Effect(i.intent)))}),
+            base_dispatcher])
 
     def test_success(self):
         """
         The data is returned as a tuple of ([NovaServer], [CLBNode/RCv3Node]).
+        Contents of CLBs referenced by servers and launch config are fetched.
         """
         clb_nodes = [CLBNode(node_id='node1', address='ip1',
                              description=CLBDescription(lb_id='lb1', port=80))]
@@ -754,10 +990,12 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
             'tid',
             'gid',
             self.now,
+            {'args': {'loadBalancers': [{'loadBalancerId': 'lb3',
+                                         'port': 80}]}},
             get_scaling_group_servers=_constant_as_eff(
-                ('tid', 'gid', self.now), self.servers),
+                ('tid', 'gid', self.now), (self.servers, False)),
             get_clb_contents=_constant_as_eff(
-                (), (clb_nodes, {'lb1': CLB(True), 'lb2': CLB(False)})),
+                (['lb1', 'lb3'],), (clb_nodes, {'lb1': CLB(True)})),
             get_rcv3_contents=_constant_as_eff((), rcv3_nodes))
 
         expected_servers = [
@@ -767,12 +1005,14 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
             server('b', ServerState.ACTIVE, created=1,
                    servicenet_address='10.0.0.2',
                    links=freeze([{'href': 'link2', 'rel': 'self'}]),
+                   desired_lbs=pset([CLBDescription(lb_id='lb1', port=80),
+                                     RCv3Description(lb_id='lb2')]),
                    json=freeze(self.servers[1]))
         ]
-        self.assertEqual(resolve_stubs(eff),
+        self.assertEqual(sync_perform(self.disp, eff),
                          {'servers': expected_servers,
                           'lb_nodes': clb_nodes + rcv3_nodes,
-                          'lbs': {'lb1': CLB(True), 'lb2': CLB(False)}})
+                          'lbs': {'lb1': CLB(True)}})
 
     def test_no_group_servers(self):
         """
@@ -783,14 +1023,239 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
             'tid',
             'gid',
             self.now,
+            {'args': {}},
             get_scaling_group_servers=_constant_as_eff(
-                ('tid', 'gid', self.now), []),
-            get_clb_contents=_constant_as_eff((), ([], {'a': CLB(False)})),
+                ('tid', 'gid', self.now), ([], False)),
+            get_clb_contents=_constant_as_eff(([],), ([], {})),
             get_rcv3_contents=_constant_as_eff((), []))
 
         self.assertEqual(
-            resolve_stubs(eff),
-            {'servers': [], 'lb_nodes': [], 'lbs': {'a': CLB(False)}})
+            sync_perform(self.disp, eff),
+            {'servers': [], 'lb_nodes': [], 'lbs': {}})
+
+    def test_shares_lb_contents(self):
+        """
+        Load balancer contents are gathered via :obj:`SharedGather` keyed
+        on tenant ID and the result of the cache is logged. CLB contents are
+        also keyed on the IDs of CLBs that are fetched. The gathering group
+        is given to the cache.
+        """
+        eff = get_all_launch_server_data(
+            'tid', 'gid', self.now, {'args': {}},
+            get_scaling_group_servers=intent_func('sg-servers'),
+            get_clb_contents=intent_func('clb'),
+            get_rcv3_contents=intent_func('rcv3'))
+        seq = [
+            (('sg-servers', 'tid', 'gid', self.now),
+             lambda i: (self.servers, False)),
+            parallel_sequence([
+                [(SharedGather(('tid', 'clb', 'lb1'),
+                               Effect(('clb', ['lb1'])), ('tid', 'gid')),
+                  lambda i: ('miss', ([], {}))),
+                 (Log('gather-cache', {'resource': 'clb',
+                                       'cache_status': 'miss'}), noop)],
+                [(SharedGather(('tid', 'rcv3'), Effect(('rcv3',)),
+                               ('tid', 'gid')),
+                  lambda i: ('hit', [])),
+                 (Log('gather-cache', {'resource': 'rcv3',
+                                       'cache_status': 'hit'}), noop)]
+            ])
+        ]
+        self.assertEqual(
+            perform_sequence(seq, eff)['lb_nodes'], [])
+
+    def test_all_clbs_when_all_servers_listed(self):
+        """
+        When all the tenant's servers were listed, contents of all the CLBs
+        are fetched and shared with other groups doing the same
+        """
+        eff = get_all_launch_server_data(
+            'tid', 'gid', self.now, {'args': {}},
+            get_scaling_group_servers=intent_func('sg-servers'),
+            get_clb_contents=intent_func('clb'),
+            get_rcv3_contents=intent_func('rcv3'))
+        seq = [
+            (('sg-servers', 'tid', 'gid', self.now),
+             lambda i: (self.servers, True)),
+            parallel_sequence([
+                [(SharedGather(('tid', 'clb', 'all'),
+                               Effect(('clb', None)), ('tid', 'gid')),
+                  lambda i: ('miss', ([], {}))),
+                 (Log('gather-cache', {'resource': 'clb',
+                                       'cache_status': 'miss'}), noop)],
+                [(SharedGather(('tid', 'rcv3'), Effect(('rcv3',)),
+                               ('tid', 'gid')),
+                  lambda i: ('hit', [])),
+                 (Log('gather-cache', {'resource': 'rcv3',
+                                       'cache_status': 'hit'}), noop)]
+            ])
+        ]
+        self.assertEqual(
+            perform_sequence(seq, eff)['lb_nodes'], [])
+
+
+class GatherCacheTests(SynchronousTestCase):
+    """
+    Tests for :obj:`GatherCache` and :obj:`SharedGather` performer
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = GatherCache(self.clock, 10)
+        self.fetches = []
+
+    def fetch(self):
+        d = Deferred()
+        self.fetches.append(d)
+        return d
+
+    def test_miss_then_hit(self):
+        """
+        Result is fetched on first call and returned from cache on
+        subsequent calls till ttl
+        """
+        d = self.cache.get('k', self.fetch)
+        self.assertNoResult(d)
+        self.fetches[0].callback('r')
+        self.assertEqual(self.successResultOf(d), ('miss', 'r'))
+        self.clock.advance(9)
+        self.assertEqual(
+            self.successResultOf(self.cache.get('k', self.fetch)),
+            ('hit', 'r'))
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_expired(self):
+        """
+        Result is fetched again after ttl has passed
+        """
+        self.cache.get('k', self.fetch)
+        self.fetches[0].callback('r')
+        self.clock.advance(10)
+        d = self.cache.get('k', self.fetch)
+        self.fetches[1].callback('r2')
+        self.assertEqual(self.successResultOf(d), ('miss', 'r2'))
+
+    def test_single_flight(self):
+        """
+        Calls made while result is being fetched wait for that fetch and
+        share its result. Different keys are fetched separately
+        """
+        d1 = self.cache.get('k', self.fetch)
+        d2 = self.cache.get('k', self.fetch)
+        d3 = self.cache.get('other', self.fetch)
+        self.assertEqual(len(self.fetches), 2)
+        self.fetches[0].callback('r')
+        self.assertEqual(self.successResultOf(d1), ('miss', 'r'))
+        self.assertEqual(self.successResultOf(d2), ('shared', 'r'))
+        self.assertNoResult(d3)
+
+    def test_error_not_cached(self):
+        """
+        Fetch errors are propogated to all waiting callers and not cached
+        """
+        d1 = self.cache.get('k', self.fetch)
+        d2 = self.cache.get('k', self.fetch)
+        self.fetches[0].errback(DummyException('e'))
+        self.failureResultOf(d1, DummyException)
+        self.failureResultOf(d2, DummyException)
+        d3 = self.cache.get('k', self.fetch)
+        self.assertEqual(len(self.fetches), 2)
+        self.assertNoResult(d3)
+
+    def test_invalidated(self):
+        """
+        After a group invalidates, it does not get results whose fetch
+        started before that, including fetches in progress, while other
+        groups still do. Results fetched later are shared with it again.
+        """
+        self.cache.get('k', self.fetch, 'g1')
+        self.fetches[0].callback('r')
+        d_other = self.cache.get('other', self.fetch, 'g2')
+        self.clock.advance(1)
+        self.cache.invalidate('g1')
+        self.clock.advance(1)
+        self.assertEqual(
+            self.successResultOf(self.cache.get('k', self.fetch, 'g2')),
+            ('hit', 'r'))
+        d1 = self.cache.get('k', self.fetch, 'g1')
+        d2 = self.cache.get('other', self.fetch, 'g1')
+        self.assertEqual(len(self.fetches), 4)
+        self.fetches[2].callback('r2')
+        self.assertEqual(self.successResultOf(d1), ('miss', 'r2'))
+        self.fetches[3].callback('o2')
+        self.assertEqual(self.successResultOf(d2), ('miss', 'o2'))
+        # Older fetch finishing later does not replace newer result
+        self.fetches[1].callback('o1')
+        self.assertEqual(self.successResultOf(d_other), ('miss', 'o1'))
+        for key, group, result in [('k', 'g1', 'r2'), ('other', 'g1', 'o2'),
+                                   ('other', 'g2', 'o2')]:
+            self.assertEqual(
+                self.successResultOf(self.cache.get(key, self.fetch, group)),
+                ('hit', result))
+        self.assertEqual(len(self.fetches), 4)
+
+    def test_perform(self):
+        """
+        :obj:`SharedGather` is performed by getting effect's result from
+        the cache of the dispatcher and :obj:`InvalidateSharedGather` by
+        invalidating the cache for the group
+        """
+        disp = ComposedDispatcher([
+            get_gather_cache_dispatcher(self.clock, 10), base_dispatcher])
+        calls = []
+        eff = Effect(SharedGather('k', Effect(Func(lambda: calls.append(1))),
+                                  'g'))
+        self.assertEqual(sync_perform(disp, eff), ('miss', None))
+        self.assertEqual(sync_perform(disp, eff), ('hit', None))
+        self.assertEqual(calls, [1])
+        self.clock.advance(1)
+        sync_perform(disp, Effect(InvalidateSharedGather('g')))
+        self.clock.advance(1)
+        self.assertEqual(sync_perform(disp, eff), ('miss', None))
+        self.assertEqual(calls, [1, 1])
+
+
+class DrainedAtCacheTests(SynchronousTestCase):
+    """
+    Tests for :obj:`DrainedAtCache` and performers of its intents
+    """
+
+    def setUp(self):
+        self.cache = DrainedAtCache(2)
+
+    def test_get_update(self):
+        """
+        Only cached keys are returned by `get` and `update` forgets undrained
+        keys
+        """
+        self.cache.update({'a': 1.0, 'b': 2.0}, [])
+        self.assertEqual(self.cache.get(['a', 'b', 'c']),
+                         {'a': 1.0, 'b': 2.0})
+        self.cache.update({}, ['a', 'c'])
+        self.assertEqual(self.cache.get(['a', 'b']), {'b': 2.0})
+
+    def test_evicts_least_recently_used(self):
+        """
+        Least recently used keys are evicted when cache has more than `size`
+        keys
+        """
+        self.cache.update({'a': 1.0, 'b': 2.0}, [])
+        self.cache.get(['a'])
+        self.cache.update({'c': 3.0}, [])
+        self.assertEqual(self.cache.get(['a', 'b', 'c']),
+                         {'a': 1.0, 'c': 3.0})
+
+    def test_perform(self):
+        """
+        :obj:`GetCachedDrainedAt` and :obj:`UpdateCachedDrainedAt` are
+        performed using a cache of the dispatcher
+        """
+        disp = get_gather_cache_dispatcher(Clock(), 10)
+        sync_perform(
+            disp, Effect(UpdateCachedDrainedAt({('1', 'n'): 3.0}, [])))
+        self.assertEqual(
+            sync_perform(disp, Effect(GetCachedDrainedAt([('1', 'n')]))),
+            {('1', 'n'): 3.0})
 
 
 class GetAllStacksTests(SynchronousTestCase):
@@ -840,6 +1305,14 @@ class GetAllLaunchStackDataTests(SynchronousTestCase):
             {'id': 'b', 'stack_name': 'bb', 'stack_status': 'CREATE_COMPLETE'}
         ]
         self.now = datetime(2010, 10, 20, 03, 30, 00)
+        self.disp = ComposedDispatcher([
+            get_gather_cache_dispatcher(Clock(), 10),
+            TypeDispatcher({
+                Log: sync_performer(lambda d, i: None),
+                ParallelEffects: perform_parallel_async,
+                Stub: sync_performer(
+                    lambda d, i: sync_perform(d, Effect(i.intent)))}),
+            base_dispatcher])
 
     def test_success(self):
         """HeatStack instances should be returned from JSON."""
@@ -851,6 +1324,7 @@ class GetAllLaunchStackDataTests(SynchronousTestCase):
             'tid',
             'gid',
             self.now,
+            {'args': {'stack': {}}},
             get_scaling_group_stacks=_constant_as_eff(('gid',), self.stacks))
 
         self.assertEqual(resolve_stubs(eff), {'stacks': expected_stacks})
@@ -864,6 +1338,7 @@ class GetAllLaunchStackDataTests(SynchronousTestCase):
             'tid',
             'gid',
             self.now,
+            {'args': {'stack': {}}},
             get_scaling_group_stacks=_constant_as_eff(('gid',), []))
 
         self.assertEqual(resolve_stubs(eff), {'stacks': []})
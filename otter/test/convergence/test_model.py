@@ -21,8 +21,10 @@ from otter.convergence.model import (
     IDrainable,
     ILBDescription,
     ILBNode,
+    LBNodeIndex,
     NovaServer,
     RCv3Description,
+    RCv3Node,
     ServerState,
     StackState,
     _private_ipv4_addresses,
@@ -31,6 +33,7 @@ from otter.convergence.model import (
     generate_metadata,
     group_id_from_metadata
 )
+from otter.test.utils import server
 
 
 @implementer(ILBDescription)
@@ -740,3 +743,72 @@ class HeatStackTests(SynchronousTestCase):
                     id='a', name='b', action=action, status=status)
                 self.assertEqual(stack.get_state(), result,
                                  'Failed at %s_%s' % (action, status))
+
+
+@implementer(ILBNode)
+@attributes(["node_id", "server_id"])
+class DummyLBNode(object):
+    """
+    Fake LB node that is not known to :obj:`LBNodeIndex`.
+    """
+    def matches(self, server):
+        """Matches server with same ID"""
+        return server.id == self.server_id
+
+
+class LBNodeIndexTests(SynchronousTestCase):
+    """
+    Tests for :obj:`LBNodeIndex`.
+    """
+
+    def setUp(self):
+        self.server = server('s1', ServerState.ACTIVE,
+                             servicenet_address='10.0.0.1')
+        self.clb = CLBNode(node_id='1', address='10.0.0.1',
+                           description=CLBDescription(lb_id='5', port=80))
+        self.rcv3 = RCv3Node(node_id='2', cloud_server_id='s1',
+                             description=RCv3Description(lb_id='6'))
+        self.other = DummyLBNode(node_id='3', server_id='s1')
+
+    def test_matching(self):
+        """
+        Returns CLB nodes with server's servicenet address, RCv3 nodes with
+        server's ID and any other node that matches the server, in the order
+        given to the index.
+        """
+        nodes = [
+            CLBNode(node_id='4', address='10.0.0.2',
+                    description=CLBDescription(lb_id='5', port=80)),
+            self.other,
+            RCv3Node(node_id='5', cloud_server_id='s2',
+                     description=RCv3Description(lb_id='6')),
+            self.rcv3,
+            DummyLBNode(node_id='6', server_id='s2'),
+            self.clb]
+        index = LBNodeIndex(nodes)
+        self.assertEqual(index.matching(self.server),
+                         [self.other, self.rcv3, self.clb])
+        self.assertEqual(
+            index.matching(self.server),
+            [node for node in nodes if node.matches(self.server)])
+
+    def test_no_servicenet_address(self):
+        """
+        A server without servicenet address does not match CLB nodes unless
+        their address is also empty, just like :func:`CLBNode.matches`.
+        """
+        server_ = server('s1', ServerState.ACTIVE)
+        empty = CLBNode(node_id='4', address='',
+                        description=CLBDescription(lb_id='5', port=80))
+        index = LBNodeIndex([self.clb, empty, self.rcv3])
+        self.assertEqual(index.matching(server_), [empty, self.rcv3])
+
+    def test_no_nodes(self):
+        """
+        Empty list is returned when nothing matches.
+        """
+        self.assertEqual(LBNodeIndex([]).matching(self.server), [])
+        self.assertEqual(
+            LBNodeIndex([self.clb, self.rcv3]).matching(
+                server('s2', ServerState.ACTIVE)),
+            [])
@@ -2,7 +2,7 @@
 Tests for :mod:`otter.convergence.selfheal`
 """
 
-from effect import base_dispatcher, raise_
+from effect import Effect, Func, base_dispatcher, raise_
 from effect.testing import (
     SequenceDispatcher, const, conste, intent_func, nested_sequence, noop,
     perform_sequence)
@@ -16,7 +16,8 @@ from twisted.trial.unittest import SynchronousTestCase
 
 from otter.convergence import selfheal as sh
 from otter.log.intents import BoundFields, Log
-from otter.models.intents import GetAllValidGroups, GetScalingGroupInfo
+from otter.models.intents import (
+    GetAllValidGroups, GetScalingGroupInfo, GetValidGroupsPage)
 from otter.models.interface import (
     GroupState, NoSuchScalingGroupError, ScalingGroupStatus)
 from otter.test.utils import CheckFailure, matches, mock_log
@@ -99,6 +100,202 @@ class SelfHealTests(SynchronousTestCase):
         self.assertFalse(call2.active())
 
 
+class PacedSelfHealTests(SynchronousTestCase):
+    """
+    Tests for :obj:`SelfHeal` in paced mode
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.log = mock_log()
+        self.groups = [
+            {"tenantId": "t{}".format(i), "groupId": "g{}".format(i)}
+            for i in range(5)]
+        self.groups[2]["paused"] = True
+        self.pages = []
+        self.triggered = []
+        self.patch(sh, "get_groups_page",
+                   lambda cf, after, limit: Effect(
+                       Func(self.get_page, cf, after, limit)))
+        self.patch(sh, "trigger_convergence",
+                   lambda t, g, selfheal: Effect(
+                       Func(self.trigger, t, g, selfheal)))
+        self.patch(sh, "with_log", lambda eff, **kw: eff)
+        self.s = sh.SelfHeal(self.clock, base_dispatcher, "cf", 300.0,
+                             self.log, paced=True, page_size=2,
+                             max_row_age=200.0)
+
+    def get_page(self, cf, after, limit):
+        self.assertEqual(cf, "cf")
+        self.pages.append((after, limit))
+        after = after or 0
+        page = self.groups[after:after + limit]
+        return page, (after + limit if after + limit < len(self.groups)
+                      else None)
+
+    def trigger(self, tenant_id, group_id, selfheal):
+        self.assertTrue(selfheal)
+        self.triggered.append((self.clock.seconds(), group_id))
+
+    def test_first_cycle(self):
+        """
+        First cycle triggers groups that can be converged without pacing
+        since number of groups is not known. Groups that cannot be converged
+        are skipped. The number of groups triggered is remembered.
+        """
+        self.successResultOf(self.s.setup())
+        self.assertEqual(self.pages, [(None, 2), (2, 2), (4, 2)])
+        self.assertEqual(self.triggered,
+                         [(0, "g0"), (0, "g1"), (0, "g3"), (0, "g4")])
+        self.log.msg.assert_called_with(
+            "selfheal-cycle-done", triggered=4, skipped=1, estimate=None,
+            elapsed=0, otter_service="selfheal")
+        self.assertEqual(self.s._estimate, 4)
+        self.assertFalse(self.s._cycling)
+
+    def test_paced_cycle(self):
+        """
+        Cycle triggers groups evenly over 90% of time range based on number
+        of groups triggered in previous cycle, fetching pages that are
+        triggered within ``max_row_age``.
+        """
+        self.s._estimate = 4
+        self.successResultOf(self.s.setup())
+        # 4 groups over 270 seconds is one every 67.5 seconds. So pages of 2
+        # groups fit in max_row_age
+        self.assertEqual(self.triggered, [(0, "g0")])
+        self.clock.pump([67.5] * 3)
+        self.assertEqual(self.pages, [(None, 2), (2, 2), (4, 2)])
+        self.assertEqual(self.triggered,
+                         [(0, "g0"), (67.5, "g1"), (135, "g3"),
+                          (202.5, "g4")])
+        self.log.msg.assert_called_with(
+            "selfheal-cycle-done", triggered=4, skipped=1, estimate=4,
+            elapsed=202.5, otter_service="selfheal")
+        self.assertFalse(self.s._cycling)
+
+    def test_uses_previous_estimate(self):
+        """
+        Cycle is paced based on number of groups triggered in previous cycle
+        and does not count groups. Progress is logged every tenth of time
+        range.
+        """
+        self.s._estimate = 9
+        self.successResultOf(self.s.setup())
+        # 9 groups over 270 seconds is one every 30 seconds
+        self.clock.pump([30] * 3)
+        self.assertEqual(self.triggered,
+                         [(0, "g0"), (30, "g1"), (60, "g3"), (90, "g4")])
+        self.assertEqual(self.pages, [(None, 2), (2, 2), (4, 2)])
+        self.log.msg.assert_any_call(
+            "selfheal-progress", triggered=2, skipped=0, estimate=9,
+            elapsed=30, otter_service="selfheal")
+        self.log.msg.assert_any_call(
+            "selfheal-progress", triggered=3, skipped=1, estimate=9,
+            elapsed=60, otter_service="selfheal")
+        self.assertEqual(self.s._estimate, 4)
+
+    def test_small_pages(self):
+        """
+        Pages are made smaller to be triggered within ``max_row_age``
+        """
+        self.s.max_row_age = 50.0
+        self.s._estimate = 4
+        self.successResultOf(self.s.setup())
+        self.clock.pump([67.5] * 3)
+        self.assertEqual(self.pages, [(None, 1), (1, 1), (2, 1), (3, 1),
+                                      (4, 1)])
+        self.assertEqual(len(self.triggered), 4)
+
+    def test_cycle_running(self):
+        """
+        Setup does not start another cycle while one is running. The next
+        cycle starts as soon as the running one finishes instead, only once
+        however many times setup was called.
+        """
+        self.s._estimate = 4
+        self.successResultOf(self.s.setup())
+        self.successResultOf(self.s.setup())
+        self.successResultOf(self.s.setup())
+        self.log.msg.assert_called_with(
+            "selfheal-cycle-running", otter_service="selfheal")
+        self.clock.pump([67.5] * 3)
+        self.assertEqual(len(self.triggered), 5)
+        self.assertEqual(self.triggered[-1], (202.5, "g0"))
+        self.assertTrue(self.s._cycling)
+        self.clock.pump([67.5] * 3)
+        self.assertEqual(len(self.triggered), 8)
+        self.assertFalse(self.s._cycling)
+        self.successResultOf(self.s.setup())
+        self.assertEqual(len(self.triggered), 9)
+
+    def test_trigger_error(self):
+        """
+        Error triggering a group is logged and the cycle continues
+        """
+        self.s._estimate = 4
+
+        def trigger(tenant_id, group_id, selfheal):
+            if group_id == "g1":
+                raise ValueError("bad")
+            self.triggered.append(group_id)
+
+        self.trigger = trigger
+        self.successResultOf(self.s.setup())
+        self.clock.pump([67.5] * 3)
+        self.assertEqual(self.triggered, ["g0", "g3", "g4"])
+        self.log.err.assert_called_once_with(
+            CheckFailure(ValueError), "selfheal-trigger-err",
+            tenant_id="t1", scaling_group_id="g1", otter_service="selfheal")
+
+    def test_page_error(self):
+        """
+        Error getting groups is logged and ends the cycle
+        """
+        self.s._estimate = 4
+        self.get_page = lambda cf, after, limit: 1 / 0
+        self.successResultOf(self.s.setup())
+        self.log.err.assert_called_once_with(
+            CheckFailure(ZeroDivisionError), "selfheal-setup-err",
+            otter_service="selfheal")
+        self.assertFalse(self.s._cycling)
+        self.assertEqual(self.s._estimate, 4)
+
+
+class GetGroupsPageTests(SynchronousTestCase):
+    """
+    Tests for :func:`get_groups_page` and :func:`can_converge`
+    """
+
+    def test_filtered(self):
+        """
+        Only convergence enabled tenants' groups are returned along with
+        ``after`` of next page
+        """
+        conf = {"non-convergence-tenants": ["t1"]}
+        groups = [{"tenantId": "t1", "groupId": "g1"},
+                  {"tenantId": "t2", "groupId": "g2"}]
+        eff = sh.get_groups_page(conf.get, ("t0", "g0"), 10)
+        seq = [(GetValidGroupsPage(props=["status", "paused", "suspended"],
+                                   after=("t0", "g0"), limit=10),
+                const((groups, ("t2", "g2"))))]
+        self.assertEqual(perform_sequence(seq, eff),
+                         (groups[1:], ("t2", "g2")))
+
+    def test_can_converge(self):
+        """
+        Groups that are ACTIVE, or have no status, and are not paused or
+        suspended can be converged
+        """
+        self.assertTrue(sh.can_converge({}))
+        self.assertTrue(sh.can_converge(
+            {"status": "ACTIVE", "paused": False, "suspended": None}))
+        self.assertFalse(sh.can_converge({"status": "ERROR"}))
+        self.assertFalse(sh.can_converge({"status": "DISABLED"}))
+        self.assertFalse(sh.can_converge({"paused": True}))
+        self.assertFalse(sh.can_converge({"suspended": True}))
+
+
 class GetGroupsToConvergeTests(SynchronousTestCase):
     """
     Tests for :func:`get_groups_to_converge`
@@ -113,7 +310,8 @@ class GetGroupsToConvergeTests(SynchronousTestCase):
                   {"tenantId": "t2", "groupId": "g2"},
                   {"tenantId": "t3", "groupId": "g3"}]
         eff = sh.get_groups_to_converge(conf.get)
-        seq = [(GetAllValidGroups(), const(groups))]
+        seq = [(GetAllValidGroups(props=["tenantId", "groupId"]),
+                const(groups))]
         self.assertEqual(perform_sequence(seq, eff), groups[2:])
 
 
@@ -123,7 +321,8 @@ class CheckTriggerTests(SynchronousTestCase):
     """
 
     def setUp(self):
-        self.patch(sh, "trigger_convergence", intent_func("tg"))
+        self.patch(sh, "trigger_convergence",
+                   lambda t, g, selfheal: Effect(("tg", t, g, selfheal)))
         self.state = GroupState("tid", "gid", 'group-name',
                                 {}, {}, None, {}, False,
                                 ScalingGroupStatus.ACTIVE, desired=2)
@@ -131,14 +330,15 @@ class CheckTriggerTests(SynchronousTestCase):
 
     def test_active_resumed(self):
         """
-        Convergence is triggerred on ACTIVE resumed group
+        Convergence is triggerred on ACTIVE resumed group with selfheal
+        priority
         """
         seq = [
             (GetScalingGroupInfo(tenant_id="tid", group_id="gid"),
              const(("group", self.manifest))),
             (BoundFields(effect=mock.ANY,
                          fields=dict(tenant_id="tid", scaling_group_id="gid")),
-             nested_sequence([(("tg", "tid", "gid"), noop)]))
+             nested_sequence([(("tg", "tid", "gid", True), noop)]))
         ]
         self.assertIsNone(
             perform_sequence(seq, sh.check_and_trigger("tid", "gid")))
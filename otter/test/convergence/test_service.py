@@ -22,6 +22,8 @@ import mock
 
 from pyrsistent import freeze, pbag, pmap, pset, s, thaw
 
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.auth import NoSuchEndpoint
@@ -30,7 +32,8 @@ from otter.cloud_client.clb import NoSuchCLBError
 from otter.constants import CONVERGENCE_DIRTY_DIR
 from otter.convergence.composition import (get_desired_server_group_state,
                                            get_desired_stack_group_state)
-from otter.convergence.gathering import (get_all_launch_server_data,
+from otter.convergence.gathering import (InvalidateSharedGather,
+                                         get_all_launch_server_data,
                                          get_all_launch_stack_data)
 from otter.convergence.model import (
     CLBDescription, CLBNode, ConvergenceIterationStatus, ErrorReason,
@@ -39,10 +42,13 @@ from otter.convergence.planning import plan_launch_server, plan_launch_stack
 from otter.convergence.service import (
     ConcurrentError,
     ConvergenceExecutor,
+    ConvergenceLimiter,
     Converger,
+    LimitedConvergence,
     converge_all_groups,
     converge_one_group,
     execute_convergence,
+    get_convergence_limiter_dispatcher,
     get_executor,
     get_my_divergent_groups,
     is_autoscale_active,
@@ -52,7 +58,8 @@ from otter.convergence.service import (
     trigger_convergence,
     update_servers_cache,
     update_stacks_cache)
-from otter.convergence.steps import ConvergeLater, CreateServer
+from otter.convergence.steps import (
+    ConvergeLater, CreateServer, RemoveNodesFromCLB)
 from otter.log.intents import BoundFields, Log, LogErr, MsgWithTime
 from otter.models.intents import (
     DeleteGroup,
@@ -75,7 +82,7 @@ from otter.test.utils import (
     mock_log,
     raise_to_exc_info,
     transform_eq)
-from otter.util.zk import CreateOrSet, DeleteNode, GetChildren, GetStat
+from otter.util.zk import CreateOrSet, DeleteNode, GetChildren, GetData
 
 
 class TriggerConvergenceTests(SynchronousTestCase):
@@ -95,6 +102,20 @@ class TriggerConvergenceTests(SynchronousTestCase):
             perform_sequence(seq, trigger_convergence("t", "g")),
             None)
 
+    def test_selfheal(self):
+        """
+        Divergent flag is set with selfheal content when triggered by selfheal
+        """
+        seq = [
+            (CreateOrSet(path="/groups/divergent/t_g", content="selfheal"),
+             noop),
+            (Log("mark-dirty-success", {}), noop)
+        ]
+        self.assertEqual(
+            perform_sequence(
+                seq, trigger_convergence("t", "g", selfheal=True)),
+            None)
+
     def test_failure(self):
         """
         If setting divergent flag errors, then error is logged and raised
@@ -552,7 +573,8 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
             ('converge', tenant_id, group_id, version, build_timeout,
              limited_retry_iterations, step_limits))
 
-    def _expect_group_converged(self, tenant_id, group_id):
+    def _expect_group_converged(self, tenant_id, group_id,
+                                content='dirty', low_priority=False):
         """
         Return a SequenceDispatcher two-tuple that matches the usual sequence
         of intents for converging a single group.
@@ -561,14 +583,18 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
             BoundFields(mock.ANY,
                         dict(tenant_id=tenant_id, scaling_group_id=group_id)),
             nested_sequence([
-                (GetStat(
+                (GetData(
                     path='/groups/divergent/{tenant_id}_{group_id}'.format(
                         tenant_id=tenant_id, group_id=group_id)),
-                 lambda i: ZNodeStatStub(version=5)),
-                (TenantScope(mock.ANY, tenant_id),
+                 lambda i: (content, ZNodeStatStub(version=5))),
+                (LimitedConvergence(tenant_id, group_id, low_priority,
+                                    mock.ANY),
                  nested_sequence([
-                     (('converge', tenant_id, group_id, 5, 3600, 23, {}),
-                      lambda i: 'converged {}!'.format(group_id)),
+                     (TenantScope(mock.ANY, tenant_id),
+                      nested_sequence([
+                          (('converge', tenant_id, group_id, 5, 3600, 23, {}),
+                           lambda i: 'converged {}!'.format(group_id)),
+                      ])),
                  ])),
             ]))
 
@@ -592,6 +618,26 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
         self.assertEqual(perform_sequence(sequence, eff),
                          ['converged g1!', 'converged g2!'])
 
+    def test_selfheal_low_priority(self):
+        """
+        Groups whose divergent flag was set by selfheal are converged with
+        low priority.
+        """
+        eff = self._converge_all_groups(['00_g1'])
+        sequence = [
+            (ReadReference(ref=self.currently_converging),
+             lambda i: pset()),
+            (Log('converge-all-groups',
+                 dict(group_infos=[self.group_infos[0]],
+                      currently_converging=[])),
+             noop),
+            (ReadReference(self.recently_converged), lambda i: pmap()),
+            (Func(time.time), lambda i: 100),
+            parallel_sequence([
+                [self._expect_group_converged('00', 'g1', 'selfheal', True)]])
+        ]
+        self.assertEqual(perform_sequence(sequence, eff), ['converged g1!'])
+
     def test_filter_out_currently_converging(self):
         """
         If a group is already being converged, its dirty flag is not statted
@@ -677,11 +723,11 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
         eff = self._converge_all_groups(['00_g1'])
 
         def get_bound_sequence(tid, gid):
-            # since this GetStat is going to return None, no more effects will
+            # since this GetData is going to return None, no more effects will
             # be run. This is the crux of what we're testing.
             znode = '/groups/divergent/{}_{}'.format(tid, gid)
             return [
-                (GetStat(path=znode), noop),
+                (GetData(path=znode), noop),
                 (Log('converge-divergent-flag-disappeared',
                      fields={'znode': znode}),
                  noop)]
@@ -703,6 +749,153 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
         self.assertEqual(perform_sequence(sequence, eff), [None])
 
 
+class ConvergenceLimiterTests(SynchronousTestCase):
+    """Tests for :obj:`ConvergenceLimiter`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = ConvergenceLimiter(self.clock, 3, 2)
+        self.started = []
+
+    def _converge(self, tenant_id, group_id, low_priority=False):
+        def f(waited, queue_depth):
+            d = Deferred()
+            self.started.append((group_id, waited, queue_depth, d))
+            return d
+        return self.limiter.run(tenant_id, group_id, low_priority, f)
+
+    def _started(self):
+        return [group_id for group_id, _, _, _ in self.started]
+
+    def _finish(self, group_id, result=None):
+        [d] = [d for gid, _, _, d in self.started if gid == group_id]
+        d.callback(result)
+
+    def test_global_limit(self):
+        """
+        Only ``limit`` convergences run at a time. Waiting ones are started
+        as running ones finish, getting the time they waited and the queue
+        depth. Result of the function is returned.
+        """
+        ds = [self._converge('t{}'.format(i), 'g{}'.format(i))
+              for i in range(4)]
+        self.assertEqual(self._started(), ['g0', 'g1', 'g2'])
+        self.assertEqual(self.limiter.queue_depth, 1)
+        self.clock.advance(5)
+        self._finish('g1', 'r1')
+        self.assertEqual(self.successResultOf(ds[1]), 'r1')
+        self.assertEqual(self.started[-1][:3], ('g3', 5, 0))
+        self.assertNoResult(ds[3])
+        self.assertEqual(self.limiter.queue_depth, 0)
+
+    def test_tenant_limit(self):
+        """
+        Only ``tenant_limit`` convergences of a tenant run at a time.
+        Convergences of other tenants can start meanwhile
+        """
+        for g in ['g1', 'g2', 'g3']:
+            self._converge('t1', g)
+        self._converge('t2', 'g4')
+        self.assertEqual(self._started(), ['g1', 'g2', 'g4'])
+        self._finish('g4')
+        self.assertEqual(self._started(), ['g1', 'g2', 'g4'])
+        self._finish('g1')
+        self.assertEqual(self._started(), ['g1', 'g2', 'g4', 'g3'])
+
+    def test_round_robin(self):
+        """
+        Waiting convergences are started round-robin across tenants
+        """
+        self.limiter = ConvergenceLimiter(self.clock, 1, 1)
+        for t, g in [('t1', 'a1'), ('t1', 'a2'), ('t1', 'a3'),
+                     ('t2', 'b1'), ('t3', 'c1'), ('t2', 'b2')]:
+            self._converge(t, g)
+        for g in ['a1', 'b1', 'c1', 'a2', 'b2']:
+            self._finish(g)
+        self.assertEqual(self._started(),
+                         ['a1', 'b1', 'c1', 'a2', 'b2', 'a3'])
+
+    def test_forgets_idle_tenants(self):
+        """
+        A tenant is forgotten when it has nothing running or waiting. Till
+        then it is remembered to keep round-robin order.
+        """
+        self.limiter = ConvergenceLimiter(self.clock, 1, 1)
+        self._converge('t1', 'a1')
+        self._converge('t1', 'a2')
+        self._converge('t2', 'b1')
+        self._finish('a1')
+        self.assertEqual(sorted(self.limiter._last_served), ['t1', 't2'])
+        self._finish('b1')
+        self.assertEqual(sorted(self.limiter._last_served), ['t1'])
+        self._finish('a2')
+        self.assertEqual(self.limiter._last_served, {})
+        self.assertEqual(self._started(), ['a1', 'b1', 'a2'])
+
+    def test_priority(self):
+        """
+        Low priority convergences are started after normal priority ones
+        """
+        self.limiter = ConvergenceLimiter(self.clock, 1, 1)
+        self._converge('t1', 'a1')
+        self._converge('t2', 'b1', True)
+        self._converge('t3', 'c1')
+        self._finish('a1')
+        self._finish('c1')
+        self.assertEqual(self._started(), ['a1', 'c1', 'b1'])
+
+    def test_already_waiting(self):
+        """
+        Running a group that is already waiting returns None without
+        running it again
+        """
+        self.limiter = ConvergenceLimiter(self.clock, 1, 1)
+        self._converge('t1', 'g1')
+        self._converge('t1', 'g2')
+        self.assertIsNone(self.successResultOf(self._converge('t1', 'g2')))
+        self._finish('g1')
+        self._finish('g2')
+        self.assertEqual(self._started(), ['g1', 'g2'])
+        self.assertEqual(self.limiter.queue_depth, 0)
+
+    def test_failure(self):
+        """
+        Failing convergence frees its slot and failure is returned
+        """
+        self.limiter = ConvergenceLimiter(self.clock, 1, 1)
+        d = self.limiter.run(
+            't1', 'g1', False, lambda w, q: fail(ValueError('e')))
+        self.failureResultOf(d, ValueError)
+        self._converge('t1', 'g2')
+        self.assertEqual(self._started(), ['g2'])
+
+    def test_synchronous(self):
+        """
+        Convergences finishing synchronously start the waiting ones
+        """
+        self.limiter = ConvergenceLimiter(self.clock, 1, 1)
+        self._converge('t1', 'g1')
+        ds = [self.limiter.run('t1', 'g{}'.format(i), False,
+                               lambda w, q, i=i: succeed(i))
+              for i in range(2, 5)]
+        self._finish('g1')
+        self.assertEqual(map(self.successResultOf, ds), [2, 3, 4])
+
+    def test_perform(self):
+        """
+        :obj:`LimitedConvergence` is performed by running its effect with
+        the limiter after logging wait time and queue depth
+        """
+        disp = get_convergence_limiter_dispatcher(self.clock, 1, 1)
+        eff = Effect(LimitedConvergence('t1', 'g1', False, Effect('conv')))
+        seq = [(Log('converge-queue-wait',
+                    dict(wait_time=0, queue_depth=0)), noop),
+               ('conv', lambda i: 'converged')]
+        self.assertEqual(
+            perform_sequence(seq, eff, fallback_dispatcher=disp),
+            'converged')
+
+
 class GetMyDivergentGroupsTests(SynchronousTestCase):
 
     def test_get_my_divergent_groups(self):
@@ -843,7 +1036,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
         """
         exec_seq = [
             (self.gsgi, lambda i: self.gsgi_result),
-            (("gacd", self.tenant_id, self.group_id, self.now),
+            (("gacd", self.tenant_id, self.group_id, self.now, self.lc),
              self.gacd_runner)
         ]
         if with_cache:
@@ -1042,6 +1235,39 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
             ConvergenceIterationStatus.Continue())
 
+    def test_lb_steps_invalidate_shared_gather(self):
+        """
+        After executing steps changing load balancers, the group's results
+        in the shared gather cache are invalidated.
+        """
+        step = RemoveNodesFromCLB(lb_id='23', node_ids=s('1'))
+        step.as_effect = lambda: Effect("remove-nodes")
+
+        def plan(*args, **kwargs):
+            return pbag([step])
+
+        sequence = [
+            parallel_sequence([
+                [parallel_sequence([
+                    [(Log('convergence-remove-clb-nodes',
+                          {'lb_id': '23', 'nodes': ['1'],
+                           'cloud_feed': True}),
+                      noop)]
+                ])]
+            ]),
+            (Log(msg='execute-convergence', fields=mock.ANY), noop),
+            parallel_sequence([
+                [("remove-nodes", lambda i: (StepResult.RETRY, []))]
+            ]),
+            (Log(msg='execute-convergence-results', fields=mock.ANY), noop),
+            (InvalidateSharedGather((self.tenant_id, self.group_id)), noop),
+            clean_waiting(self.waiting, self.group_id),
+        ]
+
+        self.assertEqual(
+            perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
+            ConvergenceIterationStatus.Continue())
+
     def _test_deleting_group(self, step_result, with_delete, exec_result):
 
         def _plan(dsg, *a, **kwargs):
@@ -1424,12 +1650,12 @@ class ExecuteConvergenceTests(SynchronousTestCase):
         Without any steps, using a launch_stack launch config stops
         convergence.
         """
-        lc = {'args': {'stack': {'stack_name': 'foo'}},
-              'type': 'launch_stack'}
+        self.lc = {'args': {'stack': {'stack_name': 'foo'}},
+                   'type': 'launch_stack'}
 
         self.manifest = {
             'state': self.state,
-            'launchConfiguration': lc,
+            'launchConfiguration': self.lc,
         }
 
         self.gsgi_result = (self.group, self.manifest)
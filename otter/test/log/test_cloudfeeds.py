@@ -8,7 +8,8 @@ from effect.testing import perform_sequence
 
 import mock
 
-from twisted.internet.defer import fail, succeed
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
 from twisted.python.failure import Failure
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.web.client import ResponseFailed
@@ -388,3 +389,111 @@ class CloudFeedsObserverTests(SynchronousTestCase):
             None, 'cf-unsuitable-message', unsuitable_message='bad',
             event_data={'event': 'dict'}, system='otter.cloud_feed',
             cf_msg='m')
+
+
+class CloudFeedsObserverQueueTests(SynchronousTestCase):
+    """
+    Tests for queueing events in :obj:`CloudFeedsObserver`
+    """
+
+    def setUp(self):
+        """
+        Observer whose events are published when their Deferred in
+        ``self.published`` is fired
+        """
+        class AddEvent(object):
+            def __init__(self, msg):
+                self.msg = msg
+
+        self.clock = Clock()
+        self.log = mock_log()
+        self.published = []
+        self.dispatchers = []
+
+        def get_disp(*args):
+            self.dispatchers.append(args)
+            return TypeDispatcher({AddEvent: deferred_performer(publish)})
+
+        def publish(d, intent):
+            self.published.append((intent.msg, Deferred()))
+            return self.published[-1][1]
+
+        self.cf = CloudFeedsObserver(
+            reactor=self.clock, authenticator='auth', tenant_id='tid',
+            region='ord', service_configs='confs', log=self.log,
+            add_event=lambda e, *a: Effect(AddEvent(e['message'][0])),
+            get_disp=get_disp, max_queue=2, concurrency=2)
+
+    def add(self, msg):
+        return self.cf({'cloud_feed': True, 'message': (msg,)})
+
+    def test_concurrency(self):
+        """
+        At most ``concurrency`` events are published at a time and the rest
+        are published in the order they came as publishing finishes. The
+        dispatcher is created once and reused.
+        """
+        ds = [self.add(str(i)) for i in range(4)]
+        self.assertEqual([m for m, _ in self.published], ['0', '1'])
+        self.published[1][1].callback('p1')
+        self.assertEqual(self.successResultOf(ds[1]), 'p1')
+        self.assertEqual([m for m, _ in self.published], ['0', '1', '2'])
+        self.published[0][1].errback(ValueError('bad'))
+        self.assertIsNone(self.successResultOf(ds[0]))
+        self.assertEqual([m for m, _ in self.published],
+                         ['0', '1', '2', '3'])
+        self.assertEqual(len(self.dispatchers), 1)
+        self.assertEqual(self.dispatchers[0][:2], (self.clock, 'auth'))
+        self.assertEqual((self.cf.published, self.cf.failed), (1, 1))
+        self.log.err.assert_called_once_with(
+            CheckFailure(ValueError), 'cf-add-failure', event_data={},
+            system='otter.cloud_feed', cf_msg='0')
+
+    def test_queue_full(self):
+        """
+        Events are dropped when ``max_queue`` events are waiting. It is logged
+        when the queue becomes full and number of dropped events is logged
+        when all events are published.
+        """
+        [self.add(str(i)) for i in range(4)]
+        d = self.add('5')
+        self.assertIsNone(self.successResultOf(d))
+        self.add('6')
+        self.assertEqual(self.cf.dropped, 2)
+        self.log.msg.assert_called_once_with(
+            'cf-queue-full', max_queue=2, event_data={},
+            system='otter.cloud_feed', cf_msg='5')
+        for i in range(4):
+            self.published[i][1].callback(None)
+        self.log.msg.assert_called_with(
+            'cf-events-dropped', dropped=2, event_data={},
+            system='otter.cloud_feed', cf_msg='3')
+        self.assertEqual(len(self.published), 4)
+
+    def test_flush(self):
+        """
+        ``flush`` returns Deferred fired when all queued events are published
+        """
+        self.successResultOf(self.cf.flush())
+        [self.add(str(i)) for i in range(3)]
+        d = self.cf.flush()
+        self.published[0][1].callback(None)
+        self.published[1][1].callback(None)
+        self.assertNoResult(d)
+        self.published[2][1].callback(None)
+        self.successResultOf(d)
+
+    def test_flush_timeout(self):
+        """
+        ``flush`` stops waiting after timeout and logs number of events not
+        published yet
+        """
+        [self.add(str(i)) for i in range(3)]
+        d = self.cf.flush(10)
+        self.published[0][1].callback(None)
+        self.clock.advance(10)
+        self.successResultOf(d)
+        self.log.msg.assert_called_once_with(
+            'cf-flush-timeout', system='otter.cloud_feed', pending=2)
+        self.published[1][1].callback(None)
+        self.published[2][1].callback(None)
@@ -3,6 +3,7 @@ Tests for logging integration.
 """
 
 import json
+import threading
 from datetime import datetime
 
 import mock
@@ -26,6 +27,7 @@ from otter.log.formatters import (
     LogLevel,
     ObserverWrapper,
     PEP3101FormattingWrapper,
+    QueuedObserver,
     StreamObserverWrapper,
     SystemFilterWrapper,
     add_to_fanout,
@@ -241,6 +243,106 @@ class StreamObserverWrapperTests(SynchronousTestCase):
              mock.call('bar')])
 
 
+class QueuedObserverTests(SynchronousTestCase):
+    """
+    Tests for :obj:`QueuedObserver`
+    """
+    def setUp(self):
+        """
+        Queued observer delegating to an observer that blocks until
+        ``self.unblock`` is set
+        """
+        self.events = []
+        self.idles = []
+        self.unblock = threading.Event()
+        self.unblock.set()
+
+        def observer(event):
+            self.unblock.wait()
+            if event.get('fail'):
+                raise ValueError('bad')
+            self.events.append(event)
+
+        self.observer = QueuedObserver(
+            observer, max_queue=2,
+            on_idle=lambda: self.idles.append(len(self.events)))
+        self.addCleanup(self.observer.stop, 5)
+
+    def test_delegates_in_thread(self):
+        """
+        Events are delegated in order from the worker thread and ``on_idle``
+        is called when there are no more events queued
+        """
+        threads = []
+        self.observer.observer = lambda e: threads.append(
+            threading.current_thread())
+        self.observer.start()
+        self.observer({'a': 1})
+        self.observer.stop(5)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_drops_when_full(self):
+        """
+        Events are dropped when the queue is full and the number dropped is
+        added to the next event delegated
+        """
+        self.unblock.clear()
+        self.observer.start()
+        self.observer({'a': 1})
+        # wait for worker to take the first event
+        while not self.observer._queue.empty():
+            threading.Event().wait(0.001)
+        for i in range(2, 6):
+            self.observer({'a': i})
+        self.assertEqual(self.observer.dropped, 2)
+        self.unblock.set()
+        self.observer.stop(5)
+        self.assertEqual(
+            self.events,
+            [{'a': 1}, {'a': 2, 'num_dropped_events': 2}, {'a': 3}])
+        self.assertEqual(self.idles[-1], 3)
+        self.assertEqual(self.observer.dropped, 0)
+
+    def test_observer_errors(self):
+        """
+        Errors delegating an event are counted, do not stop the worker and
+        their number is added to the next event delegated
+        """
+        self.observer = QueuedObserver(self.observer.observer, max_queue=10)
+        self.addCleanup(self.observer.stop, 5)
+        self.observer.start()
+        self.observer({'fail': True})
+        self.observer({'fail': True})
+        self.observer({'a': 1})
+        self.observer({'a': 2})
+        self.observer.stop(5)
+        self.assertEqual(self.events,
+                         [{'a': 1, 'num_observer_errors': 2}, {'a': 2}])
+        self.assertEqual(self.observer.errors, 0)
+
+    def test_idle_errors(self):
+        """
+        Errors calling ``on_idle`` are counted and added to the next event
+        delegated
+        """
+        self.observer.on_idle = lambda: 1 / 0
+        self.observer.start()
+        self.observer({'a': 1})
+        # wait for worker to go idle
+        while self.observer.errors == 0:
+            threading.Event().wait(0.001)
+        self.observer({'a': 2})
+        self.observer.stop(5)
+        self.assertEqual(self.events[1], {'a': 2, 'num_observer_errors': 1})
+
+    def test_stop_not_started(self):
+        """
+        Stopping observer that was not started does nothing
+        """
+        self.observer.stop()
+
+
 class SystemFilterWrapperTests(SynchronousTestCase):
     """
     Test the SystemFilterWrapper
@@ -0,0 +1,91 @@
+"""
+Tests for :mod:`otter.log.setup`
+"""
+import json
+import threading
+
+import mock
+
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.log import setup
+from otter.log.formatters import QueuedObserver, set_fanout
+from otter.test.utils import patch
+
+
+class MakeObserverChainTests(SynchronousTestCase):
+    """
+    Tests for :func:`make_observer_chain` and the observer factories using it
+    """
+
+    def setUp(self):
+        """
+        Record queued observers created and functions registered with atexit
+        """
+        self.addCleanup(set_fanout, None)
+        self.atexit = patch(self, 'otter.log.setup.atexit')
+        self.queued = []
+
+        def queued_observer(*args, **kwargs):
+            observer = QueuedObserver(*args, **kwargs)
+            self.queued.append(observer)
+            self.addCleanup(observer.stop, 5)
+            return observer
+
+        patch(self, 'otter.log.setup.QueuedObserver',
+              side_effect=queued_observer)
+        self.event = {'message': ('hello',), 'system': 'otter',
+                      'isError': False, 'time': 0}
+
+    def test_not_queued(self):
+        """
+        Events are serialized and written by the logging thread by default
+        """
+        written = []
+        chain = setup.make_observer_chain(written.append, False)
+        chain(self.event)
+        self.assertEqual(self.queued, [])
+        self.assertEqual(json.loads(written[0]['message'][0])['message'],
+                         'hello')
+
+    def test_queued(self):
+        """
+        When queued, a :obj:`QueuedObserver` is started to serialize and
+        write events from its thread, calling ``flush`` when it is idle. It
+        is stopped at exit.
+        """
+        threads = []
+        flushes = []
+
+        def observer(event):
+            threads.append(threading.current_thread())
+
+        chain = setup.make_observer_chain(
+            observer, False, queued=True, flush=lambda: flushes.append(1))
+        [queued] = self.queued
+        self.assertEqual(queued._queue.maxsize, setup.QUEUE_SIZE)
+        self.assertTrue(queued._thread.is_alive())
+        self.atexit.register.assert_called_once_with(
+            queued.stop, setup.STOP_TIMEOUT)
+        chain(self.event)
+        queued.stop(5)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertNotEqual(flushes, [])
+
+    def test_observer_factory_queued(self):
+        """
+        :func:`observer_factory_queued` writes to stdout with buffering from
+        the queued observer's thread and flushes stdout when it is idle
+        """
+        stdout = patch(self, 'otter.log.setup.sys').stdout
+        setup.observer_factory_queued()(self.event)
+        [queued] = self.queued
+        self.assertIs(queued.on_idle, stdout.flush)
+        queued.stop(5)
+        stdout.write.assert_has_calls([mock.call(mock.ANY),
+                                       mock.call('\n')])
+        self.assertEqual(
+            json.loads(stdout.write.call_args_list[0][0][0])['message'],
+            'hello')
+        self.assertTrue(stdout.flush.called)
@@ -5,20 +5,28 @@ import json
 
 from effect import raise_
 
+from pyrsistent import pmap
+
 from toolz.dicttoolz import assoc, dissoc
 
 from twisted.trial.unittest import SynchronousTestCase
 
-from otter.convergence.model import DesiredServerGroupState
+from otter.convergence.model import (
+    CLBDescription,
+    CLBNode,
+    DesiredServerGroupState,
+    ServerState)
+from otter.convergence.steps import CreateServer, DeleteServer
 
 from otter.log.spec import (
+    ConvergenceSummarizer,
     SpecificationObserverWrapper,
     get_validated_event,
     split_cf_messages,
     split_execute_convergence,
     split_list_servers
 )
-from otter.test.utils import CheckFailureValue
+from otter.test.utils import CheckFailureValue, server
 
 
 class SpecificationObserverWrapperTests(SynchronousTestCase):
@@ -293,6 +301,81 @@ class ExecuteConvergenceSplitTests(SynchronousTestCase):
         self.assertEqual(result, expected)
 
 
+class ConvergenceSummarizerTests(SynchronousTestCase):
+    """
+    Tests for :obj:`ConvergenceSummarizer`
+    """
+    def setUp(self):
+        """
+        Summarizer logging full event every 3 iterations
+        """
+        self.desired = DesiredServerGroupState(
+            server_config='config', capacity=3)
+        self.summarizer = ConvergenceSummarizer(
+            max_groups=2, full_every=lambda: 3)
+        desc = CLBDescription(lb_id='23', port=80)
+        self.lb_nodes = [
+            CLBNode(node_id='1', address='10.0.0.1', description=desc),
+            CLBNode(node_id='2', address='10.0.0.2', description=desc)]
+
+    def event(self, servers, group='g'):
+        return {'scaling_group_id': group, 'desired': self.desired,
+                'servers': servers, 'lb_nodes': self.lb_nodes, 'lbs': {},
+                'steps': [CreateServer(server_config=pmap()),
+                          DeleteServer(server_id='a')]}
+
+    def test_full_then_compact(self):
+        """
+        First iteration of a group is logged in full. Next iterations have
+        counts, server IDs by state and changes in servers since previous
+        iteration.
+        """
+        servers = [server('a', ServerState.ACTIVE),
+                   server('b', ServerState.BUILD)]
+        event = self.event(servers)
+        self.assertEqual(self.summarizer(event.copy()),
+                         [(event, 'Executing convergence')])
+        self.assertEqual(
+            self.summarizer(self.event([server('b', ServerState.ACTIVE),
+                                        server('c', ServerState.BUILD)])),
+            [({'scaling_group_id': 'g', 'desired': self.desired, 'lbs': {},
+               'num_servers': 2,
+               'servers_by_state': {'ACTIVE': ['b'], 'BUILD': ['c']},
+               'num_lb_nodes': 2, 'lb_nodes_by_lb': {'23': 2},
+               'num_steps': 2,
+               'steps_by_type': {'CreateServer': 1, 'DeleteServer': 1},
+               'server_changes': {'added': ['c'], 'removed': ['a'],
+                                  'changed': {'b': ['BUILD', 'ACTIVE']}}},
+              'Executing convergence')])
+        [(event, _)] = self.summarizer(self.event([]))
+        self.assertEqual(
+            (event['num_servers'], event['server_changes']['removed']),
+            (0, ['b', 'c']))
+        [(event, _)] = self.summarizer(self.event(servers))
+        self.assertIn('servers', event)
+
+    def test_groups_independent(self):
+        """
+        Iterations are counted and servers remembered per group, up to
+        ``max_groups`` groups
+        """
+        for group in ['g1', 'g2', 'g1', 'g3']:
+            self.summarizer(self.event([], group))
+        [(event, _)] = self.summarizer(self.event([], 'g1'))
+        self.assertNotIn('servers', event)
+        [(event, _)] = self.summarizer(self.event([], 'g2'))
+        self.assertIn('servers', event)
+
+    def test_never_full(self):
+        """
+        Full event is never logged if ``full_every`` returns None
+        """
+        summarizer = ConvergenceSummarizer(full_every=lambda: None)
+        [(event, _)] = summarizer(self.event([]))
+        self.assertNotIn('servers', event)
+        self.assertNotIn('server_changes', event)
+
+
 class CFMessageSplitTests(SynchronousTestCase):
     """
     Tests for splitting cf message type events
@@ -1,12 +1,12 @@
 """
 Tests for :mod:`otter.models.cass`
 """
-import itertools
 import json
 from collections import namedtuple
 from copy import deepcopy
 from datetime import datetime, timedelta
 from functools import partial
+from hashlib import sha1
 
 from effect import (
     Effect, ParallelEffects, TypeDispatcher, sync_perform)
@@ -26,7 +26,7 @@ from silverberg.client import CQLClient, ConsistencyLevel
 
 from testtools.matchers import IsInstance
 
-from toolz.dicttoolz import assoc, merge
+from toolz.dicttoolz import assoc, dissoc, merge
 
 from twisted.internet import defer
 from twisted.internet.task import Clock
@@ -43,11 +43,17 @@ from otter.models.cass import (
     CassScalingGroup,
     CassScalingGroupCollection,
     CassScalingGroupServersCache,
+    CassScalingGroupServersDeltaCache,
+    ManifestCache,
+    ScheduleBuckets,
     WeakLocks,
+    WebhookInfoCache,
     _assemble_webhook_from_row,
     assemble_webhooks_in_policies,
     cql_eff,
     get_cql_dispatcher,
+    get_groups_active_servers,
+    get_servers_cache,
     perform_cql_query,
     serialize_json_data,
     verified_view
@@ -430,16 +436,19 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin,
             return lock
 
         from otter.models.cass import zk
-        self.patch(zk, "PollingLock", create_ZKLock)
+        self.patch(zk, "WatchingLock", create_ZKLock)
 
         self.clock = Clock()
         locks = WeakLocks()
+        self.added_events = []
+        buckets = ScheduleBuckets(
+            range(2, 10), [lambda *a: self.added_events.append(a)])
 
         self.group = CassScalingGroup(self.mock_log,
                                       self.tenant_id,
                                       self.group_id,
                                       self.connection,
-                                      itertools.cycle(range(2, 10)),
+                                      buckets,
                                       self.kz_client,
                                       self.clock,
                                       locks,
@@ -1405,8 +1414,10 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
     def test_delete_policy_valid_policy(self, mock_webhooks, mock_get_policy):
         """
         When you delete a scaling policy, it checks if the policy exists and
-        if it does, deletes the policy and all its associated webhooks.
+        if it does, deletes the policy and all its associated webhooks. Cached
+        info of policy's webhooks is invalidated after deleting.
         """
+        cache = self.group.webhook_cache = mock.Mock(spec=WebhookInfoCache)
         d = self.group.delete_policy('3222')
         # delete returns None
         self.assertIsNone(self.successResultOf(d))
@@ -1431,6 +1442,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
 
         self.connection.execute.assert_called_once_with(
             expected_cql, expected_data, ConsistencyLevel.QUORUM)
+        cache.invalidate.assert_called_once_with(
+            self.group.tenant_id, self.group.uuid, '3222')
 
     @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
                 return_value=defer.fail(NoSuchPolicyError('t', 'g', 'p')))
@@ -1930,8 +1943,10 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
     def test_delete_webhook(self, mock_gw):
         """
         Tests that you can delete a scaling policy webhook, and if successful
-        return value is None
+        return value is None. Cached info of policy's webhooks is invalidated
+        after deleting.
         """
+        cache = self.group.webhook_cache = mock.Mock(spec=WebhookInfoCache)
         # return value for delete
         self.returns = [None]
         mock_gw.return_value = defer.succeed(
@@ -1957,6 +1972,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
 
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
+        cache.invalidate.assert_called_once_with("11111", "12345678g", "3444")
 
     @mock.patch('otter.models.cass.CassScalingGroup.get_webhook',
                 return_value=defer.fail(NoSuchWebhookError(*range(4))))
@@ -2108,6 +2124,50 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.assertFalse(self.lb.acquired)
         self.assertEqual(self.kz_client.nodes, {})
 
+    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_all_webhooks')
+    def test_delete_group_delta_servers_cache(self, mock_naive,
+                                              mock_view_state):
+        """
+        ``delete_group`` also deletes the group's servers in delta servers
+        cache if it is configured. Cached info of group's webhooks is
+        invalidated after deleting.
+        """
+        cache = self.group.webhook_cache = mock.Mock(spec=WebhookInfoCache)
+        set_config_data({'servers_cache': {'mode': 'delta'}})
+        self.addCleanup(set_config_data, {})
+        mock_view_state.return_value = defer.succeed(GroupState(
+            self.tenant_id, self.group_id, '', {}, {}, None, {}, False,
+            ScalingGroupStatus.ACTIVE))
+        mock_naive.return_value = defer.succeed([])
+
+        self.returns = [None]
+        self.clock.advance(34.575)
+        self.successResultOf(self.group.delete_group())
+
+        expected_cql = (
+            'BEGIN BATCH '
+
+            'DELETE FROM scaling_policies '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+
+            'DELETE FROM policy_webhooks '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+
+            'DELETE FROM servers_cache '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+
+            'DELETE FROM group_servers_cache '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+
+            'DELETE FROM scaling_group USING TIMESTAMP :ts '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'APPLY BATCH;')
+        self.connection.execute.assert_called_once_with(
+            expected_cql, mock.ANY, ConsistencyLevel.QUORUM)
+        cache.invalidate.assert_called_once_with(
+            self.tenant_id, self.group_id, None)
+
     @mock.patch('otter.models.cass.CassScalingGroup.view_state')
     def test_delete_lock_not_acquired(self, mock_view_state):
         """
@@ -2264,6 +2324,74 @@ class GetPolicyTests(CassScalingGroupTestCase):
         self.flushLoggedErrors(NoSuchPolicyError)
 
 
+class ViewPolicyManifestTests(CassScalingGroupTestCase):
+    """
+    Tests for :func:`CassScalingGroup.view_policy_manifest`
+    """
+
+    def setUp(self):
+        """
+        Mock verified view
+        """
+        super(ViewPolicyManifestTests, self).setUp()
+        self.verified_view = patch(
+            self, 'otter.models.cass.verified_view',
+            return_value=defer.succeed({
+                'group_config': serialize_json_data(self.config, 1.0),
+                'launch_config': serialize_json_data(self.launch_config, 1.0),
+                'created_at': 23}))
+        self.returns = [[{'data': '{"_ver": 1, "name": "p"}',
+                          'version': 'v1'}]]
+
+    def test_success(self):
+        """
+        Config, launch config and policy are read concurrently and returned
+        """
+        d = self.group.view_policy_manifest('3444', 'v1')
+        self.assertEqual(
+            self.successResultOf(d),
+            (self.config, self.launch_config, {'name': 'p'}))
+        self.verified_view.assert_called_once_with(
+            self.connection,
+            'SELECT group_config, launch_config, created_at '
+            'FROM scaling_group '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'AND deleting=false;',
+            'DELETE FROM scaling_group '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId',
+            {"tenantId": self.tenant_id, "groupId": self.group_id},
+            ConsistencyLevel.QUORUM,
+            matches(IsInstance(NoSuchScalingGroupError)), self.mock_log)
+        self.connection.execute.assert_called_once_with(
+            'SELECT data, version FROM scaling_policies '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+            'AND "policyId" = :policyId;',
+            {"tenantId": self.tenant_id, "groupId": self.group_id,
+             "policyId": "3444"},
+            ConsistencyLevel.QUORUM)
+
+    def test_no_such_policy(self):
+        """
+        Fails with `NoSuchPolicyError` if policy is not found or its version
+        does not match
+        """
+        self.failureResultOf(self.group.view_policy_manifest('3444', 'v2'),
+                             NoSuchPolicyError)
+        self.returns = [[]]
+        self.failureResultOf(self.group.view_policy_manifest('3444'),
+                             NoSuchPolicyError)
+
+    def test_no_such_group(self):
+        """
+        Fails with `NoSuchScalingGroupError` if group is not found
+        """
+        self.verified_view.return_value = defer.fail(
+            NoSuchScalingGroupError(self.tenant_id, self.group_id))
+        self.returns = [[]]
+        self.failureResultOf(self.group.view_policy_manifest('3444'),
+                             NoSuchScalingGroupError)
+
+
 class ViewManifestTests(CassScalingGroupTestCase):
     """
     Tests for :func:`view_manifest`
@@ -2338,6 +2466,69 @@ class ViewManifestTests(CassScalingGroupTestCase):
             matches(IsInstance(NoSuchScalingGroupError)),
             self.mock_log)
 
+    def test_manifest_cache(self):
+        """
+        With a manifest cache, the state is read along with the configs'
+        write timestamps and the configs are read only if the cached ones
+        were read with different timestamps
+        """
+        self.group.manifest_cache = ManifestCache()
+        state_row = merge(
+            dissoc(self.vv_return, 'group_config', 'launch_config'),
+            {'writetime(group_config)': 1, 'writetime(launch_config)': 2})
+        self.verified_view.side_effect = lambda *a: defer.succeed(state_row)
+        configs_row = {
+            'group_config': self.vv_return['group_config'],
+            'launch_config': self.vv_return['launch_config'],
+            'writetime(group_config)': 1, 'writetime(launch_config)': 2}
+        self.returns = [[configs_row]]
+
+        for _ in range(2):
+            self.assertEqual(
+                self.validate_view_manifest_return_value(with_policies=False),
+                self.manifest)
+        self.verified_view.assert_called_with(
+            self.connection,
+            'SELECT "tenantId", "groupId", active, pending, "groupTouched", '
+            '"policyTouched", paused, desired, created_at, status, '
+            'error_reasons, deleting, suspended, writetime(group_config), '
+            'writetime(launch_config) FROM scaling_group '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId',
+            'DELETE FROM scaling_group '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId',
+            {'tenantId': self.tenant_id, 'groupId': self.group_id},
+            ConsistencyLevel.QUORUM,
+            matches(IsInstance(NoSuchScalingGroupError)), self.mock_log)
+        self.connection.execute.assert_called_once_with(
+            'SELECT group_config, launch_config, writetime(group_config), '
+            'writetime(launch_config) FROM scaling_group '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId',
+            {'tenantId': self.tenant_id, 'groupId': self.group_id},
+            ConsistencyLevel.QUORUM)
+
+        # launch config got updated
+        state_row['writetime(launch_config)'] = 3
+        self.returns = [[assoc(configs_row, 'writetime(launch_config)', 3)]]
+        self.validate_view_manifest_return_value(with_policies=False)
+        self.validate_view_manifest_return_value(with_policies=False)
+        self.assertEqual(self.connection.execute.call_count, 2)
+        self.assertEqual(
+            (self.group.manifest_cache.hits, self.group.manifest_cache.misses),
+            (2, 2))
+
+    def test_manifest_cache_group_deleted(self):
+        """
+        With a manifest cache, if the group is deleted between reading its
+        state and its configs, `NoSuchScalingGroupError` is raised
+        """
+        self.group.manifest_cache = ManifestCache()
+        self.verified_view.return_value = defer.succeed(merge(
+            self.vv_return,
+            {'writetime(group_config)': 1, 'writetime(launch_config)': 2}))
+        self.returns = [[]]
+        self.failureResultOf(self.group.view_manifest(with_policies=False),
+                             NoSuchScalingGroupError)
+
     def test_different_status(self):
         """`status` is propagated to the manifest return value."""
         self.verified_view.return_value = defer.succeed(self.vv_return)
@@ -2613,6 +2804,50 @@ class CassScalingGroupUpdatePolicyTests(CassScalingGroupTestCase):
         self.connection.execute.assert_called_once_with(
             expected_cql, expected_data, ConsistencyLevel.QUORUM)
 
+    def test_update_scaling_policy_at_schedule_sliced(self):
+        """
+        Updating at-style schedule policy inserts the event into its time
+        slice partition of scaling_schedule_v3 and records the slice when
+        "scheduler.time_slice" config is set
+        """
+        set_config_data({'scheduler': {'time_slice': 3600}})
+        self.addCleanup(set_config_data, {})
+        self.returns = [None]
+        self.get_policy.return_value = defer.succeed(
+            {"type": "schedule",
+             "args": {"at": "2013-07-30T19:03:12Z"}})
+        d = self.group.update_policy(
+            '12345678', {"type": "schedule",
+                         "args": {"at": "2015-09-20T10:00:12Z"}})
+        self.assertIsNone(self.successResultOf(d))
+        expected_cql = (
+            'BEGIN BATCH '
+
+            'INSERT INTO scaling_schedule_v3(bucket, slice, "tenantId", '
+            '"groupId", "policyId", trigger, version) '
+            'VALUES (:bucket, :slice, :tenantId, :groupId, :policyId, '
+            ':trigger, :version) '
+
+            'INSERT INTO scaling_schedule_slices(bucket, slice) '
+            'VALUES (:bucket, :slice); '
+
+            'INSERT INTO scaling_policies("tenantId", "groupId", "policyId", '
+            'data, version) '
+            'VALUES (:tenantId, :groupId, :policyId, :data, :version) '
+            'APPLY BATCH;')
+        expected_data = {
+            "data": '{"_ver": 1, "args": {"at": "2015-09-20T10:00:12Z"}, '
+                    '"type": "schedule"}',
+            "groupId": '12345678g',
+            "policyId": '12345678',
+            "tenantId": '11111',
+            "trigger": from_timestamp("2015-09-20T10:00:12Z"),
+            "slice": datetime(2015, 9, 20, 10, 0, 0),
+            "version": 'timeuuid',
+            "bucket": 2}
+        self.connection.execute.assert_called_once_with(
+            expected_cql, expected_data, ConsistencyLevel.QUORUM)
+
     def test_update_scaling_policy_cron_schedule_change(self):
         """
         Updating cron-style schedule policy updates respective entry in
@@ -2799,6 +3034,8 @@ class ScalingGroupAddPoliciesTests(CassScalingGroupTestCase):
             "policy0version": 'timeuuid'}
         self.connection.execute.assert_called_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
+        self.assertEqual(self.added_events,
+                         [(2, from_timestamp(expected_at))])
 
         pol['id'] = self.mock_key.return_value
         self.assertEqual(result, [pol])
@@ -2845,6 +3082,7 @@ class ScalingGroupAddPoliciesTests(CassScalingGroupTestCase):
                         "policy0version": "timeuuid"}
         self.connection.execute.assert_called_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
+        self.assertEqual(self.added_events, [(2, 'next_time')])
 
         pol['id'] = self.mock_key.return_value
         self.assertEqual(result, [pol])
@@ -3029,12 +3267,15 @@ class CassScalingScheduleCollectionTestCase(
                 'event1trigger': 122,
                 'event1cron': 'c2',
                 'event1version': 'v2'}
-        self.collection.buckets = iter(range(2, 4))
+        self.collection.set_scheduler_buckets(range(2, 4))
+        added = []
+        self.collection.add_event_observer(lambda *a: added.append(a))
 
         result = self.successResultOf(self.collection.add_cron_events(events))
         self.assertEqual(result, None)
         self.connection.execute.assert_called_once_with(
             cql, data, ConsistencyLevel.ONE)
+        self.assertEqual(added, [(2, 100), (3, 122)])
 
     def test_get_oldest_event(self):
         """
@@ -3062,6 +3303,168 @@ class CassScalingScheduleCollectionTestCase(
         self.assertIsNone(self.successResultOf(d))
 
 
+class CassSlicedScheduleCollectionTests(SynchronousTestCase):
+    """
+    Tests for events of :class:`CassScalingGroupCollection` stored in time
+    slice partitions when "scheduler.time_slice" config is set
+    """
+
+    def setUp(self):
+        """
+        Setup the mocks and config
+        """
+        set_config_data({'scheduler': {'time_slice': 60}})
+        self.addCleanup(set_config_data, {})
+        self.connection = mock.MagicMock(spec=['execute'])
+        self.returns = [None]
+
+        def _responses(*args):
+            return defer.succeed(self.returns.pop(0))
+
+        self.connection.execute.side_effect = _responses
+        self.collection = CassScalingGroupCollection(
+            self.connection, Clock(), 1)
+        self.now = datetime(2016, 1, 1, 10, 5, 30)
+        self.event = {'tenantId': 't', 'groupId': 'g', 'policyId': 'p1',
+                      'trigger': datetime(2016, 1, 1, 10, 2, 10),
+                      'cron': None, 'version': 'v'}
+
+    def _fetch_call(self, slice_, size):
+        return mock.call(
+            'SELECT "tenantId", "groupId", "policyId", "trigger", cron, '
+            'version FROM scaling_schedule_v3 '
+            'WHERE bucket = :bucket AND slice = :slice AND trigger <= :now '
+            'LIMIT :size;',
+            {'bucket': 2, 'slice': slice_, 'now': self.now, 'size': size},
+            ConsistencyLevel.QUORUM)
+
+    def test_fetch_and_delete(self):
+        """
+        Events are fetched from due slices oldest first until ``size`` events
+        are fetched. Events in slices that can still get events are deleted
+        one by one and drained old slices are deleted whole along with their
+        entry in slices table.
+        """
+        old, current = datetime(2016, 1, 1, 10, 2), datetime(2016, 1, 1, 10, 5)
+        event2 = dict(self.event, policyId='p2',
+                      trigger=datetime(2016, 1, 1, 10, 5, 20))
+        self.returns = [[{'slice': old}, {'slice': current}],
+                        [self.event], [event2], None]
+
+        d = self.collection.fetch_and_delete(2, self.now, 3)
+
+        self.assertEqual(self.successResultOf(d), [self.event, event2])
+        del_cql = (
+            'BEGIN BATCH '
+            'DELETE FROM scaling_schedule_v3 WHERE bucket = :bucket '
+            'AND slice = :event1slice AND trigger = :event1trigger '
+            'AND "policyId" = :event1policyId; '
+            'DELETE FROM scaling_schedule_v3 WHERE bucket = :bucket '
+            'AND slice = :slice0slice; '
+            'DELETE FROM scaling_schedule_slices WHERE bucket = :bucket '
+            'AND slice = :slice0slice; '
+            'APPLY BATCH;')
+        del_data = {'bucket': 2, 'event1slice': current,
+                    'event1trigger': event2['trigger'],
+                    'event1policyId': 'p2', 'slice0slice': old}
+        self.assertEqual(
+            self.connection.execute.mock_calls,
+            [mock.call(
+                'SELECT slice FROM scaling_schedule_slices '
+                'WHERE bucket = :bucket AND slice <= :now;',
+                {'bucket': 2, 'now': self.now}, ConsistencyLevel.QUORUM),
+             self._fetch_call(old, 3),
+             self._fetch_call(current, 2),
+             mock.call(del_cql, del_data, ConsistencyLevel.QUORUM)])
+
+    def test_fetch_and_delete_size_reached(self):
+        """
+        Later slices are not read once ``size`` events are fetched and a
+        slice that returned ``size`` events is not deleted whole
+        """
+        old = datetime(2016, 1, 1, 10, 0)
+        self.returns = [
+            [{'slice': old}, {'slice': datetime(2016, 1, 1, 10, 2)}],
+            [self.event], None]
+
+        d = self.collection.fetch_and_delete(2, self.now, 1)
+
+        self.assertEqual(self.successResultOf(d), [self.event])
+        self.assertEqual(self.connection.execute.mock_calls[1:],
+                         [self._fetch_call(old, 1),
+                          mock.call(
+                              'BEGIN BATCH DELETE FROM scaling_schedule_v3 '
+                              'WHERE bucket = :bucket '
+                              'AND slice = :event0slice '
+                              'AND trigger = :event0trigger '
+                              'AND "policyId" = :event0policyId; '
+                              'APPLY BATCH;',
+                              {'bucket': 2, 'event0slice': old,
+                               'event0trigger': self.event['trigger'],
+                               'event0policyId': 'p1'},
+                              ConsistencyLevel.QUORUM)])
+
+    def test_fetch_and_delete_nothing(self):
+        """
+        Nothing is deleted if there are no events and no drained slices
+        """
+        self.returns = [[{'slice': datetime(2016, 1, 1, 10, 5)}], []]
+        d = self.collection.fetch_and_delete(2, self.now, 3)
+        self.assertEqual(self.successResultOf(d), [])
+        self.assertEqual(len(self.connection.execute.mock_calls), 2)
+
+    def test_add_cron_events(self):
+        """
+        Cron events are inserted in their time slice partitions
+        """
+        self.collection.set_scheduler_buckets([3])
+        self.successResultOf(self.collection.add_cron_events([self.event]))
+        cql = (
+            'BEGIN BATCH '
+            'INSERT INTO scaling_schedule_v3(bucket, slice, "tenantId", '
+            '"groupId", "policyId", trigger, cron, version) '
+            'VALUES (:event0bucket, :event0slice, :event0tenantId, '
+            ':event0groupId, :event0policyId, :event0trigger, :event0cron, '
+            ':event0version); '
+            'INSERT INTO scaling_schedule_slices(bucket, slice) '
+            'VALUES (:event0bucket, :event0slice); '
+            'APPLY BATCH;')
+        data = {'event0bucket': 3, 'event0slice': datetime(2016, 1, 1, 10, 2),
+                'event0tenantId': 't', 'event0groupId': 'g',
+                'event0policyId': 'p1', 'event0trigger': self.event['trigger'],
+                'event0cron': None, 'event0version': 'v'}
+        self.connection.execute.assert_called_once_with(
+            cql, data, ConsistencyLevel.ONE)
+
+    def test_get_oldest_event(self):
+        """
+        Oldest event is the first event of the first slice having events
+        """
+        slices = [datetime(2016, 1, 1, 10, 0), datetime(2016, 1, 1, 10, 2)]
+        self.returns = [[{'slice': s} for s in slices], [], [self.event]]
+
+        d = self.collection.get_oldest_event(2)
+
+        self.assertEqual(self.successResultOf(d), self.event)
+        self.assertEqual(
+            self.connection.execute.mock_calls,
+            [mock.call('SELECT slice FROM scaling_schedule_slices '
+                       'WHERE bucket = :bucket;',
+                       {'bucket': 2}, ConsistencyLevel.ONE)] +
+            [mock.call('SELECT * FROM scaling_schedule_v3 '
+                       'WHERE bucket = :bucket AND slice = :slice LIMIT 1;',
+                       {'bucket': 2, 'slice': s}, ConsistencyLevel.ONE)
+             for s in slices])
+
+    def test_get_oldest_event_empty(self):
+        """
+        None is returned when no slice has events
+        """
+        self.returns = [[{'slice': datetime(2016, 1, 1, 10, 0)}], []]
+        self.assertIsNone(
+            self.successResultOf(self.collection.get_oldest_event(2)))
+
+
 class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
                                           SynchronousTestCase):
     """
@@ -3589,6 +3992,7 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
         self.assertEqual(g.uuid, '12345678')
         self.assertEqual(g.tenant_id, '123')
         self.assertIs(g.local_locks, self.collection.local_locks)
+        self.assertIs(g.webhook_cache, self.collection.webhook_cache)
 
     def test_webhook_info_by_hash(self):
         """
@@ -3622,6 +4026,50 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.ONE)
 
+    def test_webhook_info_cached(self):
+        """
+        `webhook_info_by_hash` caches recognized and unrecognized hashes
+        """
+        self.returns = [
+            _cassandrify_data([
+                {'tenantId': '123', 'groupId': 'group1', 'policyId': 'pol1'}]),
+            []]
+        for _ in range(2):
+            d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+            self.assertEqual(self.successResultOf(d),
+                             ('123', 'group1', 'pol1'))
+            d = self.collection.webhook_info_by_hash(self.mock_log, 'y')
+            self.failureResultOf(d, UnrecognizedCapabilityError)
+        self.assertEqual(self.connection.execute.call_count, 2)
+
+    def test_webhook_info_invalidated_during_lookup(self):
+        """
+        `webhook_info_by_hash` does not cache info if cache got invalidated
+        while looking it up
+        """
+        lookup_d = defer.Deferred()
+        self.connection.execute.side_effect = lambda *a: lookup_d
+        d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+        self.collection.webhook_cache.invalidate('123', 'group1', 'pol1')
+        lookup_d.callback(_cassandrify_data([
+            {'tenantId': '123', 'groupId': 'group1', 'policyId': 'pol1'}]))
+        self.assertEqual(self.successResultOf(d), ('123', 'group1', 'pol1'))
+        self.assertEqual(self.collection.webhook_cache.get('x'),
+                         (False, None))
+
+    def test_webhook_cache_config(self):
+        """
+        Webhook cache is configured from "webhook_cache" config
+        """
+        set_config_data(
+            {'webhook_cache': {'size': 2, 'ttl': 3, 'negative_ttl': 4}})
+        self.addCleanup(set_config_data, {})
+        cache = CassScalingGroupCollection(
+            self.connection, self.clock, 1).webhook_cache
+        self.assertEqual((cache.clock, cache.size, cache.ttl,
+                          cache.negative_ttl),
+                         (self.clock, 2, 3, 4))
+
     def test_get_counts(self):
         """
         Check get_count returns dictionary in proper format
@@ -3930,6 +4378,361 @@ class CassGroupServersCacheTests(SynchronousTestCase):
         self.assertEqual(eff, cql_eff(query, params))
 
 
+class CassGroupServersDeltaCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`CassScalingGroupServersDeltaCache`
+    """
+
+    def setUp(self):
+        self.params = {"tenantId": 'tid', "groupId": 'gid'}
+        self.cache = CassScalingGroupServersDeltaCache('tid', 'gid')
+        self.dt = datetime(2010, 10, 20, 10, 0, 0)
+        self.select_hashes = (
+            'SELECT server_id, blob_hash, last_update '
+            'FROM group_servers_cache '
+            'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+
+    def _test_get_servers(self, only_as_active, query_result, exp_result):
+        query = ('SELECT server_id, server_blob, server_as_active, '
+                 'last_update FROM group_servers_cache '
+                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+        seq = [(cql_eff(query, self.params).intent, const(query_result))]
+        self.assertEqual(
+            perform_sequence(seq, self.cache.get_servers(only_as_active)),
+            exp_result)
+
+    def test_get_servers_empty(self):
+        """
+        `get_servers` returns ([], None) if cache is empty
+        """
+        self._test_get_servers(True, [], ([], None))
+        self._test_get_servers(False, [], ([], None))
+
+    def test_get_servers(self):
+        """
+        `get_servers` returns all servers or only AS active servers along
+        with last update time
+        """
+        rows = [
+            {"server_id": "a", "server_blob": '{"id": "a"}',
+             "last_update": self.dt, "server_as_active": False},
+            {"server_id": "b", "server_blob": '{"id": "b"}',
+             "last_update": self.dt, "server_as_active": True}]
+        self._test_get_servers(
+            False, rows, ([{"id": "a"}, {"id": "b"}], self.dt))
+        self._test_get_servers(True, rows, ([{"id": "b"}], self.dt))
+
+    def test_get_servers_only_last_update(self):
+        """
+        `get_servers` returns no servers but last update time if the cache
+        was updated with no servers
+        """
+        self._test_get_servers(
+            False,
+            [{"server_id": None, "server_blob": None, "last_update": self.dt,
+              "server_as_active": None}],
+            ([], self.dt))
+
+    def _row(self, server, as_active=False):
+        blob = json.dumps(server, sort_keys=True)
+        return {
+            "server_id": server["id"], "last_update": self.dt,
+            "blob_hash": sha1(
+                '{}:{}'.format(int(as_active), blob)).hexdigest()}
+
+    def test_update_servers(self):
+        """
+        `update_servers` inserts only new and changed servers, deletes
+        removed servers and updates last update time in a batch
+        """
+        rows = [self._row({"id": "a"}),
+                self._row({"id": "b"}, True),
+                self._row({"id": "c", "status": "BUILD"}),
+                self._row({"id": "d"})]
+        new_dt = self.dt + timedelta(seconds=2)
+        servers = [{"id": "a"}, {"id": "b"},
+                   {"id": "c", "status": "ACTIVE", "_is_as_active": True},
+                   {"id": "e", "links": ["l"]}]
+        insert = (
+            'INSERT INTO group_servers_cache ("tenantId", "groupId", '
+            'server_id, server_blob, server_links, server_as_active, '
+            'blob_hash) VALUES(:tenantId, :groupId, :server_id{i}, '
+            ':server_blob{i}, :server_links{i}, :server_as_active{i}, '
+            ':blob_hash{i}); ')
+        query = (
+            'BEGIN BATCH ' +
+            insert.format(i=1) + insert.format(i=2) + insert.format(i=3) +
+            'DELETE FROM group_servers_cache WHERE "tenantId"=:tenantId AND '
+            '"groupId"=:groupId AND server_id=:removed_id0; '
+            'UPDATE group_servers_cache SET last_update=:last_update WHERE '
+            '"tenantId"=:tenantId AND "groupId"=:groupId; APPLY BATCH;')
+        params = merge(self.params, {
+            "last_update": new_dt,
+            "server_id1": "b", "server_blob1": '{"id": "b"}',
+            "server_links1": '[]', "server_as_active1": False,
+            "blob_hash1": self._row({"id": "b"})["blob_hash"],
+            "server_id2": "c",
+            "server_blob2": '{"id": "c", "status": "ACTIVE"}',
+            "server_links2": '[]', "server_as_active2": True,
+            "blob_hash2": self._row(
+                {"id": "c", "status": "ACTIVE"}, True)["blob_hash"],
+            "server_id3": "e",
+            "server_blob3": '{"id": "e", "links": ["l"]}',
+            "server_links3": '["l"]', "server_as_active3": False,
+            "blob_hash3": self._row({"id": "e", "links": ["l"]})["blob_hash"],
+            "removed_id0": "d"})
+        seq = [
+            (cql_eff(self.select_hashes, self.params).intent, const(rows)),
+            (cql_eff(query, params).intent, noop)]
+        self.assertIsNone(
+            perform_sequence(seq, self.cache.update_servers(new_dt, servers)))
+
+    def test_update_servers_unchanged(self):
+        """
+        Only last update time is written if no server has changed
+        """
+        new_dt = self.dt + timedelta(seconds=2)
+        query = (
+            'BEGIN BATCH '
+            'UPDATE group_servers_cache SET last_update=:last_update WHERE '
+            '"tenantId"=:tenantId AND "groupId"=:groupId; APPLY BATCH;')
+        seq = [
+            (cql_eff(self.select_hashes, self.params).intent,
+             const([self._row({"id": "a"})])),
+            (cql_eff(query, assoc(self.params, "last_update", new_dt)).intent,
+             noop)]
+        self.assertIsNone(
+            perform_sequence(
+                seq, self.cache.update_servers(new_dt, [{"id": "a"}])))
+
+    def test_update_servers_errors(self):
+        """
+        `update_servers` errors if given time is not greater than last
+        updated time
+        """
+        seq = [(cql_eff(self.select_hashes, self.params).intent,
+                const([self._row({"id": "a"})]))]
+        eff = self.cache.update_servers(self.dt, [{"id": "a"}])
+        self.assertRaises(ValueError, perform_sequence, seq, eff)
+
+    def test_delete_servers(self):
+        """
+        `delete_servers` deletes all servers of the group
+        """
+        self.assertEqual(
+            self.cache.delete_servers(self.dt),
+            cql_eff(
+                'DELETE FROM group_servers_cache WHERE "tenantId" = :tenantId '
+                'AND "groupId" = :groupId;',
+                self.params))
+
+
+class ManifestCacheTests(SynchronousTestCase):
+    """
+    Tests for :obj:`ManifestCache`
+    """
+
+    def setUp(self):
+        self.cache = ManifestCache(size=2)
+
+    def test_versions(self):
+        """
+        Configs put are returned by `get` only for same versions
+        """
+        self.assertIsNone(self.cache.get('t', 'g', (1, 2)))
+        self.cache.put('t', 'g', (1, 2), 'c', 'l')
+        self.assertEqual(self.cache.get('t', 'g', (1, 2)), ('c', 'l'))
+        self.assertIsNone(self.cache.get('t', 'g', (1, 3)))
+        self.assertIsNone(self.cache.get('t', 'g', (1, 2)))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+
+    def test_copies(self):
+        """
+        Changing configs put or got does not change the cached configs
+        """
+        config, launch = {'minEntities': 1}, {'args': {}}
+        self.cache.put('t', 'g', (1, 2), config, launch)
+        config['minEntities'] = 0
+        got_config, got_launch = self.cache.get('t', 'g', (1, 2))
+        got_config['maxEntities'] = 0
+        got_launch['args']['server'] = {}
+        self.assertEqual(self.cache.get('t', 'g', (1, 2)),
+                         ({'minEntities': 1}, {'args': {}}))
+
+    def test_lru_and_invalidate(self):
+        """
+        Least recently used entries are evicted when size is exceeded and
+        `invalidate` removes group's entry
+        """
+        self.cache.put('t', 'g1', (1, 1), 'c1', 'l1')
+        self.cache.put('t', 'g2', (1, 1), 'c2', 'l2')
+        self.cache.get('t', 'g1', (1, 1))
+        self.cache.put('t', 'g3', (1, 1), 'c3', 'l3')
+        self.assertEqual(
+            [g for g in ['g1', 'g2', 'g3']
+             if self.cache.get('t', g, (1, 1)) is not None],
+            ['g1', 'g3'])
+        self.cache.invalidate('t', 'g1')
+        self.assertIsNone(self.cache.get('t', 'g1', (1, 1)))
+
+
+class WebhookInfoCacheTests(SynchronousTestCase):
+    """
+    Tests for :obj:`WebhookInfoCache`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = WebhookInfoCache(self.clock, size=3, ttl=10,
+                                      negative_ttl=5)
+
+    def test_get_missing(self):
+        """
+        `get` returns (False, None) for hash not in cache
+        """
+        self.assertEqual(self.cache.get('h'), (False, None))
+
+    def test_put_get(self):
+        """
+        Info put is returned by `get` until it expires after TTL. Unrecognized
+        hash is cached with negative TTL.
+        """
+        self.cache.put('h1', ('t', 'g', 'p'), 0)
+        self.cache.put('h2', None, 0)
+        self.clock.advance(4)
+        self.assertEqual(self.cache.get('h1'), (True, ('t', 'g', 'p')))
+        self.assertEqual(self.cache.get('h2'), (True, None))
+        self.clock.advance(1)
+        self.assertEqual(self.cache.get('h1'), (True, ('t', 'g', 'p')))
+        self.assertEqual(self.cache.get('h2'), (False, None))
+        self.clock.advance(5)
+        self.assertEqual(self.cache.get('h1'), (False, None))
+
+    def test_lru(self):
+        """
+        Least recently used entries are evicted when size is exceeded
+        """
+        for h in ['h1', 'h2', 'h3']:
+            self.cache.put(h, None, 0)
+        self.cache.get('h1')
+        self.cache.put('h4', None, 0)
+        self.assertEqual(
+            [h for h in ['h1', 'h2', 'h3', 'h4'] if self.cache.get(h)[0]],
+            ['h1', 'h3', 'h4'])
+
+    def test_invalidate(self):
+        """
+        `invalidate` removes entries of given group's policy or whole group
+        and ignores info put from lookups started before it
+        """
+        self.cache.put('h1', ('t', 'g', 'p1'), 0)
+        self.cache.put('h2', ('t', 'g', 'p2'), 0)
+        self.cache.put('h3', ('t', 'g2', 'p1'), 0)
+        self.cache.invalidate('t', 'g', 'p1')
+        self.assertEqual(
+            [h for h in ['h1', 'h2', 'h3'] if self.cache.get(h)[0]],
+            ['h2', 'h3'])
+        self.cache.invalidate('t', 'g')
+        self.assertEqual(
+            [h for h in ['h1', 'h2', 'h3'] if self.cache.get(h)[0]],
+            ['h3'])
+        self.cache.put('h4', ('t', 'g', 'p1'), 0)
+        self.assertEqual(self.cache.get('h4'), (False, None))
+        self.cache.put('h4', ('t', 'g', 'p1'), self.cache.generation)
+        self.assertEqual(self.cache.get('h4'), (True, ('t', 'g', 'p1')))
+
+
+class GetGroupsActiveServersTests(SynchronousTestCase):
+    """
+    Tests for `get_groups_active_servers` of servers caches
+    """
+
+    def setUp(self):
+        self.dt = datetime(2010, 10, 20, 10, 0, 0)
+        self.params = {"tenantId": "tid", "groupId0": "g1", "groupId1": "g2",
+                       "groupId2": "g3"}
+        self.addCleanup(set_config_data, {})
+
+    def test_no_groups(self):
+        """
+        No query is made if there are no groups
+        """
+        for cache_class in [CassScalingGroupServersCache,
+                            CassScalingGroupServersDeltaCache]:
+            self.assertEqual(
+                perform_sequence(
+                    [], cache_class.get_groups_active_servers('tid', [])),
+                {})
+
+    def test_full(self):
+        """
+        Returns active servers of latest cache of each group in one query
+        """
+        set_config_data({})
+        earlier = self.dt - timedelta(seconds=1)
+        query = (
+            'SELECT "groupId", server_blob, server_as_active, last_update '
+            'FROM servers_cache WHERE "tenantId"=:tenantId AND "groupId" IN '
+            '(:groupId0, :groupId1, :groupId2);')
+        rows = [
+            {"groupId": "g1", "server_blob": '{"id": "a"}',
+             "server_as_active": True, "last_update": self.dt},
+            {"groupId": "g1", "server_blob": '{"id": "b"}',
+             "server_as_active": False, "last_update": self.dt},
+            {"groupId": "g1", "server_blob": '{"id": "c"}',
+             "server_as_active": True, "last_update": earlier},
+            {"groupId": "g2", "server_blob": '{"id": "d"}',
+             "server_as_active": False, "last_update": self.dt}]
+        seq = [(cql_eff(query, self.params).intent, const(rows))]
+        self.assertEqual(
+            perform_sequence(
+                seq, get_groups_active_servers('tid', ['g1', 'g2', 'g3'])),
+            {"g1": [{"id": "a"}], "g2": []})
+
+    def test_delta(self):
+        """
+        Returns active servers' IDs and links of each group in one query
+        without decoding server blobs
+        """
+        set_config_data({'servers_cache': {'mode': 'delta'}})
+        query = (
+            'SELECT "groupId", server_id, server_links, server_as_active '
+            'FROM group_servers_cache WHERE "tenantId"=:tenantId AND '
+            '"groupId" IN (:groupId0, :groupId1, :groupId2);')
+        rows = [
+            {"groupId": "g1", "server_id": "a", "server_links": '["l"]',
+             "server_as_active": True},
+            {"groupId": "g1", "server_id": "b", "server_links": '[]',
+             "server_as_active": False},
+            {"groupId": "g2", "server_id": None, "server_links": None,
+             "server_as_active": None}]
+        seq = [(cql_eff(query, self.params).intent, const(rows))]
+        self.assertEqual(
+            perform_sequence(
+                seq, get_groups_active_servers('tid', ['g1', 'g2', 'g3'])),
+            {"g1": [{"id": "a", "links": ["l"]}], "g2": []})
+
+
+class GetServersCacheTests(SynchronousTestCase):
+    """
+    Tests for :func:`get_servers_cache`
+    """
+
+    def test_mode(self):
+        """
+        Returns delta cache if "servers_cache.mode" config is "delta" and
+        full cache otherwise
+        """
+        self.addCleanup(set_config_data, {})
+        set_config_data({})
+        self.assertIsInstance(get_servers_cache('t', 'g'),
+                              CassScalingGroupServersCache)
+        set_config_data({'servers_cache': {'mode': 'delta'}})
+        cache = get_servers_cache('t', 'g')
+        self.assertIsInstance(cache, CassScalingGroupServersDeltaCache)
+        self.assertEqual((cache.tenantId, cache.groupId), ('t', 'g'))
+
+
 class CassAdminTestCase(SynchronousTestCase):
     """
     Tests for :class:`CassAdmin`
@@ -4001,8 +4804,11 @@ class GetScalingGroupsTests(SynchronousTestCase):
     """Tests for ``get_all_valid_groups``."""
 
     @mock.patch("otter.models.cass.CassScalingGroupCollection"
-                ".get_scaling_group_rows")
-    def test_success(self, mock_gsgr):
+                ".get_scaling_group_rows_page")
+    def test_success(self, mock_gsgrp):
+        """
+        Only valid groups are returned
+        """
         clock = Clock()
         client = mock.Mock(spec=CQLClient)
         collection = CassScalingGroupCollection(client, clock, 1)
@@ -4015,10 +4821,54 @@ class GetScalingGroupsTests(SynchronousTestCase):
             {'created_at': '0', 'desired': 'some', 'deleting': 'True', },
             {'created_at': '0', 'desired': 'some', 'status': 'ERROR'}]
         rows = [assoc(row, "tenantId", "t1") for row in rows]
-        mock_gsgr.return_value = defer.succeed(rows)
+        pages = {None: (rows[:4], 'a1'), 'a1': (rows[4:], None)}
+        mock_gsgrp.side_effect = lambda p, a, l: defer.succeed(pages[a])
         results = self.successResultOf(collection.get_all_valid_groups())
         self.assertEqual(results, [rows[0], rows[3], rows[4], rows[6]])
-        mock_gsgr.assert_called_once_with()
+        self.assertEqual(mock_gsgrp.mock_calls,
+                         [mock.call(None, None, 100),
+                          mock.call(None, 'a1', 100)])
+
+    @mock.patch("otter.models.cass.CassScalingGroupCollection"
+                ".get_scaling_group_rows_page")
+    def test_props(self, mock_gsgrp):
+        """
+        Columns needed to check validity are fetched along with given columns
+        using page size from config
+        """
+        set_config_data({'cassandra': {'group_page_size': 10}})
+        self.addCleanup(set_config_data, {})
+        collection = CassScalingGroupCollection(
+            mock.Mock(spec=CQLClient), Clock(), 1)
+        mock_gsgrp.return_value = defer.succeed(([], None))
+        self.assertEqual(
+            self.successResultOf(collection.get_all_valid_groups(['status'])),
+            [])
+        mock_gsgrp.assert_called_once_with(
+            {'tenantId', 'groupId', 'created_at', 'desired', 'deleting',
+             'status'},
+            None, 10)
+
+    @mock.patch("otter.models.cass.CassScalingGroupCollection"
+                ".get_scaling_group_rows_page")
+    def test_valid_groups_page(self, mock_gsgrp):
+        """
+        ``get_valid_groups_page`` gets page of valid groups fetching columns
+        needed to check validity along with given columns
+        """
+        collection = CassScalingGroupCollection(
+            mock.Mock(spec=CQLClient), Clock(), 1)
+        rows = [{'tenantId': 't', 'groupId': 'g1', 'created_at': '0',
+                 'desired': 1},
+                {'tenantId': 't', 'groupId': 'g2', 'created_at': '0',
+                 'desired': 1, 'deleting': True}]
+        mock_gsgrp.return_value = defer.succeed((rows, ('t', 'g2')))
+        d = collection.get_valid_groups_page(['status'], ('t', 'g0'), 2)
+        self.assertEqual(self.successResultOf(d), (rows[:1], ('t', 'g2')))
+        mock_gsgrp.assert_called_once_with(
+            {'tenantId', 'groupId', 'created_at', 'desired', 'deleting',
+             'status'},
+            ('t', 'g0'), 2)
 
 
 class GetScalingGroupRowsTests(SynchronousTestCase):
@@ -4121,3 +4971,134 @@ class GetScalingGroupRowsTests(SynchronousTestCase):
             {'limit': 5, 'tenantId': 2}, [])
         d = self.collection.get_scaling_group_rows(batch_size=5)
         self.assertEqual(list(self.successResultOf(d)), groups1 + groups2)
+
+    def test_fold(self):
+        """
+        ``fold_scaling_group_rows`` folds pages with given function fetching
+        next page after the Deferred returned by the function fires
+        """
+        groups = [{'tenantId': 1, 'groupId': i} for i in range(7)]
+        self._add_exec_args(
+            self.select + ' LIMIT :limit;', {'limit': 5}, groups[:5])
+        self._add_exec_args(
+            self.select + ('WHERE "tenantId"=:tenantId AND '
+                           '"groupId">:groupId LIMIT :limit;'),
+            {'limit': 5, 'tenantId': 1, 'groupId': 4}, groups[5:])
+        self._add_exec_args(
+            self.select + ('WHERE token("tenantId") > token(:tenantId) '
+                           'LIMIT :limit;'),
+            {'limit': 5, 'tenantId': 1}, [])
+        folded = []
+
+        def f(acc, rows):
+            folded.append(defer.Deferred())
+            return folded[-1].addCallback(lambda _: acc + len(rows))
+
+        d = self.collection.fold_scaling_group_rows(f, 0, page_size=5)
+        self.assertEqual(len(folded), 1)
+        self.assertEqual(self.client.execute.call_count, 1)
+        folded[0].callback(None)
+        folded[1].callback(None)
+        self.assertEqual(self.successResultOf(d), 7)
+
+    def test_pages(self):
+        """
+        ``get_scaling_group_rows_page`` returns a page along with ``after``
+        of next page. A page that finishes a tenant's groups continues with
+        next tenants' groups. ``after`` is None on the last page.
+        """
+        groups1 = [{'tenantId': 1, 'groupId': i} for i in range(7)]
+        groups2 = [{'tenantId': 2, 'groupId': i} for i in range(3)]
+        self._add_exec_args(
+            self.select + ' LIMIT :limit;', {'limit': 5}, groups1[:5])
+        self._add_exec_args(
+            self.select + ('WHERE "tenantId"=:tenantId AND '
+                           '"groupId">:groupId LIMIT :limit;'),
+            {'limit': 5, 'tenantId': 1, 'groupId': 4}, groups1[5:])
+        self._add_exec_args(
+            self.select + ('WHERE token("tenantId") > token(:tenantId) '
+                           'LIMIT :limit;'),
+            {'limit': 5, 'tenantId': 1}, groups2)
+        d = self.collection.get_scaling_group_rows_page(limit=5)
+        self.assertEqual(self.successResultOf(d), (groups1[:5], (1, 4)))
+        d = self.collection.get_scaling_group_rows_page(
+            after=(1, 4), limit=5)
+        self.assertEqual(self.successResultOf(d), (groups1[5:] + groups2,
+                                                   None))
+
+
+class CopyEventsToSlicesTests(SynchronousTestCase):
+    """Tests for :func:`CassScalingGroupCollection.copy_events_to_slices`"""
+
+    def setUp(self):
+        """Mock"""
+        self.client = mock.Mock(spec=CQLClient)
+        self.collection = CassScalingGroupCollection(self.client, Clock(), 1)
+        self.exec_args = {}
+        self.writes = []
+
+        def _exec(query, params, c):
+            self.assertEqual(c, ConsistencyLevel.QUORUM)
+            if query.startswith('BEGIN BATCH'):
+                self.writes.append(params)
+                return defer.succeed(None)
+            return defer.succeed(self.exec_args[freeze((query, params))])
+
+        self.client.execute.side_effect = _exec
+        self.select = (
+            'SELECT * FROM scaling_schedule_v2 WHERE bucket = :bucket')
+
+    def _add_exec_args(self, where, params, ret):
+        query = self.select + where + ' LIMIT :limit;'
+        self.exec_args[freeze((query, params))] = ret
+
+    def _event(self, minute, policy_id):
+        return {'bucket': 2, 'tenantId': 't', 'groupId': 'g',
+                'policyId': policy_id,
+                'trigger': datetime(2016, 1, 1, 10, minute, 10),
+                'cron': None, 'version': 'v'}
+
+    def test_copies_pages(self):
+        """
+        Events are read a page at a time, finishing events of the last
+        trigger before getting later triggers, and each page is written in a
+        batch with the event's slice
+        """
+        events = [self._event(1, 'p1'), self._event(1, 'p2'),
+                  self._event(1, 'p3'), self._event(3, 'p1')]
+        self._add_exec_args('', {'bucket': 2, 'limit': 2}, events[:2])
+        self._add_exec_args(
+            ' AND trigger = :trigger AND "policyId" > :policyId',
+            {'bucket': 2, 'limit': 2, 'trigger': events[1]['trigger'],
+             'policyId': 'p2'},
+            events[2:3])
+        self._add_exec_args(
+            ' AND trigger > :trigger',
+            {'bucket': 2, 'limit': 2, 'trigger': events[1]['trigger']},
+            events[3:])
+        d = self.collection.copy_events_to_slices(2, 120, page_size=2)
+        self.assertEqual(self.successResultOf(d), 4)
+        self.assertEqual(len(self.writes), 2)
+        self.assertEqual(
+            [(w['event0policyId'], w['event0slice']) for w in self.writes],
+            [('p1', datetime(2016, 1, 1, 10, 0)),
+             ('p3', datetime(2016, 1, 1, 10, 0))])
+        self.assertEqual(self.writes[1]['event1slice'],
+                         datetime(2016, 1, 1, 10, 2))
+        batch_query = self.client.execute.call_args_list[1][0][0]
+        self.assertIn(
+            'INSERT INTO scaling_schedule_v3(bucket, slice, "tenantId", '
+            '"groupId", "policyId", trigger, cron, version) '
+            'VALUES (:event1bucket, :event1slice', batch_query)
+        self.assertIn(
+            'INSERT INTO scaling_schedule_slices(bucket, slice) '
+            'VALUES (:event1bucket, :event1slice);', batch_query)
+
+    def test_empty_bucket(self):
+        """
+        Nothing is written for a bucket without events
+        """
+        self._add_exec_args('', {'bucket': 2, 'limit': 100}, [])
+        d = self.collection.copy_events_to_slices(2, 120)
+        self.assertEqual(self.successResultOf(d), 0)
+        self.assertEqual(self.writes, [])
@@ -10,7 +10,8 @@ from twisted.trial.unittest import SynchronousTestCase
 
 from otter.log.intents import get_log_dispatcher
 from otter.models.intents import (
-    DeleteGroup, GetScalingGroupInfo, LoadAndUpdateGroupStatus,
+    DeleteGroup, GetScalingGroupInfo, GetValidGroupsPage,
+    LoadAndUpdateGroupStatus,
     ModifyGroupStatePaused, UpdateGroupErrorReasons, UpdateGroupStatus,
     UpdateServersCache, get_model_dispatcher)
 from otter.models.interface import (
@@ -71,6 +72,20 @@ class ScalingGroupIntentsTests(SynchronousTestCase):
             (self.log, '00', 'g1'), self.group)
         self.assertEqual(info, (self.group, manifest))
 
+    def test_get_valid_groups_page(self):
+        """
+        Performing `GetValidGroupsPage` gets page of valid groups from store
+        """
+        store = mock.Mock(spec=["get_valid_groups_page"])
+        store.get_valid_groups_page.return_value = succeed(
+            (["groups"], "after"))
+        eff = Effect(GetValidGroupsPage(props=["status"], after="a",
+                                        limit=10))
+        self.assertEqual(sync_perform(self.get_dispatcher(store), eff),
+                         (["groups"], "after"))
+        store.get_valid_groups_page.assert_called_once_with(
+            ["status"], "a", 10)
+
     def test_get_scaling_group_info_log_context(self):
         """
         When run in an effectful log context, the fields are bound to the log
@@ -140,12 +155,12 @@ class ScalingGroupIntentsTests(SynchronousTestCase):
         self.group.update_status.assert_called_once_with(
             ScalingGroupStatus.ERROR)
 
-    @mock.patch('otter.models.intents.CassScalingGroupServersCache',
+    @mock.patch('otter.models.intents.get_servers_cache',
                 new=EffectServersCache)
     def test_perform_update_servers_cache(self):
         """
         Performing :obj:`UpdateServersCache` updates using
-        CassScalingGroupServersCache
+        the cache of the group
         """
         dt = datetime(1970, 1, 1)
         eff = Effect(UpdateServersCache('tid', 'gid', dt, [{'id': 'a'}]))
@@ -308,7 +308,8 @@ class RestAPITestMixin(RequestTestMixin):
 
 def setup_mod_and_trigger(testcase):
     """
-    Mock `modify_and_trigger` function by calling internal modifier
+    Mock `modify_and_trigger` and `modify_and_trigger_combined` functions by
+    calling internal modifier
 
     :param testcase: test case that is expected to have mocked controller
         as `mock_controller` attr
@@ -323,6 +324,8 @@ def setup_mod_and_trigger(testcase):
             mod, testcase.mock_group, testcase.mock_state, *args, **kwargs)
 
     testcase.mock_controller.modify_and_trigger.side_effect = mod_and_trigger
+    testcase.mock_controller.modify_and_trigger_combined.side_effect = \
+        mod_and_trigger
 
 
 class AdminRestAPITestMixin(RequestTestMixin):
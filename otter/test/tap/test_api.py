@@ -12,7 +12,7 @@ import mock
 from testtools.matchers import Contains, IsInstance
 
 from twisted.application.internet import TimerService
-from twisted.application.service import MultiService
+from twisted.application.service import MultiService, Service
 from twisted.internet import defer
 from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
@@ -20,18 +20,22 @@ from twisted.trial.unittest import SynchronousTestCase
 from otter.auth import CachingAuthenticator, SingleTenantAuthenticator
 from otter.constants import (
     CONVERGENCE_DIRTY_DIR, ServiceType, get_service_configs)
+from otter.convergence.gathering import GatherCache, SharedGather
 from otter.convergence.selfheal import SelfHeal
-from otter.convergence.service import Converger
+from otter.convergence.service import (
+    ConvergenceLimiter, Converger, LimitedConvergence)
 from otter.log.cloudfeeds import CloudFeedsObserver
 from otter.log.formatters import get_fanout, set_fanout
 from otter.models.cass import CassScalingGroupCollection as OriginalStore
 from otter.supervisor import SupervisorService, get_supervisor, set_supervisor
 from otter.tap.api import (
+    FunctionalService,
     HealthChecker,
     Options,
     call_after_supervisor,
     makeService,
     setup_converger,
+    setup_http_pool,
     setup_scheduler,
     setup_selfheal_service
 )
@@ -39,6 +43,7 @@ from otter.test.test_auth import identity_config
 from otter.test.test_effect_dispatcher import full_intents
 from otter.test.utils import (
     CheckFailure, exp_func, matches, mock_log, patch)
+from otter.util import logging_treq
 from otter.util.config import set_config_data
 from otter.util.deferredutils import DeferredPool
 from otter.util.zkpartitioner import Partitioner
@@ -295,6 +300,8 @@ class APIMakeServiceTests(SynchronousTestCase):
         self.addCleanup(Otter_patcher.stop)
 
         self.reactor = patch(self, 'otter.tap.api.reactor')
+        self.set_combiner_clock = patch(
+            self, 'otter.tap.api.set_combiner_clock')
 
         def scaling_group_collection(*args, **kwargs):
             self.store = OriginalStore(*args, **kwargs)
@@ -328,6 +335,13 @@ class APIMakeServiceTests(SynchronousTestCase):
         makeService(test_config)
         self.service.assert_any_call('tcp:9789', self.Site.return_value)
 
+    def test_combiner_clock(self):
+        """
+        makeService sets up combining of policy executions with the reactor
+        """
+        makeService(test_config)
+        self.set_combiner_clock.assert_called_once_with(self.reactor)
+
     def test_no_admin(self):
         """
         makeService does not create admin service if admin config value is
@@ -339,6 +353,18 @@ class APIMakeServiceTests(SynchronousTestCase):
         self.assertTrue('tcp:9789' not in
                         [args[0] for args, _ in self.service.call_args_list])
 
+    @mock.patch('otter.tap.api.setup_http_pool')
+    def test_http_pool_setup(self, mock_setup_http_pool):
+        """
+        makeService sets up HTTP pool service from config
+        """
+        pool_svc = Service()
+        mock_setup_http_pool.return_value = pool_svc
+        parent = makeService(test_config)
+        mock_setup_http_pool.assert_called_once_with(
+            self.reactor, test_config, self.log)
+        self.assertIn(pool_svc, parent)
+
     def test_unicode_service_site_on_port(self):
         """
         makeService will create strports service with a byte endpoint string
@@ -492,8 +518,9 @@ class APIMakeServiceTests(SynchronousTestCase):
 
         conf = deepcopy(test_config)
         conf['cloudfeeds'] = {'service': 'cloudFeeds', 'tenant_id': 'tid',
-                              'url': 'url'}
-        makeService(conf)
+                              'url': 'url', 'max_queue': 50,
+                              'concurrency': 2}
+        parent = makeService(conf)
         serv_confs = get_service_configs(conf)
         serv_confs[ServiceType.CLOUD_FEEDS] = {'url': 'url'}
 
@@ -506,7 +533,15 @@ class APIMakeServiceTests(SynchronousTestCase):
                 authenticator=matches(IsInstance(CachingAuthenticator)),
                 tenant_id='tid',
                 region='ord',
-                service_configs=serv_confs))
+                service_configs=serv_confs,
+                max_queue=50,
+                concurrency=2))
+
+        # queued events are flushed when service stops
+        [flush] = [svc._stop for svc in parent
+                   if isinstance(svc, FunctionalService) and
+                   getattr(svc._stop, 'func', None) == cf_observer.flush]
+        self.assertEqual(flush.args, (30,))
 
         # single tenant authenticator is created
         authenticator = cf_observer.authenticator
@@ -547,7 +582,9 @@ class APIMakeServiceTests(SynchronousTestCase):
         config["selfheal"] = {"interval": 200}
         config["converger"] = {
             "interval": 20, "build_timeout": 300,
-            "limited_retry_iterations": 15, "step_limits": {"s": "l"}}
+            "limited_retry_iterations": 15, "step_limits": {"s": "l"},
+            "gather_cache_ttl": 3, "max_concurrent": 30,
+            "max_concurrent_per_tenant": 4}
 
         kz_client = mock.Mock(spec=['start', 'stop'])
         start_d = defer.Deferred()
@@ -591,7 +628,7 @@ class APIMakeServiceTests(SynchronousTestCase):
                          sch.health_check)
         self.assertEqual(self.Otter.return_value.scheduler, sch)
         mock_cvg.assert_called_once_with(
-            parent, kz_client, "disp", 20, 300, 15, {"s": "l"})
+            parent, kz_client, "disp", 20, 300, 15, {"s": "l"}, 3, 30, 4)
         mock_shsvc.assert_called_once_with(
             self.reactor, config, "disp", self.health_checker, self.log)
         self.assertTrue(mock_shsvc.return_value in list(parent))
@@ -730,7 +767,8 @@ class APIMakeServiceTests(SynchronousTestCase):
         parent = makeService(config)
 
         mock_setup_converger.assert_called_once_with(
-            parent, kz_client, mock.ANY, 10, 3600, 10, {"step": 10})
+            parent, kz_client, mock.ANY, 10, 3600, 10, {"step": 10}, 5, 100,
+            10)
 
         dispatcher = mock_setup_converger.call_args[0][2]
 
@@ -746,7 +784,7 @@ class SetupSelfhealTests(SynchronousTestCase):
     Test for :func:`setup_selfheal_service`
     """
 
-    def _test_setup(self, config, interval):
+    def _test_setup(self, config, interval, **kwargs):
         """
         SelfHeal function wrapped with locking and logging is setup to call
         again using TimerService. It is setup on given interval based on
@@ -758,7 +796,7 @@ class SetupSelfhealTests(SynchronousTestCase):
         from otter.tap.api import zk
         from otter.util.config import config_value
         selfheal = SelfHeal(clock, base_dispatcher, config_value, interval,
-                            log)
+                            log, **kwargs)
         self.patch(
             zk, "locked_logged_func",
             exp_func(self, ("func", "lock"), base_dispatcher, "/selfheallock",
@@ -784,6 +822,16 @@ class SetupSelfhealTests(SynchronousTestCase):
         """
         self._test_setup({"selfheal": {"interval": 30.0}}, 30.0)
 
+    def test_setup_paced_from_config(self):
+        """
+        SelfHeal service is paced with page size and maximum row age taken
+        from config when mode is "paced"
+        """
+        self._test_setup(
+            {"selfheal": {"interval": 30.0, "mode": "paced", "page_size": 50,
+                          "max_row_age": 10.0}},
+            30.0, paced=True, page_size=50, max_row_age=10.0)
+
     def test_no_config(self):
         """
         returns None if "selfheal" config is not there
@@ -804,6 +852,62 @@ class SetupSelfhealTests(SynchronousTestCase):
             KeyError, self._test_setup, {"selfheal": {"unknown": 30.0}}, 20)
 
 
+class SetupHTTPPoolTests(SynchronousTestCase):
+    """
+    Tests for :func:`setup_http_pool`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.log = mock_log()
+        self.addCleanup(logging_treq.set_pool, None)
+
+    def test_setup_from_config(self):
+        """
+        Pool is created from config and used by logging treq. Its statistics
+        are logged periodically and its connections are closed when service
+        stops
+        """
+        svc = setup_http_pool(
+            self.clock,
+            {"http_pool": {"max_persistent_per_host": 3, "idle_timeout": 50,
+                           "stats_interval": 30}},
+            self.log)
+        pool = logging_treq._logging_treq.pool
+        self.assertIsInstance(pool, logging_treq.MeteredHTTPConnectionPool)
+        self.assertEqual(pool.maxPersistentPerHost, 3)
+        self.assertEqual(pool.cachedConnectionTimeout, 50)
+        pool.stats[("http", "a", 80)] = logging_treq.PoolHostStats(1, 1, 0)
+        svc.startService()
+        self.log.msg.assert_called_once_with(
+            "http-pool-stats", pool_key="http:a:80", connections_requested=1,
+            connections_created=1, reuse_rate=0, avg_wait_time=0,
+            cached_connections=0, system="otter.http_pool")
+        self.clock.advance(30)
+        self.assertEqual(self.log.msg.call_count, 1)
+        conn = mock.Mock(state="QUIESCENT")
+        pool._putConnection(("http", "a", 80), conn)
+        svc.stopService()
+        conn.abort.assert_called_once_with()
+
+    def test_defaults(self):
+        """
+        Pool settings not in config take default values
+        """
+        svc = setup_http_pool(self.clock, {"http_pool": {}}, self.log)
+        pool = logging_treq._logging_treq.pool
+        self.assertEqual(pool.maxPersistentPerHost, 10)
+        self.assertEqual(pool.cachedConnectionTimeout, 240)
+        self.assertEqual(list(svc)[0].step, 60)
+
+    def test_no_config(self):
+        """
+        Returns None and keeps treq's pool if "http_pool" config is not there
+        """
+        self.assertIsNone(setup_http_pool(self.clock, {}, self.log))
+        self.assertIsNone(logging_treq._logging_treq.pool)
+
+
 class ConvergerSetupTests(SynchronousTestCase):
     """Tests for :func:`setup_converger`."""
 
@@ -819,11 +923,19 @@ class ConvergerSetupTests(SynchronousTestCase):
         kz_client = object()
         dispatcher = object()
         interval = 50
-        setup_converger(ms, kz_client, dispatcher, interval, 35, 52, {"a": 3})
+        setup_converger(ms, kz_client, dispatcher, interval, 35, 52, {"a": 3},
+                        7, 30, 4)
         [converger] = ms.services
         self.assertIs(converger.__class__, Converger)
         self.assertEqual(converger.build_timeout, 35)
-        self.assertEqual(converger._dispatcher, dispatcher)
+        gather_disp, limiter_disp, disp = converger._dispatcher.dispatchers
+        self.assertIs(disp, dispatcher)
+        cache = gather_disp.mapping[SharedGather].args[0]
+        self.assertIs(cache.__class__, GatherCache)
+        self.assertEqual(cache.ttl, 7)
+        limiter = limiter_disp.mapping[LimitedConvergence].args[0]
+        self.assertIs(limiter.__class__, ConvergenceLimiter)
+        self.assertEqual((limiter.limit, limiter.tenant_limit), (30, 4))
         self.assertEqual(converger.interval, interval / 2)
         self.assertEqual(converger.limited_retry_iterations, 52)
         self.assertEqual(converger.step_limits, "limits")
@@ -880,6 +992,19 @@ class SchedulerSetupTests(SynchronousTestCase):
         self.assertEqual(svc.partitioner.kz_client, self.kz_client)
         self.assertEqual(svc.partitioner.partitioner_path, '/part_path')
         self.assertEqual(svc.dispatcher, "disp")
+        self.assertEqual(svc.scan_interval, 30)
+        self.assertIsNone(svc.max_in_flight)
+        self.store.add_event_observer.assert_called_once_with(
+            svc._event_added)
+
+    def test_optional_config(self):
+        """
+        Optional scheduler config is passed to `SchedulerService`
+        """
+        self.config['scheduler'].update(scan_interval=45, max_in_flight=200)
+        set_config_data(self.config)
+        svc = setup_scheduler(self.parent, "disp", self.store, self.kz_client)
+        self.assertEqual((svc.scan_interval, svc.max_in_flight), (45, 200))
 
     def test_mock_store_with_scheduler(self):
         """
@@ -35,7 +35,8 @@ from otter.auth import (
     user_for_tenant
 )
 from otter.effect_dispatcher import get_simple_dispatcher
-from otter.test.utils import SameJSON, iMock, mock_log, patch
+from otter.test.utils import (
+    CheckFailure, SameJSON, iMock, mock_log, patch)
 from otter.util.http import APIError, UpstreamError
 
 
@@ -658,7 +659,8 @@ class CachingAuthenticatorTests(SynchronousTestCase):
                 return fail(r) if isinstance(r, Exception) else succeed(r)
 
         self.clock = Clock()
-        self.ca = CachingAuthenticator(self.clock, FakeAuthenticator(), 10)
+        self.auth = FakeAuthenticator()
+        self.ca = CachingAuthenticator(self.clock, self.auth, 10)
 
     def test_verifyObject(self):
         """
@@ -781,6 +783,77 @@ class CachingAuthenticatorTests(SynchronousTestCase):
         d = self.ca.authenticate_tenant(1)
         self.assertEqual(self.successResultOf(d), 'r2')
 
+    def test_refresh_ahead(self):
+        """
+        Using a token within ``refresh_ahead`` seconds of its expiry returns
+        the cached token and re-authenticates in the background only once
+        """
+        self.ca._refresh_ahead = 3
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(6)
+        auth_d = self.resps[1] = Deferred()
+        # not yet in refresh window
+        d = self.ca.authenticate_tenant(1)
+        self.assertEqual(self.successResultOf(d), self.result)
+        self.assertEqual(self.ca._refreshing, set())
+        self.clock.advance(1)
+        d = self.ca.authenticate_tenant(1)
+        self.assertEqual(self.successResultOf(d), self.result)
+        self.assertEqual(self.ca._refreshing, set([1]))
+        # Not refreshed again while refreshing
+        del self.resps[1]
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        auth_d.callback('r2')
+        self.assertEqual(self.ca._refreshing, set())
+        # Refreshed token lives for full ttl from refresh
+        self.clock.advance(6)
+        d = self.ca.authenticate_tenant(1)
+        self.assertEqual(self.successResultOf(d), 'r2')
+
+    def test_refresh_ahead_fails(self):
+        """
+        If refreshing ahead fails, error is logged and cached token keeps
+        being used until it expires
+        """
+        self.ca._refresh_ahead = 3
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(8)
+        self.resps[1] = APIError(500, '500')
+        log = mock_log()
+        d = self.ca.authenticate_tenant(1, log=log)
+        self.assertEqual(self.successResultOf(d), self.result)
+        log.err.assert_called_once_with(
+            CheckFailure(APIError), 'otter.auth.cache.refresh-failed',
+            system='otter.auth.cache', authenticator=mock.ANY,
+            cache_ttl=10, tenant_id=1)
+        self.assertEqual(self.ca._refreshing, set())
+        self.clock.advance(3)
+        self.failureResultOf(self.ca.authenticate_tenant(1), APIError)
+
+    def test_jitter(self):
+        """
+        Entry's TTL is reduced by random fraction of up to ``jitter``
+        """
+        self.ca = CachingAuthenticator(self.clock, self.auth, 10, jitter=0.2,
+                                       rand=lambda: 0.5)
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.clock.advance(9.5)
+        self.resps[1] = 'r2'
+        self.assertEqual(
+            self.successResultOf(self.ca.authenticate_tenant(1)), 'r2')
+
+    def test_evicts_least_recently_used(self):
+        """
+        Least recently used tenants are evicted when cache has more than
+        ``max_size`` tenants and evictions are counted
+        """
+        self.ca._max_size = 2
+        self.resps.update({2: 'r2', 3: 'r3'})
+        for tenant_id in [1, 2, 1, 3]:
+            self.successResultOf(self.ca.authenticate_tenant(tenant_id))
+        self.assertEqual(self.ca._cache.keys(), [1, 3])
+        self.assertEqual(self.ca.evictions, 1)
+
 
 class RetryingAuthenticatorTests(SynchronousTestCase):
     """
@@ -920,10 +993,15 @@ class AuthenticatorTests(SynchronousTestCase):
         authenticator is composed correctly with values from config
         """
         r = mock.Mock()
+        self.config.update(
+            {'cache_max_size': 7, 'cache_refresh_ahead': 8,
+             'cache_jitter': 0.3})
         a = generate_authenticator(r, self.config)
         self.assertIsInstance(a, CachingAuthenticator)
         self.assertIdentical(a._reactor, r)
         self.assertEqual(a._ttl, 50)
+        self.assertEqual((a._max_size, a._refresh_ahead, a._jitter),
+                         (7, 8, 0.3))
 
         wa = a._authenticator
         self.assertIsInstance(wa, WaitingAuthenticator)
@@ -988,3 +1066,12 @@ class AuthenticatorTests(SynchronousTestCase):
         r = mock.Mock()
         a = generate_authenticator(r, self.config)
         self.assertEqual(a._ttl, 300)
+
+    def test_cache_defaults(self):
+        """
+        CachingAuthenticator keeps 10000 tenants, refreshes ahead in last
+        tenth of TTL and jitters TTL by 10% if not given
+        """
+        a = generate_authenticator(mock.Mock(), self.config)
+        self.assertEqual((a._max_size, a._refresh_ahead, a._jitter),
+                         (10000, 5, 0.1))
@@ -17,6 +17,7 @@ import mock
 from testtools.matchers import ContainsDict, Equals
 
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter import controller
@@ -1119,9 +1120,8 @@ def mock_group():
     Create a mocked ScalingGroup.
     """
     group = iMock(IScalingGroup, tenant_id='tenant', uuid='group')
-    group.view_config.return_value = defer.succeed("config")
-    group.get_policy.return_value = defer.succeed("policy")
-    group.view_launch_config.return_value = defer.succeed("launch")
+    group.view_policy_manifest.return_value = defer.succeed(
+        ("config", "launch", "policy"))
     return group
 
 
@@ -1146,21 +1146,19 @@ class MaybeExecuteScalingPolicyTestCase(SynchronousTestCase):
     def test_maybe_execute_scaling_policy_no_such_policy(self):
         """
         If there is no such scaling policy, the whole thing fails and
-        ``NoSuchScalingPolicy`` gets propagated up.  No other model access
-        happens, and the lock is still released.
+        ``NoSuchScalingPolicy`` gets propagated up.
         """
-        self.group.get_policy.return_value = defer.fail(
+        self.group.view_policy_manifest.return_value = defer.fail(
             NoSuchPolicyError('1', '1', '1'))
 
         d = controller.maybe_execute_scaling_policy(self.mock_log,
                                                     'transaction',
                                                     self.group,
                                                     self.mock_state,
-                                                    'pol1')
+                                                    'pol1', 'ver')
         self.failureResultOf(d, NoSuchPolicyError)
-
-        self.assertEqual(len(self.group.view_config.mock_calls), 0)
-        self.assertEqual(len(self.group.view_launch_config.mock_calls), 0)
+        self.group.view_policy_manifest.assert_called_once_with('pol1', 'ver')
+        self.assertEqual(self.mocks['check_cooldowns'].call_count, 0)
 
     def test_group_paused(self):
         """
@@ -1173,8 +1171,7 @@ class MaybeExecuteScalingPolicyTestCase(SynchronousTestCase):
             controller.maybe_execute_scaling_policy,
             self.mock_log, 'transaction', self.group, self.mock_state, 'pol1')
         # Nothing else is called
-        self.assertFalse(self.group.view_config.called)
-        self.assertFalse(self.group.view_launch_config.called)
+        self.assertFalse(self.group.view_policy_manifest.called)
         self.assertEqual(self.mock_state.policy_touched, {})
 
     def test_execute_launch_config_success_on_positive_delta(self):
@@ -1582,6 +1579,242 @@ class ModifyAndTriggerTests(SynchronousTestCase):
         self.assertTrue(self.disp.consumed())
 
 
+class ModifyAndTriggerCombinedTests(SynchronousTestCase):
+    """
+    Tests for :func:`modify_and_trigger_combined` and
+    :func:`modify_and_trigger_batch`
+    """
+
+    def setUp(self):
+        self.state = sample_group_state()
+        self.state.desired = 1
+        self.group = util_mock_group(self.state, 'tid', 'gid')
+        self.clock = Clock()
+        self.modify_state = self.group.modify_state.side_effect
+
+        def modify_state(*args, **kwargs):
+            self.modify_state_reasons.append(kwargs['modify_state_reason'])
+            self.clock.advance(2)
+            return self.modify_state(*args, **kwargs)
+
+        self.modify_state_reasons = []
+        self.group.modify_state.side_effect = modify_state
+        self.addCleanup(set_config_data, {})
+        self.mock_tg = patch(self, "otter.controller.trigger_convergence",
+                             side_effect=intent_func("tg"))
+        self.logargs = {"a": "b"}
+        controller.set_combiner_clock(self.clock)
+        self.addCleanup(setattr, controller, "_combined_modifications", None)
+
+    def log_seq(self, batch_size, lock_wait_time=2, callers=None):
+        """
+        Sequence of logging batch
+        """
+        callers = callers or [self.logargs] * batch_size
+        return [
+            (BoundFields(mock.ANY, callers[0]),
+             nested_sequence([
+                 (Log("modify-state-batch",
+                      dict(batch_size=batch_size,
+                           lock_wait_time=lock_wait_time,
+                           transaction_ids=[c.get("transaction_id")
+                                            for c in callers],
+                           callers=callers)),
+                  noop)]))]
+
+    def trigger_seq(self, result=noop):
+        """
+        Sequence of triggering convergence
+        """
+        return [(BoundFields(mock.ANY, self.logargs),
+                 nested_sequence([(("tg", "tid", "gid"), result)]))]
+
+    def combined(self, disp, modifier, *args, **kwargs):
+        logargs = kwargs.pop("logargs", self.logargs)
+        return controller.modify_and_trigger_combined(
+            disp, self.group, logargs, modifier, *args,
+            modify_state_reason="reason", **kwargs)
+
+    def scale(self, group, state, by):
+        state.desired += by
+        return state
+
+    def test_worker_tenant(self):
+        """
+        Calls are not combined for worker tenants
+        """
+        set_non_conv_tenant("tid", self)
+        mt = patch(self, "otter.controller.modify_and_trigger",
+                   return_value="r")
+        self.assertEqual(self.combined("disp", self.scale, by=2), "r")
+        mt.assert_called_once_with("disp", self.group, self.logargs,
+                                   self.scale, by=2,
+                                   modify_state_reason="reason")
+
+    def test_not_set_up(self):
+        """
+        Calls are not combined until :func:`set_combiner_clock` is called
+        """
+        self.patch(controller, "_combined_modifications", None)
+        mt = patch(self, "otter.controller.modify_and_trigger",
+                   return_value="r")
+        self.assertEqual(self.combined("disp", self.scale, by=2), "r")
+        mt.assert_called_once_with("disp", self.group, self.logargs,
+                                   self.scale, by=2,
+                                   modify_state_reason="reason")
+
+    def test_single(self):
+        """
+        Single call modifies state, logs batch and triggers convergence
+        """
+        disp = SequenceDispatcher(self.log_seq(1) + self.trigger_seq())
+        with disp.consume():
+            d = self.combined(disp, self.scale, 2)
+            self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.group.modify_state_values[-1].desired, 3)
+        self.assertEqual(self.modify_state_reasons, ["reason"])
+
+    def test_combines_calls(self):
+        """
+        Calls made while a modification is in progress are applied in one
+        modification with each call getting its own result and convergence
+        is triggered once for them. A failing modifier's changes to state are
+        discarded.
+        """
+        def fail_after_change(group, state):
+            state.desired = 100
+            raise NoSuchPolicyError("tid", "gid", "pid")
+
+        cannot_exec = controller.CannotExecutePolicyError("t", "g", "p", "w")
+        self.group.pause_modify_state = True
+        disp = SequenceDispatcher(
+            self.log_seq(1) + self.trigger_seq() + self.log_seq(3) +
+            self.trigger_seq())
+        with disp.consume():
+            d1 = self.combined(disp, self.scale, 2)
+            d2 = self.combined(disp, fail_after_change)
+            d3 = self.combined(disp, self.scale, 3)
+            d4 = self.combined(disp, lambda *a: raise_(cannot_exec))
+            self.assertEqual(len(self.group.modify_state_values), 1)
+            self.group.pause_modify_state = False
+            self.group.modify_state_pause_d.callback(None)
+            self.assertIsNone(self.successResultOf(d1))
+            self.failureResultOf(d2, NoSuchPolicyError)
+            self.assertIsNone(self.successResultOf(d3))
+            self.failureResultOf(d4, controller.CannotExecutePolicyError)
+        self.assertEqual(
+            [s.desired for s in self.group.modify_state_values], [3, 4])
+        self.assertEqual(self.group.modify_state.call_count, 2)
+
+    def test_all_fail(self):
+        """
+        If all modifiers fail, state is not written and convergence is not
+        triggered
+        """
+        self.group.pause_modify_state = True
+        disp = SequenceDispatcher(
+            self.log_seq(1) + self.trigger_seq() + self.log_seq(2))
+        with disp.consume():
+            d1 = self.combined(disp, self.scale, 2)
+            d2 = self.combined(disp, lambda *a: raise_(ValueError("a")))
+            d3 = self.combined(disp, lambda *a: raise_(KeyError("a")))
+            self.group.pause_modify_state = False
+            self.group.modify_state_pause_d.callback(None)
+            self.successResultOf(d1)
+            self.failureResultOf(d2, ValueError)
+            self.failureResultOf(d3, KeyError)
+        self.assertEqual(len(self.group.modify_state_values), 1)
+
+    def test_tenant_suspended(self):
+        """
+        Fails with :obj:`TenantSuspendedError` if associated tenant is
+        suspended without calling modifier or triggering convergence
+        """
+        self.state.suspended = True
+        disp = SequenceDispatcher(self.log_seq(1))
+        with disp.consume():
+            d = self.combined(disp, lambda *a: 1 / 0)
+            self.failureResultOf(d, controller.TenantSuspendedError)
+
+    def test_modify_state_fails(self):
+        """
+        If modify_state fails before calling modifier, all calls fail with it
+        """
+        self.modify_state = lambda *a, **k: defer.fail(ValueError("lock"))
+        disp = SequenceDispatcher(self.log_seq(1, None))
+        with disp.consume():
+            self.failureResultOf(self.combined(disp, self.scale, 2),
+                                 ValueError)
+
+    def test_logs_callers(self):
+        """
+        Bound log fields of each call in the batch are logged along with
+        their transaction IDs
+        """
+        callers = [{"transaction_id": "t2", "a": "b"}, {"c": "d"},
+                   {"transaction_id": "t4"}]
+        self.group.pause_modify_state = True
+        disp = SequenceDispatcher(
+            self.log_seq(1) + self.trigger_seq() +
+            self.log_seq(3, callers=callers) +
+            [(BoundFields(mock.ANY, callers[0]),
+              nested_sequence([(("tg", "tid", "gid"), noop)]))])
+        with disp.consume():
+            self.combined(disp, self.scale, 2)
+            ds = [self.combined(disp, self.scale, 1, logargs=logargs)
+                  for logargs in callers]
+            self.group.pause_modify_state = False
+            self.group.modify_state_pause_d.callback(None)
+            for d in ds:
+                self.assertIsNone(self.successResultOf(d))
+
+    def test_write_fails(self):
+        """
+        If the state cannot be written after calling the modifiers, every
+        call that did not fail with its own error fails with the write error
+        and convergence is not triggered
+        """
+        modify_state = self.modify_state
+
+        def failing_modify_state(*args, **kwargs):
+            d = modify_state(*args, **kwargs)
+            return d.addCallback(lambda _: raise_(ValueError("write")))
+
+        self.modify_state = failing_modify_state
+        cannot_exec = controller.CannotExecutePolicyError("t", "g", "p", "w")
+        self.group.pause_modify_state = True
+        disp = SequenceDispatcher(self.log_seq(1) + self.log_seq(3))
+        with disp.consume():
+            d1 = self.combined(disp, self.scale, 2)
+            d2 = self.combined(disp, self.scale, 3)
+            d3 = self.combined(disp, lambda *a: raise_(KeyError("a")))
+            d4 = self.combined(disp, lambda *a: raise_(cannot_exec))
+            self.group.pause_modify_state = False
+            self.group.modify_state_pause_d.callback(None)
+            self.failureResultOf(d1, ValueError)
+            self.failureResultOf(d2, ValueError)
+            self.failureResultOf(d3, KeyError)
+            self.failureResultOf(d4, controller.CannotExecutePolicyError)
+
+    def test_trigger_fails(self):
+        """
+        If triggering convergence fails, calls that required it fail with
+        that error
+        """
+        self.group.pause_modify_state = True
+        disp = SequenceDispatcher(
+            self.log_seq(1) + self.trigger_seq() + self.log_seq(2) +
+            self.trigger_seq(lambda i: raise_(ValueError("tg"))))
+        with disp.consume():
+            self.combined(disp, self.scale, 2)
+            d2 = self.combined(disp, self.scale, 2)
+            d3 = self.combined(disp, lambda *a: raise_(KeyError("a")))
+            self.group.pause_modify_state = False
+            self.group.modify_state_pause_d.callback(None)
+            self.failureResultOf(d2, ValueError)
+            self.failureResultOf(d3, KeyError)
+
+
 _should_retry_params = ShouldDelayAndRetry(
     can_retry=retry_times(3),
     next_interval=exponential_backoff_interval(2))
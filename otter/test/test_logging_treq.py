@@ -99,6 +99,24 @@ class LoggingTreqTest(SynchronousTestCase):
         self.assertIs(self.successResultOf(d), self.response)
         self._assert_success_logging('patch', 204, 5)
 
+    def test_request_pool(self):
+        """
+        Pool set with :func:`set_pool` is used if request does not provide
+        one
+        """
+        logging_treq.set_pool('pool')
+        self.addCleanup(logging_treq.set_pool, None)
+        logging_treq.request('get', self.url, headers={}, log=self.log,
+                             clock=self.clock)
+        self.treq.request.assert_called_once_with(
+            method='get', url=self.url,
+            headers={'x-otter-request-id': ['uuid']}, pool='pool')
+        logging_treq.get(self.url, headers={}, pool='other', log=self.log,
+                         clock=self.clock)
+        self.treq.get.assert_called_once_with(
+            url=self.url, headers={'x-otter-request-id': ['uuid']},
+            pool='other')
+
     def test_url_params(self):
         """`params` is logged as `url_params`."""
         params = {'key': 'val'}
@@ -368,3 +386,69 @@ class LoggingTreqTest(SynchronousTestCase):
                           "{0}.{1} ({2}) is not treq.{1} ({3})"
                           .format(ltreq_instance.__name__, name, actual,
                                   expected))
+
+
+class MeteredHTTPConnectionPoolTests(SynchronousTestCase):
+    """
+    Tests for :obj:`MeteredHTTPConnectionPool`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.pool = logging_treq.MeteredHTTPConnectionPool(self.clock, 5, 100)
+        self.key = ('https', 'example.com', 443)
+        self.endpoint = mock.Mock(spec=['connect'])
+        self.endpoint.connect.return_value = Deferred()
+
+    def test_config(self):
+        """
+        Pool is persistent with given max connections per host and idle
+        timeout
+        """
+        self.assertTrue(self.pool.persistent)
+        self.assertEqual(self.pool.maxPersistentPerHost, 5)
+        self.assertEqual(self.pool.cachedConnectionTimeout, 100)
+
+    def test_new_connection(self):
+        """
+        New connection is counted as created and time taken to connect is
+        recorded
+        """
+        d = self.pool.getConnection(self.key, self.endpoint)
+        self.clock.advance(2)
+        self.endpoint.connect.return_value.callback('conn')
+        self.assertEqual(self.successResultOf(d), 'conn')
+        self.assertEqual(self.pool.stats[self.key],
+                         logging_treq.PoolHostStats(1, 1, 2))
+
+    def test_cached_connection(self):
+        """
+        Reused cached connection is counted as requested but not created
+        """
+        conn = mock.Mock(state='QUIESCENT')
+        self.pool._putConnection(self.key, conn)
+        d = self.pool.getConnection(self.key, self.endpoint)
+        self.assertIs(self.successResultOf(d)._clientProtocol, conn)
+        self.assertFalse(self.endpoint.connect.called)
+        self.assertEqual(self.pool.stats[self.key],
+                         logging_treq.PoolHostStats(1, 0, 0))
+
+    def test_log_stats(self):
+        """
+        Statistics of each host are logged and reset
+        """
+        log = mock_log()
+        self.pool.stats[self.key] = logging_treq.PoolHostStats(4, 1, 2.0)
+        self.pool.stats[('http', 'a.com', 80)] = logging_treq.PoolHostStats(
+            1, 1, 0.5)
+        self.pool.log_stats(log)
+        log.msg.assert_has_calls([
+            mock.call("http-pool-stats", pool_key='http:a.com:80',
+                      connections_requested=1, connections_created=1,
+                      reuse_rate=0.0, avg_wait_time=0.5,
+                      cached_connections=0),
+            mock.call("http-pool-stats", pool_key='https:example.com:443',
+                      connections_requested=4, connections_created=1,
+                      reuse_rate=0.75, avg_wait_time=0.5,
+                      cached_connections=0)])
+        self.assertEqual(self.pool.stats, {})
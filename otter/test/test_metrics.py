@@ -341,6 +341,7 @@ class CollectMetricsTests(SynchronousTestCase):
             self, 'otter.metrics.add_to_cloud_metrics',
             side_effect=intent_func("atcm"))
 
+        self.props = ["launch_config", "paused", "status", "desired"]
         self.config = {'cassandra': 'c', 'identity': identity_config,
                        'metrics': {'service': 'ms', 'tenant_id': 'tid',
                                    'region': 'IAD',
@@ -352,7 +353,7 @@ class CollectMetricsTests(SynchronousTestCase):
                        "non-convergence-tenants": ["ct"]}
 
         self.sequence = SequenceDispatcher([
-            (GetAllValidGroups(), const(self.groups)),
+            (GetAllValidGroups(props=self.props), const(self.groups)),
             (TenantScope(mock.ANY, "tid"),
              nested_sequence([
                  (("atcm", 200, "r", "metrics", 2, self.config,
@@ -407,7 +408,7 @@ class CollectMetricsTests(SynchronousTestCase):
         Doesnt add metrics to blueflood if metrics config is not there
         """
         sequence = SequenceDispatcher([
-            (GetAllValidGroups(), const(self.groups))
+            (GetAllValidGroups(props=self.props), const(self.groups))
         ])
         self.get_dispatcher.return_value = sequence
         del self.config["metrics"]
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import mock
 
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.controller import CannotExecutePolicyError
@@ -21,6 +22,7 @@ from otter.scheduler import (
     add_cron_events,
     check_events_in_bucket,
     execute_event,
+    pipelined_check_events_in_bucket,
     process_events
 )
 from otter.test.utils import (
@@ -33,6 +35,8 @@ from otter.test.utils import (
     mock_log,
     patch
 )
+from otter.util.timestamp import from_timestamp
+from otter.util.weaklocks import WeakLocks
 
 
 class SchedulerTests(SynchronousTestCase):
@@ -73,8 +77,10 @@ class SchedulerServiceTests(SchedulerTests, DeferredFunctionMixin):
             self.fake_partitioner = FakePartitioner(log, callable)
             return self.fake_partitioner
 
+        self.clock = Clock()
         self.scheduler_service = SchedulerService(
-            "disp", 100, self.mock_store, pfactory, threshold=600)
+            "disp", 100, self.mock_store, pfactory, threshold=600,
+            clock=self.clock)
         otter_log.bind.assert_called_once_with(system='otter.scheduler')
         self.scheduler_service.running = True
         self.assertIdentical(self.fake_partitioner,
@@ -178,27 +184,244 @@ class SchedulerServiceTests(SchedulerTests, DeferredFunctionMixin):
     @mock.patch('otter.scheduler.datetime')
     def test_check_events_acquired(self, mock_datetime):
         """
-        the got_buckets callback checks events in each bucket when they are
-        partitoned.
+        the got_buckets callback gets the oldest event of each bucket when
+        they are partitoned and checks events only in the buckets whose
+        oldest event is due.
         """
         self.scheduler_service.log = mock.Mock()
-        mock_datetime.utcnow.return_value = 'utcnow'
-
-        responses = [4, 5]
-        self.check_events_in_bucket.side_effect = \
-            lambda *_: defer.succeed(responses.pop(0))
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(4)
+        self.returns = [{'trigger': now},
+                        {'trigger': now + timedelta(seconds=10)}, None]
 
         d = self.fake_partitioner.got_buckets([2, 3])
 
-        self.assertEqual(self.successResultOf(d), [4, 5])
+        self.assertEqual(self.successResultOf(d), [4])
         self.scheduler_service.log.bind.assert_called_once_with(
-            scheduler_run_id='transaction-id', utcnow='utcnow')
+            scheduler_run_id='transaction-id', utcnow=now)
         log = self.scheduler_service.log.bind.return_value
         self.assertEqual(self.check_events_in_bucket.mock_calls,
                          [mock.call(log, "disp", self.mock_store, 2,
-                                    'utcnow', 100),
-                          mock.call(log, "disp", self.mock_store, 3,
-                                    'utcnow', 100)])
+                                    now, 100)])
+        self.assertEqual(self.mock_store.get_oldest_event.mock_calls,
+                         [mock.call(2), mock.call(3), mock.call(2)])
+
+    def test_check_events_pipelined(self):
+        """
+        Events are checked with `pipelined_check_events_in_bucket` when
+        ``max_in_flight`` is given
+        """
+        self.scheduler_service.max_in_flight = 300
+        pipelined = patch(
+            self, 'otter.scheduler.pipelined_check_events_in_bucket',
+            return_value=defer.succeed(None))
+        self.returns = [{'trigger': datetime(2015, 1, 1)}, None]
+        self.successResultOf(self.fake_partitioner.got_buckets([2]))
+        pipelined.assert_called_once_with(
+            mock.ANY, "disp", self.mock_store, 2, mock.ANY, 100,
+            max_in_flight=300)
+        self.assertFalse(self.check_events_in_bucket.called)
+
+    def _got_buckets(self, buckets, triggers):
+        """
+        Give buckets to scheduler whose oldest events are at given triggers
+        """
+        self.returns = [None if t is None else {'trigger': t}
+                        for t in triggers]
+        self.fake_partitioner.my_buckets[:] = buckets
+        return self.fake_partitioner.got_buckets(buckets)
+
+    def test_observes_store(self):
+        """
+        Scheduler observes events added to the store
+        """
+        self.mock_store.add_event_observer.assert_called_once_with(
+            self.scheduler_service._event_added)
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_scan_interval(self, mock_datetime):
+        """
+        Buckets are scanned when they are got first time, after
+        ``scan_interval`` seconds or when they change. Otherwise they are not
+        read when partitioner calls. Scanning reads only the oldest event of
+        each bucket and does not check buckets without due events.
+        """
+        mock_datetime.utcnow.return_value = datetime(2015, 1, 1)
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.scheduler_service.scan_interval = 60
+        oldest = self.mock_store.get_oldest_event
+
+        self.successResultOf(self._got_buckets([2, 3], [None, None]))
+        self.assertEqual(oldest.call_count, 2)
+        self.clock.advance(59)
+        self.assertIsNone(self.fake_partitioner.got_buckets([3, 2]))
+        self.assertEqual(oldest.call_count, 2)
+        self.clock.advance(1)
+        self.successResultOf(self._got_buckets([2, 3], [None, None]))
+        self.assertEqual(oldest.call_count, 4)
+        self.successResultOf(self._got_buckets([2], [None]))
+        self.assertEqual(oldest.call_count, 5)
+        self.assertFalse(self.check_events_in_bucket.called)
+        self.assertEqual(self.scheduler_service.next_triggers, {2: None})
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_timer_checks_due_buckets(self, mock_datetime):
+        """
+        After scanning, scheduler waits for the earliest event and checks
+        only buckets whose events are due. Next events of those buckets are
+        fetched again to wait for.
+        """
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.successResultOf(self._got_buckets(
+            [2, 3, 4], [now + timedelta(seconds=10),
+                        now + timedelta(seconds=5), None]))
+        self.check_events_in_bucket.reset_mock()
+
+        self.clock.advance(4)
+        self.assertFalse(self.check_events_in_bucket.called)
+        mock_datetime.utcnow.return_value = now + timedelta(seconds=5)
+        self.returns = [{'trigger': now + timedelta(seconds=65)}]
+        self.clock.advance(1)
+        self.check_events_in_bucket.assert_called_once_with(
+            matches(IsBoundWith(scheduler_run_id='transaction-id',
+                                utcnow=now + timedelta(seconds=5))),
+            "disp", self.mock_store, 3, now + timedelta(seconds=5), 100)
+        self.mock_store.get_oldest_event.assert_called_with(3)
+        self.assertEqual(
+            self.scheduler_service.next_triggers,
+            {2: now + timedelta(seconds=10), 3: now + timedelta(seconds=65),
+             4: None})
+        [call] = self.clock.getDelayedCalls()
+        self.assertEqual(call.getTime(), 10)
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_timer_checks_allocated_buckets(self, mock_datetime):
+        """
+        Due buckets are not checked if they are no longer allocated
+        """
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.successResultOf(
+            self._got_buckets([2], [now + timedelta(seconds=10)]))
+        self.check_events_in_bucket.reset_mock()
+        self.fake_partitioner.health = (True, {'buckets': [3]})
+        mock_datetime.utcnow.return_value = now + timedelta(seconds=10)
+        self.clock.advance(10)
+        self.fake_partitioner.health = (False, {})
+        self.scheduler_service._schedule()
+        self.clock.advance(1)
+        self.assertFalse(self.check_events_in_bucket.called)
+        # Still waiting for the due event
+        [call] = self.clock.getDelayedCalls()
+        self.assertEqual(call.getTime(), 12)
+        self.fake_partitioner.health = (True, {'buckets': [2]})
+        self.returns = [None]
+        self.clock.advance(1)
+        self.assertEqual(self.check_events_in_bucket.call_count, 1)
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_timer_fired_early(self, mock_datetime):
+        """
+        If the timer fires before the event is due, scheduler waits for it
+        again
+        """
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.successResultOf(
+            self._got_buckets([2], [now + timedelta(seconds=10)]))
+        self.check_events_in_bucket.reset_mock()
+        mock_datetime.utcnow.return_value = now + timedelta(seconds=9.9)
+        self.clock.advance(10)
+        self.assertFalse(self.check_events_in_bucket.called)
+        [call] = self.clock.getDelayedCalls()
+        self.assertEqual(call.getTime(), 11)
+        mock_datetime.utcnow.return_value = now + timedelta(seconds=11)
+        self.returns = [None]
+        self.clock.advance(1)
+        self.assertEqual(self.check_events_in_bucket.call_count, 1)
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_next_trigger_error(self, mock_datetime):
+        """
+        If next events of buckets cannot be fetched, the error is logged
+        and the buckets are checked after a second
+        """
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.returns = [ValueError("oldest")]
+        self.fake_partitioner.my_buckets[:] = [2]
+        self.successResultOf(self.fake_partitioner.got_buckets([2]))
+        self.log.err.assert_called_once_with(
+            CheckFailure(defer.FirstError), "sch-next-trigger-err")
+        self.assertEqual(self.scheduler_service.next_triggers, {2: now})
+        [call] = self.clock.getDelayedCalls()
+        self.assertEqual(call.getTime(), 1)
+        self.assertFalse(self.check_events_in_bucket.called)
+        self.returns = [None]
+        self.clock.advance(1)
+        self.assertEqual(self.check_events_in_bucket.call_count, 1)
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_due_events_checked_after_second(self, mock_datetime):
+        """
+        Events that are still due after checking the bucket are checked
+        again after a second
+        """
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.returns = [{'trigger': now - timedelta(seconds=10)}] * 2
+        self.fake_partitioner.my_buckets[:] = [2]
+        self.successResultOf(self.fake_partitioner.got_buckets([2]))
+        self.assertEqual(self.check_events_in_bucket.call_count, 1)
+        [call] = self.clock.getDelayedCalls()
+        self.assertEqual(call.getTime(), 1)
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_event_added(self, mock_datetime):
+        """
+        Events added to store in allocated buckets earlier than the bucket's
+        next event are waited for. Timezone aware triggers are supported.
+        """
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.successResultOf(
+            self._got_buckets([2, 3], [now + timedelta(seconds=10), None]))
+        added = self.scheduler_service._event_added
+
+        added(5, now + timedelta(seconds=1))
+        added(2, now + timedelta(seconds=20))
+        [call] = self.clock.getDelayedCalls()
+        self.assertEqual(call.getTime(), 10)
+
+        added(3, from_timestamp('2015-01-01T01:00:07+01:00'))
+        self.assertEqual(self.scheduler_service.next_triggers[3],
+                         now + timedelta(seconds=7))
+        [call] = self.clock.getDelayedCalls()
+        self.assertEqual(call.getTime(), 7)
+
+    @mock.patch('otter.scheduler.datetime')
+    def test_stop_cancels_timer(self, mock_datetime):
+        """
+        Stopping the service stops waiting for events
+        """
+        now = datetime(2015, 1, 1)
+        mock_datetime.utcnow.return_value = now
+        self.check_events_in_bucket.return_value = defer.succeed(None)
+        self.successResultOf(
+            self._got_buckets([2], [now + timedelta(seconds=10)]))
+        self.scheduler_service.startService()
+        self.successResultOf(self.scheduler_service.stopService())
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(self.scheduler_service.next_triggers, {})
 
 
 class CheckEventsInBucketTests(SchedulerTests):
@@ -427,6 +650,122 @@ class ProcessEventsTests(SchedulerTests):
         self.add_cron_events.assert_called_once_with(
             self.mock_store, self.log, events, set())
 
+    def test_group_locks(self):
+        """
+        Events of a group are executed one after another when group locks
+        are given. Events of different groups are executed concurrently.
+        """
+        executions = {}
+
+        def execute_event(dispatcher, store, log, event, deleted):
+            executions[event['policyId']] = d = defer.Deferred()
+            return d
+
+        self.execute_event.side_effect = execute_event
+        events = [{'tenantId': 't', 'groupId': g, 'policyId': p}
+                  for g, p in [('g1', 'p1'), ('g1', 'p2'), ('g2', 'p3')]]
+        d = process_events(events, "disp", self.mock_store, self.log,
+                           WeakLocks())
+        self.assertEqual(sorted(executions), ['p1', 'p3'])
+        executions['p1'].callback(None)
+        self.assertEqual(sorted(executions), ['p1', 'p2', 'p3'])
+        executions['p2'].callback(None)
+        self.assertNoResult(d)
+        executions['p3'].callback(None)
+        self.assertEqual(self.successResultOf(d), 3)
+
+
+class PipelinedCheckEventsInBucketTests(SchedulerTests):
+    """
+    Tests for `pipelined_check_events_in_bucket`
+    """
+
+    def setUp(self):
+        """
+        Mock store.fetch_and_delete and `process_events`
+        """
+        super(PipelinedCheckEventsInBucketTests, self).setUp()
+        self.fetches = []
+        self.mock_store.fetch_and_delete.side_effect = (
+            lambda *a: self.fetches.append(defer.Deferred()) or
+            self.fetches[-1])
+        self.processing = []
+
+        def process_events(events, dispatcher, store, log, group_locks):
+            self.assertIsInstance(group_locks, WeakLocks)
+            if not events:
+                return 0
+            self.processing.append((events, defer.Deferred()))
+            return self.processing[-1][1]
+
+        patch(self, 'otter.scheduler.process_events',
+              side_effect=process_events)
+        self.log = mock_log()
+
+    def check(self, max_in_flight=4):
+        return pipelined_check_events_in_bucket(
+            self.log, "disp", self.mock_store, 1, 'utcnow', 2, max_in_flight)
+
+    def test_prefetches(self):
+        """
+        Next batch is fetched while previous batches are processed as long as
+        fetched events that are not processed are within ``max_in_flight``
+        """
+        d = self.check()
+        self.assertEqual(len(self.fetches), 1)
+        self.fetches[0].callback(['e1', 'e2'])
+        self.assertEqual(len(self.fetches), 2)
+        self.fetches[1].callback(['e3', 'e4'])
+        # 4 events in flight
+        self.assertEqual(len(self.fetches), 2)
+        self.assertEqual([p[0] for p in self.processing],
+                         [['e1', 'e2'], ['e3', 'e4']])
+        self.processing[1][1].callback(2)
+        self.assertEqual(len(self.fetches), 3)
+        self.fetches[2].callback(['e5'])
+        # Last batch fetched
+        self.processing[0][1].callback(2)
+        self.assertEqual(len(self.fetches), 3)
+        self.assertNoResult(d)
+        self.processing[2][1].callback(1)
+        self.assertIsNone(self.successResultOf(d))
+        self.mock_store.fetch_and_delete.assert_called_with(1, 'utcnow', 2)
+
+    def test_no_events(self):
+        """
+        Returns after fetching no events
+        """
+        d = self.check()
+        self.fetches[0].callback([])
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.processing, [])
+
+    def test_max_in_flight_at_least_batchsize(self):
+        """
+        Batch is fetched even if ``max_in_flight`` is less than batch size
+        """
+        d = self.check(max_in_flight=1)
+        self.fetches[0].callback(['e1', 'e2'])
+        self.assertEqual(len(self.fetches), 1)
+        self.processing[0][1].callback(2)
+        self.fetches[1].callback([])
+        self.assertIsNone(self.successResultOf(d))
+
+    def test_errors_logged(self):
+        """
+        Processing errors are logged and does not stop fetching. Fetching
+        errors are logged and stop fetching.
+        """
+        d = self.check()
+        self.fetches[0].callback(['e1', 'e2'])
+        self.processing[0][1].errback(ValueError('p'))
+        self.log.err.assert_called_once_with(CheckFailure(ValueError),
+                                             bucket=1)
+        self.fetches[1].errback(KeyError('f'))
+        self.log.err.assert_called_with(CheckFailure(KeyError), bucket=1)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(len(self.fetches), 2)
+
 
 class AddCronEventsTests(SchedulerTests):
     """
@@ -511,8 +850,9 @@ class ExecuteEventTests(SchedulerTests):
         self.mock_group = iMock(IScalingGroup)
         self.mock_store.get_scaling_group.return_value = self.mock_group
 
-        # mock out modify_and_trigger
-        self.mock_mt = patch(self, "otter.scheduler.modify_and_trigger")
+        # mock out modify_and_trigger_combined
+        self.mock_mt = patch(
+            self, "otter.scheduler.modify_and_trigger_combined")
         self.new_state = None
 
         def _set_new_state(new_state):
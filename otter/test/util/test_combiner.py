@@ -0,0 +1,120 @@
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.python.failure import Failure
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.util.combiner import Combiner
+
+
+class CombinerTests(SynchronousTestCase):
+    """
+    Tests for `Combiner`
+    """
+
+    def setUp(self):
+        self.batches = []
+        self.combiner = Combiner(self.process)
+
+    def process(self, key, items):
+        d = Deferred()
+        self.batches.append((key, items, d))
+        return d
+
+    def test_first_item_processed_immediately(self):
+        """
+        Item added when nothing is being processed for its key is processed
+        immediately and alone
+        """
+        d = self.combiner.add("k", 1)
+        self.assertEqual(self.batches[0][:2], ("k", [1]))
+        self.assertNoResult(d)
+        self.batches[0][2].callback(["r"])
+        self.assertEqual(self.successResultOf(d), "r")
+
+    def test_combines_items_while_processing(self):
+        """
+        Items added while a batch of same key is being processed are
+        processed together after it
+        """
+        d1 = self.combiner.add("k", 1)
+        d2 = self.combiner.add("k", 2)
+        d3 = self.combiner.add("k", 3)
+        self.assertEqual(len(self.batches), 1)
+        self.batches[0][2].callback(["r1"])
+        self.assertEqual(self.successResultOf(d1), "r1")
+        self.assertEqual(self.batches[1][:2], ("k", [2, 3]))
+        self.batches[1][2].callback([Failure(ValueError("e")), "r3"])
+        self.failureResultOf(d2, ValueError)
+        self.assertEqual(self.successResultOf(d3), "r3")
+        # Next item is processed immediately
+        self.combiner.add("k", 4)
+        self.assertEqual(self.batches[2][:2], ("k", [4]))
+
+    def test_different_keys(self):
+        """
+        Items of different keys are processed independently
+        """
+        self.combiner.add("k1", 1)
+        self.combiner.add("k2", 2)
+        self.assertEqual([b[:2] for b in self.batches],
+                         [("k1", [1]), ("k2", [2])])
+
+    def test_process_fails(self):
+        """
+        If processing fails, all items in batch fail with it and next batch
+        is processed
+        """
+        d1 = self.combiner.add("k", 1)
+        d2 = self.combiner.add("k", 2)
+        d3 = self.combiner.add("k", 3)
+        self.batches[0][2].errback(ValueError("e"))
+        self.failureResultOf(d1, ValueError)
+        self.batches[1][2].errback(ValueError("e"))
+        self.failureResultOf(d2, ValueError)
+        self.failureResultOf(d3, ValueError)
+
+    def test_synchronous_process(self):
+        """
+        Synchronous processing results and errors are returned
+        """
+        combiner = Combiner(lambda key, items: [i * 2 for i in items])
+        self.assertEqual(self.successResultOf(combiner.add("k", 1)), 2)
+        combiner = Combiner(lambda key, items: 1 / 0)
+        self.failureResultOf(combiner.add("k", 1), ZeroDivisionError)
+        combiner = Combiner(lambda key, items: fail(ValueError("e")))
+        self.failureResultOf(combiner.add("k", 1), ValueError)
+        combiner = Combiner(lambda key, items: succeed(items))
+        self.assertEqual(self.successResultOf(combiner.add("k", 1)), 1)
+
+    def test_synchronous_error_releases_key(self):
+        """
+        If processing raises synchronously, the key is not left running and
+        later items are processed
+        """
+        calls = []
+
+        def process(key, items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise ValueError("e")
+            return items
+
+        combiner = Combiner(process)
+        self.failureResultOf(combiner.add("k", 1), ValueError)
+        self.assertEqual(combiner._running, set())
+        self.assertEqual(self.successResultOf(combiner.add("k", 2)), 2)
+
+    def test_bad_results(self):
+        """
+        If results cannot be handed out to the items, all the items that did
+        not get a result fail and the next batch is processed
+        """
+        d1 = self.combiner.add("k", 1)
+        d2 = self.combiner.add("k", 2)
+        d3 = self.combiner.add("k", 3)
+        self.batches[0][2].callback(None)
+        self.failureResultOf(d1, TypeError)
+        self.assertEqual(self.batches[1][:2], ("k", [2, 3]))
+        self.batches[1][2].callback(["r2"])
+        self.failureResultOf(d2, ValueError)
+        self.failureResultOf(d3, ValueError)
+        self.assertEqual(self.combiner._running, set())
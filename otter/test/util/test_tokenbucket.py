@@ -0,0 +1,115 @@
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.util.tokenbucket import TokenBucket
+
+
+class TokenBucketTests(SynchronousTestCase):
+    """
+    Tests for `TokenBucket`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.bucket = TokenBucket(
+            self.clock, 2, 3,
+            is_throttled=lambda f: f.check(ValueError) is not None)
+
+    def test_burst(self):
+        """
+        Up to ``burst`` calls are made immediately after which calls are made
+        at ``rate`` in the order they came
+        """
+        calls = []
+        ds = [self.bucket.run(calls.append, i) for i in range(6)]
+        self.assertEqual(calls, [0, 1, 2])
+        self.clock.advance(0.4)
+        self.assertEqual(calls, [0, 1, 2])
+        self.clock.advance(0.1)
+        self.assertEqual(calls, [0, 1, 2, 3])
+        self.clock.advance(0.5)
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+        self.clock.advance(0.5)
+        self.assertEqual(calls, range(6))
+        self.assertEqual([self.successResultOf(d) for d in ds], [None] * 6)
+        self.assertEqual(
+            (self.bucket.calls, self.bucket.waits, self.bucket.wait_time),
+            (6, 3, 3.0))
+
+    def test_refill(self):
+        """
+        Tokens are added at ``rate`` up to ``burst``
+        """
+        for _ in range(3):
+            self.bucket.run(lambda: None)
+        self.clock.advance(1)
+        self.assertEqual(self.bucket.tokens, 0)
+        self.assertFalse(self.bucket.idle)
+        self.assertEqual(self.bucket.tokens, 2)
+        self.clock.advance(10)
+        self.assertTrue(self.bucket.idle)
+        self.assertEqual(self.bucket.tokens, 3)
+
+    def test_result(self):
+        """
+        Result or failure of function is returned
+        """
+        self.assertEqual(
+            self.successResultOf(self.bucket.run(lambda a, b: a + b, 1, b=2)),
+            3)
+        self.failureResultOf(self.bucket.run(lambda: 1 / 0),
+                             ZeroDivisionError)
+        d = Deferred()
+        r = self.bucket.run(lambda: d)
+        self.assertNoResult(r)
+        d.callback(4)
+        self.assertEqual(self.successResultOf(r), 4)
+
+    def test_backoff_and_recover(self):
+        """
+        Rate is multiplied by ``backoff_factor`` on throttled failure, not
+        going below ``min_rate``, and grows by ``recovery_step`` on success
+        until it reaches configured rate. Other failures do not change the
+        rate.
+        """
+        self.failureResultOf(self.bucket.run(fail, ZeroDivisionError()))
+        self.assertEqual(self.bucket.rate, 2)
+        self.failureResultOf(self.bucket.run(fail, ValueError()))
+        self.assertEqual((self.bucket.rate, self.bucket.throttled), (1, 1))
+        self.bucket.run(lambda: None)
+        self.assertEqual(self.bucket.rate, 1.2)
+        for _ in range(5):
+            self.clock.advance(10)
+            self.failureResultOf(self.bucket.run(fail, ValueError()))
+        self.assertEqual(self.bucket.rate, 0.1)
+        for _ in range(20):
+            self.clock.advance(10)
+            self.bucket.run(lambda: None)
+        self.clock.advance(10)
+        self.assertEqual(self.bucket.rate, 2)
+        self.assertTrue(self.bucket.idle)
+
+    def test_backoff_delays_waiting(self):
+        """
+        Calls waiting when rate backs off wait based on the reduced rate
+        """
+        bucket = TokenBucket(self.clock, 1, is_throttled=lambda f: True)
+        self.failureResultOf(bucket.run(fail, ValueError()))
+        calls = []
+        bucket.run(calls.append, 1)
+        self.clock.advance(1.5)
+        self.assertEqual(calls, [])
+        self.clock.advance(0.5)
+        self.assertEqual(calls, [1])
+
+    def test_reset_stats(self):
+        """
+        ``reset_stats`` resets statistics but not the rate
+        """
+        self.failureResultOf(self.bucket.run(fail, ValueError()))
+        self.bucket.reset_stats()
+        self.assertEqual(
+            (self.bucket.calls, self.bucket.waits, self.bucket.wait_time,
+             self.bucket.throttled, self.bucket.rate),
+            (0, 0, 0, 0, 1))
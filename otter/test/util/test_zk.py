@@ -20,15 +20,15 @@ from kazoo.exceptions import (
     SessionExpiredError)
 
 from twisted.internet.defer import fail, maybeDeferred, succeed
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.test.utils import exp_func, mock_log, test_dispatcher
 from otter.util import zk
 from otter.util.zk import (
     CreateOrSet, CreateOrSetLoopLimitReachedError,
-    DeleteNode, GetChildren, GetChildrenWithStats,
-    GetStat,
-    get_zk_dispatcher,
+    DeleteNode, GetChildren, GetChildrenWithStats, GetData, GetStat,
+    WaitForDeletion, get_zk_dispatcher,
     perform_create_or_set, perform_delete_node)
 
 
@@ -317,6 +317,28 @@ class GetStatTests(SynchronousTestCase):
         self.assertEqual(result, None)
 
 
+class GetDataTests(SynchronousTestCase):
+    """Tests for :obj:`GetData`."""
+
+    def setUp(self):
+        self.model = ZKCrudModel()
+
+    def _gd(self, path):
+        eff = Effect(GetData(path))
+        dispatcher = get_zk_dispatcher(self.model)
+        return sync_perform(dispatcher, eff)
+
+    def test_get_data(self):
+        """Returns the content and ZnodeStat when the node exists."""
+        self.model.create('/foo/bar', value='foo', makepath=True)
+        self.assertEqual(self._gd('/foo/bar'),
+                         ('foo', ZNodeStatStub(version=0)))
+
+    def test_get_data_not_exists(self):
+        """Returns None when no node exists."""
+        self.assertIsNone(self._gd('/foo/bar'))
+
+
 class DeleteTests(SynchronousTestCase):
     """Tests for :obj:`DeleteNode`."""
     def test_delete(self):
@@ -632,6 +654,203 @@ class PollingLockTests(SynchronousTestCase):
         self.assertEqual(self.successResultOf(self.lock.is_acquired()), "ret")
 
 
+class WaitForDeletionTests(SynchronousTestCase):
+    """
+    Tests for :obj:`WaitForDeletion`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.stat = ZNodeStatStub(version=0)
+        self.watches = []
+
+        class Model(object):
+            def exists(_self, path, watch):
+                self.assertEqual(path, "/path")
+                self.watches.append(watch)
+                return succeed(self.stat)
+
+        self.dispatcher = get_zk_dispatcher(Model(), self.clock)
+
+    def _wait(self, timeout=None):
+        return zk.perform(
+            self.dispatcher, Effect(WaitForDeletion("/path", timeout)))
+
+    def test_no_node(self):
+        """
+        Results in True immediately if node does not exist
+        """
+        self.stat = None
+        self.assertTrue(self.successResultOf(self._wait()))
+
+    def test_deleted(self):
+        """
+        Results in True when watch on the node fires
+        """
+        d = self._wait()
+        self.assertNoResult(d)
+        self.watches[0]("deleted")
+        self.assertTrue(self.successResultOf(d))
+
+    def test_timeout(self):
+        """
+        Results in False if node is not deleted within timeout. Watch firing
+        later does nothing
+        """
+        d = self._wait(2)
+        self.clock.advance(1.9)
+        self.assertNoResult(d)
+        self.clock.advance(0.1)
+        self.assertFalse(self.successResultOf(d))
+        self.watches[0]("deleted")
+
+    def test_deleted_before_timeout(self):
+        """
+        Timeout is cancelled if node is deleted before it
+        """
+        d = self._wait(2)
+        self.watches[0]("deleted")
+        self.assertTrue(self.successResultOf(d))
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+class WatchingLockTests(SynchronousTestCase):
+    """
+    Tests for :obj:`WatchingLock`
+    """
+
+    def setUp(self):
+        self.lock = zk.WatchingLock("disp", "/testlock", "id")
+
+    def _create_seq(self, node):
+        return [
+            (Constant(None), noop),
+            (zk.CreateNode("/testlock"), conste(NodeExistsError())),
+            (Func(uuid.uuid4), const("prefix")),
+            (zk.CreateNode(
+                "/testlock/prefix", value="id",
+                ephemeral=True, sequence=True),
+             const("/testlock/" + node))]
+
+    def test_acquire_success(self):
+        """
+        acquire_eff creates child and gets lock as it is the smallest one
+        """
+        seq = self._create_seq("prefix0000000000") + [
+            (GetChildren("/testlock"), const(["prefix0000000000"]))]
+        self.assertTrue(
+            perform_sequence(seq, self.lock.acquire_eff(True, 1)))
+
+    def test_acquire_nonblocking_fails(self):
+        """
+        acquire_eff returns False immediately without watching after finding
+        its not the smallest child when blocking=False. It deletes child
+        node before returning.
+        """
+        seq = self._create_seq("prefix0000000001") + [
+            (GetChildren("/testlock"),
+             const(["prefix0000000001", "prefix0000000000"])),
+            (DeleteNode(path="/testlock/prefix0000000001", version=-1), noop)
+        ]
+        self.assertFalse(
+            perform_sequence(seq, self.lock.acquire_eff(False, None)))
+
+    def test_acquire_blocking_success(self):
+        """
+        acquire_eff waits on deletion of the child just before its own with
+        remaining timeout and gets the lock when it becomes the smallest one
+        """
+        seq = self._create_seq("prefix0000000002") + [
+            (GetChildren("/testlock"),
+             const(["prefix0000000002", "prefix0000000000",
+                    "prefix0000000001"])),
+            (Func(time.time), const(0)),
+            (WaitForDeletion("/testlock/prefix0000000001", 1), const(True)),
+            (GetChildren("/testlock"),
+             const(["prefix0000000002", "prefix0000000000"])),
+            (Func(time.time), const(0.4)),
+            (WaitForDeletion("/testlock/prefix0000000000", 0.6), const(True)),
+            (GetChildren("/testlock"), const(["prefix0000000002"])),
+            (Func(time.time), const(0.7))
+        ]
+        self.assertTrue(
+            perform_sequence(seq, self.lock.acquire_eff(True, 1)))
+
+    def test_acquire_blocking_no_timeout(self):
+        """
+        When acquire_eff is called without timeout, it waits on predecessor
+        forever without checking time
+        """
+        seq = self._create_seq("prefix0000000001") + [
+            (GetChildren("/testlock"),
+             const(["prefix0000000000", "prefix0000000001"])),
+            (Func(time.time), const(0)),
+            (WaitForDeletion("/testlock/prefix0000000000", None),
+             const(True)),
+            (GetChildren("/testlock"), const(["prefix0000000001"]))
+        ]
+        self.assertTrue(
+            perform_sequence(seq, self.lock.acquire_eff(True, None)))
+
+    def test_acquire_wait_timeout(self):
+        """
+        If predecessor is not deleted within remaining timeout, acquire_eff
+        raises `LockTimeout` after deleting its child node
+        """
+        seq = self._create_seq("prefix0000000001") + [
+            (GetChildren("/testlock"),
+             const(["prefix0000000000", "prefix0000000001"])),
+            (Func(time.time), const(0)),
+            (WaitForDeletion("/testlock/prefix0000000000", 0.3),
+             const(False)),
+            (DeleteNode(path="/testlock/prefix0000000001", version=-1), noop)
+        ]
+        self.assertRaises(
+            LockTimeout, perform_sequence, seq,
+            self.lock.acquire_eff(True, 0.3))
+
+    def test_acquire_timeout_elapsed(self):
+        """
+        If timeout has elapsed when woken up without the lock, acquire_eff
+        raises `LockTimeout` without waiting again
+        """
+        seq = self._create_seq("prefix0000000002") + [
+            (GetChildren("/testlock"),
+             const(["prefix0000000000", "prefix0000000001",
+                    "prefix0000000002"])),
+            (Func(time.time), const(0)),
+            (WaitForDeletion("/testlock/prefix0000000001", 0.3),
+             const(True)),
+            (GetChildren("/testlock"),
+             const(["prefix0000000000", "prefix0000000002"])),
+            (Func(time.time), const(0.3)),
+            (DeleteNode(path="/testlock/prefix0000000002", version=-1), noop)
+        ]
+        self.assertRaises(
+            LockTimeout, perform_sequence, seq,
+            self.lock.acquire_eff(True, 0.3))
+
+    def test_acquire_node_lost(self):
+        """
+        If its child node disappears while waiting, acquire_eff raises
+        `NoNodeError` instead of waiting on children forever
+        """
+        seq = self._create_seq("prefix0000000001") + [
+            (GetChildren("/testlock"),
+             const(["prefix0000000000", "prefix0000000001"])),
+            (Func(time.time), const(0)),
+            (WaitForDeletion("/testlock/prefix0000000000", None),
+             const(True)),
+            (GetChildren("/testlock"), const(["prefix0000000002"])),
+            (DeleteNode(path="/testlock/prefix0000000001", version=-1),
+             conste(NoNodeError()))
+        ]
+        self.assertRaises(
+            NoNodeError, perform_sequence, seq,
+            self.lock.acquire_eff(True, None))
+        self.assertIsNone(self.lock._node)
+
+
 class CallIfAcquiredTests(SynchronousTestCase):
     """
     Tests for :func:`call_if_acquired`
@@ -759,7 +978,7 @@ class LockedLoggedFuncTests(SynchronousTestCase):
         Ensure :func:`locked` and :func:`add_acquired_log` are called in
         sequence with correct parameters
         """
-        self.patch(zk, "PollingLock", exp_func(self, "lock", "disp", "/path"))
+        self.patch(zk, "WatchingLock", exp_func(self, "lock", "disp", "/path"))
         self.patch(zk, "locked",
                    exp_func(self, "locked_f", "lock", "disp", "func", 1))
         self.patch(zk, "add_acquired_log",
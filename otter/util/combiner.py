@@ -0,0 +1,78 @@
+from twisted.internet.defer import Deferred, maybeDeferred
+from twisted.python.failure import Failure
+
+
+class Combiner(object):
+    """
+    Combine items with the same key that get added while a previous batch of
+    that key is being processed into the next batch. Only one batch of a key
+    is processed at a time. The first item added when nothing is being
+    processed is processed alone immediately.
+    """
+
+    def __init__(self, process):
+        """
+        :param process: Callable taking key and list of items and returning
+            Deferred fired with list of results corresponding to the items.
+            Any result that is a :class:`Failure` errbacks that item's
+            Deferred. If the Deferred itself fails, all items fail with it.
+        """
+        self._process = process
+        self._pending = {}
+        self._running = set()
+
+    def add(self, key, item):
+        """
+        Add item to be processed along with other items of ``key``
+
+        :return: Deferred fired with item's result
+        """
+        d = Deferred()
+        self._pending.setdefault(key, []).append((item, d))
+        if key not in self._running:
+            self._run(key)
+        return d
+
+    def _run(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            self._running.discard(key)
+            return
+        self._running.add(key)
+        d = maybeDeferred(self._process, key, [item for item, _ in batch])
+        d.addBoth(self._fire, key, batch)
+
+    def _fire(self, results, key, batch):
+        """
+        Fire the batch's Deferreds with their results and process the next
+        batch of ``key``
+        """
+        try:
+            _fire_batch(batch, results)
+        except Exception:
+            # Do not leave the batch's Deferreds waiting forever on results
+            # that cannot be handed out
+            failure = Failure()
+            for _, d in batch:
+                if not d.called:
+                    d.errback(failure)
+        finally:
+            # Always move on to the next batch so that the key is never left
+            # marked as running
+            self._run(key)
+
+
+def _fire_batch(batch, results):
+    """
+    Fire each Deferred in ``batch`` with corresponding result in ``results``
+    """
+    if isinstance(results, Failure):
+        results = [results] * len(batch)
+    if len(results) != len(batch):
+        raise ValueError("Got {} results for {} items".format(
+            len(results), len(batch)))
+    for (_, d), result in zip(batch, results):
+        if isinstance(result, Failure):
+            d.errback(result)
+        else:
+            d.callback(result)
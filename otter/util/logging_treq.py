@@ -2,6 +2,7 @@
 A wrapper around treq to log all requests along with the status code and time
 it took.
 """
+from collections import defaultdict
 from functools import wraps
 from uuid import uuid4
 
@@ -10,6 +11,7 @@ import attr
 import treq
 
 from twisted.internet import reactor
+from twisted.web.client import HTTPConnectionPool
 
 from otter.log import log as default_log
 from otter.util.deferredutils import timeout_deferred
@@ -33,10 +35,13 @@ class LoggingTreq(object):
     :ivar log_response: - a boolean as to whether or not the response bodies
         should be logged as bytes.  Defaults to False, because this can be
         dangerous as it may log secret information such as admin passwords.
+    :ivar pool: - :obj:`HTTPConnectionPool` used for requests that do not
+        provide one. Defaults to treq's global pool if not provided.
     """
     clock = attr.ib(default=reactor)
     log = attr.ib(default=default_log)
     log_response = attr.ib(default=False)
+    pool = attr.ib(default=None)
 
     def __getattr__(self, name):
         """
@@ -97,6 +102,9 @@ class LoggingTreq(object):
             if kwargs['headers'] is None:
                 kwargs['headers'] = {}
 
+            if self.pool is not None:
+                kwargs.setdefault('pool', self.pool)
+
             treq_transaction = str(uuid4())
             kwargs['headers']['x-otter-request-id'] = [treq_transaction]
 
@@ -140,9 +148,81 @@ class LoggingTreq(object):
         return wrapper
 
 
+@attr.s
+class PoolHostStats(object):
+    """
+    Connection statistics of a host in :obj:`MeteredHTTPConnectionPool`
+    """
+    requested = attr.ib(default=0)
+    created = attr.ib(default=0)
+    wait_time = attr.ib(default=0.0)
+
+
+class MeteredHTTPConnectionPool(HTTPConnectionPool):
+    """
+    Persistent :obj:`HTTPConnectionPool` that keeps statistics of each host:
+    number of connections requested, number of those that had to be newly
+    created instead of reusing a cached one and total time spent waiting for
+    them.
+
+    :param reactor: Twisted reactor
+    :param int max_persistent_per_host: Maximum number of idle connections
+        cached per host
+    :param idle_timeout: Seconds after which an idle connection is closed
+    """
+
+    def __init__(self, reactor, max_persistent_per_host=2, idle_timeout=240):
+        HTTPConnectionPool.__init__(self, reactor, persistent=True)
+        self.maxPersistentPerHost = max_persistent_per_host
+        self.cachedConnectionTimeout = idle_timeout
+        self.stats = defaultdict(PoolHostStats)
+
+    def getConnection(self, key, endpoint):
+        """
+        See :meth:`HTTPConnectionPool.getConnection`
+        """
+        stats = self.stats[key]
+        stats.requested += 1
+        start = self._reactor.seconds()
+
+        def got_connection(connection):
+            stats.wait_time += self._reactor.seconds() - start
+            return connection
+
+        d = HTTPConnectionPool.getConnection(self, key, endpoint)
+        return d.addCallback(got_connection)
+
+    def _newConnection(self, key, endpoint):
+        self.stats[key].created += 1
+        return HTTPConnectionPool._newConnection(self, key, endpoint)
+
+    def log_stats(self, log):
+        """
+        Log statistics of each host since the last call and reset them
+        """
+        stats, self.stats = self.stats, defaultdict(PoolHostStats)
+        for key, host_stats in sorted(stats.items()):
+            log.msg(
+                "http-pool-stats", pool_key=":".join(map(str, key)),
+                connections_requested=host_stats.requested,
+                connections_created=host_stats.created,
+                reuse_rate=(1 - host_stats.created /
+                            float(host_stats.requested)),
+                avg_wait_time=host_stats.wait_time / host_stats.requested,
+                cached_connections=len(self._connections.get(key, [])))
+
+
 _logging_treq = LoggingTreq()
 
 
+def set_pool(pool):
+    """
+    Set pool used by requests made by this module's functions. This includes
+    requests performed by :obj:`otter.util.pure_http.Request` effects.
+    """
+    _logging_treq.pool = pool
+
+
 # these methods just wrap logging_treq
 request = _logging_treq.request
 head = _logging_treq.head
@@ -0,0 +1,138 @@
+from collections import deque
+
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+
+
+class TokenBucket(object):
+    """
+    Token bucket limiting the rate at which functions are called. Tokens are
+    added at ``rate`` per second up to ``burst`` tokens and each call takes
+    one, waiting for it if none is available. Waiting calls are released in
+    the order they came.
+
+    The rate adapts to the upstream service: it is multiplied by
+    ``backoff_factor`` every time a call fails with an error that
+    ``is_throttled`` recognizes and grows back by ``recovery_step`` on every
+    successful call until it reaches the configured rate again.
+    """
+
+    def __init__(self, clock, rate, burst=1, is_throttled=lambda f: False,
+                 backoff_factor=0.5, recovery_step=None, min_rate=None):
+        """
+        :param clock: :obj:`IReactorTime` provider
+        :param float rate: Maximum tokens added per second
+        :param int burst: Maximum number of tokens the bucket holds
+        :param is_throttled: Callable taking a :obj:`Failure` and returning
+            True if it means the upstream service is throttling the calls
+        :param float backoff_factor: Rate multiplier on throttled calls
+        :param float recovery_step: Rate added on every successful call.
+            Defaults to a tenth of ``rate``
+        :param float min_rate: Rate below which it does not back off. Defaults
+            to a twentieth of ``rate``
+        """
+        self.clock = clock
+        self.max_rate = self.rate = float(rate)
+        self.burst = burst
+        self.is_throttled = is_throttled
+        self.backoff_factor = backoff_factor
+        self.recovery_step = (
+            rate / 10.0 if recovery_step is None else recovery_step)
+        self.min_rate = rate / 20.0 if min_rate is None else min_rate
+        self.tokens = float(burst)
+        self._last = clock.seconds()
+        self._waiting = deque()
+        self._release_call = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset the statistics collected since it was created or last reset
+        """
+        self.calls = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.throttled = 0
+
+    @property
+    def idle(self):
+        """
+        Is the bucket full with nothing waiting and rate fully recovered?
+        Such a bucket behaves the same as a newly created one.
+        """
+        self._refill()
+        return (not self._waiting and self.tokens == self.burst and
+                self.rate == self.max_rate)
+
+    def _refill(self):
+        now = self.clock.seconds()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """
+        Take a token, waiting for it if none is available
+
+        :return: Deferred fired when token is taken
+        """
+        self.calls += 1
+        self._refill()
+        if not self._waiting and self.tokens >= 1:
+            self.tokens -= 1
+            return succeed(None)
+        d = Deferred()
+        self._waiting.append((self.clock.seconds(), d))
+        self._schedule_release()
+        return d
+
+    def _schedule_release(self):
+        if self._release_call is None and self._waiting:
+            self._release_call = self.clock.callLater(
+                (1 - self.tokens) / self.rate, self._release)
+
+    def _release(self):
+        self._release_call = None
+        self._refill()
+        while self._waiting and self.tokens >= 1:
+            self.tokens -= 1
+            queued, d = self._waiting.popleft()
+            self.waits += 1
+            self.wait_time += self.clock.seconds() - queued
+            d.callback(None)
+        self._schedule_release()
+
+    def _backoff(self):
+        self.throttled += 1
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+        if self._release_call is not None:
+            # Waiting calls should now wait according to the reduced rate
+            self._release_call.cancel()
+            self._release_call = None
+            self._schedule_release()
+
+    def _recover(self):
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+    def run(self, f, *args, **kwargs):
+        """
+        Call ``f`` with given arguments after taking a token and adapt the
+        rate based on its result
+
+        :return: Deferred fired with result of ``f``
+        """
+        def call(_):
+            return maybeDeferred(f, *args, **kwargs).addCallbacks(
+                succeeded, failed)
+
+        def succeeded(result):
+            self._recover()
+            return result
+
+        def failed(failure):
+            if self.is_throttled(failure):
+                self._backoff()
+            return failure
+
+        return self.acquire().addCallback(call)
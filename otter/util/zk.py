@@ -14,7 +14,7 @@ from effect.do import do, do_return
 
 from kazoo.exceptions import LockTimeout, NoNodeError, NodeExistsError
 
-from twisted.internet.defer import maybeDeferred
+from twisted.internet.defer import Deferred, maybeDeferred
 
 from txeffect import deferred_performer, perform
 
@@ -152,6 +152,67 @@ def perform_get_stat(kz_client, dispatcher, intent):
     return kz_client.exists(intent.path)
 
 
+@attributes(['path'], apply_with_init=False)
+class GetData(object):
+    """
+    Get the content and :obj:`ZnodeStat` of a ZK node as a tuple, or None if
+    the node does not exist.
+    """
+    def __init__(self, path):
+        self.path = path
+
+
+@deferred_performer
+def perform_get_data(kz_client, dispatcher, intent):
+    """Perform a :obj:`GetData`."""
+    d = kz_client.get(intent.path)
+    return d.addErrback(catch_failure(NoNodeError, lambda f: None))
+
+
+@attr.s
+class WaitForDeletion(object):
+    """
+    Intent to wait until a znode is deleted by leaving a watch on it.
+
+    Results in ``True`` once the node does not exist or ``False`` if it
+    still exists after ``timeout`` seconds. ``None`` timeout waits forever.
+    """
+    path = attr.ib()
+    timeout = attr.ib(default=None)
+
+
+@deferred_performer
+def perform_wait_for_deletion(kz_client, clock, dispatcher, intent):
+    """
+    Perform :obj:`WaitForDeletion`. Must be partialed with ``kz_client`` and
+    ``clock``.
+
+    Any event on the watched node fires the result with ``True`` since the
+    caller is expected to check again why it was woken up.
+    """
+    waited = Deferred()
+
+    def fire(result):
+        if not waited.called:
+            waited.callback(result)
+
+    def cancel_timeout(result, call):
+        if call.active():
+            call.cancel()
+        return result
+
+    def got_stat(stat):
+        if stat is None:
+            fire(True)
+        elif intent.timeout is not None:
+            call = clock.callLater(intent.timeout, fire, False)
+            waited.addBoth(cancel_timeout, call)
+        return waited
+
+    d = kz_client.exists(intent.path, watch=lambda event: fire(True))
+    return d.addCallback(got_stat)
+
+
 @attributes(['path', 'version'])
 class DeleteNode(object):
     """Delete a node."""
@@ -168,8 +229,17 @@ def perform_delete_node(kz_client, dispatcher, intent):
     return kz_client.delete(intent.path, version=intent.version)
 
 
-def get_zk_dispatcher(kz_client):
-    """Get a dispatcher that can support all of the ZooKeeper intents."""
+def get_zk_dispatcher(kz_client, clock=None):
+    """
+    Get a dispatcher that can support all of the ZooKeeper intents.
+
+    :param kz_client: txKazoo client
+    :param IReactorTime clock: Clock used to time out :obj:`WaitForDeletion`.
+        Defaults to the global reactor.
+    """
+    if clock is None:  # pragma: no cover
+        from twisted.internet import reactor
+        clock = reactor
     return TypeDispatcher({
         CreateNode: partial(perform_create, kz_client),
         CreateOrSet:
@@ -180,8 +250,12 @@ def get_zk_dispatcher(kz_client):
             partial(perform_get_children_with_stats, kz_client),
         GetChildren:
             partial(perform_get_children, kz_client),
+        GetData:
+            partial(perform_get_data, kz_client),
         GetStat:
-            partial(perform_get_stat, kz_client)
+            partial(perform_get_stat, kz_client),
+        WaitForDeletion:
+            partial(perform_wait_for_deletion, kz_client, clock)
     })
 
 
@@ -307,6 +381,48 @@ class PollingLock(object):
             return Effect(Constant(None))
 
 
+class WatchingLock(PollingLock):
+    """
+    Zookeeper lock recipe that, while waiting, leaves a watch on the child
+    node just before its own instead of polling the children. Waiting for the
+    lock thus costs one read per predecessor released instead of one read
+    every polling interval. Apart from that it behaves exactly like
+    :obj:`PollingLock`.
+    """
+
+    def _predecessor(self, children):
+        """
+        Return the child just before this lock's child node or None if this
+        lock's node is the first child, i.e. the lock is acquired.
+        """
+        basename = self._node.rsplit("/")[-1]
+        children = sorted(children, key=lambda c: c[-10:])
+        if basename not in children:
+            raise NoNodeError("{} does not exist".format(self._node))
+        index = children.index(basename)
+        return children[index - 1] if index > 0 else None
+
+    @do
+    def _acquire_loop(self, blocking, timeout):
+        predecessor = self._predecessor(
+            (yield Effect(GetChildren(self.path))))
+        if predecessor is None or not blocking:
+            yield do_return(predecessor is None)
+        start = now = yield Effect(Func(time.time))
+        while predecessor is not None:
+            wait = None if timeout is None else timeout - (now - start)
+            if wait is not None and wait <= 0 or not (yield Effect(
+                    WaitForDeletion(self.path + "/" + predecessor, wait))):
+                raise LockTimeout(
+                    "Failed to acquire lock on {} in {} seconds".format(
+                        self.path, timeout))
+            predecessor = self._predecessor(
+                (yield Effect(GetChildren(self.path))))
+            if timeout is not None:
+                now = yield Effect(Func(time.time))
+        yield do_return(True)
+
+
 # Sentinet object representing the fact that eff passed in ``call_if_acquired``
 # was not called
 NOT_CALLED = object()
@@ -397,7 +513,7 @@ def locked_logged_func(dispatcher, path, log, message, func, *args, **kwargs):
 
     :return: (wrapped function, lock object) tuple
     """
-    lock = PollingLock(dispatcher, path)
+    lock = WatchingLock(dispatcher, path)
     f = locked(lock, dispatcher, func, *args, **kwargs)
     return add_acquired_log(log, message, f), lock
 
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""
+Measure log bytes and CPU time per convergence iteration taken by the
+"execute-convergence" event of a synthetic group when it is logged in full
+(split by :func:`otter.log.spec.split_execute_convergence`) and compactly
+(by :obj:`otter.log.spec.ConvergenceSummarizer`). The event is run through
+the same observers as :func:`otter.log.setup.make_observer_chain`.
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+from datetime import datetime
+
+from pyrsistent import freeze, pmap, pset
+
+from toolz.dicttoolz import assoc
+
+from otter.convergence.model import (
+    CLBDescription,
+    CLBNode,
+    DesiredServerGroupState,
+    NovaServer,
+    ServerState)
+from otter.convergence.steps import CreateServer
+from otter.log.formatters import (
+    ErrorFormattingWrapper,
+    JSONObserverWrapper,
+    ObserverWrapper,
+    PEP3101FormattingWrapper,
+    SystemFilterWrapper)
+from otter.log.spec import (
+    ConvergenceSummarizer,
+    SpecificationObserverWrapper,
+    get_validated_event,
+    msg_types,
+    split_execute_convergence)
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark logging execute-convergence event")
+
+the_parser.add_argument(
+    '--servers', type=int, default=1000,
+    help='Number of servers in the group. Default: 1000')
+
+the_parser.add_argument(
+    '--iterations', type=int, default=20,
+    help='Number of convergence iterations to log. Default: 20')
+
+
+def make_event(num_servers, iteration):
+    """
+    Return execute-convergence event of a group whose servers are all in a
+    CLB. One server gets replaced every iteration.
+    """
+    desc = CLBDescription(lb_id='1', port=80)
+    servers = []
+    nodes = []
+    for i in range(iteration, num_servers + iteration):
+        server_id = 'server{}'.format(i)
+        address = '10.{}.{}.{}'.format(i // 65536, i // 256 % 256, i % 256)
+        servers.append(NovaServer(
+            id=server_id, state=ServerState.ACTIVE, created=i,
+            image_id='image', flavor_id='flavor', servicenet_address=address,
+            desired_lbs=pset([desc]),
+            json=freeze({'id': server_id, 'status': 'ACTIVE',
+                         'name': 'as-server-{}'.format(i),
+                         'addresses': {'private': [{'addr': address}]},
+                         'metadata': {'rax:autoscale:group:id': 'group'},
+                         'links': [{'href': 'http://nova/' + server_id,
+                                    'rel': 'self'}]})))
+        nodes.append(CLBNode(node_id='node{}'.format(i), address=address,
+                             description=desc))
+    return {
+        'message': ('execute-convergence',), 'system': 'otter',
+        'isError': False, 'time': time.time(), 'tenant_id': 'tenant',
+        'scaling_group_id': 'group', 'now': datetime.utcnow(),
+        'servers': servers, 'lb_nodes': nodes, 'lbs': {},
+        'desired': DesiredServerGroupState(
+            server_config=pmap(), capacity=num_servers),
+        'steps': [CreateServer(server_config=pmap())]}
+
+
+def run_chain(formatter, events):
+    """
+    Log events with given execute-convergence formatter and return log bytes
+    and CPU seconds taken per event
+    """
+    lines = []
+    observer = SpecificationObserverWrapper(
+        PEP3101FormattingWrapper(
+            SystemFilterWrapper(
+                ErrorFormattingWrapper(
+                    ObserverWrapper(
+                        JSONObserverWrapper(
+                            lambda e: lines.append(e['message'][0]),
+                            sort_keys=True),
+                        hostname='host')))),
+        lambda e: get_validated_event(
+            e, assoc(msg_types, 'execute-convergence', formatter)))
+    start = time.clock()
+    for event in events:
+        observer(event)
+    cpu = time.clock() - start
+    return (sum(map(len, lines)) / float(len(events)),
+            cpu / len(events), len(lines))
+
+
+def run(args):
+    """
+    Print log bytes and CPU time per iteration in both formats
+    """
+    for name, formatter in [
+            ('full', split_execute_convergence),
+            ('compact', ConvergenceSummarizer(full_every=lambda: None))]:
+        events = [make_event(args.servers, i) for i in range(args.iterations)]
+        size, cpu, lines = run_chain(formatter, events)
+        print('{}: {:.0f} bytes, {:.4f}s CPU per iteration in {} lines'
+              .format(name, size, cpu, lines))
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
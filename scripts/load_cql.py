@@ -37,7 +37,7 @@ the_parser.add_argument(
 the_parser.add_argument(
     '--migrate', '-m', type=str,
     choices=['webhook_migrate', 'webhook_index', 'insert_deleting_false',
-             'set_desired'],
+             'set_desired', 'slice_events'],
     help='Run a migration job')
 
 the_parser.add_argument(
@@ -46,6 +46,17 @@ the_parser.add_argument(
           "desired value. This is only necessary/valid for the `set_desired` "
           "migration."))
 
+the_parser.add_argument(
+    "--buckets", type=int, default=10,
+    help=("Number of scheduler buckets. This is only necessary/valid for the "
+          "`slice_events` migration. Default: 10"))
+
+the_parser.add_argument(
+    "--time-slice", dest="time_slice", type=int, default=3600,
+    help=("Length of event time slices in seconds. It should be same as "
+          "\"scheduler.time_slice\" config. This is only necessary/valid for "
+          "the `slice_events` migration. Default: 3600"))
+
 the_parser.add_argument(
     '--keyspace', type=str, default='otter',
     help='The name of the keyspace.  Default: otter')
@@ -178,23 +189,27 @@ def webhook_migrate(reactor, conn, args):
     return perform(get_working_cql_dispatcher(reactor, conn), eff)
 
 
-@inlineCallbacks
 def insert_deleting_false(reactor, conn, args):
     """
-    Insert false to all group's deleting column
+    Insert false to all group's deleting column one page of groups at a time
     """
     store = CassScalingGroupCollection(conn, None, 3)
-    groups = yield store.get_scaling_group_rows()
     query = (
         'INSERT INTO scaling_group ("tenantId", "groupId", deleting) '
         'VALUES (:tenantId{i}, :groupId{i}, false);')
-    queries, params = [], {}
-    for i, group in enumerate(groups):
-        queries.append(query.format(i=i))
-        params['tenantId{}'.format(i)] = group['tenantId']
-        params['groupId{}'.format(i)] = group['groupId']
-    yield conn.execute(batch(queries), params, ConsistencyLevel.ONE)
-    returnValue(None)
+
+    def insert_page(_, groups):
+        if not groups:
+            return None
+        queries, params = [], {}
+        for i, group in enumerate(groups):
+            queries.append(query.format(i=i))
+            params['tenantId{}'.format(i)] = group['tenantId']
+            params['groupId{}'.format(i)] = group['groupId']
+        return conn.execute(batch(queries), params, ConsistencyLevel.ONE)
+
+    return store.fold_scaling_group_rows(
+        insert_page, None, props=['tenantId', 'groupId'])
 
 
 @inlineCallbacks
@@ -216,6 +231,21 @@ def set_desired(reactor, conn, args):
     returnValue(None)
 
 
+@inlineCallbacks
+def slice_events(reactor, conn, args):
+    """
+    Copy events of every bucket from scaling_schedule_v2 to time slice
+    partitions in scaling_schedule_v3. Run this with the scheduler stopped
+    and then start it with "scheduler.time_slice" config set to
+    ``--time-slice``.
+    """
+    store = CassScalingGroupCollection(conn, None, 3)
+    for bucket in range(1, args.buckets + 1):
+        copied = yield store.copy_events_to_slices(bucket, args.time_slice)
+        print('Copied {} events of bucket {}'.format(copied, bucket))
+    returnValue(None)
+
+
 def setup_connection(reactor, args):
     """
     Return Cassandra connection
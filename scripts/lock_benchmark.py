@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Compare ZooKeeper operations per second issued by
+:obj:`otter.util.zk.PollingLock` and :obj:`otter.util.zk.WatchingLock` when
+many contenders keep acquiring the same group lock. The locks are run on a
+simulated clock against a small in-memory model of ZooKeeper.
+"""
+
+from __future__ import print_function
+
+import argparse
+from collections import Counter
+
+from effect import ComposedDispatcher, base_dispatcher
+
+from kazoo.exceptions import NoNodeError, NodeExistsError
+
+from twisted.internet.defer import fail, succeed
+from twisted.internet.task import Clock, deferLater
+
+from txeffect import make_twisted_dispatcher
+
+from otter.util.zk import PollingLock, WatchingLock, get_zk_dispatcher
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark ZooKeeper load of group locks under contention")
+
+the_parser.add_argument(
+    '--contenders', type=int, default=20,
+    help='Number of processes contending for the lock. Default: 20')
+
+the_parser.add_argument(
+    '--hold', type=float, default=0.05,
+    help='Seconds the lock is held once acquired. Default: 0.05')
+
+the_parser.add_argument(
+    '--duration', type=float, default=60,
+    help='Simulated seconds to run for. Default: 60')
+
+
+class ZKModel(object):
+    """
+    In-memory model of the txKazoo operations used by the locks, counting
+    each operation
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.watches = {}
+        self.sequence = 0
+        self.ops = Counter()
+
+    def create(self, path, value="", ephemeral=False, sequence=False,
+               makepath=False):
+        self.ops['create'] += 1
+        if sequence:
+            path += '{:010d}'.format(self.sequence)
+            self.sequence += 1
+        if path in self.nodes:
+            return fail(NodeExistsError(path))
+        self.nodes[path] = value
+        return succeed(path)
+
+    def get_children(self, path):
+        self.ops['get_children'] += 1
+        prefix = path + '/'
+        return succeed([p[len(prefix):] for p in self.nodes
+                        if p.startswith(prefix)])
+
+    def exists(self, path, watch=None):
+        self.ops['exists'] += 1
+        if path not in self.nodes:
+            return succeed(None)
+        if watch is not None:
+            self.watches.setdefault(path, []).append(watch)
+        return succeed(object())
+
+    def delete(self, path, version=-1):
+        self.ops['delete'] += 1
+        if path not in self.nodes:
+            return fail(NoNodeError(path))
+        del self.nodes[path]
+        for watch in self.watches.pop(path, []):
+            watch('DELETED')
+        return succeed(None)
+
+
+def contend(clock, lock, hold, until, acquired):
+    """
+    Keep acquiring ``lock``, holding it for ``hold`` seconds and releasing it
+    until ``until`` seconds
+    """
+    def got_lock(_):
+        acquired[0] += 1
+        return deferLater(clock, hold, lock.release).addCallback(again)
+
+    def again(_):
+        if clock.seconds() < until:
+            return lock.acquire(True, None).addCallback(got_lock)
+
+    return again(None)
+
+
+def run_locks(make_lock, args):
+    """
+    Run contenders with locks created by ``make_lock`` and return
+    (operations counter, number of times lock was acquired)
+    """
+    clock = Clock()
+    model = ZKModel()
+    dispatcher = ComposedDispatcher([
+        get_zk_dispatcher(model, clock), make_twisted_dispatcher(clock),
+        base_dispatcher])
+    acquired = [0]
+    for _ in range(args.contenders):
+        contend(clock, make_lock(dispatcher, '/locks/group'), args.hold,
+                args.duration, acquired)
+    while clock.seconds() < args.duration:
+        clock.advance(0.01)
+    return model.ops, acquired[0]
+
+
+def run(args):
+    """
+    Print ZooKeeper operations per second and lock acquisitions of both locks
+    """
+    for name, make_lock in [('polling', PollingLock),
+                            ('watching', WatchingLock)]:
+        ops, acquired = run_locks(make_lock, args)
+        total = sum(ops.values())
+        print('{}: {:.0f} ZK ops/sec ({}), {} acquisitions, {:.1f} ZK ops '
+              'per acquisition'.format(
+                  name, total / args.duration,
+                  ', '.join('{} {:.0f}'.format(op, count / args.duration)
+                            for op, count in sorted(ops.items())),
+                  acquired, total / float(acquired)))
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
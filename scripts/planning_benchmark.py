@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""
+Time :func:`otter.convergence.planning.plan_launch_server` on a synthetic
+group whose tenant has many load balancer nodes. Useful to check how the
+planner scales with the number of servers and LB nodes.
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from pyrsistent import pmap, pset
+
+from otter.convergence.model import (
+    CLBDescription,
+    CLBNode,
+    DesiredServerGroupState,
+    NovaServer,
+    RCv3Description,
+    RCv3Node,
+    ServerState)
+from otter.convergence.planning import plan_launch_server
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark the launch_server convergence planner")
+
+the_parser.add_argument(
+    '--servers', type=int, default=1000,
+    help='Number of servers in the group. Default: 1000')
+
+the_parser.add_argument(
+    '--other-nodes', type=int, default=10000,
+    help=('Number of LB nodes on the tenant not belonging to the group. '
+          'Default: 10000'))
+
+the_parser.add_argument(
+    '--repeat', type=int, default=5,
+    help='Number of times to run the planner. Default: 5')
+
+
+def make_state(num_servers, num_other_nodes):
+    """
+    Return arguments for ``plan_launch_server`` with every server in a CLB
+    and an RCv3 load balancer.
+    """
+    clb_desc = CLBDescription(lb_id='1', port=80)
+    rcv3_desc = RCv3Description(lb_id='2')
+    servers = []
+    nodes = []
+    for i in range(num_servers):
+        address = '10.{}.{}.{}'.format(i // 65536, i // 256 % 256, i % 256)
+        server_id = 'server{}'.format(i)
+        servers.append(NovaServer(
+            id=server_id, state=ServerState.ACTIVE, created=i,
+            image_id='image', flavor_id='flavor', servicenet_address=address,
+            desired_lbs=pset([clb_desc, rcv3_desc]),
+            json=pmap({'id': server_id, 'status': 'ACTIVE'})))
+        nodes.append(CLBNode(node_id='clb{}'.format(i), address=address,
+                             description=clb_desc))
+        nodes.append(RCv3Node(node_id='rcv3{}'.format(i),
+                              cloud_server_id=server_id,
+                              description=rcv3_desc))
+    for i in range(num_other_nodes):
+        nodes.append(CLBNode(node_id='other{}'.format(i),
+                             address='192.168.{}.{}'.format(i // 256 % 256,
+                                                            i % 256),
+                             description=clb_desc))
+    return dict(servers=pset(servers), lb_nodes=pset(nodes),
+                lbs={'1': None, '2': None})
+
+
+def run(args):
+    """
+    Plan convergence of a group already at its desired state and print the
+    time taken.
+    """
+    state = make_state(args.servers, args.other_nodes)
+    desired = DesiredServerGroupState(
+        server_config=pmap(), capacity=args.servers,
+        desired_lbs=pset())
+
+    def plan():
+        plan_launch_server(desired, 0, 3600, {}, **state)
+
+    times = timeit.repeat(plan, repeat=args.repeat, number=1)
+    print('servers: {}, lb nodes: {}'.format(args.servers,
+                                             len(state['lb_nodes'])))
+    print('best: {:.4f}s, worst: {:.4f}s'.format(min(times), max(times)))
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
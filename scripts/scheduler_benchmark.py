@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+Compare events drained per second from a backlog of due events in a bucket
+by :obj:`otter.scheduler.check_events_in_bucket` and
+:obj:`otter.scheduler.pipelined_check_events_in_bucket`. Both are run on a
+simulated clock against an in-memory store with configurable latencies.
+Executing an event is simulated by holding its group's lock for some time
+like executing a policy does.
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+from datetime import datetime
+
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.task import Clock, deferLater
+
+from otter import scheduler
+from otter.log.bound import BoundLog
+from otter.util.weaklocks import WeakLocks
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark draining a backlog of scheduled events")
+
+the_parser.add_argument(
+    '--events', type=int, default=10000,
+    help='Number of due events in the bucket. Default: 10000')
+
+the_parser.add_argument(
+    '--groups', type=int, default=2000,
+    help='Number of groups the events belong to. Default: 2000')
+
+the_parser.add_argument(
+    '--batchsize', type=int, default=100,
+    help='Number of events fetched at a time. Default: 100')
+
+the_parser.add_argument(
+    '--max-in-flight', type=int, default=300,
+    help='Maximum events in flight when pipelined. Default: 300')
+
+the_parser.add_argument(
+    '--fetch-latency', type=float, default=0.03,
+    help='Seconds taken to fetch and delete a batch. Default: 0.03')
+
+the_parser.add_argument(
+    '--execute-latency', type=float, default=0.1,
+    help=('Seconds the group is locked to execute an event. Some events '
+          'take up to 5 times longer. Default: 0.1'))
+
+
+class Store(object):
+    """
+    In-memory store of due events in a bucket
+    """
+
+    def __init__(self, clock, events, fetch_latency):
+        self.clock = clock
+        self.events = events
+        self.fetch_latency = fetch_latency
+        self.fetches = 0
+
+    def fetch_and_delete(self, bucket, now, size):
+        self.fetches += 1
+        batch, self.events = self.events[:size], self.events[size:]
+        return deferLater(self.clock, self.fetch_latency, lambda: batch)
+
+
+def make_events(args, rand):
+    """
+    Return due events spread randomly among groups
+    """
+    return [{'tenantId': 't',
+             'groupId': 'g{}'.format(rand.randrange(args.groups)),
+             'policyId': 'p{}'.format(i), 'trigger': datetime(2016, 1, 1),
+             'cron': None, 'version': 'v'}
+            for i in range(args.events)]
+
+
+def run_check(check, args, seed=0):
+    """
+    Drain the backlog with ``check`` and return simulated seconds taken
+    """
+    rand = random.Random(seed)
+    clock = Clock()
+    store = Store(clock, make_events(args, rand), args.fetch_latency)
+    group_locks = WeakLocks()
+
+    def execute_event(dispatcher, store, log, event, deleted_policy_ids):
+        latency = args.execute_latency * rand.choice([1, 1, 1, 5])
+        return group_locks.get_lock(event['groupId']).run(
+            deferLater, clock, latency, lambda: None)
+
+    scheduler.execute_event = execute_event
+    log = BoundLog(lambda *a, **kw: None, lambda *a, **kw: None)
+    d = maybeDeferred(check, log, "dispatcher", store, 1, datetime.utcnow(),
+                      args.batchsize)
+    done = []
+    d.addBoth(done.append)
+    while not done:
+        clock.advance(min(call.getTime() for call in clock.getDelayedCalls()) -
+                      clock.seconds())
+    return clock.seconds()
+
+
+def run(args):
+    """
+    Print events drained per second in both modes
+    """
+    def pipelined(*check_args):
+        return scheduler.pipelined_check_events_in_bucket(
+            *(check_args + (args.max_in_flight,)))
+
+    original = scheduler.execute_event
+    try:
+        for mode, check in [
+                ('sequential', scheduler.check_events_in_bucket),
+                ('pipelined', pipelined)]:
+            seconds = run_check(check, args)
+            print('{}: drained {} events in {:.1f} seconds, {:.0f} events/sec'
+                  .format(mode, args.events, seconds, args.events / seconds))
+    finally:
+        scheduler.execute_event = original
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
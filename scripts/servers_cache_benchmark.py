@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+Compare bytes written and rows tombstoned per convergence iteration by the
+"full" and "delta" servers cache modes. The caches are run against a small
+in-memory model of the tables that understands only the queries issued by
+them.
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import re
+from datetime import datetime, timedelta
+
+from effect import ComposedDispatcher, TypeDispatcher, sync_perform
+from effect import base_dispatcher, sync_performer
+
+from otter.models.cass import (
+    CQLQueryExecute,
+    CassScalingGroupServersCache,
+    CassScalingGroupServersDeltaCache)
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark servers cache writes per convergence iteration")
+
+the_parser.add_argument(
+    '--servers', type=int, default=100,
+    help='Number of servers in the group. Default: 100')
+
+the_parser.add_argument(
+    '--iterations', type=int, default=100,
+    help='Number of convergence iterations. Default: 100')
+
+the_parser.add_argument(
+    '--change-ratio', type=float, default=0.02,
+    help=('Ratio of servers that change in an iteration. A changed server is '
+          'replaced half of the time. Default: 0.02'))
+
+
+_PRIMARY_KEYS = {
+    'servers_cache': ('last_update', 'server_id'),
+    'group_servers_cache': ('server_id',)
+}
+
+
+class Tables(object):
+    """
+    In-memory model of servers cache tables of a single group, counting bytes
+    written and rows deleted
+    """
+
+    def __init__(self):
+        self.rows = {table: {} for table in _PRIMARY_KEYS}
+        self.static = {}
+        self.bytes_written = 0
+        self.tombstones = 0
+
+    def execute(self, query, params):
+        """
+        Execute query and return rows if it is a SELECT
+        """
+        if query.startswith('BEGIN BATCH '):
+            statements = query[len('BEGIN BATCH '):-len(' APPLY BATCH;')]
+            for statement in statements.split('; '):
+                self.execute(statement.rstrip(';'), params)
+            return None
+        table = re.search(r'(?:FROM|INTO|UPDATE) (\w+)', query).group(1)
+        conditions = dict(
+            (col.strip('"'), params[name]) for col, name in
+            re.findall(r'(\w+|"\w+")\s*=\s*:(\w+)',
+                       query.partition('WHERE')[2]))
+        conditions.pop('tenantId', None)
+        conditions.pop('groupId', None)
+        if query.startswith('SELECT'):
+            rows = sorted(self.rows[table].values(),
+                          key=lambda r: r.get('last_update'), reverse=True)
+            if table in self.static:
+                rows = [dict(r, last_update=self.static[table])
+                        for r in rows] or [
+                    {'server_id': None, 'last_update': self.static[table]}]
+            return rows
+        elif query.startswith('INSERT'):
+            cols, names = re.search(
+                r'\((.*)\) VALUES\((.*)\)', query).groups()
+            row = dict(zip([c.strip(' "') for c in cols.split(',')],
+                           [params[n.strip(' :')] for n in names.split(',')]))
+            self.bytes_written += sum(len(str(v)) for v in row.values())
+            key = tuple(row[k] for k in _PRIMARY_KEYS[table])
+            self.rows[table][key] = row
+        elif query.startswith('DELETE'):
+            deleted = [key for key, row in self.rows[table].items()
+                       if all(row[c] == v for c, v in conditions.items())]
+            for key in deleted:
+                del self.rows[table][key]
+            self.tombstones += len(deleted)
+        elif query.startswith('UPDATE'):
+            col, name = re.search(r'SET (\w+)=:(\w+)', query).groups()
+            self.static[table] = params[name]
+            self.bytes_written += len(str(params[name]))
+
+
+def make_server(i, status='ACTIVE'):
+    """
+    Return server dict similar in size to a Nova server details
+    """
+    return {
+        'id': 'server{}'.format(i), 'status': status,
+        'name': 'as{}-{}'.format(i, 'x' * 20),
+        'addresses': {'private': [{'addr': '10.0.0.{}'.format(i % 256),
+                                   'version': 4}]},
+        'metadata': {'rax:auto_scaling_group_id': 'group-' + 'g' * 30,
+                     'rax:autoscale:lb:CloudLoadBalancer:1':
+                         '[{"port": 80}]'},
+        'image': {'id': 'image' * 8}, 'flavor': {'id': 'general1-2'},
+        'links': [{'href': 'https://example.com/servers/' + 'l' * 40,
+                   'rel': 'self'}],
+        'created': '2016-01-01T00:00:00Z'}
+
+
+def run_iterations(cache_class, args, seed=0):
+    """
+    Update cache twice per iteration, like convergence does, with some
+    servers changing every iteration and return the :obj:`Tables`
+    """
+    rand = random.Random(seed)
+    tables = Tables()
+    dispatcher = ComposedDispatcher([
+        TypeDispatcher({
+            CQLQueryExecute: sync_performer(
+                lambda d, i: tables.execute(i.query, i.params))}),
+        base_dispatcher])
+    cache = cache_class('tenant', 'group')
+    servers = {i: make_server(i) for i in range(args.servers)}
+    next_id = args.servers
+    now = datetime(2016, 1, 1)
+    for _ in range(args.iterations):
+        for i in rand.sample(servers.keys(),
+                             int(args.servers * args.change_ratio)):
+            if rand.random() < 0.5:
+                servers[i] = make_server(
+                    i, rand.choice(['ACTIVE', 'BUILD', 'ERROR']))
+            else:
+                del servers[i]
+                servers[next_id] = make_server(next_id)
+                next_id += 1
+        for _ in range(2):
+            now += timedelta(seconds=1)
+            sync_perform(dispatcher, cache.update_servers(
+                now, [dict(s, _is_as_active=True) for s in servers.values()]))
+    return tables
+
+
+def run(args):
+    """
+    Print bytes written and rows deleted per iteration by both modes
+    """
+    for mode, cache_class in [('full', CassScalingGroupServersCache),
+                              ('delta', CassScalingGroupServersDeltaCache)]:
+        tables = run_iterations(cache_class, args)
+        print('{}: {:.0f} bytes written, {:.1f} rows tombstoned '
+              'per iteration'.format(
+                  mode, tables.bytes_written / float(args.iterations),
+                  tables.tombstones / float(args.iterations)))
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
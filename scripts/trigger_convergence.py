@@ -20,7 +20,7 @@ from datetime import datetime
 from functools import partial
 from pprint import pprint
 
-from effect import Effect, Func, parallel
+from effect import ComposedDispatcher, Effect, Func, parallel
 from effect.do import do, do_return
 
 from toolz.curried import filter
@@ -39,7 +39,8 @@ from txeffect import perform
 from otter.auth import generate_authenticator, public_endpoint_url
 from otter.cloud_client import TenantScope
 from otter.constants import get_service_configs
-from otter.convergence.gathering import get_all_launch_server_data
+from otter.convergence.gathering import (
+    get_all_launch_server_data, get_gather_cache_dispatcher)
 from otter.convergence.planning import Destiny, get_destiny
 from otter.convergence.service import convergence_exec_data, get_executor
 from otter.effect_dispatcher import get_full_dispatcher
@@ -130,12 +131,12 @@ def get_groups(parsed, store, conf):
         return succeed(
             [{"tenantId": tid, "groupId": gid} for tid, gid in groups])
     elif parsed.all:
-        d = store.get_all_valid_groups()
+        d = store.get_all_valid_groups(["tenantId", "groupId"])
     elif parsed.tenant_id:
         d = get_groups_of_tenants(log, store, parsed.tenant_id)
     elif parsed.disabled_tenants:
         non_conv_tenants = conf["non-convergence-tenants"]
-        d = store.get_all_valid_groups()
+        d = store.get_all_valid_groups(["tenantId", "groupId"])
         d.addCallback(
             filter(lambda g: g["tenantId"] not in set(non_conv_tenants)))
         d.addCallback(list)
@@ -191,9 +192,11 @@ def groups_steps(groups, reactor, store, cass_client, authenticator, conf):
     Return [(group, (steps, delta))] list
     """
     eff = parallel(map(group_steps, groups))
-    disp = get_full_dispatcher(
-        reactor, authenticator, mock_log(), get_service_configs(conf),
-        "kzclient", store, "supervisor", cass_client)
+    disp = ComposedDispatcher([
+        get_gather_cache_dispatcher(reactor, 0),
+        get_full_dispatcher(
+            reactor, authenticator, mock_log(), get_service_configs(conf),
+            "kzclient", store, "supervisor", cass_client)])
     d = perform(disp, eff)
     return d.addCallback(lambda steps: zip(groups, steps))
 
@@ -220,9 +223,11 @@ def set_desired_to_actual_group(dispatcher, cass_client, group):
 
 def set_desired_to_actual(groups, reactor, store, cass_client, authenticator,
                           conf):
-    dispatcher = get_full_dispatcher(
-        reactor, authenticator, mock_log(), get_service_configs(conf),
-        "kzclient", store, "supervisor", cass_client)
+    dispatcher = ComposedDispatcher([
+        get_gather_cache_dispatcher(reactor, 0),
+        get_full_dispatcher(
+            reactor, authenticator, mock_log(), get_service_configs(conf),
+            "kzclient", store, "supervisor", cass_client)])
     return gatherResults(
         map(partial(set_desired_to_actual_group, dispatcher, cass_client),
             groups))